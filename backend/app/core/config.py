@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Optional, List, Dict, Any
 import os
 
 class Settings(BaseSettings):
@@ -15,6 +15,40 @@ class Settings(BaseSettings):
     max_tokens_per_chunk: int = 500
     temperature: float = 0.7
     
+    # LLM端点池配置
+    # 每项形如 {"api_base": "...", "api_key": "...", "weight": 1, "max_concurrency": 4}
+    # 为空时使用 api_base/llm_api_key 作为唯一端点
+    llm_endpoints: List[Dict[str, Any]] = []
+    llm_balance_strategy: str = "least_outstanding"  # 可选值: least_outstanding, ewma
+    llm_endpoint_max_concurrency: int = 4  # 单个端点默认最大并发数
+    llm_max_concurrency: int = 8  # 单个报告内同时处理的片段数
+    llm_ewma_alpha: float = 0.3  # EWMA延迟平滑系数
+    llm_endpoint_failure_threshold: int = 3  # 连续失败多少次后标记端点不健康
+    llm_endpoint_cooldown: float = 30.0  # 不健康端点的冷却时间（秒）
+    
+    # 对冲请求配置
+    llm_hedge_enabled: bool = False  # 超过p95延迟未返回时发出副本请求
+    llm_hedge_quantile: float = 0.95  # 触发对冲的延迟分位数
+    llm_hedge_budget_ratio: float = 0.1  # 额外请求数上限（占主请求数的比例）
+    llm_hedge_min_samples: int = 20  # 延迟样本数达到该值后才开始对冲
+    llm_hedge_min_delay: float = 1.0  # 对冲等待时间下限（秒）
+    llm_latency_window: int = 500  # 延迟统计滑动窗口大小
+    
+    # 模型路由配置
+    model_routing_enabled: bool = False  # 按片段选择大/小模型
+    model_routing_light_model: str = "qwen-turbo"  # 短片段、低相关片段使用的模型
+    model_routing_heavy_model: str = "qwen-plus"  # 高价值片段使用的模型（为空时使用model_name）
+    model_routing_min_chars: int = 500  # 少于该字符数的片段路由到小模型
+    model_routing_min_relevance: float = 0.1  # 问题词项覆盖率低于该值的片段路由到小模型
+    # 自定义规则（按顺序匹配），如 [{"max_chars": 300, "model": "qwen-turbo"}]，为空时使用默认规则；格式错误时启动失败
+    model_routing_rules: List[Dict[str, Any]] = []
+    
+    # 模型调用录制回放配置
+    llm_cassette_mode: str = "off"  # off, record（记录真实调用）, replay（按录制结果回放，不发起网络请求）
+    llm_cassette_path: str = "cassettes/llm.jsonl"
+    llm_cassette_time_scale: float = 1.0  # 回放时的延迟倍率，0表示不等待
+    llm_cassette_strict: bool = False  # 回放时请求必须与录制的完全一致，否则按录制顺序取下一条
+    
     # 提示词配置
     prompt_version: str = "default"  # 可选值: default, v1, v2, v3
     
@@ -23,15 +57,66 @@ class Settings(BaseSettings):
     max_chunk_size: int = 2000
     overlap_size: int = 200
     
+    # 小片段打包配置
+    chunk_packing_enabled: bool = False  # 将多个小片段合并到一次模型调用
+    chunk_packing_small_chars: int = 400  # 少于该字符数的片段视为小片段
+    chunk_packing_max_chunks: int = 8  # 每次调用最多打包的片段数
+    
+    # 阻塞操作分流配置（文件I/O线程池、PDF解析进程池）
+    offload_io_workers: int = 8
+    offload_cpu_workers: int = 2
+    offload_cpu_mode: str = "process"  # process（进程池）或 thread（独立线程池）
+    
     # 文件存储配置
     reports_dir: str = "reports"
-    upload_dir: str = "uploads"
+    report_compression: str = "none"  # 报告正文存储压缩：none, gzip, zstd（zstd需安装zstandard）
+    report_compression_level: int = 6
+    report_layout: str = "sharded"  # 报告目录布局：sharded（按哈希前缀分目录）或 flat
+    
+    # 报告保留与归档配置（0表示不限制）
+    report_retention_days: int = 0  # 超过天数的报告被删除
+    report_retention_max_count: int = 0  # 最多保留的报告数
+    report_retention_max_bytes: int = 0  # 报告总占用上限
+    report_archive_after_days: int = 0  # 超过天数的报告压缩进归档分片
+    report_archive_shard_bytes: int = 64 * 1024 * 1024  # 单个归档分片大小上限
+    report_archive_compact_ratio: float = 0.5  # 删除后分片中仍被引用的数据占比低于该值时重写分片
+    report_maintenance_interval: float = 3600.0  # 保留与归档任务的最短执行间隔（秒）
+    upload_dir: str = "uploads"  # 上传文件按内容哈希去重存储
+    upload_quota_bytes: int = 2 * 1024 * 1024 * 1024  # 上传文件总占用上限，超出后淘汰无引用或只被报告引用的文件
     max_file_size: int = 50 * 1024 * 1024  # 50MB
+    in_memory_pdf_max_bytes: int = 8 * 1024 * 1024  # 不超过该大小的PDF直接在内存中解析，更大的从磁盘打开
+    
+    # 文档会话配置（上传一次，多次提问）
+    documents_dir: str = "documents"
+    documents_quota_bytes: int = 1024 * 1024 * 1024  # 文档总占用上限，超出后按LRU淘汰
+    
+    # 检查点配置（按文档哈希+问题+提示词版本保存每个片段的结果）
+    checkpoint_enabled: bool = True
+    checkpoint_dir: str = "checkpoints"
+    checkpoint_max_retries: int = 2  # 失败片段在重新运行/恢复时的最大重试次数
+    checkpoint_completed_ttl: float = 0.0  # 报告完整保存后检查点的保留时间（秒），0为保存后立即删除
+    checkpoint_ttl: float = 7 * 86400.0  # 未完成的检查点（部分报告、失败片段）超过该时间未更新时删除，0为不清理
     
     # 日志配置
     log_level: str = "INFO"
     log_file: str = "logs/app.log"
     
+    # 追踪配置（按请求记录各阶段耗时，/debug/traces 查询）
+    tracing_enabled: bool = True
+    trace_buffer_size: int = 200  # 内存中保留的最近请求追踪数
+    trace_file: str = ""  # 非空时同时追加写入该JSONL文件
+    loop_lag_interval: float = 0.5  # 事件循环延迟采样间隔（秒）
+    loop_lag_warn_ms: float = 100.0  # 延迟超过该值时记录警告
+    
+    # 性能剖析配置（单个请求按需开启，结果与报告保存在一起）
+    profiling_token: str = ""  # 请求头 X-Profile 或查询参数 profile 与之相同时剖析该请求；为空时关闭
+    profile_interval_ms: float = 5.0  # 采样间隔（毫秒）
+    memory_profile_frames: int = 1  # 内存剖析（X-Memory-Profile）记录的调用栈深度，越深开销越大
+    
+    # 内存预算配置（单个任务的中间文本预计超出预算时改为流式清理，清理后的文本与分片落盘）
+    job_memory_budget_bytes: int = 0  # 0为不限制
+    spool_dir: str = ""  # 落盘中间结果的目录，为空时使用系统临时目录
+    
     # 服务器配置
     host: str = "0.0.0.0"
     port: int = 8000
@@ -56,6 +141,8 @@ def ensure_directories():
     directories = [
         settings.reports_dir,
         settings.upload_dir,
+        settings.checkpoint_dir,
+        settings.documents_dir,
         os.path.dirname(settings.log_file)
     ]
     
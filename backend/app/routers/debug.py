@@ -0,0 +1,48 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from typing import Optional
+
+from app.schemas.report_schema import StandardResponse
+from app.utils.profiler import requested as profiling_requested
+from app.utils.resources import resource_snapshot
+from app.utils.tracing import trace_recorder, loop_lag_monitor
+
+router = APIRouter()
+
+
+@router.get("/traces", response_model=StandardResponse)
+async def get_traces(
+    limit: int = Query(50, ge=1, le=1000, description="返回的追踪条数"),
+    request_id: Optional[str] = Query(None, description="按请求ID过滤"),
+    path: Optional[str] = Query(None, description="按请求路径前缀过滤"),
+    min_duration_ms: float = Query(0.0, ge=0, description="只返回耗时不低于该值的请求")
+):
+    """查询最近的请求追踪（新的在前）与事件循环延迟统计"""
+    return StandardResponse(
+        code=200,
+        msg="success",
+        data={
+            "loop_lag": loop_lag_monitor.stats(),
+            "traces": trace_recorder.query(
+                limit=limit,
+                request_id=request_id,
+                path=path,
+                min_duration_ms=min_duration_ms
+            )
+        }
+    )
+
+
+@router.get("/resources", response_model=StandardResponse)
+async def get_resources(
+    request: Request,
+    top: int = Query(50, ge=0, description="返回数量最多的前N种对象类型，0为全部"),
+    collect: bool = Query(False, description="统计前先执行一次完整gc，避免把待回收的对象计为累积")
+):
+    """进程资源快照：RSS、文件描述符、线程、asyncio任务、loguru处理器与按类型统计的对象数
+
+    需在请求头 X-Profile 或查询参数 profile 中带上配置的剖析口令，未配置口令时不可用。
+    在事件循环中同步执行（堆较大时约几十到几百毫秒），供长时间压测低频采样使用。
+    """
+    if not profiling_requested(request.headers.get("x-profile"), request.query_params.get("profile")):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return StandardResponse(code=200, msg="success", data=resource_snapshot(top=top, collect=collect))
@@ -1,30 +1,115 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, Depends
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, Depends, Request, Query
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
+import asyncio
 import os
-import tempfile
+import time
+import uuid
 from typing import Optional
 from loguru import logger
 
 from app.services.report_service import ReportService
 from app.services.prompt_service import PromptService
+from app.services.document_service import DocumentService
+from app.services.upload_store import UploadStore
+from app.services.checkpoint_service import CheckpointInUseError
 from app.schemas.report_schema import (
+    GenerateReportRequest,
     GenerateReportResponse,
     StandardResponse,
     ReportListResponse
 )
 from app.core.config import settings
+from app.utils.cancellation import CancellationToken, ReportCancelledError, watch_disconnect
+from app.utils.offload import run_io, run_cpu
+from app.utils.tracing import span
+from app.utils import metrics
+from app.utils.profiler import SamplingProfiler, requested as profiling_requested
+from app.utils.memory import MemoryProfile
 
 router = APIRouter()
 report_service = ReportService()
 prompt_service = PromptService()
+upload_store = UploadStore()
+document_service = DocumentService(upload_store)
+
+# 上次执行报告保留与归档任务的时间
+_last_maintenance = 0.0
+
+
+def run_report_maintenance(force: bool = False):
+    """按间隔执行报告保留与归档，并移除被删除报告对上传文件的引用"""
+    global _last_maintenance
+    now = time.time()
+    if not force and now - _last_maintenance < settings.report_maintenance_interval:
+        return None
+    _last_maintenance = now
+    result = report_service.run_maintenance()
+    for report_id in result["deleted"]:
+        upload_store.remove_ref(f"{UploadStore.REPORT_REF}{report_id}")
+    return result
+
+
+async def _add_report_ref(file_hash: Optional[str], report_id: str):
+    """记录报告来源的上传文件（报告引用不阻止配额淘汰，文件已被淘汰时忽略）"""
+    if not file_hash:
+        return
+    try:
+        await run_io(upload_store.add_ref, file_hash, f"{UploadStore.REPORT_REF}{report_id}")
+    except FileNotFoundError:
+        logger.warning(f"Upload {file_hash} of report {report_id} already evicted")
+
+
+async def _store_upload(file: UploadFile, ref: str):
+    """保存上传文件到上传存储，返回 (哈希, PDF来源)
+
+    小文件整体读入内存，解析时直接使用字节内容；大文件流式落盘，解析时从磁盘打开
+    """
+    with span("upload", size=file.size) as upload_span:
+        if file.size is not None and file.size <= settings.in_memory_pdf_max_bytes:
+            content = await file.read()
+            metrics.UPLOAD_SIZE.observe(len(content))
+            file_hash, _ = await run_io(upload_store.put_bytes, content, ref=ref)
+            if upload_span:
+                upload_span.set(in_memory=True)
+            return file_hash, content
+        file_hash, path = await upload_store.save_upload(file, ref=ref)
+        metrics.UPLOAD_SIZE.observe(file.size if file.size is not None else await run_io(os.path.getsize, path))
+        return file_hash, path
+
+def _start_profiler(request: Request) -> Optional[SamplingProfiler]:
+    """请求头 X-Profile 或查询参数 profile 与配置的口令一致时剖析该请求，否则不做任何事"""
+    if not profiling_requested(request.headers.get("x-profile"), request.query_params.get("profile")):
+        return None
+    logger.info(f"Profiling request: {request.method} {request.url.path}")
+    return SamplingProfiler().start()
+
+async def _finish_profiler(request_profiler: SamplingProfiler, report_id: str) -> dict:
+    """停止剖析并把结果保存在报告旁"""
+    request_profiler.stop()
+    return await run_io(report_service.save_profile, report_id, request_profiler)
+
+def _start_memory_profile(request: Request) -> Optional[MemoryProfile]:
+    """请求头 X-Memory-Profile 或查询参数 memory_profile 与配置的口令一致时按阶段统计该请求的内存"""
+    if not profiling_requested(request.headers.get("x-memory-profile"), request.query_params.get("memory_profile")):
+        return None
+    logger.info(f"Memory profiling request: {request.method} {request.url.path}")
+    return MemoryProfile().start()
+
+async def _finish_memory_profile(memory_profile: MemoryProfile, report_id: str) -> dict:
+    """停止内存剖析并把结果保存在报告旁"""
+    memory_profile.stop()
+    return await run_io(report_service.save_memory_profile, report_id, memory_profile)
 
 @router.post("/generate_report", response_model=StandardResponse)
 async def generate_report(
+    request: Request,
     background_tasks: BackgroundTasks,
     file: UploadFile = File(..., description="PDF文件"),
     question: str = Form(..., description="研究问题", min_length=1, max_length=1000)
 ):
     """生成研究报告"""
+    request_profiler = _start_profiler(request)
+    memory_profile = _start_memory_profile(request)
     try:
         # 验证文件类型
         if not file.filename.lower().endswith('.pdf'):
@@ -34,19 +119,25 @@ async def generate_report(
         if file.size > settings.max_file_size:
             raise HTTPException(status_code=400, detail="文件大小超过限制")
         
-        # 保存上传的文件
-        temp_file_path = None
+        # 保存上传的文件（按内容哈希去重；生成期间持有临时引用，避免被淘汰，生成后只保留不阻止淘汰的报告引用）
+        upload_ref = f"upload:{uuid.uuid4().hex}"
+        file_hash, pdf_source = await _store_upload(file, upload_ref)
         try:
-            # 创建临时文件
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-                content = await file.read()
-                temp_file.write(content)
-                temp_file_path = temp_file.name
+            logger.info(f"File uploaded: {file.filename}, size: {file.size} bytes, hash: {file_hash}")
             
-            logger.info(f"File uploaded: {file.filename}, size: {file.size} bytes")
-            
-            # 生成报告
-            result = await report_service.generate_report(temp_file_path, question)
+            # 生成报告（客户端断开时取消在途的模型调用）
+            cancel_token = CancellationToken()
+            watcher = asyncio.create_task(watch_disconnect(request, cancel_token))
+            try:
+                result = await report_service.generate_report(pdf_source, question, cancel_token=cancel_token)
+            finally:
+                watcher.cancel()
+            await _add_report_ref(file_hash, result["report_id"])
+            background_tasks.add_task(run_report_maintenance)
+            if request_profiler is not None:
+                result["profile"] = await _finish_profiler(request_profiler, result["report_id"])
+            if memory_profile is not None:
+                result["memory_profile"] = await _finish_memory_profile(memory_profile, result["report_id"])
             
             return StandardResponse(
                 code=200,
@@ -54,26 +145,35 @@ async def generate_report(
                 data=result
             )
             
+        except ReportCancelledError:
+            # 客户端已断开，响应不会被接收
+            raise HTTPException(status_code=499, detail="客户端已断开连接")
         finally:
-            # 清理临时文件
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
+            await run_io(upload_store.remove_ref, upload_ref, file_hash)
+            background_tasks.add_task(upload_store.evict_if_needed)
                 
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error generating report: {e}")
         raise HTTPException(status_code=500, detail="生成报告失败")
+    finally:
+        if request_profiler is not None:
+            request_profiler.stop()
+        if memory_profile is not None:
+            memory_profile.stop()
 
 @router.get("/download_report/{report_id}")
-async def download_report(report_id: str):
-    """下载报告文件"""
+async def download_report(report_id: str, request: Request):
+    """下载报告文件（按Accept-Encoding协商，压缩存储的报告直接发送压缩内容）"""
     try:
         # 获取报告内容
-        report_content = report_service.get_report(report_id)
+        body, content_encoding = await run_io(
+            report_service.get_report_encoded, report_id, request.headers.get("accept-encoding")
+        )
         
         # 获取报告标题用于文件名
-        report_title = report_service.get_report_title(report_id)
+        report_title = await run_io(report_service.get_report_title, report_id)
         
         # 清理文件名中的特殊字符，确保文件名合法
         import re
@@ -89,52 +189,16 @@ async def download_report(report_id: str):
         # URL编码中文文件名用于filename*参数
         encoded_filename = urllib.parse.quote(safe_filename)
         
-        # 创建临时文件用于下载
-        temp_file_path = None
-        try:
-            # 创建临时文件并写入内容
-            temp_file_path = tempfile.mktemp(suffix='.md')
-            with open(temp_file_path, 'w', encoding='utf-8') as temp_file:
-                temp_file.write(report_content)
-            
-            async def cleanup_temp_file():
-                """异步清理临时文件的函数"""
-                try:
-                    if os.path.exists(temp_file_path):
-                        os.unlink(temp_file_path)
-                        logger.info(f"Cleaned up temp file: {temp_file_path}")
-                except Exception as e:
-                    logger.warning(f"Failed to cleanup temp file {temp_file_path}: {e}")
-            
-            def file_generator():
-                try:
-                    with open(temp_file_path, 'rb') as f:
-                        yield from f
-                except Exception as e:
-                    logger.error(f"Error reading file {temp_file_path}: {e}")
-                    raise
-                finally:
-                    # Ensure cleanup happens even if client disconnects or error occurs
-                    try:
-                        if os.path.exists(temp_file_path):
-                            os.unlink(temp_file_path)
-                            logger.info(f"Cleaned up temp file: {temp_file_path}")
-                    except Exception as e:
-                        logger.warning(f"Failed to cleanup temp file {temp_file_path}: {e}")
-            
-            return StreamingResponse(
-                file_generator(),
-                media_type="text/markdown",
-                headers={
-                    "Content-Disposition": f'attachment; filename="{english_filename}.md"; filename*=UTF-8\'\'{encoded_filename}.md',
-                    "Access-Control-Expose-Headers": "Content-Disposition"
-                }
-            )
-            
-        except Exception as e:
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
-            raise e
+        headers = {
+            "Content-Disposition": f'attachment; filename="{english_filename}.md"; filename*=UTF-8\'\'{encoded_filename}.md',
+            "Access-Control-Expose-Headers": "Content-Disposition",
+            "Vary": "Accept-Encoding"
+        }
+        if content_encoding:
+            # 存储的压缩字节原样发送，不重新压缩
+            headers["Content-Encoding"] = content_encoding
+        
+        return Response(content=body, media_type="text/markdown; charset=utf-8", headers=headers)
             
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="报告不存在")
@@ -146,7 +210,7 @@ async def download_report(report_id: str):
 async def list_reports():
     """获取报告列表"""
     try:
-        reports = report_service.list_reports()
+        reports = await run_io(report_service.list_reports)
         
         return StandardResponse(
             code=200,
@@ -161,22 +225,69 @@ async def list_reports():
         logger.error(f"Error listing reports: {e}")
         raise HTTPException(status_code=500, detail="获取报告列表失败")
 
+@router.post("/reports/maintenance", response_model=StandardResponse)
+async def report_maintenance():
+    """立即执行报告保留策略与归档"""
+    try:
+        return StandardResponse(
+            code=200,
+            msg="success",
+            data=await run_io(run_report_maintenance, force=True)
+        )
+    except Exception as e:
+        logger.error(f"Error running report maintenance: {e}")
+        raise HTTPException(status_code=500, detail="报告维护失败")
+
+@router.get("/reports/search", response_model=StandardResponse)
+async def search_reports(
+    q: str = Query(..., min_length=1, max_length=200, description="检索关键词"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100)
+):
+    """全文检索报告（问题、标题、正文），按相关度排序分页返回"""
+    try:
+        return StandardResponse(
+            code=200,
+            msg="success",
+            data=await run_io(report_service.search_reports, q, page, page_size)
+        )
+    except Exception as e:
+        logger.error(f"Error searching reports: {e}")
+        raise HTTPException(status_code=500, detail="检索报告失败")
+
+@router.get("/reports/stats", response_model=StandardResponse)
+async def get_report_stats(
+    since: Optional[str] = Query(None, description="起始时间，格式 YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS"),
+    prompt_version: Optional[str] = Query(None, description="按提示词版本过滤"),
+    model: Optional[str] = Query(None, description="按使用的模型过滤")
+):
+    """跨报告汇总阶段耗时、模型调用延迟、token用量、重试与缓存命中"""
+    try:
+        return StandardResponse(
+            code=200,
+            msg="success",
+            data=await run_io(report_service.aggregate_stats, since, prompt_version, model)
+        )
+    except Exception as e:
+        logger.error(f"Error aggregating report stats: {e}")
+        raise HTTPException(status_code=500, detail="汇总报告统计失败")
+
 @router.get("/reports/{report_id}", response_model=StandardResponse)
 async def get_report(report_id: str):
     """获取报告详情"""
     try:
-        report_content = report_service.get_report(report_id)
-        metadata = report_service.get_report_metadata(report_id)
-        created_at = report_service.get_report_created_at(report_id)
+        def load_report():
+            return {
+                "report_id": report_id,
+                "content": report_service.get_report(report_id),
+                "report_metadata": report_service.get_report_metadata(report_id),
+                "created_at": report_service.get_report_created_at(report_id)
+            }
+        
         return StandardResponse(
             code=200,
             msg="success",
-            data={
-                "report_id": report_id,
-                "content": report_content,
-                "report_metadata": metadata,
-                "created_at": created_at
-            }
+            data=await run_io(load_report)
         )
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="报告不存在")
@@ -184,17 +295,58 @@ async def get_report(report_id: str):
         logger.error(f"Error getting report {report_id}: {e}")
         raise HTTPException(status_code=500, detail="获取报告失败")
 
+@router.get("/reports/{report_id}/profile")
+async def download_profile(
+    report_id: str,
+    format: str = Query(
+        "speedscope", pattern="^(speedscope|collapsed|memory)$",
+        description="speedscope、collapsed（折叠栈）或 memory（按阶段的内存剖析）"
+    )
+):
+    """下载生成报告时采集的剖析结果（需在生成请求中开启剖析或内存剖析）"""
+    try:
+        path = await run_io(report_service.get_profile_path, report_id, format)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="剖析结果不存在")
+    if format == "speedscope":
+        return FileResponse(path, media_type="application/json", filename=f"{report_id}.speedscope.json")
+    if format == "memory":
+        return FileResponse(path, media_type="application/json", filename=f"{report_id}.memory.json")
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=f"{report_id}.collapsed.txt")
+
+@router.post("/reports/{report_id}/resume", response_model=StandardResponse)
+async def resume_report(report_id: str, request: Request):
+    """从检查点恢复报告生成，只处理缺失或失败的片段"""
+    try:
+        cancel_token = CancellationToken()
+        watcher = asyncio.create_task(watch_disconnect(request, cancel_token))
+        try:
+            result = await report_service.resume_report(report_id, cancel_token=cancel_token)
+        finally:
+            watcher.cancel()
+        
+        return StandardResponse(
+            code=200,
+            msg="success",
+            data=result
+        )
+        
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="报告检查点不存在")
+    except CheckpointInUseError:
+        raise HTTPException(status_code=409, detail="该报告正在生成中")
+    except ReportCancelledError:
+        raise HTTPException(status_code=499, detail="客户端已断开连接")
+    except Exception as e:
+        logger.error(f"Error resuming report {report_id}: {e}")
+        raise HTTPException(status_code=500, detail="恢复报告失败")
+
 @router.delete("/reports/{report_id}", response_model=StandardResponse)
 async def delete_report(report_id: str):
     """删除报告"""
     try:
-        report_file_path = os.path.join(settings.reports_dir, f"{report_id}.md")
-        
-        if not os.path.exists(report_file_path):
-            raise HTTPException(status_code=404, detail="报告不存在")
-        
-        os.remove(report_file_path)
-        logger.info(f"Report deleted: {report_id}")
+        await run_io(report_service.delete_report, report_id)
+        await run_io(upload_store.remove_ref, f"{UploadStore.REPORT_REF}{report_id}")
         
         return StandardResponse(
             code=200,
@@ -202,12 +354,133 @@ async def delete_report(report_id: str):
             data={"deleted": True}
         )
         
-    except HTTPException:
-        raise
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="报告不存在")
     except Exception as e:
         logger.error(f"Error deleting report {report_id}: {e}")
         raise HTTPException(status_code=500, detail="删除报告失败")
 
+@router.post("/documents", response_model=StandardResponse)
+async def create_document(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(..., description="PDF文件")
+):
+    """上传文档：保存PDF并完成提取与分片，返回document_id供多次提问"""
+    try:
+        # 验证文件类型
+        if not file.filename.lower().endswith('.pdf'):
+            raise HTTPException(status_code=400, detail="只支持PDF文件")
+        
+        # 验证文件大小
+        if file.size > settings.max_file_size:
+            raise HTTPException(status_code=400, detail="文件大小超过限制")
+        
+        upload_ref = f"upload:{uuid.uuid4().hex}"
+        file_hash, pdf_source = await _store_upload(file, upload_ref)
+        try:
+            logger.info(f"Document uploaded: {file.filename}, size: {file.size} bytes, hash: {file_hash}")
+            # 解析在CPU池中完成，写入文档文件在I/O池中完成
+            with span("parse"):
+                parsed = await run_cpu(document_service.pdf_service.process_pdf_with_info, pdf_source)
+            document = await run_io(
+                document_service.create_document, pdf_source, file.filename,
+                source_hash=file_hash, parsed=parsed
+            )
+            
+            return StandardResponse(
+                code=200,
+                msg="success",
+                data=document
+            )
+            
+        finally:
+            await run_io(upload_store.remove_ref, upload_ref, file_hash)
+            background_tasks.add_task(upload_store.evict_if_needed)
+                
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error creating document: {e}")
+        raise HTTPException(status_code=500, detail="上传文档失败")
+
+@router.get("/documents/{document_id}", response_model=StandardResponse)
+async def get_document(document_id: str):
+    """获取文档信息"""
+    try:
+        return StandardResponse(
+            code=200,
+            msg="success",
+            data=await run_io(document_service.get_document, document_id)
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="文档不存在")
+
+@router.post("/documents/{document_id}/reports", response_model=StandardResponse)
+async def generate_document_report(
+    document_id: str,
+    body: GenerateReportRequest,
+    request: Request,
+    background_tasks: BackgroundTasks
+):
+    """基于已上传的文档生成研究报告，复用已提取的分片与相关度索引"""
+    request_profiler = _start_profiler(request)
+    memory_profile = _start_memory_profile(request)
+    try:
+        document = await run_io(document_service.load_for_report, document_id)
+        
+        cancel_token = CancellationToken()
+        watcher = asyncio.create_task(watch_disconnect(request, cancel_token))
+        try:
+            result = await report_service.generate_report_from_chunks(
+                document["chunks"],
+                body.question,
+                chunk_terms=document["chunk_terms"],
+                document_hash=document["meta"]["document_hash"],
+                cancel_token=cancel_token
+            )
+        finally:
+            watcher.cancel()
+        await _add_report_ref(document["meta"].get("source_hash"), result["report_id"])
+        background_tasks.add_task(run_report_maintenance)
+        if request_profiler is not None:
+            result["profile"] = await _finish_profiler(request_profiler, result["report_id"])
+        if memory_profile is not None:
+            result["memory_profile"] = await _finish_memory_profile(memory_profile, result["report_id"])
+        
+        return StandardResponse(
+            code=200,
+            msg="success",
+            data=result
+        )
+        
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="文档不存在")
+    except ReportCancelledError:
+        raise HTTPException(status_code=499, detail="客户端已断开连接")
+    except Exception as e:
+        logger.error(f"Error generating report for document {document_id}: {e}")
+        raise HTTPException(status_code=500, detail="生成报告失败")
+    finally:
+        if request_profiler is not None:
+            request_profiler.stop()
+        if memory_profile is not None:
+            memory_profile.stop()
+
+@router.delete("/documents/{document_id}", response_model=StandardResponse)
+async def delete_document(document_id: str):
+    """删除文档"""
+    try:
+        await run_io(document_service.delete_document, document_id)
+        return StandardResponse(
+            code=200,
+            msg="success",
+            data={"deleted": True}
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="文档不存在")
+
 @router.get("/health", response_model=StandardResponse)
 async def health_check():
     """健康检查"""
@@ -220,11 +493,20 @@ async def health_check():
         }
     )
 
+@router.get("/llm/stats", response_model=StandardResponse)
+async def get_llm_stats():
+    """获取LLM端点负载与对冲统计"""
+    return StandardResponse(
+        code=200,
+        msg="success",
+        data=report_service.get_llm_stats()
+    )
+
 @router.get("/prompts/versions", response_model=StandardResponse)
 async def get_prompt_versions():
     """获取可用的提示词版本列表"""
     try:
-        versions = prompt_service.get_available_prompt_versions()
+        versions = await run_io(prompt_service.get_available_prompt_versions)
         return StandardResponse(
             code=200,
             msg="success",
@@ -241,7 +523,7 @@ async def get_prompt_versions():
 async def get_prompt_info(version: str):
     """获取指定提示词版本的详细信息"""
     try:
-        info = prompt_service.get_prompt_info(version)
+        info = await run_io(prompt_service.get_prompt_info, version)
         if "error" in info:
             raise HTTPException(status_code=404, detail=info["error"])
         
@@ -260,7 +542,7 @@ async def get_prompt_info(version: str):
 async def get_current_prompt_info():
     """获取当前使用的提示词信息"""
     try:
-        info = prompt_service.get_prompt_info()
+        info = await run_io(prompt_service.get_prompt_info)
         return StandardResponse(
             code=200,
             msg="success",
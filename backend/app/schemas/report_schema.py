@@ -11,12 +11,21 @@ class ReportMetadata(BaseModel):
     """报告元数据"""
     total_chunks: int = Field(..., description="总片段数")
     processed_chunks: int = Field(..., description="已处理片段数")
-    token_per_chunk: int = Field(..., description="每个片段的token数")
+    token_per_chunk: int = Field(..., description="每个片段的输出token上限（配置值）")
     chunk_size: int = Field(..., description="分片大小（字符数）")
     overlap_size: int = Field(..., description="重叠大小（字符数）")
     model_context_length: int = Field(..., description="模型上下文长度（tokens）")
     processing_time: float = Field(..., description="处理时间（秒）")
     model_used: str = Field(..., description="使用的模型")
+    model_usage: Optional[Dict[str, Dict[str, Any]]] = Field(None, description="各模型调用次数与延迟统计")
+    is_partial: bool = Field(False, description="是否为部分报告（超过请求时限）")
+    skipped_chunks: int = Field(0, description="因超时未处理的片段数")
+    stage_timings: Optional[Dict[str, float]] = Field(None, description="各阶段耗时（秒）：parse/extract/clean/chunk/llm/combine/save")
+    llm_latency: Optional[Dict[str, Any]] = Field(None, description="单次模型调用延迟（秒）：calls/p50/p95/max")
+    prompt_tokens: int = Field(0, description="实际消耗的输入token数（来自response.usage）")
+    completion_tokens: int = Field(0, description="实际消耗的输出token数（来自response.usage）")
+    retried_chunks: int = Field(0, description="重试的失败片段数")
+    cache_hits: Optional[Dict[str, int]] = Field(None, description="缓存命中：checkpoint为从检查点恢复的片段数，document为复用已解析文档")
     created_at: datetime = Field(default_factory=datetime.now, description="创建时间")
     
     model_config = {
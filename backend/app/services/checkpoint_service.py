@@ -0,0 +1,302 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import List, Dict, Any, Optional, Set
+from loguru import logger
+from app.core.config import settings
+
+# 本进程中正被报告任务使用的检查点目录；同一检查点同时只由一个任务读写，
+# 避免相同请求并发时共用报告ID，先完成的任务删除检查点后另一个任务写入失败
+_in_use: Set[str] = set()
+_in_use_lock = threading.Lock()
+
+
+class CheckpointInUseError(Exception):
+    """检查点正被另一个报告任务使用"""
+    pass
+
+
+def compute_document_hash(chunks: List[str]) -> str:
+    """根据分片结果计算文档哈希（分片配置变化时哈希随之变化）"""
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def _dump_chunks(chunks: List[str], f):
+    """逐个写入分片的JSON数组（与json.dump结果一致），分片可以是落盘的ChunkSpool，不会整体读回内存"""
+    f.write("[")
+    for index, chunk in enumerate(chunks):
+        if index:
+            f.write(", ")
+        f.write(json.dumps(chunk, ensure_ascii=False))
+    f.write("]")
+
+
+def compute_checkpoint_key(document_hash: str, question: str, prompt_version: str) -> str:
+    """检查点键：文档哈希 + 问题 + 提示词版本"""
+    raw = f"{document_hash}\n{question}\n{prompt_version}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+class Checkpoint:
+    """单个报告任务的检查点：保存分片内容与每个片段的处理结果"""
+
+    MANIFEST_FILE = "manifest.json"
+    CHUNKS_FILE = "chunks.json"
+    RESULTS_FILE = "results.jsonl"
+
+    def __init__(self, directory: str, manifest: Dict[str, Any]):
+        self.directory = directory
+        self.manifest = manifest
+        # 片段序号 -> {"status": "ok"/"failed", "content": str, "attempts": int}
+        self.results: Dict[int, Dict[str, Any]] = {}
+        self._load_results()
+
+    @property
+    def key(self) -> str:
+        return self.manifest["key"]
+
+    @property
+    def report_id(self) -> str:
+        return self.manifest["report_id"]
+
+    @property
+    def question(self) -> str:
+        return self.manifest["question"]
+
+    def _load_results(self):
+        """回放结果日志，同一片段以最后一条为准"""
+        path = os.path.join(self.directory, self.RESULTS_FILE)
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程中断可能留下不完整的最后一行
+                    logger.warning(f"Skipping corrupt checkpoint line in {path}")
+                    continue
+                self.results[entry["index"]] = entry
+
+    def load_chunks(self) -> List[str]:
+        """读取保存的分片内容"""
+        with open(os.path.join(self.directory, self.CHUNKS_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def completed_results(self) -> Dict[int, str]:
+        """已成功处理的片段结果"""
+        return {
+            index: entry.get("content", "")
+            for index, entry in self.results.items()
+            if entry.get("status") == "ok"
+        }
+
+    def attempts(self, index: int) -> int:
+        entry = self.results.get(index)
+        return entry.get("attempts", 0) if entry else 0
+
+    def pending_indices(self, total_chunks: int, max_retries: int) -> List[int]:
+        """需要（重新）处理的片段：缺失的片段，以及重试预算未用完的失败片段"""
+        pending = []
+        for index in range(total_chunks):
+            entry = self.results.get(index)
+            if entry is None:
+                pending.append(index)
+            elif entry.get("status") != "ok" and entry.get("attempts", 0) <= max_retries:
+                pending.append(index)
+        return pending
+
+    def record(self, index: int, content: Optional[str]):
+        """追加一条片段结果；content为None表示处理失败"""
+        entry = {
+            "index": index,
+            "status": "ok" if content is not None else "failed",
+            "content": content or "",
+            "attempts": self.attempts(index) + 1,
+            "updated_at": time.time()
+        }
+        self.results[index] = entry
+        with open(os.path.join(self.directory, self.RESULTS_FILE), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class CheckpointStore:
+    """基于文件的检查点存储，按检查点键分目录保存"""
+
+    def __init__(self, base_dir: str = None):
+        self.base_dir = base_dir
+
+    @property
+    def root(self) -> str:
+        return self.base_dir or settings.checkpoint_dir
+
+    def _checkpoint_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def _report_ref_path(self, report_id: str) -> str:
+        return os.path.join(self.root, "by_report", f"{report_id}.key")
+
+    @staticmethod
+    def _claim_directory(directory: str) -> bool:
+        with _in_use_lock:
+            if directory in _in_use:
+                return False
+            _in_use.add(directory)
+            return True
+
+    def claim(self, checkpoint: Checkpoint):
+        """占用检查点直到release；已被其他任务占用时抛出CheckpointInUseError"""
+        if not self._claim_directory(checkpoint.directory):
+            raise CheckpointInUseError(f"Checkpoint {checkpoint.key} is in use by another report run")
+
+    @staticmethod
+    def _release_directory(directory: str):
+        with _in_use_lock:
+            _in_use.discard(directory)
+
+    def release(self, checkpoint: Checkpoint):
+        """释放open或claim占用的检查点（可重复调用）"""
+        self._release_directory(checkpoint.directory)
+
+    def open(
+        self,
+        document_hash: str,
+        question: str,
+        prompt_version: str,
+        chunks: List[str],
+        report_id: str
+    ) -> Checkpoint:
+        """打开（或创建）并占用检查点，已存在时沿用其中的报告ID；检查点正被使用时抛出CheckpointInUseError"""
+        key = compute_checkpoint_key(document_hash, question, prompt_version)
+        directory = self._checkpoint_dir(key)
+        manifest_path = os.path.join(directory, Checkpoint.MANIFEST_FILE)
+        if not self._claim_directory(directory):
+            raise CheckpointInUseError(f"Checkpoint {key} is in use by another report run")
+        try:
+            if os.path.exists(manifest_path):
+                with open(manifest_path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+                checkpoint = Checkpoint(directory, manifest)
+                logger.info(
+                    f"Resuming from checkpoint {key}: "
+                    f"{len(checkpoint.completed_results())}/{manifest['total_chunks']} chunks already done"
+                )
+                return checkpoint
+
+            os.makedirs(directory, exist_ok=True)
+            manifest = {
+                "key": key,
+                "report_id": report_id,
+                "question": question,
+                "prompt_version": prompt_version,
+                "document_hash": document_hash,
+                "total_chunks": len(chunks),
+                "created_at": time.time()
+            }
+            with open(os.path.join(directory, Checkpoint.CHUNKS_FILE), "w", encoding="utf-8") as f:
+                _dump_chunks(chunks, f)
+            # manifest最后写入，存在即表示检查点完整可用
+            with open(manifest_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False)
+
+            os.makedirs(os.path.dirname(self._report_ref_path(report_id)), exist_ok=True)
+            with open(self._report_ref_path(report_id), "w", encoding="utf-8") as f:
+                f.write(key)
+            return Checkpoint(directory, manifest)
+        except BaseException:
+            self._release_directory(directory)
+            raise
+
+    def get_by_report(self, report_id: str) -> Optional[Checkpoint]:
+        """根据报告ID查找检查点"""
+        ref_path = self._report_ref_path(report_id)
+        if not os.path.exists(ref_path):
+            return None
+        with open(ref_path, "r", encoding="utf-8") as f:
+            key = f.read().strip()
+        manifest_path = os.path.join(self._checkpoint_dir(key), Checkpoint.MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        return Checkpoint(self._checkpoint_dir(key), manifest)
+
+    def complete(self, checkpoint: Checkpoint, keep_seconds: float = 0):
+        """报告已完整保存：keep_seconds为0时删除检查点，否则标记完成时间，到期后由sweep删除"""
+        if keep_seconds <= 0:
+            self.delete_by_report(checkpoint.report_id)
+            return
+        checkpoint.manifest["completed_at"] = time.time()
+        manifest_path = os.path.join(checkpoint.directory, Checkpoint.MANIFEST_FILE)
+        tmp_path = f"{manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint.manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, manifest_path)
+
+    def _last_activity(self, directory: str) -> float:
+        """检查点最后一次写入的时间（manifest与结果日志的修改时间）"""
+        latest = 0.0
+        for name in (Checkpoint.MANIFEST_FILE, Checkpoint.RESULTS_FILE):
+            try:
+                latest = max(latest, os.path.getmtime(os.path.join(directory, name)))
+            except OSError:
+                continue
+        return latest
+
+    def sweep(self, ttl: float, completed_ttl: float = 0, now: float = None) -> List[str]:
+        """删除过期的检查点，返回被删除的检查点键
+
+        - 已完成的检查点：完成时间超过completed_ttl
+        - 未完成的检查点（部分报告、失败片段或中断的任务）：最后一次写入超过ttl（ttl为0时不清理）
+        - 没有manifest的目录（创建中途中断）同样按最后修改时间清理
+        """
+        now = now if now is not None else time.time()
+        if not os.path.isdir(self.root):
+            return []
+        expired = []
+        for key in os.listdir(self.root):
+            directory = self._checkpoint_dir(key)
+            if key == "by_report" or not os.path.isdir(directory) or directory in _in_use:
+                continue
+            manifest = None
+            try:
+                with open(os.path.join(directory, Checkpoint.MANIFEST_FILE), "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                pass
+            completed_at = manifest.get("completed_at") if manifest else None
+            if completed_at is not None:
+                is_expired = now - completed_at >= completed_ttl
+            else:
+                last = self._last_activity(directory) or os.path.getmtime(directory)
+                is_expired = ttl > 0 and now - last >= ttl
+            if not is_expired:
+                continue
+            shutil.rmtree(directory, ignore_errors=True)
+            if manifest and manifest.get("report_id"):
+                ref_path = self._report_ref_path(manifest["report_id"])
+                if os.path.exists(ref_path):
+                    os.remove(ref_path)
+            expired.append(key)
+        if expired:
+            logger.info(f"Expired {len(expired)} checkpoint(s)")
+        return expired
+
+    def delete_by_report(self, report_id: str):
+        """删除报告对应的检查点"""
+        checkpoint = self.get_by_report(report_id)
+        if checkpoint is not None:
+            shutil.rmtree(checkpoint.directory, ignore_errors=True)
+        ref_path = self._report_ref_path(report_id)
+        if os.path.exists(ref_path):
+            os.remove(ref_path)
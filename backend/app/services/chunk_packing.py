@@ -0,0 +1,102 @@
+import re
+from dataclasses import dataclass
+from typing import List, Dict, Optional
+
+# 输入中的片段分隔标记
+SECTION_START = "<<<片段 {number}>>>"
+SECTION_END = "<<<片段 {number} 结束>>>"
+
+# 输出中的片段标记，形如 "=== 片段 3 ==="
+_OUTPUT_MARKER = re.compile(r'^\s*=+\s*片段\s*(\d+)\s*=+\s*$', re.MULTILINE)
+
+
+@dataclass
+class ChunkBatch:
+    """一次模型调用要处理的片段（单个或打包的多个）"""
+    indices: List[int]
+    contents: List[str]
+
+    @property
+    def is_packed(self) -> bool:
+        return len(self.indices) > 1
+
+    @property
+    def total_chars(self) -> int:
+        return sum(len(content) for content in self.contents)
+
+
+class ChunkPacker:
+    """小片段打包：把相邻的多个小片段合并到一次调用中"""
+
+    def __init__(self, small_chunk_chars: int, budget_chars: int, max_chunks: int = 8):
+        self.small_chunk_chars = small_chunk_chars
+        self.budget_chars = budget_chars
+        self.max_chunks = max(1, max_chunks)
+
+    def pack(self, chunks: List[str], indices: Optional[List[int]] = None) -> List[ChunkBatch]:
+        """按顺序贪心打包：连续的小片段在字符预算内合并，大片段单独成批
+
+        indices为各片段在原文档中的序号，默认为0..n-1
+        """
+        batches = []
+        current: Optional[ChunkBatch] = None
+        indices = indices if indices is not None else list(range(len(chunks)))
+
+        for i, chunk in zip(indices, chunks):
+            if len(chunk) >= self.small_chunk_chars:
+                if current:
+                    batches.append(current)
+                    current = None
+                batches.append(ChunkBatch([i], [chunk]))
+                continue
+
+            if current and (
+                len(current.indices) >= self.max_chunks
+                or current.total_chars + len(chunk) > self.budget_chars
+            ):
+                batches.append(current)
+                current = None
+
+            if current is None:
+                current = ChunkBatch([i], [chunk])
+            else:
+                current.indices.append(i)
+                current.contents.append(chunk)
+
+        if current:
+            batches.append(current)
+        return batches
+
+    @staticmethod
+    def format_sections(batch: ChunkBatch) -> str:
+        """用分隔标记拼接批次内的片段内容（片段编号从1开始）"""
+        sections = []
+        for index, content in zip(batch.indices, batch.contents):
+            number = index + 1
+            sections.append(f"{SECTION_START.format(number=number)}\n{content}\n{SECTION_END.format(number=number)}")
+        return "\n\n".join(sections)
+
+    @staticmethod
+    def split_response(response: str, indices: List[int]) -> Dict[int, Optional[str]]:
+        """把打包调用的输出拆回各片段
+
+        - 找到标记的片段得到各自内容，缺失的片段为None（视为处理失败）
+        - 输出中完全没有标记时，整段内容归入第一个片段，其余片段为None，
+          无法确认模型是否处理了这些片段，按失败计入并在从检查点续跑时重新处理
+        """
+        markers = list(_OUTPUT_MARKER.finditer(response))
+        if not markers:
+            parts: Dict[int, Optional[str]] = {index: None for index in indices}
+            parts[indices[0]] = response.strip() or None
+            return parts
+
+        wanted = {index + 1: index for index in indices}
+        parts: Dict[int, Optional[str]] = {index: None for index in indices}
+        for i, marker in enumerate(markers):
+            number = int(marker.group(1))
+            if number not in wanted:
+                continue
+            end = markers[i + 1].start() if i + 1 < len(markers) else len(response)
+            content = response[marker.end():end].strip()
+            parts[wanted[number]] = content or None
+        return parts
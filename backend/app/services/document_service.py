@@ -0,0 +1,174 @@
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import List, Dict, Any, Optional, Set, Tuple
+from loguru import logger
+from app.core.config import settings
+from app.services.pdf_service import PDFService, PDFSource
+from app.services.checkpoint_service import compute_document_hash
+from app.services.upload_store import UploadStore
+from app.utils.tokenizer import term_set
+
+# 文档ID为 uuid4().hex；拼接路径前校验，避免 ../ 等路径穿越
+_DOCUMENT_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class DocumentService:
+    """文档会话服务：上传一次PDF，保存分片结果，供多个问题复用
+
+    原始PDF保存在上传存储中（按内容哈希去重，文档持有 document:{document_id} 引用），
+    每个文档的处理结果保存在 documents_dir/{document_id}/ 下：
+    - chunks.json: 分片后的文本
+    - terms.json: 每个片段的词项（相关度索引，用于模型路由）
+    - meta.json: 文档信息与最近访问时间（用于LRU淘汰）
+    """
+
+    CHUNKS_FILE = "chunks.json"
+    TERMS_FILE = "terms.json"
+    META_FILE = "meta.json"
+
+    def __init__(self, upload_store: UploadStore = None):
+        self.pdf_service = PDFService()
+        self.upload_store = upload_store or UploadStore()
+
+    def _document_dir(self, document_id: str) -> str:
+        if not _DOCUMENT_ID.fullmatch(document_id):
+            raise FileNotFoundError(f"Document not found: {document_id}")
+        return os.path.join(settings.documents_dir, document_id)
+
+    def _read_json(self, document_id: str, filename: str):
+        path = os.path.join(self._document_dir(document_id), filename)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Document not found: {document_id}")
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_json(self, document_id: str, filename: str, data):
+        with open(os.path.join(self._document_dir(document_id), filename), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    def create_document(
+        self,
+        pdf_source: PDFSource,
+        filename: str = "",
+        source_hash: str = None,
+        parsed: Optional[Tuple[List[str], Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """完成PDF提取与分片，返回文档信息
+
+        pdf_source为PDF路径或字节内容；source_hash为PDF在上传存储中的哈希，未提供时先存入上传存储。
+        parsed为已完成的 (分片, PDF信息)，调用方已在CPU池中解析时传入，避免重复解析
+        """
+        document_id = uuid.uuid4().hex
+        directory = self._document_dir(document_id)
+        os.makedirs(directory, exist_ok=True)
+        ref = f"document:{document_id}"
+
+        try:
+            if source_hash is None:
+                if isinstance(pdf_source, str):
+                    with open(pdf_source, "rb") as f:
+                        pdf_source = f.read()
+                source_hash, _ = self.upload_store.put_bytes(pdf_source, ref=ref)
+            else:
+                self.upload_store.add_ref(source_hash, ref)
+
+            chunks, pdf_info = parsed or self.pdf_service.process_pdf_with_info(pdf_source)
+            if not chunks:
+                raise ValueError("PDF文件内容为空或无法解析")
+
+            self._write_json(document_id, self.CHUNKS_FILE, chunks)
+            self._write_json(document_id, self.TERMS_FILE, [sorted(term_set(chunk)) for chunk in chunks])
+
+            now = time.time()
+            meta = {
+                "document_id": document_id,
+                "filename": filename,
+                "page_count": pdf_info.get("page_count", 0),
+                "total_chunks": len(chunks),
+                "document_hash": compute_document_hash(chunks),
+                "source_hash": source_hash,
+                "created_at": now,
+                "last_accessed_at": now
+            }
+            meta["size_bytes"] = self._directory_size(directory)
+            self._write_json(document_id, self.META_FILE, meta)
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            self.upload_store.remove_ref(ref)
+            raise
+
+        logger.info(f"Document created: {document_id}, {meta['total_chunks']} chunks, {meta['size_bytes']} bytes")
+        self.evict_if_needed(keep={document_id})
+        return meta
+
+    def get_document(self, document_id: str) -> Dict[str, Any]:
+        """获取文档信息"""
+        return self._read_json(document_id, self.META_FILE)
+
+    def load_for_report(self, document_id: str) -> Dict[str, Any]:
+        """读取分片与相关度索引，并刷新最近访问时间"""
+        meta = self.get_document(document_id)
+        chunks: List[str] = self._read_json(document_id, self.CHUNKS_FILE)
+        try:
+            chunk_terms: Optional[List[Set[str]]] = [set(terms) for terms in self._read_json(document_id, self.TERMS_FILE)]
+        except FileNotFoundError:
+            chunk_terms = None
+
+        meta["last_accessed_at"] = time.time()
+        self._write_json(document_id, self.META_FILE, meta)
+        return {"meta": meta, "chunks": chunks, "chunk_terms": chunk_terms}
+
+    def delete_document(self, document_id: str):
+        """删除文档"""
+        directory = self._document_dir(document_id)
+        if not os.path.exists(os.path.join(directory, self.META_FILE)):
+            raise FileNotFoundError(f"Document not found: {document_id}")
+        shutil.rmtree(directory, ignore_errors=True)
+        self.upload_store.remove_ref(f"document:{document_id}")
+        logger.info(f"Document deleted: {document_id}")
+
+    def list_documents(self) -> List[Dict[str, Any]]:
+        """列出所有文档（按最近访问时间倒序）"""
+        documents = []
+        if not os.path.exists(settings.documents_dir):
+            return documents
+        for document_id in os.listdir(settings.documents_dir):
+            try:
+                documents.append(self.get_document(document_id))
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+        documents.sort(key=lambda meta: meta.get("last_accessed_at", 0), reverse=True)
+        return documents
+
+    def evict_if_needed(self, keep: Set[str] = None) -> List[str]:
+        """总占用超过配额时，按最近访问时间淘汰最久未用的文档"""
+        keep = keep or set()
+        documents = self.list_documents()
+        total_size = sum(meta.get("size_bytes", 0) for meta in documents)
+        evicted = []
+
+        for meta in reversed(documents):
+            if total_size <= settings.documents_quota_bytes:
+                break
+            if meta["document_id"] in keep:
+                continue
+            shutil.rmtree(self._document_dir(meta["document_id"]), ignore_errors=True)
+            self.upload_store.remove_ref(f"document:{meta['document_id']}")
+            total_size -= meta.get("size_bytes", 0)
+            evicted.append(meta["document_id"])
+
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} document(s) to stay under quota, total size now {total_size} bytes")
+        return evicted
+
+    @staticmethod
+    def _directory_size(directory: str) -> int:
+        return sum(
+            os.path.getsize(os.path.join(directory, name))
+            for name in os.listdir(directory)
+            if os.path.isfile(os.path.join(directory, name))
+        )
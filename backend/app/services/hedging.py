@@ -0,0 +1,135 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Any, Optional, TypeVar
+from loguru import logger
+from app.core.config import settings
+from app.utils.metrics import percentile
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """滑动窗口延迟统计"""
+
+    def __init__(self, window: int = 500):
+        self._samples = deque(maxlen=window)
+
+    def record(self, latency: float):
+        """记录一次延迟样本"""
+        self._samples.append(latency)
+
+    @property
+    def count(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, quantile: float) -> Optional[float]:
+        """计算分位数（最近秩法），无样本时返回None"""
+        return percentile(self._samples, quantile)
+
+
+class RequestHedger:
+    """对冲请求：超过运行中的p95延迟仍未返回时发出副本请求，取先完成者"""
+
+    def __init__(
+        self,
+        quantile: float = 0.95,
+        budget_ratio: float = 0.1,
+        min_samples: int = 20,
+        min_delay: float = 1.0,
+        window: int = 500
+    ):
+        self.quantile = quantile
+        self.budget_ratio = budget_ratio
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.latency_tracker = LatencyTracker(window)
+
+        # 计数器
+        self.primary_requests = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self.hedges_skipped = 0
+
+    @classmethod
+    def from_settings(cls) -> "RequestHedger":
+        """根据全局配置创建对冲器"""
+        return cls(
+            quantile=settings.llm_hedge_quantile,
+            budget_ratio=settings.llm_hedge_budget_ratio,
+            min_samples=settings.llm_hedge_min_samples,
+            min_delay=settings.llm_hedge_min_delay,
+            window=settings.llm_latency_window
+        )
+
+    def hedge_delay(self) -> Optional[float]:
+        """发出对冲请求前的等待时间，样本不足时不对冲"""
+        if self.latency_tracker.count < self.min_samples:
+            return None
+        return max(self.min_delay, self.latency_tracker.percentile(self.quantile))
+
+    def _has_budget(self) -> bool:
+        """额外请求数是否仍在预算内"""
+        return self.hedges_fired < self.budget_ratio * self.primary_requests
+
+    async def _timed(self, call: Callable[[], Awaitable[T]]) -> T:
+        """执行调用并在成功时记录延迟"""
+        start_time = time.monotonic()
+        result = await call()
+        self.latency_tracker.record(time.monotonic() - start_time)
+        return result
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        """执行一次（可能被对冲的）调用"""
+        self.primary_requests += 1
+        primary = asyncio.ensure_future(self._timed(call))
+        delay = self.hedge_delay()
+
+        try:
+            if delay is None:
+                return await primary
+
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+
+            if not self._has_budget():
+                self.hedges_skipped += 1
+                return await primary
+
+            self.hedges_fired += 1
+            logger.info(f"LLM call exceeded p{int(self.quantile * 100)} ({delay:.2f}s), firing hedged request")
+            hedge = asyncio.ensure_future(self._timed(call))
+            return await self._first_success(primary, hedge)
+        finally:
+            if not primary.done():
+                primary.cancel()
+
+    async def _first_success(self, primary: "asyncio.Future[T]", hedge: "asyncio.Future[T]") -> T:
+        """返回最先成功的结果并取消另一个请求；两者都失败时抛出主请求的异常"""
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is None:
+                        if task is hedge:
+                            self.hedges_won += 1
+                        return task.result()
+            # 两个请求都失败
+            return primary.result()
+        finally:
+            for task in (primary, hedge):
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取对冲统计"""
+        return {
+            "primary_requests": self.primary_requests,
+            "hedges_fired": self.hedges_fired,
+            "hedges_won": self.hedges_won,
+            "hedges_skipped": self.hedges_skipped,
+            "hedge_delay": self.hedge_delay(),
+            "latency_samples": self.latency_tracker.count
+        }
@@ -0,0 +1,260 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+from loguru import logger
+from app.core.config import settings
+
+
+class ReplayedLLMError(Exception):
+    """回放录制时失败的模型调用"""
+
+
+class ReplayedLLMTimeout(ReplayedLLMError, TimeoutError):
+    """回放录制时超时的模型调用（或缩放后的延迟超过本次调用的超时时间）"""
+
+
+def request_key(request: Dict[str, Any]) -> str:
+    """请求指纹：模型、消息与生成参数完全一致时相同"""
+    payload = json.dumps(
+        {name: request.get(name) for name in ("model", "messages", "max_tokens", "temperature")},
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _response_fields(response) -> Dict[str, Any]:
+    choice = response.choices[0]
+    usage = getattr(response, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    return {
+        "content": choice.message.content,
+        "finish_reason": getattr(choice, "finish_reason", None),
+        "usage": {
+            "prompt_tokens": prompt_tokens if isinstance(prompt_tokens, int) else None,
+            "completion_tokens": completion_tokens if isinstance(completion_tokens, int) else None
+        }
+    }
+
+
+def _build_response(entry: Dict[str, Any]):
+    """按录制内容构造与 openai ChatCompletion 字段一致的响应对象"""
+    recorded = entry["response"]
+    usage = recorded.get("usage") or {}
+    return SimpleNamespace(
+        model=entry["request"].get("model"),
+        choices=[SimpleNamespace(
+            index=0,
+            finish_reason=recorded.get("finish_reason"),
+            message=SimpleNamespace(role="assistant", content=recorded.get("content"))
+        )],
+        usage=SimpleNamespace(
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens")
+        ) if usage.get("prompt_tokens") is not None else None
+    )
+
+
+class _Completions:
+    def __init__(self, owner: "CassetteClient"):
+        self._owner = owner
+
+    def create(self, **kwargs):
+        return self._owner.create(**kwargs)
+
+
+class CassetteClient:
+    """替换端点客户端：录制模式下转发给真实客户端并记录，回放模式下直接返回录制结果"""
+
+    def __init__(self, cassette: "LLMCassette", inner: Any = None):
+        self.cassette = cassette
+        self.inner = inner
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def create(self, **kwargs):
+        if self.cassette.mode == "replay":
+            return self.cassette.replay(kwargs)
+        started = time.time()
+        start = time.monotonic()
+        try:
+            response = self.inner.chat.completions.create(**kwargs)
+        except Exception as e:
+            self.cassette.record(kwargs, started, time.monotonic() - start, error=e)
+            raise
+        self.cassette.record(kwargs, started, time.monotonic() - start, response=response)
+        return response
+
+
+class LLMCassette:
+    """模型调用录制与回放
+
+    录制模式把每次调用的请求、响应、token用量与耗时追加到JSONL录制文件；回放模式不发起网络请求，
+    按录制的耗时（乘以time_scale）等待后返回录制的响应或错误。回放时优先匹配完全相同的请求，
+    匹配不到时按录制顺序取下一条（strict为真时报错），以便在改动提示词或分片后仍能回放真实的延迟与输出长度。
+    """
+
+    MODES = ("record", "replay")
+
+    def __init__(self, path: str, mode: str, time_scale: float = 1.0, strict: bool = False):
+        if mode not in self.MODES:
+            raise ValueError(f"不支持的录制回放模式: {mode}")
+        self.path = path
+        self.mode = mode
+        self.time_scale = max(0.0, time_scale)
+        self.strict = strict
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.replayed = 0
+        self.exact_hits = 0
+        self.fallbacks = 0
+        self.entries: List[Dict[str, Any]] = []
+        self._by_key: Dict[str, List[int]] = defaultdict(list)
+        # 每个请求键下一条可能未用过的录制位置，之前的都已用过
+        self._key_cursor: Dict[str, int] = {}
+        self._used: List[bool] = []
+        self._cursor = 0
+        if mode == "replay":
+            self._load()
+
+    @classmethod
+    def from_settings(cls) -> Optional["LLMCassette"]:
+        """根据全局配置创建，关闭时返回None"""
+        if settings.llm_cassette_mode == "off":
+            return None
+        cassette = cls(
+            settings.llm_cassette_path,
+            settings.llm_cassette_mode,
+            time_scale=settings.llm_cassette_time_scale,
+            strict=settings.llm_cassette_strict
+        )
+        logger.info(f"LLM cassette {cassette.mode} mode: {cassette.path}")
+        return cassette
+
+    def client_factory(self, base_factory: Callable[[str, str], Any]) -> Callable[[str, str], Any]:
+        """包装端点池的客户端工厂；回放模式不创建真实客户端"""
+        if self.mode == "replay":
+            return lambda api_base, api_key: CassetteClient(self)
+        return lambda api_base, api_key: CassetteClient(self, base_factory(api_base, api_key))
+
+    # ---- 录制 ----
+
+    def record(self, request: Dict[str, Any], started: float, latency: float, response=None, error: Exception = None):
+        entry = {
+            "key": request_key(request),
+            "recorded_at": datetime.fromtimestamp(started).strftime("%Y-%m-%d %H:%M:%S"),
+            "started": round(started, 6),
+            "latency": round(latency, 6),
+            "request": {name: request.get(name) for name in ("model", "messages", "max_tokens", "temperature")},
+            "response": _response_fields(response) if response is not None else None,
+            "error": {
+                "type": type(error).__name__,
+                "message": str(error),
+                "status": getattr(error, "status_code", None)
+            } if error is not None else None
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self.recorded += 1
+
+    # ---- 回放 ----
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"录制文件不存在: {self.path}")
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping corrupt cassette entry in {self.path}")
+                    continue
+                self._by_key[entry["key"]].append(len(self.entries))
+                self.entries.append(entry)
+        if not self.entries:
+            raise ValueError(f"录制文件为空: {self.path}")
+        self._reset_used()
+        logger.info(f"Loaded {len(self.entries)} cassette entries from {self.path}")
+
+    def _reset_used(self):
+        self._used = [False] * len(self.entries)
+        self._key_cursor.clear()
+        self._cursor = 0
+
+    def _next_exact(self, key: str) -> Optional[int]:
+        """该请求键下第一条未用过的录制；严格模式下都用过时从头循环使用这些录制"""
+        indices = self._by_key.get(key)
+        if not indices:
+            return None
+        position = self._key_cursor.get(key, 0)
+        while position < len(indices) and self._used[indices[position]]:
+            position += 1
+        if position == len(indices):
+            if not self.strict:
+                return None
+            for index in indices:
+                self._used[index] = False
+            position = 0
+        self._key_cursor[key] = position + 1
+        return indices[position]
+
+    def _next_entry(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """完全匹配优先，否则按录制顺序取下一条未用过的（全部用过后从头循环）"""
+        with self._lock:
+            self.replayed += 1
+            if all(self._used):
+                self._reset_used()
+            index = self._next_exact(request_key(request))
+            if index is not None:
+                self._used[index] = True
+                self.exact_hits += 1
+                return self.entries[index]
+            if self.strict:
+                raise ReplayedLLMError("录制文件中没有与本次请求一致的调用")
+            while self._used[self._cursor]:
+                self._cursor = (self._cursor + 1) % len(self.entries)
+            self._used[self._cursor] = True
+            self.fallbacks += 1
+            return self.entries[self._cursor]
+
+    def replay(self, request: Dict[str, Any]):
+        entry = self._next_entry(request)
+        delay = entry["latency"] * self.time_scale
+        timeout = request.get("timeout")
+        if isinstance(timeout, (int, float)) and 0 < timeout < delay:
+            time.sleep(timeout)
+            raise ReplayedLLMTimeout(f"回放延迟 {delay:.2f}s 超过超时时间 {timeout}s")
+        if delay > 0:
+            time.sleep(delay)
+        error = entry.get("error")
+        if error is not None:
+            message = f"{error['type']}: {error['message']}"
+            if "Timeout" in error["type"]:
+                raise ReplayedLLMTimeout(message)
+            raise ReplayedLLMError(message)
+        return _build_response(entry)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "path": self.path,
+            "time_scale": self.time_scale,
+            "entries": len(self.entries),
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "exact_hits": self.exact_hits,
+            "fallbacks": self.fallbacks
+        }
@@ -0,0 +1,214 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional
+from openai import OpenAI
+from loguru import logger
+from app.core.config import settings
+
+
+@dataclass
+class LLMCallResult:
+    """单次LLM调用结果"""
+    content: str
+    model: str
+    endpoint: str
+    latency: float
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+def default_client_factory(api_base: str, api_key: str) -> OpenAI:
+    return OpenAI(api_key=api_key, base_url=api_base)
+
+
+def configured_endpoints() -> List[Dict[str, Any]]:
+    """配置中的端点列表；未配置端点池时为单一端点"""
+    return settings.llm_endpoints or [{
+        "api_base": settings.api_base,
+        "api_key": settings.llm_api_key
+    }]
+
+
+def configured_capacity() -> int:
+    """按配置创建的端点池的总并发额度"""
+    return sum(
+        int(entry.get("max_concurrency", settings.llm_endpoint_max_concurrency))
+        for entry in configured_endpoints()
+    )
+
+
+@dataclass
+class LLMEndpoint:
+    """单个LLM端点（base URL + API Key）及其运行状态"""
+    name: str
+    api_base: str
+    api_key: str
+    client: Any
+    weight: float = 1.0
+    max_concurrency: int = 4
+    outstanding: int = 0
+    ewma_latency: Optional[float] = None
+    total_requests: int = 0
+    total_failures: int = 0
+    consecutive_failures: int = 0
+    unhealthy_until: float = 0.0
+
+    def is_healthy(self, now: float = None) -> bool:
+        """端点当前是否可用"""
+        now = now if now is not None else time.monotonic()
+        return now >= self.unhealthy_until
+
+    def has_capacity(self) -> bool:
+        """端点是否还有空闲并发额度"""
+        return self.outstanding < self.max_concurrency
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出端点状态（不包含API Key）"""
+        return {
+            "name": self.name,
+            "api_base": self.api_base,
+            "weight": self.weight,
+            "max_concurrency": self.max_concurrency,
+            "outstanding": self.outstanding,
+            "ewma_latency": self.ewma_latency,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures,
+            "healthy": self.is_healthy()
+        }
+
+
+class LLMEndpointPool:
+    """LLM端点池：按最少在途请求或EWMA延迟在多个端点间做负载均衡"""
+
+    STRATEGIES = ("least_outstanding", "ewma")
+
+    def __init__(
+        self,
+        endpoints: List[LLMEndpoint],
+        strategy: str = "least_outstanding",
+        ewma_alpha: float = 0.3,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0
+    ):
+        if not endpoints:
+            raise ValueError("LLM端点池至少需要一个端点")
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"不支持的负载均衡策略: {strategy}")
+        self.endpoints = endpoints
+        self.strategy = strategy
+        self.ewma_alpha = ewma_alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        # 等待空闲端点的协程（不绑定事件循环，便于跨请求复用）
+        self._waiters = deque()
+
+    @classmethod
+    def from_settings(cls, client_factory=None) -> "LLMEndpointPool":
+        """根据全局配置创建端点池"""
+        client_factory = client_factory or default_client_factory
+        endpoints = []
+        for i, entry in enumerate(configured_endpoints()):
+            api_base = entry.get("api_base") or settings.api_base
+            api_key = entry.get("api_key") or settings.llm_api_key
+            endpoints.append(LLMEndpoint(
+                name=entry.get("name") or f"endpoint-{i}",
+                api_base=api_base,
+                api_key=api_key,
+                client=client_factory(api_base, api_key),
+                weight=float(entry.get("weight", 1.0)),
+                max_concurrency=int(entry.get("max_concurrency", settings.llm_endpoint_max_concurrency))
+            ))
+
+        logger.info(f"LLM endpoint pool initialized with {len(endpoints)} endpoint(s), strategy={settings.llm_balance_strategy}")
+        return cls(
+            endpoints,
+            strategy=settings.llm_balance_strategy,
+            ewma_alpha=settings.llm_ewma_alpha,
+            failure_threshold=settings.llm_endpoint_failure_threshold,
+            cooldown=settings.llm_endpoint_cooldown
+        )
+
+    @property
+    def total_capacity(self) -> int:
+        """端点池的总并发额度"""
+        return sum(endpoint.max_concurrency for endpoint in self.endpoints)
+
+    def _score(self, endpoint: LLMEndpoint) -> float:
+        """计算端点负载得分，越小越优先"""
+        weight = endpoint.weight if endpoint.weight > 0 else 1e-6
+        if self.strategy == "ewma":
+            # 尚无延迟样本的端点优先被探测
+            latency = endpoint.ewma_latency or 0.0
+            return latency * (endpoint.outstanding + 1) / weight
+        return endpoint.outstanding / weight
+
+    def _select(self, exclude: Optional[LLMEndpoint] = None) -> Optional[LLMEndpoint]:
+        """选择一个有空闲额度的端点；全部不健康时退化为在所有端点中选择
+
+        存在健康端点时只在健康端点中选择，健康端点都满载时返回None（调用方等待），不把请求转给不健康的端点。
+        """
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e.is_healthy(now)] or self.endpoints
+        available = [e for e in candidates if e.has_capacity() and e is not exclude]
+        if not available and exclude is not None:
+            available = [e for e in candidates if e.has_capacity()]
+        if not available:
+            return None
+        return min(available, key=self._score)
+
+    async def acquire(self, exclude: Optional[LLMEndpoint] = None) -> LLMEndpoint:
+        """获取一个端点的并发额度，所有端点都满载时等待"""
+        while True:
+            endpoint = self._select(exclude)
+            if endpoint is not None:
+                endpoint.outstanding += 1
+                endpoint.total_requests += 1
+                return endpoint
+
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # 已被唤醒但随即取消时，把唤醒机会让给下一个等待者
+                if waiter.done() and not waiter.cancelled():
+                    self._wake_one()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    def release(self, endpoint: LLMEndpoint, latency: Optional[float] = None, success: bool = True):
+        """释放端点额度并更新延迟与健康状态"""
+        endpoint.outstanding = max(0, endpoint.outstanding - 1)
+
+        if success:
+            endpoint.consecutive_failures = 0
+            endpoint.unhealthy_until = 0.0
+            if latency is not None:
+                if endpoint.ewma_latency is None:
+                    endpoint.ewma_latency = latency
+                else:
+                    endpoint.ewma_latency = self.ewma_alpha * latency + (1 - self.ewma_alpha) * endpoint.ewma_latency
+        else:
+            endpoint.total_failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.failure_threshold:
+                endpoint.unhealthy_until = time.monotonic() + self.cooldown
+                logger.warning(f"LLM endpoint {endpoint.name} marked unhealthy for {self.cooldown}s")
+
+        self._wake_one()
+
+    def _wake_one(self):
+        """唤醒一个等待中的协程"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """获取所有端点状态"""
+        return [endpoint.to_dict() for endpoint in self.endpoints]
@@ -0,0 +1,139 @@
+from typing import List, Dict, Any, Optional, Set
+from loguru import logger
+from app.core.config import settings
+from app.utils.tokenizer import term_set, relevance_score
+
+
+class ModelRouter:
+    """模型路由：按片段长度、相关度和位置选择模型
+
+    规则按顺序匹配，命中第一条即使用其模型；均未命中时使用默认（大）模型。
+    每条规则支持的条件：
+    - position: 片段位置列表，取值 first / last / middle
+    - max_chars / min_chars: 片段字符数范围
+    - max_relevance / min_relevance: 问题与片段的词项覆盖率范围
+    """
+
+    POSITIONS = ("first", "last", "middle")
+    THRESHOLDS = ("max_chars", "min_chars", "max_relevance", "min_relevance")
+
+    def __init__(self, rules: List[Dict[str, Any]], default_model: str):
+        self.rules = rules
+        self.default_model = default_model
+
+    @classmethod
+    def from_settings(cls) -> "ModelRouter":
+        """根据全局配置创建路由器"""
+        heavy_model = settings.model_routing_heavy_model or settings.model_name
+        rules = settings.model_routing_rules or cls.default_rules(
+            light_model=settings.model_routing_light_model,
+            heavy_model=heavy_model,
+            min_chars=settings.model_routing_min_chars,
+            min_relevance=settings.model_routing_min_relevance
+        )
+        cls.validate_rules(rules)
+        logger.info(f"Model routing enabled with {len(rules)} rule(s), default model: {heavy_model}")
+        return cls(rules, heavy_model)
+
+    @staticmethod
+    def default_rules(light_model: str, heavy_model: str, min_chars: int, min_relevance: float) -> List[Dict[str, Any]]:
+        """默认规则：首尾片段（标题引言、总结结论）用大模型，短片段和低相关片段用小模型"""
+        return [
+            {"position": ["first", "last"], "model": heavy_model},
+            {"max_chars": min_chars, "model": light_model},
+            {"max_relevance": min_relevance, "model": light_model}
+        ]
+
+    @classmethod
+    def validate_rules(cls, rules: List[Dict[str, Any]]):
+        """校验规则格式，配置错误时在启动阶段报错，而不是在每次路由时失败"""
+        for number, rule in enumerate(rules, start=1):
+            if not isinstance(rule, dict):
+                raise ValueError(f"模型路由规则 {number} 必须是对象: {rule!r}")
+            unknown = set(rule) - {"model", "position", *cls.THRESHOLDS}
+            if unknown:
+                raise ValueError(f"模型路由规则 {number} 包含未知条件: {', '.join(sorted(unknown))}")
+            if not isinstance(rule.get("model"), str) or not rule["model"]:
+                raise ValueError(f"模型路由规则 {number} 缺少 model")
+            if "position" in rule:
+                positions = rule["position"]
+                if not isinstance(positions, list) or not set(positions) <= set(cls.POSITIONS):
+                    raise ValueError(f"模型路由规则 {number} 的 position 只能是 {'/'.join(cls.POSITIONS)} 组成的列表")
+            for key in cls.THRESHOLDS:
+                value = rule.get(key)
+                if key in rule and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                    raise ValueError(f"模型路由规则 {number} 的 {key} 必须是数值")
+
+    @staticmethod
+    def _position(chunk_index: int, total_chunks: int) -> str:
+        if chunk_index == 0:
+            return "first"
+        if chunk_index == total_chunks - 1:
+            return "last"
+        return "middle"
+
+    def _matches(self, rule: Dict[str, Any], position: str, chars: int, relevance: float) -> bool:
+        """判断片段是否满足规则的全部条件"""
+        if "position" in rule and position not in rule["position"]:
+            return False
+        if "max_chars" in rule and chars >= rule["max_chars"]:
+            return False
+        if "min_chars" in rule and chars < rule["min_chars"]:
+            return False
+        if "max_relevance" in rule and relevance >= rule["max_relevance"]:
+            return False
+        if "min_relevance" in rule and relevance < rule["min_relevance"]:
+            return False
+        return True
+
+    def select_model(
+        self,
+        question: str,
+        chunk_content: str,
+        chunk_index: int,
+        total_chunks: int,
+        question_terms: Optional[Set[str]] = None,
+        chunk_terms: Optional[Set[str]] = None
+    ) -> str:
+        """为片段选择模型"""
+        position = self._position(chunk_index, total_chunks)
+        question_terms = question_terms if question_terms is not None else term_set(question)
+        chunk_terms = chunk_terms if chunk_terms is not None else term_set(chunk_content)
+        relevance = relevance_score(question_terms, chunk_terms)
+
+        for rule in self.rules:
+            if self._matches(rule, position, len(chunk_content), relevance):
+                return rule["model"]
+        return self.default_model
+
+
+class ModelUsageStats:
+    """按模型统计调用次数与延迟"""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, model: str, latency: float):
+        """记录一次成功调用"""
+        entry = self._stats.setdefault(model, {"calls": 0, "total_latency": 0.0, "max_latency": 0.0})
+        entry["calls"] += 1
+        entry["total_latency"] += latency
+        entry["max_latency"] = max(entry["max_latency"], latency)
+
+    def models(self) -> List[str]:
+        return list(self._stats.keys())
+
+    def total_latency(self) -> float:
+        """所有调用的累计延迟（秒）"""
+        return sum(entry["total_latency"] for entry in self._stats.values())
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        """导出统计，包含平均延迟"""
+        return {
+            model: {
+                "calls": int(entry["calls"]),
+                "avg_latency": round(entry["total_latency"] / entry["calls"], 3),
+                "max_latency": round(entry["max_latency"], 3)
+            }
+            for model, entry in self._stats.items()
+        }
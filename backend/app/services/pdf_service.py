@@ -1,8 +1,29 @@
 import fitz  # PyMuPDF
+import os
 import re
-from typing import List, Tuple
+import time
+from collections import deque
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
 from loguru import logger
 from app.core.config import settings
+from app.utils.tracing import span
+from app.utils.spool import ChunkSpool, SpooledText
+from app.utils import metrics
+
+# PDF来源：文件路径，或已读入内存的PDF字节（小文件直接在内存中解析，无需落盘再读回）
+PDFSource = Union[str, bytes]
+
+# 内存中处理时每个提取字符的峰值占用估算（字节）：原文、清理后的文本与分片同时存在，
+# 且含中文的字符串每字符占2~4字节，正则替换还会产生临时副本（tests/test_memory_budget.py 校验该估算不偏低）
+MEMORY_PER_CHAR = 12
+# 流式清理时每次处理的原文长度（字符），流式处理的峰值约为其十几倍字节
+STREAM_BLOCK_CHARS = 64 * 1024
+
+# 流式清理可以在“非空白字符 + 空白字符”之间切分：切分点前的字符需保留在清理结果中，
+# 且不能是页码模式（第 n 页 / Page n）的组成部分，这样分块清理后拼接与整体清理完全一致
+_KEPT_CHAR = re.compile(r'[\w\u4e00-\u9fff.,!?;:()\[\]{}"\'-]')
+_UNSAFE_CUT_CHAR = re.compile(r'[\d第e]')
+
 
 class PDFService:
     """PDF文档解析与分片服务"""
@@ -47,26 +68,104 @@ class PDFService:
         overlap = max(overlap, 200)
         return overlap
     
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
-        """从PDF文件中提取文本内容"""
+    @staticmethod
+    def open_document(source: PDFSource) -> fitz.Document:
+        """打开PDF文档：字节内容通过内存流打开，路径从磁盘打开"""
+        if isinstance(source, (bytes, bytearray)):
+            return fitz.open(stream=source, filetype="pdf")
+        return fitz.open(source)
+    
+    @staticmethod
+    def describe_source(source: PDFSource) -> str:
+        """用于日志的来源描述"""
+        if isinstance(source, (bytes, bytearray)):
+            return f"<memory {len(source)} bytes>"
+        return source
+    
+    @staticmethod
+    def _iter_page_text(doc: fitz.Document) -> Iterator[str]:
+        started = time.perf_counter()
+        for page_num in range(len(doc)):
+            yield doc.load_page(page_num).get_text()
+        if len(doc):
+            metrics.EXTRACT_SECONDS_PER_PAGE.observe((time.perf_counter() - started) / len(doc))
+    
+    @classmethod
+    def _read_text(cls, doc: fitz.Document) -> str:
+        return "".join(cls._iter_page_text(doc))
+    
+    def _read_text_within_budget(self, doc: fitz.Document, source: PDFSource, budget: int) -> Union[str, SpooledText]:
+        """逐页提取文本；预计占用超出预算时，已提取与后续的页面改为流式清理并落盘，返回清理后的SpooledText"""
+        base = len(source) if isinstance(source, (bytes, bytearray)) else 0
+        pages = deque()
+        chars = 0
+        page_iter = self._iter_page_text(doc)
+        for page_text in page_iter:
+            pages.append(page_text)
+            chars += len(page_text)
+            if budget and base + chars * MEMORY_PER_CHAR > budget:
+                break
+        else:
+            return "".join(pages)
+        
+        logger.info(
+            f"Estimated memory exceeds job budget ({budget} bytes) after {len(pages)}/{len(doc)} pages, "
+            f"spooling cleaned text to disk"
+        )
+        
+        def drain() -> Iterator[str]:
+            while pages:
+                yield pages.popleft()
+            yield from page_iter
+        
+        text = SpooledText()
         try:
-            doc = fitz.open(pdf_path)
-            text = ""
-            
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text += page.get_text()
-            
-            doc.close()
-            logger.info(f"Successfully extracted text from PDF: {pdf_path}")
+            for piece in self.clean_text_stream(drain()):
+                text.write(piece)
+        except BaseException:
+            text.close()
+            raise
+        return text
+    
+    @staticmethod
+    def _read_info(doc: fitz.Document, source: PDFSource) -> dict:
+        if isinstance(source, (bytes, bytearray)):
+            file_size = len(source)
+        else:
+            file_size = os.path.getsize(source)
+        metadata = doc.metadata or {}
+        return {
+            "page_count": len(doc),
+            "file_size": file_size,
+            "title": metadata.get("title", ""),
+            "author": metadata.get("author", ""),
+            "subject": metadata.get("subject", "")
+        }
+    
+    def extract_text_from_pdf(self, pdf_path: PDFSource) -> str:
+        """从PDF文件（路径或字节内容）中提取文本内容"""
+        try:
+            with span("extract") as extract_span:
+                doc = self.open_document(pdf_path)
+                try:
+                    text = self._read_text(doc)
+                    if extract_span:
+                        extract_span.set(pages=len(doc), chars=len(text))
+                finally:
+                    doc.close()
+            logger.info(f"Successfully extracted text from PDF: {self.describe_source(pdf_path)}")
             return text
             
         except Exception as e:
-            logger.error(f"Error extracting text from PDF {pdf_path}: {e}")
+            logger.error(f"Error extracting text from PDF {self.describe_source(pdf_path)}: {e}")
             raise
     
     def clean_text(self, text: str) -> str:
         """清理和预处理文本"""
+        return self._clean_block(text).strip()
+    
+    @staticmethod
+    def _clean_block(text: str) -> str:
         # 移除多余的空白字符
         text = re.sub(r'\s+', ' ', text)
         # 移除特殊字符
@@ -74,8 +173,55 @@ class PDFService:
         # 移除页眉页脚等重复内容
         text = re.sub(r'第\s*\d+\s*页', '', text)
         text = re.sub(r'Page\s*\d+', '', text)
+        return text
+    
+    @staticmethod
+    def _safe_cut(text: str, floor: int) -> int:
+        """从末尾向前找可以切分的位置（见 _KEPT_CHAR），找不到时返回-1"""
+        for index in range(len(text) - 1, max(floor, 1) - 1, -1):
+            if text[index].isspace() and not text[index - 1].isspace():
+                previous = text[index - 1]
+                if _KEPT_CHAR.match(previous) and not _UNSAFE_CUT_CHAR.match(previous):
+                    return index
+        return -1
+    
+    def clean_text_stream(self, pieces: Iterable[str]) -> Iterator[str]:
+        """流式清理：输入为原文的连续片段（如逐页文本），输出片段拼接后与 clean_text(原文) 完全一致
+
+        每次最多缓存约 STREAM_BLOCK_CHARS 个字符的原文，内存占用与文档大小无关
+        """
+        started = False
+        pending = ""  # 暂存的结尾空格，后面还有内容时才输出（整体清理会去掉首尾空白）
+        
+        def emit(block: str) -> Iterator[str]:
+            nonlocal started, pending
+            cleaned = self._clean_block(block)
+            if not started:
+                cleaned = cleaned.lstrip()
+            body = cleaned.rstrip(" ")
+            if body:
+                yield pending + body
+                started = True
+                pending = cleaned[len(body):]
+            elif started:
+                pending += cleaned
         
-        return text.strip()
+        parts: List[str] = []
+        buffered = 0
+        for piece in pieces:
+            parts.append(piece)
+            buffered += len(piece)
+            if buffered < STREAM_BLOCK_CHARS:
+                continue
+            buffer = "".join(parts)
+            cut = self._safe_cut(buffer, len(buffer) // 2)
+            if cut > 0:
+                yield from emit(buffer[:cut])
+                buffer = buffer[cut:]
+            parts = [buffer]
+            buffered = len(buffer)
+        if buffered:
+            yield from emit("".join(parts))
     
     def split_text_semantic(self, text: str) -> List[str]:
         """基于语义的文本分片"""
@@ -89,18 +235,16 @@ class PDFService:
             if not paragraph:
                 continue
                 
-            # 如果当前段落加上现有内容超过最大长度，保存当前块并开始新块
-            if len(current_chunk) + len(paragraph) > self.max_chunk_size:
+            # 如果当前段落加上现有内容（含段落分隔符）超过最大长度，保存当前块并开始新块
+            if len(current_chunk) + len(paragraph) + 2 > self.max_chunk_size:
                 if current_chunk:
                     chunks.append(current_chunk.strip())
                     # 保留重叠部分
                     overlap_start = max(0, len(current_chunk) - self.overlap_size)
-                    current_chunk = current_chunk[overlap_start:] + "\n\n" + paragraph
+                    current_chunk = self._split_oversized(current_chunk[overlap_start:] + "\n\n" + paragraph, chunks)
                 else:
                     # 如果单个段落就超过最大长度，强制分割
-                    current_chunk = paragraph[:self.max_chunk_size]
-                    chunks.append(current_chunk)
-                    current_chunk = paragraph[self.max_chunk_size - self.overlap_size:]
+                    current_chunk = self._split_oversized(paragraph, chunks)
             else:
                 current_chunk += "\n\n" + paragraph if current_chunk else paragraph
         
@@ -111,9 +255,24 @@ class PDFService:
         logger.info(f"Split text into {len(chunks)} chunks")
         return chunks
     
-    def split_text_fixed(self, text: str) -> List[str]:
-        """固定长度的文本分片"""
-        chunks = []
+    def _split_oversized(self, text: str, chunks: List[str]) -> str:
+        """按最大长度从text切出完整的块（相邻块保留重叠）追加到chunks，返回不足一块的剩余部分
+
+        按下标推进，每个字符只复制一次，超长段落（如清理后不含段落分隔的整篇文本）也是线性耗时
+        """
+        step = max(1, self.max_chunk_size - self.overlap_size)
+        start = 0
+        while len(text) - start > self.max_chunk_size:
+            chunks.append(text[start:start + self.max_chunk_size])
+            start += step
+        return text[start:] if start else text
+    
+    def split_text_fixed(self, text: str, chunks: Optional[List[str]] = None) -> List[str]:
+        """固定长度的文本分片
+
+        只用到 len(text) 与切片，text也可以是落盘的SpooledText；chunks为追加结果的目标（如ChunkSpool），默认新建列表
+        """
+        chunks = [] if chunks is None else chunks
         start = 0
         
         while start < len(text):
@@ -134,49 +293,114 @@ class PDFService:
                     end = start + split_point + 1
             
             chunks.append(chunk.strip())
-            start = end - self.overlap_size
+            if end >= len(text):
+                break
+            # 重叠不小于本块长度时不保留重叠，保证向前推进
+            start = end - self.overlap_size if end - self.overlap_size > start else end
         
         logger.info(f"Split text into {len(chunks)} fixed-size chunks")
         return chunks
     
-    def process_pdf(self, pdf_path: str) -> List[str]:
-        """处理PDF文件并返回分片后的文本"""
-        try:
-            # 提取文本
-            raw_text = self.extract_text_from_pdf(pdf_path)
-            
-            # 清理文本
+    def split_text(self, raw_text: str) -> List[str]:
+        """清理文本并按配置的策略分片，过滤空块"""
+        with span("clean", chars=len(raw_text)):
             cleaned_text = self.clean_text(raw_text)
-            
-            # 根据策略分片
+        with span("chunk", strategy=settings.chunk_strategy) as chunk_span:
             if settings.chunk_strategy == "semantic":
                 chunks = self.split_text_semantic(cleaned_text)
             else:
                 chunks = self.split_text_fixed(cleaned_text)
-            
-            # 过滤空块
             chunks = [chunk for chunk in chunks if chunk.strip()]
-            
+            if chunk_span:
+                chunk_span.set(chunks=len(chunks))
+        self._observe_chunks([len(chunk) for chunk in chunks])
+        return chunks
+    
+    @staticmethod
+    def _observe_chunks(lengths):
+        metrics.CHUNK_COUNT.labels(settings.chunk_strategy).observe(len(lengths))
+        chunk_size = metrics.CHUNK_SIZE.labels(settings.chunk_strategy)
+        for length in lengths:
+            chunk_size.observe(length)
+    
+    def split_spooled(self, text: SpooledText) -> ChunkSpool:
+        """对落盘的清理后文本分片，结果写入ChunkSpool，与 split_text 对同一文本的结果一致"""
+        chunks = ChunkSpool()
+        try:
+            with span("chunk", strategy=settings.chunk_strategy, spooled=True) as chunk_span:
+                if settings.chunk_strategy == "semantic":
+                    # 清理后的文本不含段落分隔，语义分片即按最大长度切分（相邻块保留重叠）
+                    if len(text) <= self.max_chunk_size:
+                        chunks.append(text[:])
+                    else:
+                        chunks.append(self._split_oversized(text, chunks).strip())
+                else:
+                    self.split_text_fixed(text, chunks)
+                chunks.finish()
+                if chunk_span:
+                    chunk_span.set(chunks=len(chunks))
+        except BaseException:
+            chunks.close()
+            raise
+        self._observe_chunks(chunks.lengths)
+        return chunks
+    
+    def process_pdf(self, pdf_path: PDFSource, memory_budget: Optional[int] = None) -> Union[List[str], ChunkSpool]:
+        """处理PDF文件（路径或字节内容）并返回分片后的文本
+
+        memory_budget为单个任务的内存预算（字节，默认settings.job_memory_budget_bytes，0为不限制）；
+        预计超出时改为流式清理，返回落盘的ChunkSpool（只读序列，用法与列表相同）
+        """
+        budget = settings.job_memory_budget_bytes if memory_budget is None else memory_budget
+        try:
+            with span("extract") as extract_span:
+                doc = self.open_document(pdf_path)
+                try:
+                    text = self._read_text_within_budget(doc, pdf_path, budget)
+                    if extract_span:
+                        extract_span.set(pages=len(doc), chars=len(text), spooled=isinstance(text, SpooledText))
+                finally:
+                    doc.close()
+            if isinstance(text, SpooledText):
+                with text:
+                    chunks = self.split_spooled(text)
+            else:
+                chunks = self.split_text(text)
             logger.info(f"Successfully processed PDF: {len(chunks)} chunks created")
             return chunks
             
         except Exception as e:
-            logger.error(f"Error processing PDF {pdf_path}: {e}")
+            logger.error(f"Error processing PDF {self.describe_source(pdf_path)}: {e}")
             raise
     
-    def get_pdf_info(self, pdf_path: str) -> dict:
+    def process_pdf_with_info(self, pdf_path: PDFSource) -> Tuple[List[str], dict]:
+        """只打开一次文档，同时返回分片结果与文件信息"""
+        try:
+            with span("extract") as extract_span:
+                doc = self.open_document(pdf_path)
+                try:
+                    info = self._read_info(doc, pdf_path)
+                    raw_text = self._read_text(doc)
+                finally:
+                    doc.close()
+                if extract_span:
+                    extract_span.set(pages=info["page_count"], chars=len(raw_text))
+            chunks = self.split_text(raw_text)
+            logger.info(f"Successfully processed PDF: {info['page_count']} pages, {len(chunks)} chunks created")
+            return chunks, info
+            
+        except Exception as e:
+            logger.error(f"Error processing PDF {self.describe_source(pdf_path)}: {e}")
+            raise
+    
+    def get_pdf_info(self, pdf_path: PDFSource) -> dict:
         """获取PDF文件信息"""
         try:
-            doc = fitz.open(pdf_path)
-            info = {
-                "page_count": len(doc),
-                "file_size": doc.filesize,
-                "title": doc.metadata.get("title", ""),
-                "author": doc.metadata.get("author", ""),
-                "subject": doc.metadata.get("subject", "")
-            }
-            doc.close()
-            return info
+            doc = self.open_document(pdf_path)
+            try:
+                return self._read_info(doc, pdf_path)
+            finally:
+                doc.close()
         except Exception as e:
-            logger.error(f"Error getting PDF info {pdf_path}: {e}")
-            raise 
\ No newline at end of file
+            logger.error(f"Error getting PDF info {self.describe_source(pdf_path)}: {e}")
+            raise
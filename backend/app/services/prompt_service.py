@@ -118,6 +118,37 @@ class PromptService:
             logger.error(f"Error building chat messages: {e}")
             raise
     
+    def build_packed_chat_messages(self, question: str, packed_content: str, chunk_indices: list, total_chunks: int = 1) -> list:
+        """构建多片段打包调用的聊天消息，要求模型按片段标记分段输出"""
+        try:
+            # 系统提示词只渲染一次，片段内容为带分隔标记的多个片段
+            system_prompt = self.render_prompt(question, packed_content, chunk_indices[0], total_chunks)
+            numbers = [index + 1 for index in chunk_indices]
+            numbers_text = "、".join(str(number) for number in numbers)
+            format_example = "\n".join(f"=== 片段 {number} ===\n（第{number}个片段的分析内容）" for number in numbers)
+            
+            messages = [
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": (
+                        f"上述PDF片段内容包含第{numbers_text}个片段（共{total_chunks}个片段），"
+                        f"每个片段以\"<<<片段 N>>>\"开始、以\"<<<片段 N 结束>>>\"结束。"
+                        f"请基于上述要求，分别为每个片段生成研究报告内容，并严格按以下格式输出，不要省略任何片段标记：\n"
+                        f"{format_example}"
+                    )
+                }
+            ]
+            
+            return messages
+            
+        except Exception as e:
+            logger.error(f"Error building packed chat messages: {e}")
+            raise
+    
     def validate_prompt_params(self, question: str, chunk_content: str) -> bool:
         """验证Prompt参数"""
         if not question or not question.strip():
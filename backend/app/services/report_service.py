@@ -1,252 +1,948 @@
+import asyncio
+import json
+import re
+import threading
 import time
 import uuid
 import os
-from typing import List, Dict, Any
-from openai import OpenAI
+from dataclasses import dataclass, field
+from itertools import chain
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Set
 from loguru import logger
 from app.core.config import settings
-from app.services.pdf_service import PDFService
+from app.services.pdf_service import PDFService, PDFSource
 from app.services.prompt_service import PromptService
+from app.services.llm_pool import LLMEndpoint, LLMEndpointPool, LLMCallResult, default_client_factory
+from app.services.llm_cassette import LLMCassette
+from app.services.hedging import RequestHedger, LatencyTracker
+from app.services.model_router import ModelRouter, ModelUsageStats
+from app.services.chunk_packing import ChunkPacker, ChunkBatch
+from app.services.checkpoint_service import CheckpointStore, Checkpoint, CheckpointInUseError, compute_document_hash
+from app.services.report_store import ReportStore, parse_accept_encoding
+from app.services.search_index import ReportSearchIndex
+from app.services.report_stats import ReportStatsLog
+from app.utils.tokenizer import term_set
+from app.utils.deadline import Deadline, deadline_from_timeout
+from app.utils.cancellation import CancellationToken, ReportCancelledError
+from app.utils.offload import run_io, run_cpu, run_llm
+from app.utils.tracing import span, collect_stages
+from app.utils.spool import ChunkSpool
+from app.utils import metrics
 from app.schemas.report_schema import ReportMetadata
 
+
+@dataclass
+class ReportRun:
+    """单次报告生成的运行状态"""
+    deadline: Optional[Deadline] = None
+    cancel_token: Optional[CancellationToken] = None
+    checkpoint: Optional[Checkpoint] = None
+    # 预处理文档提供的文档哈希与每个片段的词项（相关度索引）
+    document_hash: Optional[str] = None
+    chunk_terms: Optional[List[Set[str]]] = None
+    model_usage: ModelUsageStats = field(default_factory=ModelUsageStats)
+    skipped_chunks: int = 0
+    # 取消后的浪费统计
+    aborted_calls: int = 0
+    cancelled_chunks: int = 0
+    # 检查点统计
+    restored_chunks: int = 0
+    retried_chunks: int = 0
+    # 资源统计：各阶段耗时（秒）、单次模型调用延迟与实际token用量
+    stage_timings: Dict[str, float] = field(default_factory=dict)
+    llm_latency: LatencyTracker = field(default_factory=lambda: LatencyTracker(window=100000))
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    reused_document: bool = False
+
+
 class ReportService:
     """报告生成服务"""
     
     def __init__(self):
         self.pdf_service = PDFService()
         self.prompt_service = PromptService()
-        self.client = OpenAI(
-            api_key=settings.llm_api_key,
-            base_url=settings.api_base
-        )
+        self.cassette = LLMCassette.from_settings()
+        client_factory = None
+        if self.cassette is not None:
+            client_factory = self.cassette.client_factory(default_client_factory)
+        self.endpoint_pool = LLMEndpointPool.from_settings(client_factory=client_factory)
+        # 主端点客户端（单端点部署时即唯一客户端）
+        self.client = self.endpoint_pool.endpoints[0].client
+        self.hedger = RequestHedger.from_settings() if settings.llm_hedge_enabled else None
+        self.model_router = ModelRouter.from_settings() if settings.model_routing_enabled else None
+        self.chunk_packer = None
+        if settings.chunk_packing_enabled:
+            # 打包后的输入不超过单个分片的字符预算
+            self.chunk_packer = ChunkPacker(
+                small_chunk_chars=settings.chunk_packing_small_chars,
+                budget_chars=self.pdf_service.max_chunk_size,
+                max_chunks=settings.chunk_packing_max_chunks
+            )
+        self.checkpoint_store = CheckpointStore() if settings.checkpoint_enabled else None
+        self.report_store = ReportStore()
+        self.search_index = ReportSearchIndex(self.report_store)
+        self.stats_log = ReportStatsLog(self.report_store)
+        # 客户端断开导致的浪费统计
+        self.cancellation_stats = {
+            "cancelled_reports": 0,
+            "aborted_calls": 0,
+            "skipped_chunks": 0,
+            "discarded_chunks": 0,
+            "discarded_llm_seconds": 0.0,
+            # 被放弃（对冲落败、截止时间、客户端断开）但仍在线程中跑完的模型请求
+            "abandoned_calls": 0,
+            "abandoned_llm_seconds": 0.0
+        }
     
-    async def generate_report(self, pdf_path: str, question: str) -> Dict[str, Any]:
-        """生成研究报告"""
+    async def generate_report(
+        self,
+        pdf_path: PDFSource,
+        question: str,
+        deadline: Optional[Deadline] = None,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Dict[str, Any]:
+        """生成研究报告
+
+        pdf_path为PDF路径或已读入内存的字节内容。
+        deadline为空时使用settings.request_timeout；超过截止时间后未开始的片段被跳过，
+        已完成的片段保存为部分报告。cancel_token被触发时中止在途调用，不保存报告，
+        并抛出ReportCancelledError。
+        """
         start_time = time.time()
-        report_id = str(uuid.uuid4())
+        run = ReportRun(
+            deadline=deadline or deadline_from_timeout(settings.request_timeout),
+            cancel_token=cancel_token
+        )
         
         try:
             logger.info(f"Starting report generation for question: {question}")
             
-            # 1. 处理PDF文件
-            chunks = self.pdf_service.process_pdf(pdf_path)
-            total_chunks = len(chunks)
-            
-            if total_chunks == 0:
-                raise ValueError("PDF文件内容为空或无法解析")
-            
-            logger.info(f"PDF processed into {total_chunks} chunks")
+            # 1. 处理PDF文件（超出内存预算时分片落盘，返回ChunkSpool）
+            with collect_stages(run.stage_timings), span("parse"):
+                chunks = await run_cpu(self.pdf_service.process_pdf, pdf_path)
             
-            # 2. 分段调用大模型
-            report_parts = []
-            processed_chunks = 0
+            try:
+                if len(chunks) == 0:
+                    raise ValueError("PDF文件内容为空或无法解析")
+                
+                logger.info(f"PDF processed into {len(chunks)} chunks")
+                
+                return await self._generate_from_chunks(chunks, question, run, start_time)
+            finally:
+                if isinstance(chunks, ChunkSpool):
+                    chunks.close()
             
-            for i, chunk in enumerate(chunks):
+        except ReportCancelledError:
+            logger.info(f"Report generation cancelled ({cancel_token.reason}), nothing saved")
+            raise
+        except Exception as e:
+            logger.error(f"Error generating report: {e}")
+            raise
+    
+    async def generate_report_from_chunks(
+        self,
+        chunks: List[str],
+        question: str,
+        chunk_terms: Optional[List[Set[str]]] = None,
+        document_hash: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Dict[str, Any]:
+        """基于已预处理的文档分片生成研究报告（跳过PDF提取与分片）"""
+        start_time = time.time()
+        run = ReportRun(
+            deadline=deadline or deadline_from_timeout(settings.request_timeout),
+            cancel_token=cancel_token,
+            document_hash=document_hash,
+            chunk_terms=chunk_terms,
+            reused_document=True
+        )
+        
+        try:
+            logger.info(f"Starting report generation from {len(chunks)} pre-processed chunks for question: {question}")
+            if not chunks:
+                raise ValueError("文档内容为空")
+            return await self._generate_from_chunks(chunks, question, run, start_time)
+        except ReportCancelledError:
+            logger.info(f"Report generation cancelled ({cancel_token.reason}), nothing saved")
+            raise
+        except Exception as e:
+            logger.error(f"Error generating report: {e}")
+            raise
+    
+    async def resume_report(
+        self,
+        report_id: str,
+        deadline: Optional[Deadline] = None,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Dict[str, Any]:
+        """从检查点恢复报告：只为缺失或失败（重试预算内）的片段调用模型"""
+        start_time = time.time()
+        if self.checkpoint_store is None:
+            raise FileNotFoundError("Checkpointing is disabled")
+        checkpoint = await run_io(self.checkpoint_store.get_by_report, report_id)
+        if checkpoint is None:
+            raise FileNotFoundError(f"Checkpoint not found for report: {report_id}")
+        self.checkpoint_store.claim(checkpoint)
+        
+        run = ReportRun(
+            deadline=deadline or deadline_from_timeout(settings.request_timeout),
+            cancel_token=cancel_token,
+            checkpoint=checkpoint
+        )
+        
+        try:
+            logger.info(f"Resuming report generation: {report_id}")
+            chunks = await run_io(checkpoint.load_chunks)
+            return await self._generate_from_chunks(chunks, checkpoint.question, run, start_time)
+        except ReportCancelledError:
+            logger.info(f"Report resume cancelled ({cancel_token.reason}), nothing saved")
+            raise
+        except Exception as e:
+            logger.error(f"Error resuming report {report_id}: {e}")
+            raise
+        finally:
+            self.checkpoint_store.release(checkpoint)
+    
+    async def _generate_from_chunks(self, chunks: List[str], question: str, run: ReportRun, start_time: float) -> Dict[str, Any]:
+        """基于已分片的文本生成并保存报告，并按结果计数"""
+        outcome = "error"
+        metrics.REPORTS_IN_FLIGHT.inc()
+        try:
+            with collect_stages(run.stage_timings):
+                result = await self._run_generation(chunks, question, run, start_time)
+            outcome = "partial" if result["report_metadata"].is_partial else "ok"
+            return result
+        except ReportCancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            if run.checkpoint is not None:
+                self.checkpoint_store.release(run.checkpoint)
+            metrics.REPORTS_IN_FLIGHT.dec()
+            metrics.REPORTS_TOTAL.labels(self.prompt_service.prompt_version, settings.chunk_strategy, outcome).inc()
+    
+    async def _run_generation(self, chunks: List[str], question: str, run: ReportRun, start_time: float) -> Dict[str, Any]:
+        """基于已分片的文本生成并保存报告"""
+        cancel_token = run.cancel_token
+        total_chunks = len(chunks)
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        
+        # 打开检查点：同一文档、问题和提示词版本的重复运行沿用已完成的片段结果；
+        # 相同的请求正在运行时不使用检查点，本次运行使用新的报告ID
+        if run.checkpoint is None and self.checkpoint_store is not None:
+            def open_checkpoint():
                 try:
-                    # 构建Prompt
-                    messages = self.prompt_service.build_chat_messages(
+                    return self.checkpoint_store.open(
+                        document_hash=run.document_hash or compute_document_hash(chunks),
                         question=question,
-                        chunk_content=chunk,
-                        chunk_index=i,
-                        total_chunks=total_chunks
+                        prompt_version=self.prompt_service.prompt_version,
+                        chunks=chunks,
+                        report_id=str(uuid.uuid4())
                     )
-                    
-                    # 调用OpenAI API
-                    response = await self._call_openai_api(messages)
-                    
-                    if response and response.strip():
-                        report_parts.append(response.strip())
-                        processed_chunks += 1
-                        logger.info(f"Processed chunk {i + 1}/{total_chunks}")
-                    else:
-                        logger.warning(f"Empty response for chunk {i + 1}")
-                        
-                except Exception as e:
-                    logger.error(f"Error processing chunk {i + 1}: {e}")
-                    # 继续处理其他片段
-                    continue
-            
-            # 3. 拼接报告
-            if not report_parts:
-                raise ValueError("所有片段处理失败，无法生成报告")
-            
+                except CheckpointInUseError as e:
+                    logger.info(f"{e}, running without checkpoint")
+                    return None
+            run.checkpoint = await run_io(open_checkpoint)
+        report_id = run.checkpoint.report_id if run.checkpoint else str(uuid.uuid4())
+        
+        # 2. 分段调用大模型（并发处理，按片段顺序拼接）
+        with span("llm", chunks=total_chunks):
+            results = await self._process_chunks(chunks, question, run)
+        report_parts = [part for part in results if part]
+        processed_chunks = sum(1 for part in results if part is not None)
+        
+        if cancel_token is not None and cancel_token.cancelled:
+            self._record_cancellation(run, processed_chunks)
+            cancel_token.raise_if_cancelled()
+        
+        # 3. 拼接报告
+        if not report_parts:
+            raise ValueError("所有片段处理失败，无法生成报告")
+        
+        with span("combine", parts=len(report_parts)):
             markdown_report = self._combine_report_parts(report_parts)
-            
-            # 4. 计算处理时间
-            processing_time = time.time() - start_time
-            
-            # 5. 构建元数据
-            metadata = ReportMetadata(
-                total_chunks=total_chunks,
-                processed_chunks=processed_chunks,
-                token_per_chunk=settings.max_tokens_per_chunk,
-                chunk_size=self.pdf_service.max_chunk_size,
-                overlap_size=self.pdf_service.overlap_size,
-                model_context_length=settings.model_context_length,
-                processing_time=processing_time,
-                model_used=settings.model_name
+        
+        # 超过截止时间且未处理完全部片段时，作为部分报告保存
+        is_partial = processed_chunks < total_chunks and run.deadline is not None and run.deadline.expired
+        if is_partial:
+            logger.warning(
+                f"Request deadline exceeded, saving partial report: "
+                f"{processed_chunks}/{total_chunks} chunks processed, {run.skipped_chunks} skipped"
             )
-            
-            # 6. 保存报告
-            self._save_report(report_id, markdown_report, question, metadata)
-            
-            logger.info(f"Report generation completed: {report_id}")
-            
-            return {
-                "report_id": report_id,
-                "markdown_report": markdown_report,
-                "report_metadata": metadata
-            }
-            
+            markdown_report = (
+                f"> ⚠️ 部分报告：已超过请求时限，仅处理了{processed_chunks}/{total_chunks}个片段。\n\n"
+                + markdown_report
+            )
+        
+        # 4. 计算处理时间
+        processing_time = time.time() - start_time
+        
+        # 5. 构建元数据
+        metadata = ReportMetadata(
+            total_chunks=total_chunks,
+            processed_chunks=processed_chunks,
+            token_per_chunk=settings.max_tokens_per_chunk,
+            chunk_size=self.pdf_service.max_chunk_size,
+            overlap_size=self.pdf_service.overlap_size,
+            model_context_length=settings.model_context_length,
+            processing_time=processing_time,
+            model_used=", ".join(run.model_usage.models()) or settings.model_name,
+            model_usage=run.model_usage.to_dict(),
+            is_partial=is_partial,
+            skipped_chunks=run.skipped_chunks,
+            stage_timings=self._stage_timings(run),
+            llm_latency=self._latency_summary(run.llm_latency),
+            prompt_tokens=run.prompt_tokens,
+            completion_tokens=run.completion_tokens,
+            retried_chunks=run.retried_chunks,
+            cache_hits={"checkpoint": run.restored_chunks, "document": int(run.reused_document)}
+        )
+        
+        # 6. 保存报告（保存耗时在保存之后才知道，只写入统计日志与返回的元数据）
+        with span("save", report_id=report_id):
+            save_started = time.perf_counter()
+            await run_io(self._save_report, report_id, markdown_report, question, metadata)
+            save_time = time.perf_counter() - save_started
+        metrics.REPORT_SAVE_SECONDS.labels(self.prompt_service.prompt_version, settings.chunk_strategy).observe(save_time)
+        metadata.stage_timings["save"] = round(save_time, 3)
+        await run_io(self._record_stats, report_id, metadata)
+        
+        # 全部片段都已处理的报告不再需要续跑，删除（或标记到期）检查点；部分报告保留以便恢复
+        if run.checkpoint is not None and self.checkpoint_store is not None and processed_chunks == total_chunks:
+            try:
+                await run_io(self.checkpoint_store.complete, run.checkpoint, settings.checkpoint_completed_ttl)
+            except OSError as e:
+                logger.warning(f"Failed to complete checkpoint for report {report_id}: {e}")
+        
+        logger.info(f"Report generation completed: {report_id}")
+        
+        return {
+            "report_id": report_id,
+            "markdown_report": markdown_report,
+            "report_metadata": metadata
+        }
+    
+    @staticmethod
+    def _stage_timings(run: ReportRun) -> Dict[str, float]:
+        """报告元数据中的阶段耗时（llm为并发调用阶段的总耗时）"""
+        return {
+            stage: round(seconds, 3)
+            for stage, seconds in run.stage_timings.items()
+            if stage in ("parse", "extract", "clean", "chunk", "llm", "combine", "save")
+        }
+    
+    @staticmethod
+    def _latency_summary(tracker: LatencyTracker) -> Dict[str, Any]:
+        """单次模型调用延迟的分位数（秒）"""
+        def rounded(value: Optional[float]) -> Optional[float]:
+            return round(value, 3) if value is not None else None
+        
+        return {
+            "calls": tracker.count,
+            "p50": rounded(tracker.percentile(0.5)),
+            "p95": rounded(tracker.percentile(0.95)),
+            "max": rounded(tracker.percentile(1.0))
+        }
+    
+    def _record_stats(self, report_id: str, metadata: ReportMetadata):
+        """追加报告统计记录（失败不影响报告保存）"""
+        try:
+            self.stats_log.add(ReportStatsLog.build_record(
+                report_id,
+                metadata.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+                metadata.model_dump(mode="json"),
+                self.prompt_service.prompt_version
+            ))
         except Exception as e:
-            logger.error(f"Error generating report: {e}")
+            logger.warning(f"Failed to record stats for report {report_id}: {e}")
+    
+    def _record_cancellation(self, run: ReportRun, processed_chunks: int):
+        """记录取消造成的浪费"""
+        stats = self.cancellation_stats
+        stats["cancelled_reports"] += 1
+        stats["aborted_calls"] += run.aborted_calls
+        stats["skipped_chunks"] += run.cancelled_chunks
+        stats["discarded_chunks"] += processed_chunks
+        stats["discarded_llm_seconds"] += run.model_usage.total_latency()
+        logger.info(
+            f"Cancelled report: {run.aborted_calls} in-flight calls aborted, "
+            f"{run.cancelled_chunks} chunks skipped, {processed_chunks} finished chunks discarded"
+        )
+    
+    async def _process_chunks(self, chunks: List[str], question: str, run: ReportRun = None) -> List[Optional[str]]:
+        """并发处理所有片段，返回与片段顺序一致的结果（失败为None，已打包覆盖但无独立内容为空字符串）"""
+        run = run or ReportRun()
+        deadline = run.deadline
+        cancel_token = run.cancel_token
+        started = set()
+        total_chunks = len(chunks)
+        semaphore = asyncio.Semaphore(max(1, settings.llm_max_concurrency))
+        question_terms = term_set(question) if self.model_router else None
+        results: List[Optional[str]] = [None] * total_chunks
+        checkpoint = run.checkpoint
+        
+        # 从检查点恢复已完成的片段，只处理缺失或失败（重试预算内）的片段
+        if checkpoint is not None:
+            for index, content in checkpoint.completed_results().items():
+                if index < total_chunks:
+                    results[index] = content
+                    run.restored_chunks += 1
+            pending = checkpoint.pending_indices(total_chunks, settings.checkpoint_max_retries)
+            run.retried_chunks = sum(1 for index in pending if checkpoint.attempts(index) > 0)
+            if run.restored_chunks:
+                logger.info(f"Restored {run.restored_chunks}/{total_chunks} chunks from checkpoint, {len(pending)} pending")
+        else:
+            pending = list(range(total_chunks))
+        if checkpoint is not None:
+            metrics.record_cache("checkpoint", hit=True, count=run.restored_chunks)
+            metrics.record_cache("checkpoint", hit=False, count=len(pending))
+        
+        # 落盘的分片按最大长度切出，没有可打包的小片段；不打包时片段内容在调用前才读取
+        if self.chunk_packer and not isinstance(chunks, ChunkSpool):
+            batches = self.chunk_packer.pack([chunks[i] for i in pending], pending)
+        else:
+            batches = [ChunkBatch([i], []) for i in pending]
+        
+        def record_batch(batch: ChunkBatch):
+            for index in batch.indices:
+                checkpoint.record(index, results[index])
+        
+        async def save_checkpoint(batch: ChunkBatch):
+            """检查点只用于续跑，写入失败（如磁盘已满）时记录日志并继续，不影响本次报告"""
+            if checkpoint is None:
+                return
+            try:
+                await run_io(record_batch, batch)
+            except Exception as e:
+                logger.warning(f"Failed to save checkpoint for chunk {', '.join(str(i + 1) for i in batch.indices)}: {e}")
+        
+        async def process_batch(batch: ChunkBatch):
+            metrics.CHUNKS_QUEUED.inc()
+            try:
+                await semaphore.acquire()
+            finally:
+                metrics.CHUNKS_QUEUED.dec()
+            try:
+                await process_batch_locked(batch)
+            finally:
+                semaphore.release()
+        
+        async def process_batch_locked(batch: ChunkBatch):
+            label = ", ".join(str(i + 1) for i in batch.indices)
+            
+            # 已取消的请求不再开始新的片段
+            if cancel_token is not None and cancel_token.cancelled:
+                run.cancelled_chunks += len(batch.indices)
+                return
+            
+            # 已超过截止时间的片段不再开始
+            if deadline is not None and deadline.expired:
+                run.skipped_chunks += len(batch.indices)
+                logger.warning(f"Skipping chunk {label}: request deadline exceeded")
+                return
+            
+            started.add(batch.indices[0])
+            try:
+                # 构建Prompt
+                if batch.is_packed:
+                    chunk_content = ChunkPacker.format_sections(batch)
+                    messages = self.prompt_service.build_packed_chat_messages(
+                        question=question,
+                        packed_content=chunk_content,
+                        chunk_indices=batch.indices,
+                        total_chunks=total_chunks
+                    )
+                else:
+                    chunk_content = batch.contents[0] if batch.contents else chunks[batch.indices[0]]
+                    messages = self.prompt_service.build_chat_messages(
+                        question=question,
+                        chunk_content=chunk_content,
+                        chunk_index=batch.indices[0],
+                        total_chunks=total_chunks
+                    )
+                
+                # 选择模型（打包批次包含末尾片段时按末尾片段路由）
+                model = None
+                if self.model_router:
+                    route_index = batch.indices[-1] if batch.indices[-1] == total_chunks - 1 else batch.indices[0]
+                    chunk_terms = None
+                    if run.chunk_terms is not None and not batch.is_packed:
+                        chunk_terms = run.chunk_terms[batch.indices[0]]
+                    model = self.model_router.select_model(
+                        question, chunk_content, route_index, total_chunks,
+                        question_terms=question_terms, chunk_terms=chunk_terms
+                    )
+                
+                # 调用OpenAI API（打包时按片段数放大输出上限，超时不超过剩余时间）
+                call = self._call_llm(
+                    messages,
+                    model=model,
+                    max_tokens=settings.max_tokens_per_chunk * len(batch.indices),
+                    timeout=deadline.call_timeout(settings.llm_api_timeout) if deadline else None
+                )
+                if deadline is not None:
+                    result = await asyncio.wait_for(call, timeout=deadline.remaining())
+                else:
+                    result = await call
+                run.model_usage.record(result.model, result.latency)
+                run.llm_latency.record(result.latency)
+                run.prompt_tokens += result.prompt_tokens
+                run.completion_tokens += result.completion_tokens
+                response = result.content
+                
+                if not response or not response.strip():
+                    logger.warning(f"Empty response for chunk {label}")
+                    await save_checkpoint(batch)
+                    return
+                
+                if batch.is_packed:
+                    for index, part in ChunkPacker.split_response(response, batch.indices).items():
+                        results[index] = part
+                else:
+                    results[batch.indices[0]] = response.strip()
+                await save_checkpoint(batch)
+                logger.info(f"Processed chunk {label}/{total_chunks}")
+                
+            except asyncio.TimeoutError:
+                if deadline is not None and deadline.expired:
+                    # 超过请求截止时间不是片段本身的失败，不计入重试次数，续跑时照常处理
+                    logger.error(f"Chunk {label} timed out: request deadline exceeded")
+                else:
+                    logger.error(f"Chunk {label} timed out")
+                    await save_checkpoint(batch)
+            except Exception as e:
+                logger.error(f"Error processing chunk {label}: {e}")
+                await save_checkpoint(batch)
+                # 继续处理其他片段
+        
+        async def process_batch_cancellable(batch: ChunkBatch):
+            try:
+                await process_batch(batch)
+            except asyncio.CancelledError:
+                # 只吞掉由取消令牌触发的取消
+                if cancel_token is None or not cancel_token.cancelled:
+                    raise
+                if batch.indices[0] in started:
+                    run.aborted_calls += 1
+                else:
+                    run.cancelled_chunks += len(batch.indices)
+        
+        tasks = [asyncio.ensure_future(process_batch_cancellable(batch)) for batch in batches]
+        if cancel_token is not None:
+            cancel_token.add_callback(lambda: [task.cancel() for task in tasks if not task.done()])
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # 一个片段任务异常（或本任务被取消）时取消其余片段，不再为失败的报告继续调用模型
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
             raise
+        return results
     
-    async def _call_openai_api(self, messages: List[Dict[str, str]]) -> str:
+    async def _call_openai_api(self, messages: List[Dict[str, str]], model: str = None) -> str:
         """调用OpenAI API"""
+        result = await self._call_llm(messages, model=model)
+        return result.content
+    
+    async def _call_llm(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        max_tokens: int = None,
+        timeout: float = None
+    ) -> LLMCallResult:
+        """调用大模型，启用对冲时由对冲器决定是否发出副本请求（副本优先避开主请求所在的端点）"""
+        if self.hedger is not None:
+            dispatched: List[LLMEndpoint] = []
+            return await self.hedger.run(lambda: self._dispatch_llm(messages, model, max_tokens, timeout, dispatched))
+        return await self._dispatch_llm(messages, model, max_tokens, timeout)
+    
+    async def _dispatch_llm(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        max_tokens: int = None,
+        timeout: float = None,
+        dispatched: Optional[List[LLMEndpoint]] = None
+    ) -> LLMCallResult:
+        """从端点池中选择端点并调用大模型；dispatched记录同一次调用已选用的端点，新请求避开其中第一个"""
+        model = model or settings.model_name
+        max_tokens = max_tokens or settings.max_tokens_per_chunk
+        timeout = timeout if timeout is not None else settings.llm_api_timeout
+        endpoint = await self.endpoint_pool.acquire(exclude=dispatched[0] if dispatched else None)
+        if dispatched is not None:
+            dispatched.append(endpoint)
+        start_time = time.monotonic()
+        latency = None
+        success = False
+        outcome = "error"
+        prompt_version = self.prompt_service.prompt_version
+        in_flight = metrics.LLM_IN_FLIGHT.labels(model)
+        in_flight.inc()
+        create = endpoint.client.chat.completions.create
+        abandoned = threading.Event()
+        call_task = None
+
+        def call(**kwargs):
+            # 排队期间已被放弃的调用不再发出请求
+            if abandoned.is_set():
+                return None
+            return create(**kwargs)
+
         try:
-            response = self.client.chat.completions.create(
-                model=settings.model_name,
-                messages=messages,
-                max_tokens=settings.max_tokens_per_chunk,
-                temperature=settings.temperature,
-                timeout=settings.llm_api_timeout
-            )
+            with span("llm_call", model=model, endpoint=endpoint.name):
+                call_task = asyncio.ensure_future(run_llm(
+                    call,
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=settings.temperature,
+                    timeout=timeout
+                ))
+                response = await asyncio.shield(call_task)
+            latency = time.monotonic() - start_time
+            success = True
+            outcome = "ok"
+            prompt_tokens, completion_tokens = self._token_usage(response, model, prompt_version)
             
             content = response.choices[0].message.content
-            return content if content else ""
+            return LLMCallResult(
+                content=content if content else "",
+                model=model,
+                endpoint=endpoint.name,
+                latency=latency,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens
+            )
             
+        except asyncio.CancelledError:
+            if call_task is not None and not call_task.done():
+                # 同步客户端的请求在线程中无法中止：线程真正结束后才释放端点额度并记录耗时，
+                # 使被放弃的请求仍受端点并发上限约束，且计入延迟直方图
+                abandoned.set()
+                call_task.add_done_callback(
+                    lambda task: self._finish_abandoned_call(task, endpoint, model, prompt_version, start_time)
+                )
+                raise
+            # 被取消的调用（如对冲落败）不计入端点失败
+            success = True
+            outcome = "cancelled"
+            raise
         except Exception as e:
-            logger.error(f"OpenAI API call failed: {e}")
+            logger.error(f"OpenAI API call failed on {endpoint.name}: {e}")
             raise
+        finally:
+            if not abandoned.is_set():
+                in_flight.dec()
+                metrics.LLM_LATENCY.labels(model, prompt_version, outcome).observe(time.monotonic() - start_time)
+                self.endpoint_pool.release(endpoint, latency=latency, success=success)
+    
+    def _finish_abandoned_call(self, task: asyncio.Future, endpoint, model: str, prompt_version: str, start_time: float):
+        """被放弃的模型请求在线程中结束后释放端点额度，并记录其实际耗时"""
+        duration = time.monotonic() - start_time
+        failed = not task.cancelled() and task.exception() is not None
+        metrics.LLM_IN_FLIGHT.labels(model).dec()
+        metrics.LLM_LATENCY.labels(model, prompt_version, "cancelled").observe(duration)
+        self.cancellation_stats["abandoned_calls"] += 1
+        self.cancellation_stats["abandoned_llm_seconds"] += duration
+        self.endpoint_pool.release(endpoint, success=not failed)
+    
+    @staticmethod
+    def _token_usage(response, model: str, prompt_version: str):
+        """读取并记录响应中的token用量，返回 (输入token, 输出token)；服务不返回usage时为0"""
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        if not isinstance(prompt_tokens, int):
+            prompt_tokens = 0
+        else:
+            metrics.LLM_PROMPT_TOKENS.labels(model, prompt_version).observe(prompt_tokens)
+        if not isinstance(completion_tokens, int):
+            completion_tokens = 0
+        else:
+            metrics.LLM_COMPLETION_TOKENS.labels(model, prompt_version).observe(completion_tokens)
+        return prompt_tokens, completion_tokens
+    
+    def get_llm_stats(self) -> Dict[str, Any]:
+        """获取LLM端点与对冲统计"""
+        return {
+            "endpoints": self.endpoint_pool.stats(),
+            "hedging": self.hedger.stats() if self.hedger is not None else None,
+            "cancellation": dict(self.cancellation_stats),
+            "cassette": self.cassette.stats() if self.cassette is not None else None
+        }
     
     def _combine_report_parts(self, parts: List[str]) -> str:
-        """拼接报告片段"""
+        """拼接报告片段
+
+        与先用空行拼接、再清理重复标题、最后补全标题的结果一致，但逐行处理各片段，只生成最终报告一份完整副本
+        """
         try:
-            # 简单的拼接策略
-            combined_report = "\n\n".join(parts)
-            
-            # 清理重复的标题
-            combined_report = self._clean_duplicate_headers(combined_report)
-            
+            lines = self._dedupe_header_lines(self._part_lines(parts))
             # 确保报告有合适的结构
-            if not combined_report.startswith("#"):
-                combined_report = "# 研究报告\n\n" + combined_report
-            
-            return combined_report
+            first = next(lines, None)
+            if first is None:
+                return "# 研究报告\n\n"
+            if not first.startswith("#"):
+                return "\n".join(chain(["# 研究报告", "", first], lines))
+            return "\n".join(chain([first], lines))
             
         except Exception as e:
             logger.error(f"Error combining report parts: {e}")
             raise
     
-    def _clean_duplicate_headers(self, report: str) -> str:
-        """清理重复的标题"""
-        lines = report.split('\n')
-        cleaned_lines = []
+    @staticmethod
+    def _part_lines(parts: List[str]) -> Iterator[str]:
+        """各片段的行，片段之间插入一个空行（等价于 "\\n\\n".join(parts).split("\\n")）"""
+        for index, part in enumerate(parts):
+            if index:
+                yield ""
+            yield from part.split("\n")
+    
+    @staticmethod
+    def _dedupe_header_lines(lines: Iterable[str]) -> Iterator[str]:
         seen_headers = set()
-        
         for line in lines:
             if line.strip().startswith('#'):
                 # 提取标题文本（去除#符号）
                 header_text = line.strip().lstrip('#').strip()
                 if header_text not in seen_headers:
-                    cleaned_lines.append(line)
                     seen_headers.add(header_text)
+                    yield line
             else:
-                cleaned_lines.append(line)
-        
-        return '\n'.join(cleaned_lines)
+                yield line
+    
+    def _clean_duplicate_headers(self, report: str) -> str:
+        """清理重复的标题"""
+        return '\n'.join(self._dedupe_header_lines(report.split('\n')))
     
     def _save_report(self, report_id: str, markdown_report: str, question: str, metadata: ReportMetadata = None):
-        """保存报告到文件"""
+        """保存报告到文件（正文按配置压缩，头部信息另存侧车元数据）"""
         try:
-            # 确保reports目录存在
-            os.makedirs(settings.reports_dir, exist_ok=True)
-            
-            # 保存Markdown文件
-            report_file_path = os.path.join(settings.reports_dir, f"{report_id}.md")
-            
-            with open(report_file_path, 'w', encoding='utf-8') as f:
-                f.write(f"# 研究报告\n\n")
-                f.write(f"**研究问题**: {question}\n\n")
-                f.write(f"**报告ID**: {report_id}\n\n")
-                f.write(f"**生成时间**: {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-                
-                # 保存元数据
-                if metadata:
-                    f.write(f"**总片段数**: {metadata.total_chunks}\n\n")
-                    f.write(f"**已处理片段**: {metadata.processed_chunks}\n\n")
-                    f.write(f"**每片段Token数**: {metadata.token_per_chunk}\n\n")
-                    f.write(f"**分片大小**: {metadata.chunk_size}\n\n")
-                    f.write(f"**重叠大小**: {metadata.overlap_size}\n\n")
-                    f.write(f"**模型上下文长度**: {metadata.model_context_length}\n\n")
-                    f.write(f"**处理时间**: {metadata.processing_time:.2f}秒\n\n")
-                    f.write(f"**使用模型**: {metadata.model_used}\n\n")
-                
-                f.write("---\n\n")
-                f.write(markdown_report)
+            created_at = time.strftime('%Y-%m-%d %H:%M:%S')
+            lines = [
+                "# 研究报告\n\n",
+                f"**研究问题**: {question}\n\n",
+                f"**报告ID**: {report_id}\n\n",
+                f"**生成时间**: {created_at}\n\n",
+            ]
+            
+            # 保存元数据
+            if metadata:
+                lines.append(f"**总片段数**: {metadata.total_chunks}\n\n")
+                lines.append(f"**已处理片段**: {metadata.processed_chunks}\n\n")
+                lines.append(f"**每片段Token数**: {metadata.token_per_chunk}\n\n")
+                lines.append(f"**分片大小**: {metadata.chunk_size}\n\n")
+                lines.append(f"**重叠大小**: {metadata.overlap_size}\n\n")
+                lines.append(f"**模型上下文长度**: {metadata.model_context_length}\n\n")
+                lines.append(f"**处理时间**: {metadata.processing_time:.2f}秒\n\n")
+                lines.append(f"**使用模型**: {metadata.model_used}\n\n")
+                if metadata.is_partial:
+                    lines.append(f"**报告状态**: 部分完成（已超过请求时限，跳过{metadata.skipped_chunks}个片段）\n\n")
+                if metadata.model_usage:
+                    lines.append(f"**模型调用统计**: {json.dumps(metadata.model_usage, ensure_ascii=False)}\n\n")
+            
+            lines.append("---\n\n")
+            lines.append(markdown_report)
+            content = "".join(lines)
+            
+            header = self._parse_report_header(content)
+            title = self._extract_title(content)
+            # 侧车元数据额外保存资源统计（阶段耗时、模型延迟、token用量、重试与缓存命中）
+            sidecar_metadata = dict(header["metadata"])
+            if metadata:
+                sidecar_metadata.update(metadata.model_dump(mode="json", include={
+                    "stage_timings", "llm_latency", "prompt_tokens", "completion_tokens", "retried_chunks", "cache_hits"
+                }))
+            report_file_path = self.report_store.save(report_id, content, {
+                "question": question,
+                "created_at": created_at,
+                "title": title,
+                "metadata": sidecar_metadata
+            })
             
             logger.info(f"Report saved to: {report_file_path}")
             
+            # 更新全文索引（索引失败不影响报告保存，缺失的索引可在重建时补齐）
+            try:
+                self.search_index.add(report_id, question, title, markdown_report, created_at)
+            except Exception as e:
+                logger.warning(f"Failed to index report {report_id}: {e}")
+            
         except Exception as e:
             logger.error(f"Error saving report: {e}")
             raise
     
+    @staticmethod
+    def _parse_report_header(content: str) -> Dict[str, Any]:
+        """解析报告头部的问题、生成时间与元数据（用于没有侧车文件的旧报告）"""
+        question = ""
+        created_at = ""
+        metadata = {}
+        
+        for line in content.split('\n'):
+            line = line.strip()
+            if line == '---':
+                break
+            if line.startswith('**研究问题**:'):
+                question = line.replace('**研究问题**:', '').strip()
+            elif line.startswith('**生成时间**:'):
+                created_at = line.replace('**生成时间**:', '').strip()
+            elif line.startswith('**总片段数**:'):
+                metadata['total_chunks'] = int(line.replace('**总片段数**:', '').strip())
+            elif line.startswith('**已处理片段**:'):
+                metadata['processed_chunks'] = int(line.replace('**已处理片段**:', '').strip())
+            elif line.startswith('**每片段Token数**:'):
+                metadata['token_per_chunk'] = int(line.replace('**每片段Token数**:', '').strip())
+            elif line.startswith('**分片大小**:'):
+                metadata['chunk_size'] = int(line.replace('**分片大小**:', '').strip())
+            elif line.startswith('**重叠大小**:'):
+                metadata['overlap_size'] = int(line.replace('**重叠大小**:', '').strip())
+            elif line.startswith('**模型上下文长度**:'):
+                metadata['model_context_length'] = int(line.replace('**模型上下文长度**:', '').strip())
+            elif line.startswith('**处理时间**:'):
+                time_str = line.replace('**处理时间**:', '').replace('秒', '').strip()
+                metadata['processing_time'] = float(time_str)
+            elif line.startswith('**使用模型**:'):
+                metadata['model_used'] = line.replace('**使用模型**:', '').strip()
+            elif line.startswith('**报告状态**:'):
+                metadata['is_partial'] = True
+                skipped = re.search(r'跳过(\d+)个片段', line)
+                if skipped:
+                    metadata['skipped_chunks'] = int(skipped.group(1))
+            elif line.startswith('**模型调用统计**:'):
+                metadata['model_usage'] = json.loads(line.replace('**模型调用统计**:', '').strip())
+        
+        return {"question": question, "created_at": created_at, "metadata": metadata}
+    
+    def _read_sidecar(self, report_id: str) -> Optional[Dict[str, Any]]:
+        """读取报告的头部信息：优先侧车文件，旧报告回退为解析正文"""
+        sidecar = self.report_store.read_sidecar(report_id)
+        if sidecar is not None:
+            return sidecar
+        if not self.report_store.exists(report_id):
+            return None
+        content = self.report_store.read_text(report_id)
+        return {**self._parse_report_header(content), "title": self._extract_title(content)}
+    
     def get_report(self, report_id: str) -> str:
         """获取报告内容"""
         try:
-            report_file_path = os.path.join(settings.reports_dir, f"{report_id}.md")
-            
-            if not os.path.exists(report_file_path):
-                raise FileNotFoundError(f"Report not found: {report_id}")
-            
-            with open(report_file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            return content
+            return self.report_store.read_text(report_id)
             
         except Exception as e:
             logger.error(f"Error getting report {report_id}: {e}")
             raise
     
+    def get_report_encoded(self, report_id: str, accept_encoding: Optional[str] = None):
+        """按Accept-Encoding获取报告正文字节，返回 (内容, 内容编码或None)"""
+        return self.report_store.read_encoded(report_id, parse_accept_encoding(accept_encoding))
+    
+    def delete_report(self, report_id: str):
+        """删除报告及其检查点"""
+        if not self.report_store.delete(report_id):
+            raise FileNotFoundError(f"Report not found: {report_id}")
+        if self.checkpoint_store is not None:
+            self.checkpoint_store.delete_by_report(report_id)
+        self.search_index.remove(report_id)
+        self.stats_log.remove(report_id)
+        logger.info(f"Report deleted: {report_id}")
+    
+    def run_maintenance(self) -> Dict[str, List[str]]:
+        """执行报告保留策略与归档：删除过期报告，把旧报告压缩进归档分片，清理过期的检查点"""
+        deleted = []
+        for report_id in self.report_store.select_expired():
+            try:
+                self.delete_report(report_id)
+                deleted.append(report_id)
+            except FileNotFoundError:
+                continue
+        
+        archived = []
+        if settings.report_archive_after_days > 0:
+            archived = self.report_store.archive_older_than(settings.report_archive_after_days * 86400)
+        
+        expired_checkpoints = []
+        if self.checkpoint_store is not None:
+            expired_checkpoints = self.checkpoint_store.sweep(settings.checkpoint_ttl, settings.checkpoint_completed_ttl)
+        
+        if deleted or archived:
+            logger.info(f"Report maintenance: {len(deleted)} deleted, {len(archived)} archived")
+        return {"deleted": deleted, "archived": archived, "expired_checkpoints": expired_checkpoints}
+    
+    # 剖析结果格式 -> 附属文件后缀
+    PROFILE_FORMATS = {
+        "speedscope": ".profile.speedscope.json",
+        "collapsed": ".profile.collapsed.txt",
+        "memory": ".profile.memory.json"
+    }
+    
+    def save_profile(self, report_id: str, profiler) -> Dict[str, Any]:
+        """把请求的剖析结果以speedscope与折叠栈两种格式保存在报告旁"""
+        self.report_store.save_artifact(
+            report_id, self.PROFILE_FORMATS["speedscope"],
+            profiler.speedscope_json(name=f"report {report_id}").encode("utf-8")
+        )
+        self.report_store.save_artifact(
+            report_id, self.PROFILE_FORMATS["collapsed"], profiler.collapsed().encode("utf-8")
+        )
+        logger.info(f"Profile saved for report {report_id}: {profiler.sample_count} samples in {profiler.duration:.2f}s")
+        return {
+            "samples": profiler.sample_count,
+            "duration": round(profiler.duration, 3),
+            "formats": ["speedscope", "collapsed"]
+        }
+    
+    def save_memory_profile(self, report_id: str, memory_profile) -> Dict[str, Any]:
+        """把请求的内存剖析结果（各阶段峰值、留存量与主要分配位置）保存在报告旁"""
+        self.report_store.save_artifact(report_id, self.PROFILE_FORMATS["memory"], memory_profile.to_json().encode("utf-8"))
+        summary = memory_profile.summary()
+        logger.info(f"Memory profile saved for report {report_id}: peak {summary['peak_mb']}MB")
+        return {**summary, "formats": ["memory"]}
+    
+    def get_profile_path(self, report_id: str, profile_format: str = "speedscope") -> str:
+        """获取报告剖析结果文件路径"""
+        suffix = self.PROFILE_FORMATS.get(profile_format)
+        if suffix is None:
+            raise ValueError(f"Unknown profile format: {profile_format}")
+        path = self.report_store.artifact_path(report_id, suffix)
+        if path is None:
+            raise FileNotFoundError(f"Profile not found for report: {report_id}")
+        return path
+    
+    def aggregate_stats(self, since: Optional[str] = None, prompt_version: Optional[str] = None, model: Optional[str] = None) -> Dict[str, Any]:
+        """跨报告汇总阶段耗时、模型延迟、token用量、重试与缓存命中"""
+        return self.stats_log.aggregate(since=since, prompt_version=prompt_version, model=model)
+    
+    def search_reports(self, query: str, page: int = 1, page_size: int = 20) -> Dict[str, Any]:
+        """按问题、标题与正文全文检索报告"""
+        return self.search_index.search(query, page, page_size)
+    
     def list_reports(self) -> List[Dict[str, Any]]:
         """列出所有报告"""
         try:
             reports = []
             
-            if not os.path.exists(settings.reports_dir):
-                return reports
-            
-            for filename in os.listdir(settings.reports_dir):
-                if filename.endswith('.md'):
-                    report_id = filename[:-3]  # 移除.md后缀
-                    report_path = os.path.join(settings.reports_dir, filename)
-                    
-                    try:
-                        with open(report_path, 'r', encoding='utf-8') as f:
-                            content = f.read()
-                        
-                        # 提取基本信息
-                        lines = content.split('\n')
-                        question = ""
-                        created_at = ""
-                        
-                        for line in lines:
-                            if line.startswith('**研究问题**:'):
-                                question = line.replace('**研究问题**:', '').strip()
-                            elif line.startswith('**生成时间**:'):
-                                created_at = line.replace('**生成时间**:', '').strip()
-                        
-                        reports.append({
-                            "report_id": report_id,
-                            "question": question,
-                            "created_at": created_at,
-                            "file_size": os.path.getsize(report_path)
-                        })
-                        
-                    except Exception as e:
-                        logger.warning(f"Error reading report {filename}: {e}")
+            for report_id in self.report_store.list_ids():
+                try:
+                    sidecar = self._read_sidecar(report_id)
+                    if sidecar is None:
                         continue
+                    reports.append({
+                        "report_id": report_id,
+                        "question": sidecar.get("question", ""),
+                        "created_at": sidecar.get("created_at", ""),
+                        "file_size": self.report_store.stored_size(report_id)
+                    })
+                    
+                except Exception as e:
+                    logger.warning(f"Error reading report {report_id}: {e}")
+                    continue
             
             # 按创建时间排序
             reports.sort(key=lambda x: x.get('created_at', ''), reverse=True)
@@ -258,84 +954,51 @@ class ReportService:
             raise 
 
     def get_report_metadata(self, report_id: str) -> dict:
-        """从报告文件中提取元数据"""
+        """获取报告元数据"""
         try:
-            report_file_path = os.path.join(settings.reports_dir, f"{report_id}.md")
-            if not os.path.exists(report_file_path):
-                return {}
-            
-            with open(report_file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            lines = content.split('\n')
-            metadata = {}
-            
-            for line in lines:
-                line = line.strip()
-                if line.startswith('**总片段数**:'):
-                    metadata['total_chunks'] = int(line.replace('**总片段数**:', '').strip())
-                elif line.startswith('**已处理片段**:'):
-                    metadata['processed_chunks'] = int(line.replace('**已处理片段**:', '').strip())
-                elif line.startswith('**每片段Token数**:'):
-                    metadata['token_per_chunk'] = int(line.replace('**每片段Token数**:', '').strip())
-                elif line.startswith('**分片大小**:'):
-                    metadata['chunk_size'] = int(line.replace('**分片大小**:', '').strip())
-                elif line.startswith('**重叠大小**:'):
-                    metadata['overlap_size'] = int(line.replace('**重叠大小**:', '').strip())
-                elif line.startswith('**模型上下文长度**:'):
-                    metadata['model_context_length'] = int(line.replace('**模型上下文长度**:', '').strip())
-                elif line.startswith('**处理时间**:'):
-                    time_str = line.replace('**处理时间**:', '').replace('秒', '').strip()
-                    metadata['processing_time'] = float(time_str)
-                elif line.startswith('**使用模型**:'):
-                    metadata['model_used'] = line.replace('**使用模型**:', '').strip()
-            
-            return metadata
+            sidecar = self._read_sidecar(report_id)
+            return dict(sidecar.get("metadata", {})) if sidecar else {}
             
         except Exception as e:
             logger.warning(f"Error reading report metadata for {report_id}: {e}")
             return {}
 
+    @staticmethod
+    def _extract_title(content: str) -> str:
+        """从报告内容中提取标题，找不到时返回空字符串"""
+        lines = content.split('\n')
+        for line in lines:
+            line = line.strip()
+            # 查找第一个一级标题（# 标题）
+            if line.startswith('# ') and not line.startswith('# 研究报告'):
+                return line.replace('# ', '').strip()
+        
+        # 如果没有找到标题，使用研究问题作为标题
+        for line in lines:
+            if line.startswith('**研究问题**:'):
+                question = line.replace('**研究问题**:', '').strip()
+                return f"{question}研究报告"
+        return ""
+
     def get_report_title(self, report_id: str) -> str:
         """提取报告标题"""
         try:
-            report_content = self.get_report(report_id)
-            
-            # 查找报告标题
-            lines = report_content.split('\n')
-            for line in lines:
-                line = line.strip()
-                # 查找第一个一级标题（# 标题）
-                if line.startswith('# ') and not line.startswith('# 研究报告'):
-                    title = line.replace('# ', '').strip()
-                    return title
-            
-            # 如果没有找到标题，使用研究问题作为标题
-            for line in lines:
-                if line.startswith('**研究问题**:'):
-                    question = line.replace('**研究问题**:', '').strip()
-                    return f"{question}研究报告"
+            sidecar = self._read_sidecar(report_id)
+            if sidecar is None:
+                raise FileNotFoundError(f"Report not found: {report_id}")
             
             # 默认标题
-            return f"研究报告_{report_id}"
+            return sidecar.get("title") or f"研究报告_{report_id}"
             
         except Exception as e:
             logger.error(f"Error extracting report title for {report_id}: {e}")
             return f"研究报告_{report_id}"
 
     def get_report_created_at(self, report_id: str) -> str:
-        """从报告文件中提取创建时间（如有）"""
+        """获取报告创建时间（如有）"""
         try:
-            report_file_path = os.path.join(settings.reports_dir, f"{report_id}.md")
-            if not os.path.exists(report_file_path):
-                return ""
-            with open(report_file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            lines = content.split('\n')
-            for line in lines:
-                if line.startswith('**生成时间**:'):
-                    return line.replace('**生成时间**:', '').strip()
-            return ""
+            sidecar = self._read_sidecar(report_id)
+            return sidecar.get("created_at", "") if sidecar else ""
         except Exception as e:
             logger.warning(f"Error reading report created_at for {report_id}: {e}")
-            return "" 
\ No newline at end of file
+            return ""
@@ -0,0 +1,170 @@
+import os
+import threading
+from typing import Dict, Any, List, Optional
+from loguru import logger
+from app.utils.journal import JsonlJournal
+from app.utils.metrics import percentile
+
+# 汇总时统计分位数的阶段
+STAGES = ("parse", "extract", "clean", "chunk", "llm", "combine", "save")
+
+
+def _summary(values: List[float]) -> Dict[str, Any]:
+    return {
+        "count": len(values),
+        "avg": round(sum(values) / len(values), 3) if values else None,
+        "p50": round(percentile(values, 0.5), 3) if values else None,
+        "p95": round(percentile(values, 0.95), 3) if values else None,
+        "max": round(max(values), 3) if values else None
+    }
+
+
+class ReportStatsLog:
+    """报告资源统计日志
+
+    每份报告保存后追加一条紧凑的统计记录（阶段耗时、模型延迟、token用量、重试与缓存命中）到
+    report_stats.jsonl，删除时追加del记录。汇总只读这一个文件（增量读取），无需逐个打开报告侧车文件。
+    日志不存在时从报告侧车元数据重建。
+    """
+
+    STATS_FILE = "report_stats.jsonl"
+    COMPACT_MIN_RECORDS = 1000
+
+    def __init__(self, report_store):
+        self.report_store = report_store
+        self._lock = threading.Lock()
+        self._journal = JsonlJournal()
+        self._reset(None)
+
+    def _reset(self, path: Optional[str]):
+        self._journal.reset(path)
+        self.records: Dict[str, Dict[str, Any]] = {}
+
+    def _stats_path(self) -> str:
+        return os.path.join(self.report_store.root, self.STATS_FILE)
+
+    def _apply(self, record: Dict[str, Any]):
+        if record.get("op") == "del":
+            self.records.pop(record["report_id"], None)
+        else:
+            self.records[record["report_id"]] = record
+
+    def _sync(self):
+        """增量读取其他实例追加的记录（调用方持有锁）"""
+        path = self._stats_path()
+        if path != self._journal.path:
+            self._reset(path)
+            if not os.path.exists(path):
+                self._rebuild()
+                return
+        if not os.path.exists(path):
+            return
+        self._journal.read(self._apply, lambda: self._reset(path))
+
+    def _append(self, record: Dict[str, Any]):
+        self._journal.append(record)
+        self._apply(record)
+
+    def _write_snapshot(self):
+        self._journal.rewrite(self.records.values())
+
+    def _rebuild(self):
+        """从报告侧车元数据重建（统计日志缺失时）"""
+        for report_id in self.report_store.list_ids():
+            sidecar = self.report_store.read_sidecar(report_id) or {}
+            metadata = sidecar.get("metadata") or {}
+            self._apply(self.build_record(report_id, sidecar.get("created_at", ""), metadata))
+        if self.records:
+            self._write_snapshot()
+            logger.info(f"Report stats rebuilt from {len(self.records)} report(s)")
+
+    @staticmethod
+    def build_record(report_id: str, created_at: str, metadata: Dict[str, Any], prompt_version: str = "") -> Dict[str, Any]:
+        """从报告元数据提取统计记录"""
+        return {
+            "op": "add",
+            "report_id": report_id,
+            "created_at": created_at,
+            "prompt_version": prompt_version,
+            "model_used": metadata.get("model_used", ""),
+            "processing_time": metadata.get("processing_time"),
+            "total_chunks": metadata.get("total_chunks", 0),
+            "is_partial": bool(metadata.get("is_partial", False)),
+            "stage_timings": metadata.get("stage_timings") or {},
+            "llm_latency": metadata.get("llm_latency") or {},
+            "prompt_tokens": metadata.get("prompt_tokens", 0),
+            "completion_tokens": metadata.get("completion_tokens", 0),
+            "retried_chunks": metadata.get("retried_chunks", 0),
+            "cache_hits": metadata.get("cache_hits") or {}
+        }
+
+    # ---- 公共接口 ----
+
+    def add(self, record: Dict[str, Any]):
+        """追加（或覆盖）一份报告的统计"""
+        with self._lock:
+            self._sync()
+            self._append(record)
+
+    def remove(self, report_id: str):
+        """移除报告的统计"""
+        with self._lock:
+            self._sync()
+            if report_id not in self.records:
+                return
+            self._append({"op": "del", "report_id": report_id})
+            if self._journal.needs_compaction(len(self.records), self.COMPACT_MIN_RECORDS):
+                self._write_snapshot()
+
+    def get(self, report_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._sync()
+            record = self.records.get(report_id)
+            return dict(record) if record else None
+
+    def aggregate(self, since: Optional[str] = None, prompt_version: Optional[str] = None, model: Optional[str] = None) -> Dict[str, Any]:
+        """汇总报告统计；since为 YYYY-MM-DD[ HH:MM:SS] 格式的起始时间"""
+        with self._lock:
+            self._sync()
+            records = [
+                record for record in self.records.values()
+                if (not since or record.get("created_at", "") >= since)
+                and (not prompt_version or record.get("prompt_version") == prompt_version)
+                and (not model or model in record.get("model_used", ""))
+            ]
+
+        stage_values: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        llm_p95: List[float] = []
+        llm_max: List[float] = []
+        cache_hits: Dict[str, int] = {}
+        for record in records:
+            for stage, seconds in record.get("stage_timings", {}).items():
+                if stage in stage_values:
+                    stage_values[stage].append(seconds)
+            latency = record.get("llm_latency") or {}
+            if latency.get("p95") is not None:
+                llm_p95.append(latency["p95"])
+            if latency.get("max") is not None:
+                llm_max.append(latency["max"])
+            for cache, hits in record.get("cache_hits", {}).items():
+                cache_hits[cache] = cache_hits.get(cache, 0) + hits
+
+        prompt_tokens = sum(record.get("prompt_tokens", 0) for record in records)
+        completion_tokens = sum(record.get("completion_tokens", 0) for record in records)
+        return {
+            "reports": len(records),
+            "partial_reports": sum(1 for record in records if record.get("is_partial")),
+            "processing_time": _summary([record["processing_time"] for record in records if record.get("processing_time") is not None]),
+            "stage_timings": {stage: _summary(values) for stage, values in stage_values.items() if values},
+            "llm_latency": {
+                "p95_of_reports": _summary(llm_p95),
+                "max": round(max(llm_max), 3) if llm_max else None
+            },
+            "tokens": {
+                "prompt": prompt_tokens,
+                "completion": completion_tokens,
+                "avg_per_report": round((prompt_tokens + completion_tokens) / len(records), 1) if records else None
+            },
+            "retried_chunks": sum(record.get("retried_chunks", 0) for record in records),
+            "cache_hits": cache_hits
+        }
@@ -0,0 +1,489 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Tuple
+from loguru import logger
+from app.core.config import settings
+
+try:
+    import zstandard
+except ImportError:  # zstd为可选依赖
+    zstandard = None
+
+
+# 存储编码 -> 报告正文文件后缀
+_SUFFIXES = {
+    "identity": ".md",
+    "gzip": ".md.gz",
+    "zstd": ".md.zst",
+}
+SIDECAR_SUFFIX = ".meta.json"
+# 与报告保存在一起的附属文件（如单请求剖析结果），删除报告时一并删除
+ARTIFACT_SUFFIXES = (".profile.speedscope.json", ".profile.collapsed.txt", ".profile.memory.json")
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=settings.report_compression_level)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=settings.report_compression_level).compress(data)
+    return data
+
+
+def _decompress(data: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed, cannot read zstd-compressed report")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+def parse_accept_encoding(header: Optional[str]) -> List[str]:
+    """解析Accept-Encoding请求头，返回客户端可接受的编码（忽略q=0）"""
+    accepted = []
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.append(token)
+    return accepted
+
+
+class ReportStore:
+    """报告文件存储
+
+    报告正文按settings.report_compression保存为 {id}.md / {id}.md.gz / {id}.md.zst，
+    头部信息（问题、生成时间、元数据）另存于 {id}.meta.json，列表与元数据查询无需读取正文。
+
+    目录布局：
+    - sharded（默认）: reports_dir/{sha1(id)[0:2]}/{sha1(id)[2:4]}/，避免单个目录文件过多
+    - flat: 直接保存在reports_dir下（旧布局，读取时始终兼容，可用 migrate_reports.py 迁移）
+    - archive/: 旧报告压缩归档的分片文件 archive-NNNNN.bin 与索引 index.json，
+      正文原样（含压缩）追加到分片中，按索引中的偏移量读取；删除使分片中仍被索引引用的数据占比
+      低于 report_archive_compact_ratio 时，把剩余报告重写到新分片并删除旧分片
+    """
+
+    ARCHIVE_DIR = "archive"
+    ARCHIVE_INDEX = "index.json"
+
+    def __init__(self, base_dir: str = None):
+        self._base_dir = base_dir
+        self._lock = threading.Lock()
+        self._archive_cache: Optional[Tuple[str, float, Dict[str, Dict[str, Any]]]] = None
+
+    @property
+    def root(self) -> str:
+        return self._base_dir or settings.reports_dir
+
+    @staticmethod
+    def storage_encoding() -> str:
+        """当前配置的存储编码；未安装zstandard时回退为gzip"""
+        encoding = (settings.report_compression or "none").lower()
+        if encoding in ("none", "identity", ""):
+            return "identity"
+        if encoding == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed, falling back to gzip report compression")
+            return "gzip"
+        if encoding not in _SUFFIXES:
+            raise ValueError(f"Unsupported report compression: {encoding}")
+        return encoding
+
+    # ---- 路径 ----
+
+    def _shard_dir(self, report_id: str) -> str:
+        digest = hashlib.sha1(report_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], digest[2:4])
+
+    def _directories(self, report_id: str) -> List[str]:
+        """报告可能所在的目录，写入布局优先"""
+        if settings.report_layout == "flat":
+            return [self.root, self._shard_dir(report_id)]
+        return [self._shard_dir(report_id), self.root]
+
+    def _find_body(self, report_id: str) -> Optional[Tuple[str, str]]:
+        """查找未归档的报告正文文件，返回 (路径, 存储编码)"""
+        for directory in self._directories(report_id):
+            for encoding, suffix in _SUFFIXES.items():
+                path = os.path.join(directory, f"{report_id}{suffix}")
+                if os.path.exists(path):
+                    return path, encoding
+        return None
+
+    def _find_sidecar(self, report_id: str) -> Optional[str]:
+        for directory in self._directories(report_id):
+            path = os.path.join(directory, f"{report_id}{SIDECAR_SUFFIX}")
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _remove_live(self, report_id: str) -> bool:
+        """删除所有布局与编码下的正文和侧车文件，返回是否存在正文"""
+        found = False
+        for directory in self._directories(report_id):
+            for suffix in _SUFFIXES.values():
+                path = os.path.join(directory, f"{report_id}{suffix}")
+                if os.path.exists(path):
+                    os.remove(path)
+                    found = True
+            for suffix in (SIDECAR_SUFFIX,) + ARTIFACT_SUFFIXES:
+                extra_path = os.path.join(directory, f"{report_id}{suffix}")
+                if os.path.exists(extra_path):
+                    os.remove(extra_path)
+        return found
+
+    def body_path(self, report_id: str) -> Optional[str]:
+        """未归档报告的正文文件路径"""
+        found = self._find_body(report_id)
+        return found[0] if found else None
+
+    def save_artifact(self, report_id: str, suffix: str, data: bytes) -> str:
+        """在报告所在目录保存附属文件，返回路径"""
+        if suffix not in ARTIFACT_SUFFIXES:
+            raise ValueError(f"Unknown report artifact: {suffix}")
+        directory = self.root if settings.report_layout == "flat" else self._shard_dir(report_id)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{report_id}{suffix}")
+        self._atomic_write(path, data)
+        return path
+
+    def artifact_path(self, report_id: str, suffix: str) -> Optional[str]:
+        """报告附属文件的路径，不存在时返回None"""
+        for directory in self._directories(report_id):
+            path = os.path.join(directory, f"{report_id}{suffix}")
+            if os.path.exists(path):
+                return path
+        return None
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    # ---- 归档索引 ----
+
+    def _archive_dir(self) -> str:
+        return os.path.join(self.root, self.ARCHIVE_DIR)
+
+    def _load_archive_index(self) -> Dict[str, Dict[str, Any]]:
+        """读取归档索引（按文件修改时间缓存，调用方持有锁）"""
+        path = os.path.join(self._archive_dir(), self.ARCHIVE_INDEX)
+        if not os.path.exists(path):
+            return {}
+        mtime = os.path.getmtime(path)
+        if self._archive_cache and self._archive_cache[0] == path and self._archive_cache[1] == mtime:
+            return self._archive_cache[2]
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        self._archive_cache = (path, mtime, index)
+        return index
+
+    def _save_archive_index(self, index: Dict[str, Dict[str, Any]]):
+        path = os.path.join(self._archive_dir(), self.ARCHIVE_INDEX)
+        self._atomic_write(path, json.dumps(index, ensure_ascii=False).encode("utf-8"))
+        self._archive_cache = (path, os.path.getmtime(path), index)
+
+    def _archive_entry(self, report_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._load_archive_index().get(report_id)
+
+    def _read_archived(self, entry: Dict[str, Any]) -> bytes:
+        with open(os.path.join(self._archive_dir(), entry["shard"]), "rb") as f:
+            f.seek(entry["offset"])
+            return f.read(entry["length"])
+
+    def _shards(self) -> List[str]:
+        return sorted(name for name in os.listdir(self._archive_dir()) if name.endswith(".bin"))
+
+    def _new_shard(self) -> str:
+        shards = self._shards()
+        number = int(shards[-1][len("archive-"):-len(".bin")]) + 1 if shards else 1
+        return f"archive-{number:05d}.bin"
+
+    def _current_shard(self, index: Dict[str, Dict[str, Any]]) -> str:
+        """当前可追加的归档分片，超过大小上限时开启新分片"""
+        shards = self._shards()
+        if shards and os.path.getsize(os.path.join(self._archive_dir(), shards[-1])) < settings.report_archive_shard_bytes:
+            return shards[-1]
+        return self._new_shard()
+
+    def _compact_shard(self, index: Dict[str, Dict[str, Any]], shard: str) -> Dict[str, Dict[str, Any]]:
+        """分片中仍被引用的数据占比低于阈值时，把这些报告重写到新分片，返回更新后的索引（调用方持有锁）
+
+        先写新分片与索引再删除旧分片，中途失败时索引仍指向完整的旧分片。
+        """
+        shard_path = os.path.join(self._archive_dir(), shard)
+        if not os.path.exists(shard_path):
+            return index
+        live = sorted((entry["offset"], report_id) for report_id, entry in index.items() if entry["shard"] == shard)
+        if not live:
+            os.remove(shard_path)
+            return index
+        live_bytes = sum(index[report_id]["length"] for _, report_id in live)
+        size = os.path.getsize(shard_path)
+        if live_bytes >= size * settings.report_archive_compact_ratio:
+            return index
+
+        new_shard = self._new_shard()
+        index = dict(index)
+        with open(shard_path, "rb") as src, open(os.path.join(self._archive_dir(), new_shard), "wb") as dst:
+            for offset, report_id in live:
+                entry = index[report_id]
+                src.seek(offset)
+                data = src.read(entry["length"])
+                index[report_id] = {**entry, "shard": new_shard, "offset": dst.tell()}
+                dst.write(data)
+            dst.flush()
+            os.fsync(dst.fileno())
+        self._save_archive_index(index)
+        os.remove(shard_path)
+        logger.info(f"Compacted archive shard {shard} into {new_shard}: {live_bytes}/{size} bytes live")
+        return index
+
+    # ---- 读写 ----
+
+    def save(self, report_id: str, content: str, sidecar: Dict[str, Any]) -> str:
+        """保存报告正文与侧车元数据，返回正文文件路径"""
+        encoding = self.storage_encoding()
+        raw = content.encode("utf-8")
+        directory = self.root if settings.report_layout == "flat" else self._shard_dir(report_id)
+        os.makedirs(directory, exist_ok=True)
+
+        # 清理同一报告的旧版本（如压缩或布局配置变更后重新生成、已归档后恢复生成）
+        self._remove_live(report_id)
+        self._remove_archived(report_id)
+
+        path = os.path.join(directory, f"{report_id}{_SUFFIXES[encoding]}")
+        self._atomic_write(path, _compress(raw, encoding))
+        sidecar = {
+            **sidecar,
+            "report_id": report_id,
+            "encoding": encoding,
+            "size": len(raw),
+            "saved_at": time.time()
+        }
+        self._atomic_write(
+            os.path.join(directory, f"{report_id}{SIDECAR_SUFFIX}"),
+            json.dumps(sidecar, ensure_ascii=False).encode("utf-8")
+        )
+        return path
+
+    def _read_stored(self, report_id: str) -> Tuple[bytes, str]:
+        """读取存储的原始字节（可能已压缩），返回 (内容, 存储编码)"""
+        found = self._find_body(report_id)
+        if found is not None:
+            path, encoding = found
+            with open(path, "rb") as f:
+                return f.read(), encoding
+        entry = self._archive_entry(report_id)
+        if entry is not None:
+            try:
+                return self._read_archived(entry), entry["encoding"]
+            except FileNotFoundError:
+                # 查到索引后分片被压缩删除，按新的位置再读一次
+                entry = self._archive_entry(report_id)
+                if entry is not None:
+                    return self._read_archived(entry), entry["encoding"]
+        raise FileNotFoundError(f"Report not found: {report_id}")
+
+    def exists(self, report_id: str) -> bool:
+        return self._find_body(report_id) is not None or self._archive_entry(report_id) is not None
+
+    def read_text(self, report_id: str) -> str:
+        """读取解压后的报告正文"""
+        data, encoding = self._read_stored(report_id)
+        return _decompress(data, encoding).decode("utf-8")
+
+    def read_encoded(self, report_id: str, accepted: Iterable[str]) -> Tuple[bytes, Optional[str]]:
+        """按客户端可接受的编码读取正文
+
+        存储编码被接受时原样返回压缩字节（不重新压缩），否则返回解压后的内容，编码为None
+        """
+        data, encoding = self._read_stored(report_id)
+        if encoding == "identity":
+            return data, None
+        accepted = set(accepted)
+        if encoding in accepted or "*" in accepted:
+            return data, encoding
+        return _decompress(data, encoding), None
+
+    def read_sidecar(self, report_id: str) -> Optional[Dict[str, Any]]:
+        """读取侧车元数据，不存在（旧格式报告）时返回None"""
+        path = self._find_sidecar(report_id)
+        if path is not None:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        entry = self._archive_entry(report_id)
+        if entry is not None:
+            return entry.get("sidecar")
+        return None
+
+    def stored_size(self, report_id: str) -> int:
+        """正文在磁盘上的大小"""
+        found = self._find_body(report_id)
+        if found is not None:
+            return os.path.getsize(found[0])
+        entry = self._archive_entry(report_id)
+        return entry["length"] if entry else 0
+
+    def _remove_archived(self, report_id: str) -> bool:
+        """从归档索引中移除报告；分片中不再有报告时删除分片文件，剩余数据占比过低时压缩分片"""
+        with self._lock:
+            index = self._load_archive_index()
+            entry = index.get(report_id)
+            if entry is None:
+                return False
+            index = {key: value for key, value in index.items() if key != report_id}
+            self._save_archive_index(index)
+            self._compact_shard(index, entry["shard"])
+            return True
+
+    def delete(self, report_id: str) -> bool:
+        """删除报告正文与侧车文件（含归档），返回报告是否存在"""
+        found = self._remove_live(report_id)
+        archived = self._remove_archived(report_id)
+        return found or archived
+
+    def _iter_live(self) -> Iterator[Tuple[str, str]]:
+        """遍历未归档的报告，产出 (报告ID, 正文路径)"""
+        archive_dir = self._archive_dir()
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self.root and self.ARCHIVE_DIR in dirnames:
+                dirnames.remove(self.ARCHIVE_DIR)
+            if dirpath.startswith(archive_dir):
+                continue
+            for filename in filenames:
+                for suffix in _SUFFIXES.values():
+                    if filename.endswith(suffix):
+                        yield filename[:-len(suffix)], os.path.join(dirpath, filename)
+                        break
+
+    def list_ids(self) -> List[str]:
+        """列出所有报告ID（含归档）"""
+        if not os.path.exists(self.root):
+            return []
+        ids = {report_id for report_id, _ in self._iter_live()}
+        with self._lock:
+            ids.update(self._load_archive_index())
+        return sorted(ids)
+
+    # ---- 迁移、归档与保留策略 ----
+
+    def migrate_to_sharded(self) -> int:
+        """把平铺布局下的报告移动到分片目录，返回迁移的报告数"""
+        if not os.path.exists(self.root):
+            return 0
+        migrated = 0
+        for filename in os.listdir(self.root):
+            path = os.path.join(self.root, filename)
+            if not os.path.isfile(path):
+                continue
+            for suffix in list(_SUFFIXES.values()) + [SIDECAR_SUFFIX]:
+                if filename.endswith(suffix):
+                    report_id = filename[:-len(suffix)]
+                    shard_dir = self._shard_dir(report_id)
+                    os.makedirs(shard_dir, exist_ok=True)
+                    os.replace(path, os.path.join(shard_dir, filename))
+                    if suffix != SIDECAR_SUFFIX:
+                        migrated += 1
+                    break
+        logger.info(f"Migrated {migrated} report(s) to sharded layout under {self.root}")
+        return migrated
+
+    def _saved_at(self, report_id: str, body_path: Optional[str] = None) -> float:
+        """报告保存时间：侧车中的saved_at，其次为生成时间，最后为文件修改时间"""
+        sidecar = self.read_sidecar(report_id) or {}
+        if sidecar.get("saved_at"):
+            return float(sidecar["saved_at"])
+        if sidecar.get("created_at"):
+            try:
+                return datetime.strptime(sidecar["created_at"], "%Y-%m-%d %H:%M:%S").timestamp()
+            except ValueError:
+                pass
+        body_path = body_path or self.body_path(report_id)
+        return os.path.getmtime(body_path) if body_path else 0.0
+
+    def archive_older_than(self, max_age_seconds: float, now: float = None) -> List[str]:
+        """把保存时间早于max_age_seconds的报告追加到归档分片，返回归档的报告ID"""
+        now = now or time.time()
+        candidates = [
+            (report_id, path) for report_id, path in self._iter_live()
+            if now - self._saved_at(report_id, path) > max_age_seconds
+        ]
+        if not candidates:
+            return []
+
+        archived = []
+        os.makedirs(self._archive_dir(), exist_ok=True)
+        with self._lock:
+            index = dict(self._load_archive_index())
+            for report_id, path in candidates:
+                encoding = next(enc for enc, suffix in _SUFFIXES.items() if path.endswith(suffix))
+                with open(path, "rb") as f:
+                    data = f.read()
+                sidecar_path = self._find_sidecar(report_id)
+                sidecar = None
+                if sidecar_path:
+                    with open(sidecar_path, "r", encoding="utf-8") as f:
+                        sidecar = json.load(f)
+
+                shard = self._current_shard(index)
+                with open(os.path.join(self._archive_dir(), shard), "ab") as f:
+                    offset = f.tell()
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                index[report_id] = {
+                    "shard": shard,
+                    "offset": offset,
+                    "length": len(data),
+                    "encoding": encoding,
+                    "sidecar": sidecar
+                }
+                archived.append(report_id)
+            # 先写索引再删除原文件，中途失败时报告仍可从原文件读取
+            self._save_archive_index(index)
+
+        for report_id in archived:
+            self._remove_live(report_id)
+        logger.info(f"Archived {len(archived)} report(s)")
+        return archived
+
+    def select_expired(self, now: float = None) -> List[str]:
+        """按保留策略（保存天数、报告数、总大小）选出应删除的报告，最旧的优先"""
+        now = now or time.time()
+        max_age = settings.report_retention_days * 86400
+        max_count = settings.report_retention_max_count
+        max_bytes = settings.report_retention_max_bytes
+        if not (max_age or max_count or max_bytes):
+            return []
+
+        reports = sorted(
+            ((self._saved_at(report_id), self.stored_size(report_id), report_id) for report_id in self.list_ids()),
+            reverse=True
+        )
+        expired = []
+        kept_bytes = 0
+        kept_count = 0
+        for saved_at, size, report_id in reports:
+            if (
+                (max_age and now - saved_at > max_age)
+                or (max_count and kept_count >= max_count)
+                or (max_bytes and kept_bytes + size > max_bytes)
+            ):
+                expired.append(report_id)
+                continue
+            kept_count += 1
+            kept_bytes += size
+        return expired
@@ -0,0 +1,364 @@
+import heapq
+import math
+import os
+import threading
+from collections import Counter
+from typing import Dict, Any, List, Optional, Set, Tuple
+from loguru import logger
+from app.utils.journal import JsonlJournal
+from app.utils.tokenizer import tokenize
+
+# 各字段的词频权重：问题与标题命中比正文更重要
+FIELD_WEIGHTS = {"question": 3, "title": 2, "body": 1}
+
+# BM25参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 平均文档长度变化超过该比例时重新计算长度归一化因子
+NORM_REFRESH_RATIO = 0.05
+# 出现在超过该比例报告中的常见词项只参与排序，不单独召回（查询中有更少见的词项时）
+COMMON_TERM_RATIO = 0.5
+# 影响值（BM25中与词项权重无关的部分 tf/(tf+norm)，取值0~1）的分档数
+IMPACT_LEVELS = 256
+# 倒排列表至少有这么多报告时缓存并增量维护其影响值分档，更短的列表在查询时直接分档
+IMPACT_CACHE_MIN_POSTINGS = 256
+# 单次查询最多完整打分的候选报告数，超出后提前结束（结果为近似的前若干条，总数仍精确）
+MAX_SCORED_CANDIDATES = 20000
+
+# 按影响值上限降序排列的分档：[(该档影响值上限, 报告ID), ...]
+ImpactBuckets = List[Tuple[float, Tuple[str, ...]]]
+
+
+class ReportSearchIndex:
+    """报告全文检索的倒排索引
+
+    索引在内存中维护 词项 -> {报告ID: 加权词频}，变更以追加方式写入日志文件
+    search_index.jsonl（add/del 两种记录），启动时重放日志；其他实例追加的记录在查询前增量读取。
+    删除记录过多时重写日志进行压缩。日志不存在时从报告存储重建。
+    分词与模型路由一致：中文按字二元组，拉丁文按单词。
+
+    查询按阈值算法取前若干条：被查询过的词项的倒排列表按影响值分档缓存（增删报告时增量维护），
+    从得分上限最高的分档开始完整打分，第k名的得分超过未打分报告的得分上限时结束，常见词项不必遍历全部报告。
+    打分在锁外基于查询时的快照进行，不阻塞保存报告时的索引更新。
+    """
+
+    INDEX_FILE = "search_index.jsonl"
+    COMPACT_MIN_RECORDS = 1000
+
+    def __init__(self, report_store):
+        self.report_store = report_store
+        self._lock = threading.Lock()
+        self._journal = JsonlJournal()
+        self._reset(None)
+
+    def _reset(self, path: Optional[str]):
+        self._journal.reset(path)
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self._total_length = 0
+        # 缓存的BM25长度归一化因子，按计算时的平均长度维护，避免每次查询遍历全部文档
+        self._norms: Dict[str, float] = {}
+        self._norm_avg = 0.0
+        # 词项 -> 影响值分档 -> 报告ID；归一化因子重新计算时清空
+        self._impacts: Dict[str, Dict[int, Set[str]]] = {}
+
+    def _index_path(self) -> str:
+        return os.path.join(self.report_store.root, self.INDEX_FILE)
+
+    @staticmethod
+    def _weighted_terms(question: str, title: str, body: str) -> Counter:
+        counts = Counter()
+        for field, text in (("question", question), ("title", title), ("body", body)):
+            weight = FIELD_WEIGHTS[field]
+            for term in tokenize(text):
+                counts[term] += weight
+        return counts
+
+    # ---- 内存索引维护 ----
+
+    def _apply(self, record: Dict[str, Any]):
+        report_id = record["id"]
+        self._remove_document(report_id)
+        if record["op"] == "add":
+            tf = record["tf"]
+            for term, count in tf.items():
+                self.postings.setdefault(term, {})[report_id] = count
+            self.documents[report_id] = {
+                "question": record.get("question", ""),
+                "title": record.get("title", ""),
+                "created_at": record.get("created_at", ""),
+                "length": record["len"],
+                "terms": list(tf)
+            }
+            self._total_length += record["len"]
+            if self._norm_avg:
+                norm = self._norms[report_id] = self._norm(record["len"], self._norm_avg)
+                impacts = self._impacts
+                for term, count in tf.items():
+                    levels = impacts.get(term)
+                    if levels is not None:
+                        levels.setdefault(self._level(count, norm), set()).add(report_id)
+
+    def _remove_document(self, report_id: str):
+        document = self.documents.pop(report_id, None)
+        if document is None:
+            return
+        norm = self._norms.pop(report_id, None)
+        for term in document["terms"]:
+            postings = self.postings.get(term)
+            if postings is not None:
+                tf = postings.pop(report_id, None)
+                levels = self._impacts.get(term)
+                if levels is not None and tf is not None and norm is not None:
+                    level = self._level(tf, norm)
+                    bucket = levels.get(level)
+                    if bucket is not None:
+                        bucket.discard(report_id)
+                        if not bucket:
+                            del levels[level]
+                if not postings:
+                    del self.postings[term]
+                    self._impacts.pop(term, None)
+        self._total_length -= document["length"]
+
+    @staticmethod
+    def _norm(length: int, avg_length: float) -> float:
+        return BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+
+    @staticmethod
+    def _level(tf: int, norm: float) -> int:
+        return min(IMPACT_LEVELS - 1, int(tf / (tf + norm) * IMPACT_LEVELS))
+
+    def _refresh_norms(self):
+        avg_length = (self._total_length / len(self.documents)) or 1.0
+        if self._norm_avg and abs(avg_length - self._norm_avg) <= NORM_REFRESH_RATIO * self._norm_avg:
+            return
+        self._norm_avg = avg_length
+        self._norms = {
+            report_id: self._norm(document["length"], avg_length)
+            for report_id, document in self.documents.items()
+        }
+        self._impacts = {}
+
+    def _impact_buckets(self, term: str, postings: Dict[str, int], limit: int) -> ImpactBuckets:
+        """词项按影响值上限降序的分档快照（调用方持有锁），报告数累计达到limit后的分档不再复制"""
+        levels = self._impacts.get(term)
+        if levels is None:
+            levels = {}
+            norms = self._norms
+            level_of = self._level
+            for report_id, tf in postings.items():
+                levels.setdefault(level_of(tf, norms[report_id]), set()).add(report_id)
+            if len(postings) >= IMPACT_CACHE_MIN_POSTINGS:
+                self._impacts[term] = levels
+        buckets = []
+        copied = 0
+        for level in sorted(levels, reverse=True):
+            report_ids = tuple(levels[level])
+            buckets.append(((level + 1) / IMPACT_LEVELS, report_ids))
+            copied += len(report_ids)
+            if copied >= limit:
+                break
+        return buckets
+
+    # ---- 日志读写 ----
+
+    def _sync(self):
+        """确保内存索引与日志文件一致（调用方持有锁）"""
+        path = self._index_path()
+        if path != self._journal.path:
+            self._reset(path)
+            if not os.path.exists(path):
+                self._rebuild()
+                return
+
+        if not os.path.exists(path):
+            if self.documents:
+                # 日志文件被删除，从报告存储重建
+                self._reset(path)
+                self._rebuild()
+            return
+
+        self._journal.read(self._apply, lambda: self._reset(path))
+
+    def _append(self, record: Dict[str, Any]):
+        self._journal.append(record)
+        self._apply(record)
+
+    def _document_record(self, report_id: str) -> Dict[str, Any]:
+        document = self.documents[report_id]
+        return {
+            "op": "add",
+            "id": report_id,
+            "question": document["question"],
+            "title": document["title"],
+            "created_at": document["created_at"],
+            "len": document["length"],
+            "tf": {term: self.postings[term][report_id] for term in document["terms"]}
+        }
+
+    def _write_snapshot(self):
+        self._journal.rewrite(self._document_record(report_id) for report_id in self.documents)
+
+    def _maybe_compact(self):
+        if self._journal.needs_compaction(len(self.documents), self.COMPACT_MIN_RECORDS):
+            self._write_snapshot()
+            logger.info(f"Search index compacted to {len(self.documents)} report(s)")
+
+    def _rebuild(self):
+        """从报告存储重建索引（索引文件缺失时）"""
+        report_ids = self.report_store.list_ids()
+        for report_id in report_ids:
+            try:
+                sidecar = self.report_store.read_sidecar(report_id) or {}
+                # 去掉报告头部，只索引正文
+                body = self.report_store.read_text(report_id).split("\n---\n", 1)[-1]
+            except Exception as e:
+                logger.warning(f"Skipping report {report_id} while rebuilding search index: {e}")
+                continue
+            self._apply(self._build_record(
+                report_id, sidecar.get("question", ""), sidecar.get("title", ""),
+                body, sidecar.get("created_at", "")
+            ))
+        if report_ids:
+            self._write_snapshot()
+            logger.info(f"Search index rebuilt from {len(self.documents)} report(s)")
+
+    def _build_record(self, report_id: str, question: str, title: str, body: str, created_at: str) -> Dict[str, Any]:
+        tf = self._weighted_terms(question, title, body)
+        return {
+            "op": "add",
+            "id": report_id,
+            "question": question,
+            "title": title,
+            "created_at": created_at,
+            "len": sum(tf.values()),
+            "tf": dict(tf)
+        }
+
+    # ---- 公共接口 ----
+
+    def add(self, report_id: str, question: str, title: str, body: str, created_at: str = ""):
+        """索引（或重新索引）一份报告"""
+        with self._lock:
+            self._sync()
+            self._append(self._build_record(report_id, question, title, body, created_at))
+            self._maybe_compact()
+
+    def remove(self, report_id: str):
+        """从索引中移除报告"""
+        with self._lock:
+            self._sync()
+            if report_id not in self.documents:
+                return
+            self._append({"op": "del", "id": report_id})
+            self._maybe_compact()
+
+    def search(self, query: str, page: int = 1, page_size: int = 20) -> Dict[str, Any]:
+        """BM25排序检索，返回分页结果"""
+        page = max(1, page)
+        page_size = max(1, page_size)
+        terms = set(tokenize(query))
+        start = (page - 1) * page_size
+
+        # 锁内只取快照（各词项的影响值分档、倒排表引用与命中总数），打分在锁外进行
+        lists = []
+        norms: Dict[str, float] = {}
+        total = 0
+        with self._lock:
+            self._sync()
+            documents = self.documents
+            total_documents = len(documents)
+            if terms and total_documents:
+                self._refresh_norms()
+                norms = self._norms
+                common_limit = COMMON_TERM_RATIO * total_documents
+                matched = [(term, self.postings[term]) for term in terms if term in self.postings]
+                has_selective = any(len(postings) <= common_limit for _, postings in matched)
+                for term, postings in matched:
+                    idf = math.log(1 + (total_documents - len(postings) + 0.5) / (len(postings) + 0.5))
+                    # 查询中有更少见的词项时，常见词项只给已召回的报告加分，不单独召回
+                    recall = not has_selective or len(postings) <= common_limit
+                    buckets = self._impact_buckets(term, postings, MAX_SCORED_CANDIDATES if recall else 1)
+                    lists.append((idf * (BM25_K1 + 1), postings, recall, buckets))
+                recalled = [postings for _, postings, recall, _ in lists if recall]
+                if any(len(postings) == total_documents for postings in recalled):
+                    total = total_documents
+                elif recalled:
+                    total = len(set().union(*recalled))
+
+        top = self._top_k(lists, norms, documents, start + page_size) if lists else []
+        results = []
+        for score, _, report_id in top[start:]:
+            document = documents.get(report_id)
+            if document is None:
+                continue
+            results.append({
+                "report_id": report_id,
+                "question": document["question"],
+                "title": document["title"],
+                "created_at": document["created_at"],
+                "score": round(score, 4)
+            })
+
+        return {
+            "query": query,
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "results": results
+        }
+
+    @staticmethod
+    def _top_k(lists, norms: Dict[str, float], documents: Dict[str, Dict[str, Any]], k: int) -> List[Tuple[float, str, str]]:
+        """阈值算法取前k条 (得分, 创建时间, 报告ID)，得分相同时较新的报告在前
+
+        每次取得分上限（词项权重 × 分档影响值上限）最高的召回分档，为其中的报告完整打分；
+        第k名的得分超过未打分报告的得分上限（各召回列表当前分档的上限之和，加上常见词项的最高分档上限）时结束。
+        """
+        scoring = [(weight, postings) for weight, postings, _, _ in lists]
+        bound_offset = sum(weight * buckets[0][0] for weight, _, recall, buckets in lists if not recall and buckets)
+        recall_lists = [(weight, buckets) for weight, _, recall, buckets in lists if recall]
+        positions = [0] * len(recall_lists)
+
+        heap: List[Tuple[float, str, str]] = []
+        seen: Set[str] = set()
+        while len(seen) < MAX_SCORED_CANDIDATES:
+            best = -1
+            best_bound = -1.0
+            bound = bound_offset
+            for i, (weight, buckets) in enumerate(recall_lists):
+                if positions[i] < len(buckets):
+                    upper = weight * buckets[positions[i]][0]
+                    bound += upper
+                    if upper > best_bound:
+                        best, best_bound = i, upper
+            if best < 0 or (len(heap) == k and heap[0][0] > bound):
+                break
+            report_ids = recall_lists[best][1][positions[best]][1]
+            positions[best] += 1
+            for report_id in report_ids:
+                if report_id in seen:
+                    continue
+                seen.add(report_id)
+                norm = norms.get(report_id)
+                document = documents.get(report_id)
+                if norm is None or document is None:
+                    # 快照之后新增或删除的报告
+                    continue
+                score = 0.0
+                for weight, postings in scoring:
+                    tf = postings.get(report_id)
+                    if tf:
+                        score += weight * tf / (tf + norm)
+                item = (score, document["created_at"], report_id)
+                if len(heap) < k:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+        return sorted(heap, reverse=True)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._sync()
+            return len(self.documents)
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Any, List, Optional, Tuple
+from fastapi import UploadFile
+from loguru import logger
+from app.core.config import settings
+from app.utils.offload import run_io
+from app.utils import metrics
+
+
+class UploadStore:
+    """内容寻址的上传文件存储
+
+    文件按SHA-256哈希保存在 upload_dir/{hash[0:2]}/{hash[2:4]}/{hash}.pdf，相同内容只保存一份。
+    refs.json 记录每个文件的引用（生成期间的 upload:{临时ID}、文档会话的 document:{id}、报告的 report:{id}），
+    总大小超过配额时按最久未使用顺序淘汰：先淘汰无引用的文件，仍超出时再淘汰只被报告引用的文件。
+    报告正文与恢复所需的分片都不依赖上传的PDF，报告引用只记录来源，不阻止淘汰。
+    """
+
+    INDEX_FILE = "refs.json"
+    # 报告引用的前缀：不阻止淘汰
+    REPORT_REF = "report:"
+    READ_BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, root: str = None):
+        self._root = root
+        self._lock = threading.Lock()
+
+    @property
+    def root(self) -> str:
+        return self._root or settings.upload_dir
+
+    def path_for(self, file_hash: str) -> str:
+        """根据哈希计算分片存储路径"""
+        return os.path.join(self.root, file_hash[:2], file_hash[2:4], f"{file_hash}.pdf")
+
+    def _index_path(self) -> str:
+        return os.path.join(self.root, self.INDEX_FILE)
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        path = self._index_path()
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            logger.warning(f"Upload index {path} is corrupt, rebuilding from disk")
+            return self._rebuild_index()
+
+    def _save_index(self, index: Dict[str, Dict[str, Any]]):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{self._index_path()}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, self._index_path())
+
+    def _rebuild_index(self) -> Dict[str, Dict[str, Any]]:
+        """索引损坏时根据磁盘上的文件重建（引用信息丢失，文件视为无引用）"""
+        index = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(".pdf"):
+                    path = os.path.join(dirpath, filename)
+                    index[filename[:-4]] = {
+                        "size": os.path.getsize(path),
+                        "refs": [],
+                        "created_at": os.path.getmtime(path),
+                        "last_used_at": os.path.getmtime(path)
+                    }
+        return index
+
+    def _register(self, file_hash: str, size: int, ref: Optional[str]) -> Dict[str, Any]:
+        """登记文件与引用（调用方持有锁）"""
+        index = self._load_index()
+        now = time.time()
+        entry = index.setdefault(file_hash, {"size": size, "refs": [], "created_at": now})
+        entry["last_used_at"] = now
+        if ref and ref not in entry["refs"]:
+            entry["refs"].append(ref)
+        self._save_index(index)
+        return dict(entry)
+
+    def _commit_file(self, tmp_path: str, file_hash: str, size: int, ref: Optional[str]) -> str:
+        """把临时文件移动到内容寻址路径并登记引用；内容已存在时丢弃临时文件
+
+        移动与登记在同一把锁内完成，避免并发的淘汰在登记引用之前删除文件。
+        """
+        path = self.path_for(file_hash)
+        with self._lock:
+            if os.path.exists(path):
+                metrics.record_cache("upload", hit=True)
+                os.remove(tmp_path)
+            else:
+                metrics.record_cache("upload", hit=False)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            self._register(file_hash, size, ref)
+        return path
+
+    def _tmp_path(self) -> str:
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        return os.path.join(tmp_dir, f"{uuid.uuid4().hex}.part")
+
+    def put_bytes(self, content: bytes, ref: Optional[str] = None) -> Tuple[str, str]:
+        """保存字节内容，返回 (哈希, 文件路径)"""
+        file_hash = hashlib.sha256(content).hexdigest()
+        path = self.path_for(file_hash)
+        with self._lock:
+            if os.path.exists(path):
+                metrics.record_cache("upload", hit=True)
+                self._register(file_hash, len(content), ref)
+                return file_hash, path
+        tmp_path = self._tmp_path()
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        return file_hash, self._commit_file(tmp_path, file_hash, len(content), ref)
+
+    async def save_upload(self, upload_file: UploadFile, ref: Optional[str] = None) -> Tuple[str, str]:
+        """流式保存上传文件并计算哈希，返回 (哈希, 文件路径)"""
+        digest = hashlib.sha256()
+        size = 0
+        tmp_path = await run_io(self._tmp_path)
+        f = await run_io(open, tmp_path, "wb")
+        try:
+            while True:
+                block = await upload_file.read(self.READ_BLOCK_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+                size += len(block)
+                await run_io(f.write, block)
+        except Exception:
+            await run_io(f.close)
+            if os.path.exists(tmp_path):
+                await run_io(os.remove, tmp_path)
+            raise
+        await run_io(f.close)
+
+        file_hash = digest.hexdigest()
+        path = await run_io(self._commit_file, tmp_path, file_hash, size, ref)
+        logger.info(f"Upload stored: {file_hash} ({size} bytes)")
+        return file_hash, path
+
+    def add_ref(self, file_hash: str, ref: str):
+        """为文件增加引用"""
+        with self._lock:
+            index = self._load_index()
+            entry = index.get(file_hash)
+            if entry is None:
+                raise FileNotFoundError(f"Upload not found: {file_hash}")
+            if ref not in entry["refs"]:
+                entry["refs"].append(ref)
+            entry["last_used_at"] = time.time()
+            self._save_index(index)
+
+    def remove_ref(self, ref: str, file_hash: Optional[str] = None):
+        """移除引用；未指定哈希时从所有文件中移除"""
+        with self._lock:
+            index = self._load_index()
+            changed = False
+            for key, entry in index.items():
+                if file_hash is not None and key != file_hash:
+                    continue
+                if ref in entry["refs"]:
+                    entry["refs"].remove(ref)
+                    changed = True
+            if changed:
+                self._save_index(index)
+
+    def get(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        """获取文件索引信息"""
+        with self._lock:
+            entry = self._load_index().get(file_hash)
+        if entry is None:
+            return None
+        return {**entry, "hash": file_hash, "path": self.path_for(file_hash)}
+
+    def total_size(self) -> int:
+        with self._lock:
+            return sum(entry.get("size", 0) for entry in self._load_index().values())
+
+    def evict_if_needed(self) -> List[str]:
+        """总大小超过配额时，按最久未使用顺序删除无引用的文件"""
+        with self._lock:
+            index = self._load_index()
+            total_size = sum(entry.get("size", 0) for entry in index.values())
+            if total_size <= settings.upload_quota_bytes:
+                return []
+
+            # 生成中与文档会话引用的文件不淘汰；只被报告引用的文件排在无引用文件之后
+            candidates = sorted(
+                (key for key, entry in index.items() if all(ref.startswith(self.REPORT_REF) for ref in entry["refs"])),
+                key=lambda key: (bool(index[key]["refs"]), index[key].get("last_used_at", 0))
+            )
+            evicted = []
+            for file_hash in candidates:
+                if total_size <= settings.upload_quota_bytes:
+                    break
+                path = self.path_for(file_hash)
+                if os.path.exists(path):
+                    os.remove(path)
+                total_size -= index.pop(file_hash).get("size", 0)
+                evicted.append(file_hash)
+
+            if evicted:
+                self._save_index(index)
+                logger.info(f"Evicted {len(evicted)} upload(s), total size now {total_size} bytes")
+            return evicted
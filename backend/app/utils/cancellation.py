@@ -0,0 +1,55 @@
+import asyncio
+from typing import Callable, List, Optional
+from loguru import logger
+
+
+class ReportCancelledError(Exception):
+    """报告生成被取消（如客户端断开连接）"""
+
+
+class CancellationToken:
+    """请求级取消令牌，用于把取消信号传递到处理流程中"""
+
+    def __init__(self):
+        self.reason: Optional[str] = None
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def cancel(self, reason: str = "cancelled"):
+        """触发取消并执行已注册的回调（只生效一次）"""
+        if self.cancelled:
+            return
+        self.reason = reason
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Cancellation callback failed: {e}")
+
+    def add_callback(self, callback: Callable[[], None]):
+        """注册取消回调，已取消时立即执行"""
+        if self.cancelled:
+            callback()
+        else:
+            self._callbacks.append(callback)
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise ReportCancelledError(self.reason)
+
+
+async def watch_disconnect(request, token: CancellationToken, interval: float = 0.5):
+    """轮询客户端连接状态，断开时触发取消"""
+    try:
+        while not token.cancelled:
+            if await request.is_disconnected():
+                logger.info("Client disconnected, cancelling in-flight report generation")
+                token.cancel("client_disconnected")
+                return
+            await asyncio.sleep(interval)
+    except asyncio.CancelledError:
+        pass
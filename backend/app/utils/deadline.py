@@ -0,0 +1,29 @@
+import time
+from typing import Optional
+
+
+class Deadline:
+    """请求级截止时间，用于在整个处理流程中传递剩余时间"""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    def remaining(self) -> float:
+        """剩余时间（秒），已过期时为0"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def call_timeout(self, default: float) -> float:
+        """单次调用的超时时间：不超过默认值，也不超过剩余时间"""
+        return min(default, self.remaining())
+
+
+def deadline_from_timeout(timeout: Optional[float]) -> Optional[Deadline]:
+    """根据超时配置创建截止时间，未配置（<=0）时返回None"""
+    if not timeout or timeout <= 0:
+        return None
+    return Deadline(timeout)
@@ -0,0 +1,84 @@
+import json
+import os
+import uuid
+from typing import Callable, Dict, Any, Iterable, Optional
+from loguru import logger
+
+# 追加写入的JSONL日志：多个实例共享同一文件，各自按偏移量增量读取，压缩时整体重写
+
+
+class JsonlJournal:
+    """追加写入的JSONL日志文件
+
+    记录读取位置（inode与字节偏移量），read() 只读取其他实例新追加的完整行；
+    文件被重写（inode变化或变短）时通知调用方清空内存状态后从头重放。
+    records 为自上次重写以来读取与追加的记录数，用于判断是否需要压缩。
+    调用方负责加锁。
+    """
+
+    def __init__(self):
+        self.reset(None)
+
+    def reset(self, path: Optional[str]):
+        self.path = path
+        self._inode = None
+        self._offset = 0
+        self.records = 0
+
+    def exists(self) -> bool:
+        return self.path is not None and os.path.exists(self.path)
+
+    def read(self, apply: Callable[[Dict[str, Any]], None], reload: Callable[[], None]):
+        """重放新追加的记录；首次读取或文件被重写时先调用reload"""
+        stat = os.stat(self.path)
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            # 首次加载，或日志被其他实例压缩重写：重新加载
+            reload()
+            self._inode = stat.st_ino
+            self._offset = 0
+            self.records = 0
+        if stat.st_size == self._offset:
+            return
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    # 写入中的不完整记录，下次再读
+                    break
+                self._offset += len(line.encode("utf-8"))
+                try:
+                    apply(json.loads(line))
+                except (json.JSONDecodeError, KeyError):
+                    logger.warning(f"Skipping corrupt journal record in {self.path}")
+                    continue
+                self.records += 1
+
+    def append(self, record: Dict[str, Any]):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+        if self._inode is None:
+            self._inode = os.stat(self.path).st_ino
+        self._offset += len(line.encode("utf-8"))
+        self.records += 1
+
+    def rewrite(self, records: Iterable[Dict[str, Any]]):
+        """以当前全部有效记录原子替换日志文件"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        count = 0
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+        os.replace(tmp_path, self.path)
+        stat = os.stat(self.path)
+        self._inode = stat.st_ino
+        self._offset = stat.st_size
+        self.records = count
+
+    def needs_compaction(self, live_records: int, min_records: int) -> bool:
+        """记录数超过有效记录两倍（且不少于min_records）时需要压缩"""
+        return self.records > max(min_records, 2 * live_records)
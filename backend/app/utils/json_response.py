@@ -0,0 +1,22 @@
+import json
+from typing import Any
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，未安装时使用标准库json
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """序列化为UTF-8 JSON字节：优先使用orjson"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """使用orjson编码的JSON响应，报告正文等大响应体的序列化更快"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
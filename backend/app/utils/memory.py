@@ -0,0 +1,202 @@
+import json
+import threading
+import time
+import tracemalloc
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+
+# 单个请求的内存剖析（按需开启）：基于tracemalloc按span名称统计各阶段的分配峰值与留存量
+# - tracemalloc是进程级的，同时剖析多个请求时各自的数字会包含其他请求的分配，适合单独复现问题时使用
+# - CPU池为进程模式时，子进程中的解析与分片不在统计范围内
+
+_current_memory: ContextVar[Optional["MemoryProfile"]] = ContextVar("current_memory_profile", default=None)
+
+# 进程内活跃的剖析数；由本模块启动的tracemalloc在最后一个剖析结束时停止
+_active = 0
+_started_tracing = False
+_active_lock = threading.Lock()
+
+MB = 1024 * 1024
+TOP_ALLOCATIONS = 10
+# 跟踪内存比上次快照时增长该比例以上时重新拍摄快照，快照数随内存增长呈对数级
+SNAPSHOT_GROWTH = 1.25
+
+
+def current_profile() -> Optional["MemoryProfile"]:
+    return _current_memory.get()
+
+
+def _start_tracing():
+    global _active, _started_tracing
+    with _active_lock:
+        if _active == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, settings.memory_profile_frames))
+            _started_tracing = True
+        _active += 1
+
+
+def _stop_tracing():
+    global _active, _started_tracing
+    with _active_lock:
+        _active -= 1
+        if _active == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+class _OpenStage:
+    __slots__ = ("name", "start_current", "peak")
+
+    def __init__(self, name: str, start_current: int):
+        self.name = name
+        self.start_current = start_current
+        self.peak = start_current
+
+
+class MemoryProfile:
+    """按阶段统计的内存剖析
+
+    每个阶段记录进入时的跟踪内存、期间的峰值与退出时的留存量（均相对剖析开始时的基线）。
+    同名阶段（如并发的llm_call）合并为一条：次数、最大峰值与累计留存。
+    """
+
+    def __init__(self, label: str = "request"):
+        self.label = label
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.baseline = 0
+        self.peak = 0
+        self.started_at = 0.0
+        self.duration = 0.0
+        self._open: List[_OpenStage] = []
+        self._lock = threading.Lock()
+        self._token = None
+        self._running = False
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._snapshot_at = 0
+        self._snapshot_stage = ""
+
+    # ---- 启停 ----
+
+    def start(self) -> "MemoryProfile":
+        _start_tracing()
+        self._running = True
+        self.started_at = time.time()
+        tracemalloc.reset_peak()
+        self.baseline = tracemalloc.get_traced_memory()[0]
+        self._token = _current_memory.set(self)
+        return self
+
+    def stop(self):
+        """停止剖析（可重复调用）"""
+        if not self._running:
+            return
+        with self._lock:
+            self._fold_peak()
+        self._running = False
+        self.duration = time.time() - self.started_at
+        if self._token is not None:
+            try:
+                _current_memory.reset(self._token)
+            except ValueError:
+                pass
+            self._token = None
+        _stop_tracing()
+
+    # ---- 阶段 ----
+
+    def _fold_peak(self) -> int:
+        """把当前峰值计入所有未结束的阶段后重置峰值，返回当前跟踪内存"""
+        current, peak = tracemalloc.get_traced_memory()
+        for stage in self._open:
+            stage.peak = max(stage.peak, peak)
+        self.peak = max(self.peak, peak)
+        tracemalloc.reset_peak()
+        return current
+
+    def enter(self, name: str) -> Optional[_OpenStage]:
+        if not self._running:
+            return None
+        with self._lock:
+            stage = _OpenStage(name, self._fold_peak())
+            self._open.append(stage)
+        return stage
+
+    def exit(self, stage: Optional[_OpenStage]):
+        if stage is None or not self._running:
+            return
+        with self._lock:
+            current = self._fold_peak()
+            self._open.remove(stage)
+            entry = self.stages.setdefault(stage.name, {
+                "count": 0,
+                "start_bytes": stage.start_current - self.baseline,
+                "peak_bytes": 0,
+                "alloc_peak_bytes": 0,
+                "retained_bytes": 0
+            })
+            entry["count"] += 1
+            entry["peak_bytes"] = max(entry["peak_bytes"], stage.peak - self.baseline)
+            entry["alloc_peak_bytes"] = max(entry["alloc_peak_bytes"], stage.peak - stage.start_current)
+            entry["retained_bytes"] += current - stage.start_current
+            take_snapshot = current > self.baseline and current > self._snapshot_at * SNAPSHOT_GROWTH
+        if take_snapshot:
+            # 留存量明显增长时记录分配位置，用于定位哪些中间结果占住了内存
+            self._snapshot = tracemalloc.take_snapshot()
+            self._snapshot_at = current
+            self._snapshot_stage = stage.name
+
+    # ---- 输出 ----
+
+    def top_allocations(self, limit: int = TOP_ALLOCATIONS) -> List[Dict[str, Any]]:
+        if self._snapshot is None:
+            return []
+        snapshot = self._snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>")
+        ])
+        return [
+            {
+                "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_bytes": stat.size,
+                "count": stat.count
+            }
+            for stat in snapshot.statistics("lineno")[:limit]
+        ]
+
+    def to_dict(self) -> Dict[str, Any]:
+        def mb(value: int) -> float:
+            return round(value / MB, 3)
+
+        return {
+            "label": self.label,
+            "duration": round(self.duration, 3),
+            "peak_mb": mb(self.peak - self.baseline),
+            "cpu_mode": settings.offload_cpu_mode,
+            "stages": {
+                name: {
+                    "count": entry["count"],
+                    "start_mb": mb(entry["start_bytes"]),
+                    "peak_mb": mb(entry["peak_bytes"]),
+                    "alloc_peak_mb": mb(entry["alloc_peak_bytes"]),
+                    "retained_mb": mb(entry["retained_bytes"])
+                }
+                for name, entry in self.stages.items()
+            },
+            "top_allocations": {
+                "after_stage": self._snapshot_stage,
+                "traced_mb": mb(self._snapshot_at - self.baseline),
+                "sites": self.top_allocations()
+            }
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+
+    def summary(self) -> Dict[str, Any]:
+        """随接口返回的摘要：总峰值与各阶段峰值"""
+        data = self.to_dict()
+        return {
+            "peak_mb": data["peak_mb"],
+            "stages": {name: stage["peak_mb"] for name, stage in data["stages"].items()}
+        }
@@ -0,0 +1,345 @@
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from loguru import logger
+
+# 轻量的Prometheus文本格式指标（不依赖prometheus_client）
+# - 标签组合对应的子指标创建后缓存复用，每次观测只做一次字典查找、一次二分和几次加法
+# - 每个指标的标签组合数有上限，超出的组合合并到 other 标签下，避免标签值失控导致内存膨胀
+# - 进程池子进程中的观测先暂存，随任务结果带回父进程重放（见 capture / replay）
+
+MAX_SERIES_PER_METRIC = 200
+OVERFLOW_LABEL = "other"
+
+# 常用的桶边界
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = tuple(float(1024 * 4 ** i) for i in range(11))  # 1KB ~ 1GB
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+# 子进程中暂存的观测：[(指标名, 标签值, 方法, 数值)]；None表示直接记录
+_captured: Optional[List[Tuple[str, Tuple[str, ...], str, float]]] = None
+
+
+def percentile(values: Sequence[float], quantile: float) -> Optional[float]:
+    """最近秩法分位数，无样本时返回None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(quantile * len(ordered))) - 1]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类：按标签值缓存子指标"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        self._overflow_warned = False
+        if not self.labelnames:
+            self._default = self._new_child(())
+            self._children[()] = self._default
+
+    def _new_child(self, labelvalues: Tuple[str, ...]):
+        raise NotImplementedError
+
+    def labels(self, *labelvalues) -> "_Metric":
+        """获取标签值对应的子指标"""
+        key = tuple(str(value) for value in labelvalues)
+        child = self._children.get(key)
+        if child is not None:
+            return child
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                if len(self._children) >= MAX_SERIES_PER_METRIC:
+                    if not self._overflow_warned:
+                        self._overflow_warned = True
+                        logger.warning(f"Metric {self.name} exceeded {MAX_SERIES_PER_METRIC} series, folding new labels into '{OVERFLOW_LABEL}'")
+                    key = (OVERFLOW_LABEL,) * len(self.labelnames)
+                    child = self._children.get(key)
+                if child is None:
+                    child = self._new_child(key)
+                    self._children[key] = child
+        return child
+
+    def _label_text(self, labelvalues: Tuple[str, ...], extra: Iterable[Tuple[str, str]] = ()) -> str:
+        pairs = list(zip(self.labelnames, labelvalues)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labelvalues, child in sorted(self._children.items()):
+            lines.extend(child._render_samples(self, labelvalues))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("name", "labelvalues", "value", "_lock")
+
+    def __init__(self, name: str, labelvalues: Tuple[str, ...]):
+        self.name = name
+        self.labelvalues = labelvalues
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        if _captured is not None:
+            _captured.append((self.name, self.labelvalues, "inc", amount))
+            return
+        with self._lock:
+            self.value += amount
+
+    def _render_samples(self, metric: _Metric, labelvalues):
+        return [f"{metric.name}{metric._label_text(labelvalues)} {_format_value(self.value)}"]
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        if _captured is not None:
+            _captured.append((self.name, self.labelvalues, "set", value))
+            return
+        with self._lock:
+            self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ("name", "labelvalues", "bounds", "counts", "sum", "_lock")
+
+    def __init__(self, name: str, labelvalues: Tuple[str, ...], bounds: Tuple[float, ...]):
+        self.name = name
+        self.labelvalues = labelvalues
+        self.bounds = bounds
+        # 最后一个桶为 +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        if _captured is not None:
+            _captured.append((self.name, self.labelvalues, "observe", value))
+            return
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def _render_samples(self, metric: _Metric, labelvalues):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf,), counts):
+            cumulative += count
+            lines.append(
+                f"{metric.name}_bucket{metric._label_text(labelvalues, [('le', _format_value(bound))])} {cumulative}"
+            )
+        labels = metric._label_text(labelvalues)
+        lines.append(f"{metric.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{metric.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Counter(_Metric):
+    """只增计数器"""
+
+    kind = "counter"
+
+    def _new_child(self, labelvalues):
+        return _CounterChild(self.name, labelvalues)
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    """可增减的瞬时值"""
+
+    kind = "gauge"
+
+    def _new_child(self, labelvalues):
+        return _GaugeChild(self.name, labelvalues)
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+    def set(self, value: float):
+        self._default.set(value)
+
+
+class Histogram(_Metric):
+    """固定桶边界的直方图"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(float(bound) for bound in buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self, labelvalues):
+        return _HistogramChild(self.name, labelvalues, self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+
+class Registry:
+    """指标注册表，按注册顺序输出"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        # 抓取时才计算的指标（如线程池队列长度），避免在热路径上维护
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]):
+        self._collectors.append(collector)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def replay(self, observations: List[Tuple[str, Tuple[str, ...], str, float]]):
+        """重放子进程中暂存的观测"""
+        for name, labelvalues, method, value in observations:
+            metric = self._metrics.get(name)
+            if metric is not None:
+                getattr(metric.labels(*labelvalues), method)(value)
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def call_with_capture(func: Callable):
+    """在子进程中执行func，返回 (结果, 期间暂存的观测)"""
+    global _captured
+    _captured = []
+    try:
+        result = func()
+        return result, _captured
+    finally:
+        _captured = None
+
+
+# ---- 报告流水线指标 ----
+
+UPLOAD_SIZE = histogram("docreader_upload_size_bytes", "Size of uploaded PDF files", buckets=SIZE_BUCKETS)
+EXTRACT_SECONDS_PER_PAGE = histogram(
+    "docreader_pdf_extract_seconds_per_page", "PDF text extraction time divided by page count",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+CHUNK_COUNT = histogram(
+    "docreader_chunks_per_document", "Number of chunks a document was split into",
+    ["chunk_strategy"], buckets=COUNT_BUCKETS
+)
+CHUNK_SIZE = histogram(
+    "docreader_chunk_size_chars", "Size of individual chunks in characters",
+    ["chunk_strategy"], buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+)
+LLM_LATENCY = histogram(
+    "docreader_llm_call_seconds", "Latency of individual LLM calls",
+    ["model", "prompt_version", "outcome"]
+)
+LLM_PROMPT_TOKENS = histogram(
+    "docreader_llm_prompt_tokens", "Prompt tokens per LLM call",
+    ["model", "prompt_version"], buckets=TOKEN_BUCKETS
+)
+LLM_COMPLETION_TOKENS = histogram(
+    "docreader_llm_completion_tokens", "Completion tokens per LLM call",
+    ["model", "prompt_version"], buckets=TOKEN_BUCKETS
+)
+LLM_IN_FLIGHT = gauge("docreader_llm_calls_in_flight", "LLM calls currently in flight", ["model"])
+CHUNKS_QUEUED = gauge("docreader_chunks_queued", "Chunk batches waiting for an LLM concurrency slot")
+REPORTS_IN_FLIGHT = gauge("docreader_reports_in_flight", "Reports currently being generated")
+CACHE_REQUESTS = counter("docreader_cache_requests_total", "Cache lookups by cache and result", ["cache", "result"])
+CACHE_HIT_RATIO = gauge("docreader_cache_hit_ratio", "Cache hit ratio since start", ["cache"])
+OFFLOAD_QUEUE_DEPTH = gauge("docreader_offload_queue_depth", "Tasks waiting in offload executor queues", ["pool"])
+REPORT_SAVE_SECONDS = histogram(
+    "docreader_report_save_seconds", "Time to persist and index a finished report",
+    ["prompt_version", "chunk_strategy"]
+)
+REPORTS_TOTAL = counter(
+    "docreader_reports_total", "Finished report runs by outcome",
+    ["prompt_version", "chunk_strategy", "outcome"]
+)
+
+
+def record_cache(cache: str, hit: bool, count: int = 1):
+    """记录缓存命中/未命中"""
+    if count:
+        CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc(count)
+
+
+def _collect_cache_ratios():
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), child in list(CACHE_REQUESTS._children.items()):
+        entry = totals.setdefault(cache, [0.0, 0.0])
+        entry[0 if result == "hit" else 1] += child.value
+    for cache, (hits, misses) in totals.items():
+        if hits + misses:
+            CACHE_HIT_RATIO.labels(cache).set(hits / (hits + misses))
+
+
+REGISTRY.add_collector(_collect_cache_ratios)
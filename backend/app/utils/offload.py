@@ -0,0 +1,134 @@
+import asyncio
+import contextvars
+import functools
+import math
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from loguru import logger
+from app.core.config import settings
+from app.services import llm_pool
+from app.utils import metrics, profiler, tracing
+
+# 阻塞操作的分流层：异步处理函数中的阻塞调用统一交给这里，避免阻塞事件循环
+# - io:  文件读写、删除等阻塞I/O（线程池）
+# - llm: 同步的大模型客户端调用（线程池，按端点池总并发额度留出对冲余量）
+# - cpu: PDF解析等CPU密集型任务（进程池；OFFLOAD_CPU_MODE=thread时改为独立线程池）
+
+_executors: Dict[str, Executor] = {}
+_lock = threading.Lock()
+
+
+def _create_executor(kind: str) -> Executor:
+    if kind == "io":
+        return ThreadPoolExecutor(max_workers=settings.offload_io_workers, thread_name_prefix="offload-io")
+    if kind == "llm":
+        # 每个在途请求（含对冲副本与被放弃但仍在执行的请求）都占用一个端点额度，线程数按端点池总额度确定，
+        # 不随并发报告数增长；开启对冲时按预算比例额外留出余量
+        capacity = llm_pool.configured_capacity()
+        headroom = math.ceil(capacity * settings.llm_hedge_budget_ratio) if settings.llm_hedge_enabled else 0
+        workers = max(1, capacity + headroom)
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="offload-llm")
+    if kind == "cpu":
+        if settings.offload_cpu_mode == "process":
+            # spawn避免在持有线程和锁的进程中fork
+            return ProcessPoolExecutor(
+                max_workers=settings.offload_cpu_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return ThreadPoolExecutor(max_workers=settings.offload_cpu_workers, thread_name_prefix="offload-cpu")
+    raise ValueError(f"Unknown offload pool: {kind}")
+
+
+def get_executor(kind: str) -> Executor:
+    """获取（按需创建）指定类型的执行器"""
+    executor = _executors.get(kind)
+    if executor is None:
+        with _lock:
+            executor = _executors.get(kind)
+            if executor is None:
+                executor = _create_executor(kind)
+                _executors[kind] = executor
+                logger.info(f"Offload pool '{kind}' created: {type(executor).__name__}")
+    return executor
+
+
+def _call_in_child(call: Callable, request_id: Optional[str], with_stages: bool, profile_interval: Optional[float]):
+    """子进程中的执行入口：返回 (结果, span列表, 阶段耗时, 暂存的指标观测, 剖析采样)"""
+    if profile_interval:
+        call = functools.partial(profiler.call_with_profile, call, profile_interval)
+    (result, spans, stages), observations = metrics.call_with_capture(
+        functools.partial(tracing.call_with_spans, call, request_id, with_stages)
+    )
+    stacks = None
+    if profile_interval:
+        result, stacks = result
+    return result, spans, stages, observations, stacks
+
+
+async def _run(kind: str, func: Callable, *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs) if kwargs else functools.partial(func, *args)
+    executor = get_executor(kind)
+    active_profiler = profiler.current_profiler()
+    if isinstance(executor, ProcessPoolExecutor):
+        # 子进程中记录的span、阶段耗时、指标与剖析采样随结果带回，并入当前请求的上下文与本进程的指标
+        trace = tracing.current_trace()
+        parent_id = tracing.current_span_id()
+        result, spans, stages, observations, stacks = await loop.run_in_executor(
+            executor, functools.partial(
+                _call_in_child, call, trace.request_id if trace else None,
+                tracing.current_stages() is not None,
+                active_profiler.interval * 1000 if active_profiler else None
+            )
+        )
+        if trace is not None:
+            trace.merge(spans, parent_id)
+        tracing.merge_stages(stages)
+        metrics.REGISTRY.replay(observations)
+        if stacks:
+            active_profiler.merge(stacks)
+        return result
+    if active_profiler is not None:
+        call = functools.partial(active_profiler.run_in_thread, f"offload-{kind}", call)
+    # 线程池中沿用调用方的上下文，使请求追踪等contextvars在工作线程中可见
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(context.run, call))
+
+
+async def run_io(func: Callable, *args, **kwargs) -> Any:
+    """在I/O线程池中执行阻塞的文件操作"""
+    return await _run("io", func, *args, **kwargs)
+
+
+async def run_llm(func: Callable, *args, **kwargs) -> Any:
+    """在模型调用线程池中执行同步的客户端请求"""
+    return await _run("llm", func, *args, **kwargs)
+
+
+async def run_cpu(func: Callable, *args, **kwargs) -> Any:
+    """在CPU池中执行计算密集型任务（进程模式下func与参数需可pickle）"""
+    return await _run("cpu", func, *args, **kwargs)
+
+
+def _collect_queue_depth():
+    for name, executor in list(_executors.items()):
+        if isinstance(executor, ThreadPoolExecutor):
+            depth = executor._work_queue.qsize()
+        else:
+            depth = len(getattr(executor, "_pending_work_items", {}))
+        metrics.OFFLOAD_QUEUE_DEPTH.labels(name).set(depth)
+
+
+metrics.REGISTRY.add_collector(_collect_queue_depth)
+
+
+def shutdown(wait: bool = True, kind: Optional[str] = None):
+    """关闭执行器（应用退出时调用）；下次使用时会重新创建"""
+    with _lock:
+        kinds = [kind] if kind else list(_executors)
+        for name in kinds:
+            executor = _executors.pop(name, None)
+            if executor is not None:
+                executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.core.config import settings
+
+# 单个请求的采样剖析（按需开启，关闭时不创建任何线程、不修改事件循环）
+# - 事件循环线程：只在当前运行的任务属于被剖析请求时采样（通过临时安装的任务工厂登记请求派生的任务）
+# - 分流线程池：执行被剖析请求的调用期间登记工作线程
+# - 进程池：子进程中另起采样线程，调用栈随结果带回合并
+
+_current_profiler: ContextVar[Optional["SamplingProfiler"]] = ContextVar("current_profiler", default=None)
+
+MAX_STACK_DEPTH = 128
+_BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 安装了剖析任务工厂的事件循环 -> (原任务工厂, 活跃的剖析器数)
+_factories: Dict[asyncio.AbstractEventLoop, List[Any]] = {}
+_factories_lock = threading.Lock()
+
+Frame = Tuple[str, str, int]
+Stack = Tuple[str, Tuple[Frame, ...]]
+
+
+def current_profiler() -> Optional["SamplingProfiler"]:
+    return _current_profiler.get()
+
+
+def requested(header_value: Optional[str], query_value: Optional[str]) -> bool:
+    """请求是否要求剖析：请求头或查询参数需与配置的口令一致，未配置口令时始终关闭（CPU剖析、内存剖析与 /debug/resources 共用）"""
+    token = settings.profiling_token
+    if not token:
+        return False
+    return token in (header_value, query_value)
+
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(_BACKEND_ROOT):
+        return os.path.relpath(filename, _BACKEND_ROOT)
+    marker = "site-packages" + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    return filename
+
+
+def _frame_stack(frame) -> Tuple[Frame, ...]:
+    """从栈顶帧回溯，返回从根到叶的 (函数名, 文件, 首行号)"""
+    frames = []
+    while frame is not None and len(frames) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        frames.append((code.co_name, _short_path(code.co_filename), code.co_firstlineno))
+        frame = frame.f_back
+    frames.reverse()
+    return tuple(frames)
+
+
+def _profiling_task_factory(loop, coro, **kwargs):
+    """登记被剖析请求派生的任务（在创建者的上下文中判断）"""
+    previous = _factories[loop][0]
+    task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+    context = kwargs.get("context")
+    profiler = context.get(_current_profiler) if context is not None else _current_profiler.get()
+    if profiler is not None:
+        profiler.tasks.add(task)
+    return task
+
+
+class SamplingProfiler:
+    """按固定间隔采样调用栈的剖析器"""
+
+    def __init__(self, interval_ms: float = None, label: str = "request"):
+        self.interval = (interval_ms or settings.profile_interval_ms) / 1000
+        self.label = label
+        self.samples: Counter = Counter()
+        self.tasks: "weakref.WeakSet[asyncio.Task]" = weakref.WeakSet()
+        self._threads: Dict[int, str] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._token = None
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self.started_at = 0.0
+        self.duration = 0.0
+
+    # ---- 启停 ----
+
+    def start(self) -> "SamplingProfiler":
+        """在请求所在的任务中启动：登记当前任务，并为其派生的任务安装登记用的任务工厂"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self.tasks.add(asyncio.current_task())
+        self._token = _current_profiler.set(self)
+        with _factories_lock:
+            entry = _factories.get(self._loop)
+            if entry is None:
+                _factories[self._loop] = [self._loop.get_task_factory(), 1]
+                self._loop.set_task_factory(_profiling_task_factory)
+            else:
+                entry[1] += 1
+        self._start_sampler()
+        return self
+
+    def stop(self):
+        """停止采样（可重复调用）"""
+        if self._sampler is None:
+            return
+        self._stop_sampler()
+        if self._token is not None:
+            try:
+                _current_profiler.reset(self._token)
+            except ValueError:
+                # 在其他上下文中停止时无法复位，请求结束后上下文随之丢弃
+                pass
+            self._token = None
+        if self._loop is not None:
+            with _factories_lock:
+                entry = _factories.get(self._loop)
+                if entry is not None:
+                    entry[1] -= 1
+                    if entry[1] <= 0:
+                        self._loop.set_task_factory(entry[0])
+                        del _factories[self._loop]
+
+    def _start_sampler(self):
+        self.started_at = time.time()
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._run, name=f"profiler-{self.label}", daemon=True)
+        self._sampler.start()
+
+    def _stop_sampler(self):
+        self._stop.set()
+        self._sampler.join()
+        self._sampler = None
+        self.duration = time.time() - self.started_at
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        frames = sys._current_frames()
+        for ident, label in list(self._threads.items()):
+            frame = frames.get(ident)
+            if frame is not None:
+                self.samples[(label, _frame_stack(frame))] += 1
+        if self._loop_thread is not None:
+            task = asyncio.current_task(self._loop)
+            if task is not None and task in self.tasks:
+                frame = frames.get(self._loop_thread)
+                if frame is not None:
+                    self.samples[("event-loop", _frame_stack(frame))] += 1
+
+    # ---- 线程与子进程 ----
+
+    def run_in_thread(self, label: str, func: Callable):
+        """在分流线程中执行func，执行期间采样该线程"""
+        ident = threading.get_ident()
+        self._threads[ident] = label
+        try:
+            return func()
+        finally:
+            self._threads.pop(ident, None)
+
+    def merge(self, stacks: List[Tuple[str, List[List[Any]], int]]):
+        """合并子进程带回的采样"""
+        for label, frames, count in stacks:
+            self.samples[(label, tuple(tuple(frame) for frame in frames))] += count
+
+    def export_stacks(self) -> List[Tuple[str, List[List[Any]], int]]:
+        return [(label, [list(frame) for frame in frames], count) for (label, frames), count in self.samples.items()]
+
+    # ---- 输出 ----
+
+    @property
+    def sample_count(self) -> int:
+        return sum(self.samples.values())
+
+    def collapsed(self) -> str:
+        """折叠栈格式（flamegraph.pl / speedscope 均可导入）：每行 线程;帧;帧 次数"""
+        lines = []
+        for (label, frames), count in sorted(self.samples.items(), key=lambda item: -item[1]):
+            names = [label] + [f"{name} ({path}:{line})" for name, path, line in frames]
+            lines.append(f"{';'.join(name.replace(';', ':') for name in names)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str = "") -> Dict[str, Any]:
+        """speedscope 采样格式，每类线程一个profile"""
+        frame_index: Dict[Frame, int] = {}
+        frames: List[Dict[str, Any]] = []
+        profiles: Dict[str, Dict[str, Any]] = {}
+        for (label, stack), count in self.samples.items():
+            indices = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                indices.append(frame_index[frame])
+            profile = profiles.setdefault(label, {
+                "type": "sampled",
+                "name": label,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": 0,
+                "samples": [],
+                "weights": []
+            })
+            profile["samples"].append(indices)
+            profile["weights"].append(count * self.interval)
+            profile["endValue"] += count * self.interval
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name or self.label,
+            "exporter": "document-reader-assistant",
+            "shared": {"frames": frames},
+            "profiles": list(profiles.values())
+        }
+
+    def speedscope_json(self, name: str = "") -> str:
+        return json.dumps(self.speedscope(name), ensure_ascii=False)
+
+
+def call_with_profile(func: Callable, interval_ms: float) -> Tuple[Any, List[Tuple[str, List[List[Any]], int]]]:
+    """在子进程中执行func并采样当前线程，返回 (结果, 调用栈采样)"""
+    profiler = SamplingProfiler(interval_ms, label="cpu-process")
+    profiler._threads[threading.get_ident()] = "cpu-process"
+    profiler._start_sampler()
+    try:
+        result = func()
+    finally:
+        profiler._stop_sampler()
+    return result, profiler.export_stacks()
@@ -0,0 +1,81 @@
+import asyncio
+import gc
+import os
+import sys
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional
+from loguru import logger
+
+# 进程资源快照（/debug/resources）：RSS、打开的文件描述符、线程与按类型统计的对象数，
+# 长时间运行时定期采样，用于发现持续增长的资源并定位累积的对象类型
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes() -> Optional[int]:
+    """当前进程常驻内存（字节），非Linux平台返回None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def open_fds() -> Optional[int]:
+    """当前进程打开的文件描述符数"""
+    for fd_dir in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(fd_dir))
+        except OSError:
+            continue
+    return None
+
+
+def _type_name(obj_type: type) -> str:
+    module = obj_type.__module__
+    if module == "builtins":
+        return obj_type.__qualname__
+    return f"{module}.{obj_type.__qualname__}"
+
+
+def object_counts() -> Counter:
+    """gc跟踪的对象按类型计数（不含int、str等不被gc跟踪的原子类型）"""
+    counts: Counter = Counter()
+    for obj in gc.get_objects():
+        counts[type(obj)] += 1
+    return Counter({_type_name(obj_type): count for obj_type, count in counts.items()})
+
+
+def _loguru_handlers() -> Optional[int]:
+    # loguru没有公开的处理器数量接口；重复 logger.add 而不 remove 是常见的泄漏来源
+    core = getattr(logger, "_core", None)
+    handlers = getattr(core, "handlers", None)
+    return len(handlers) if handlers is not None else None
+
+
+def _asyncio_tasks() -> Optional[int]:
+    try:
+        return len(asyncio.all_tasks())
+    except RuntimeError:
+        return None
+
+
+def resource_snapshot(top: int = 50, collect: bool = True) -> Dict[str, Any]:
+    """进程资源快照；top为返回的对象类型数（按数量降序，0为全部），collect为统计前先执行一次完整gc"""
+    collected = gc.collect() if collect else None
+    counts = object_counts()
+    objects = counts.most_common(top or None)
+    return {
+        "pid": os.getpid(),
+        "rss_bytes": rss_bytes(),
+        "open_fds": open_fds(),
+        "threads": threading.active_count(),
+        "asyncio_tasks": _asyncio_tasks(),
+        "loguru_handlers": _loguru_handlers(),
+        "gc_objects": sum(counts.values()),
+        "gc_collected": collected,
+        "gc_garbage": len(gc.garbage),
+        "modules": len(sys.modules),
+        "object_types": dict(objects)
+    }
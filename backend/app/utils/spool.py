@@ -0,0 +1,152 @@
+import os
+import tempfile
+import threading
+import weakref
+from array import array
+from typing import Iterator, Optional, Union
+from app.core.config import settings
+
+# 超出内存预算时的落盘中间结果：清理后的全文与分片写入临时文件，按需读回
+
+
+def _spool_dir() -> Optional[str]:
+    if settings.spool_dir:
+        os.makedirs(settings.spool_dir, exist_ok=True)
+        return settings.spool_dir
+    return None
+
+
+def _unlink(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class SpooledText:
+    """落盘的长文本，按UTF-32编码定长存储，支持 len() 与按字符下标切片
+
+    分片函数只用到 len(text) 与 text[start:end]，可直接作用于本对象，切片结果为普通字符串。
+    """
+
+    CHAR_BYTES = 4
+    ENCODING = "utf-32-le"
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile(prefix="text-", suffix=".spool", dir=_spool_dir())
+        self._length = 0
+        self._lock = threading.Lock()
+
+    def write(self, text: str):
+        self._file.write(text.encode(self.ENCODING))
+        self._length += len(text)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, key: Union[int, slice]) -> str:
+        if isinstance(key, int):
+            if key < 0:
+                key += self._length
+            if not 0 <= key < self._length:
+                raise IndexError("SpooledText index out of range")
+            key = slice(key, key + 1)
+        start, stop, step = key.indices(self._length)
+        if step != 1:
+            raise ValueError("SpooledText只支持连续切片")
+        if stop <= start:
+            return ""
+        with self._lock:
+            self._file.seek(start * self.CHAR_BYTES)
+            data = self._file.read((stop - start) * self.CHAR_BYTES)
+        return data.decode(self.ENCODING)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> "SpooledText":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ChunkSpool:
+    """落盘的分片序列，支持 len()、下标访问与迭代，只读使用时可替代 List[str]
+
+    分片以UTF-8追加写入同一个文件，内存中只保留每个分片的偏移与字符数。空白分片不写入（与split_text过滤空块一致）。
+    可pickle（进程模式的CPU池返回结果时）：文件的删除责任随pickle转移给接收方。
+    """
+
+    def __init__(self):
+        handle, self.path = tempfile.mkstemp(prefix="chunks-", suffix=".spool", dir=_spool_dir())
+        os.close(handle)
+        self.offsets = array("q", [0])
+        self.lengths = array("q")
+        self._writer = open(self.path, "ab")
+        self._reader = None
+        self._lock = threading.Lock()
+        self._finalizer = weakref.finalize(self, _unlink, self.path)
+
+    def append(self, chunk: str):
+        if not chunk.strip():
+            return
+        data = chunk.encode("utf-8")
+        self._writer.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+        self.lengths.append(len(chunk))
+
+    def finish(self) -> "ChunkSpool":
+        """写入结束，之后只读"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        return self
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ChunkSpool index out of range")
+        self.finish()
+        start, end = self.offsets[index], self.offsets[index + 1]
+        with self._lock:
+            if self._reader is None:
+                self._reader = open(self.path, "rb")
+            self._reader.seek(start)
+            data = self._reader.read(end - start)
+        return data.decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def total_bytes(self) -> int:
+        return self.offsets[-1]
+
+    def close(self):
+        """关闭并删除文件（可重复调用）"""
+        self.finish()
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        self._finalizer()
+
+    def __getstate__(self):
+        self.finish()
+        # 由接收方负责删除文件
+        self._finalizer.detach()
+        return {"path": self.path, "offsets": self.offsets, "lengths": self.lengths}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self.offsets = state["offsets"]
+        self.lengths = state["lengths"]
+        self._writer = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self._finalizer = weakref.finalize(self, _unlink, self.path)
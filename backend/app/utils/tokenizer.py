@@ -0,0 +1,35 @@
+import re
+from typing import List, Set
+
+# 连续的CJK字符 或 拉丁字母/数字组成的单词
+_TOKEN_PATTERN = re.compile(r'[\u4e00-\u9fff]+|[A-Za-z0-9]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """分词：中文按字二元组（bigram），拉丁文按单词并转小写"""
+    tokens = []
+    if not text:
+        return tokens
+
+    for match in _TOKEN_PATTERN.finditer(text):
+        segment = match.group()
+        if '\u4e00' <= segment[0] <= '\u9fff':
+            if len(segment) == 1:
+                tokens.append(segment)
+            else:
+                tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+        else:
+            tokens.append(segment.lower())
+    return tokens
+
+
+def term_set(text: str) -> Set[str]:
+    """获取文本的词项集合"""
+    return set(tokenize(text))
+
+
+def relevance_score(question_terms: Set[str], chunk_terms: Set[str]) -> float:
+    """问题词项在片段中的覆盖率（0~1）"""
+    if not question_terms:
+        return 0.0
+    return len(question_terms & chunk_terms) / len(question_terms)
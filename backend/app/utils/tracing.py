@@ -0,0 +1,313 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from loguru import logger
+from app.core.config import settings
+from app.services.hedging import LatencyTracker
+from app.utils import memory
+
+# 当前请求的追踪与当前所在的span（asyncio任务创建时会复制上下文，并发子任务共享同一追踪）
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+# 按span名称累计耗时（秒），用于报告元数据中的阶段耗时，不依赖是否开启追踪
+_current_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("current_stages", default=None)
+
+
+class Span:
+    """一个计时区间（时间为epoch秒，可跨进程合并）"""
+
+    __slots__ = ("span_id", "parent_id", "name", "start", "end", "attrs")
+
+    def __init__(self, name: str, parent_id: Optional[str] = None, attrs: Dict[str, Any] = None):
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.attrs = dict(attrs) if attrs else {}
+
+    def set(self, **attrs):
+        """补充属性（如调用完成后的token数）"""
+        self.attrs.update(attrs)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.time()) - self.start) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration_ms, 3),
+            "attrs": self.attrs
+        }
+
+
+class Trace:
+    """单个请求的追踪，按请求UUID标识"""
+
+    def __init__(self, request_id: str, method: str = "", path: str = ""):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.status_code: Optional[int] = None
+        self.spans: List[Span] = []
+        self.attrs: Dict[str, Any] = {}
+
+    def add_span(self, span: Span):
+        self.spans.append(span)
+
+    def merge(self, spans: List[Dict[str, Any]], parent_id: Optional[str]):
+        """合并在子进程中记录的span，根span挂到parent_id下"""
+        for data in spans:
+            span = Span(data["name"], data["parent_id"] or parent_id, data["attrs"])
+            span.span_id = data["span_id"]
+            span.start = data["start"]
+            span.end = data["start"] + data["duration_ms"] / 1000
+            self.spans.append(span)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.time()) - self.start) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": self.status_code,
+            "start": self.start,
+            "duration_ms": round(self.duration_ms, 3),
+            "attrs": self.attrs,
+            "spans": [span.to_dict() for span in sorted(self.spans, key=lambda s: s.start)]
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Optional[Span]]:
+    """记录一个span；不在追踪中时返回None，只在collect_stages中累计耗时（开启内存剖析时同时统计该阶段的内存）"""
+    trace = _current_trace.get()
+    stages = _current_stages.get()
+    memory_profile = memory.current_profile()
+    if trace is None and stages is None and memory_profile is None:
+        yield None
+        return
+    started = time.perf_counter()
+    current = None
+    if trace is not None:
+        parent = _current_span.get()
+        current = Span(name, parent.span_id if parent else None, attrs)
+        token = _current_span.set(current)
+    memory_stage = memory_profile.enter(name) if memory_profile is not None else None
+    try:
+        yield current
+    except BaseException as e:
+        if current is not None:
+            current.set(error=type(e).__name__)
+        raise
+    finally:
+        if memory_profile is not None:
+            memory_profile.exit(memory_stage)
+        if stages is not None:
+            stages[name] = stages.get(name, 0.0) + time.perf_counter() - started
+        if current is not None:
+            current.end = time.time()
+            _current_span.reset(token)
+            trace.add_span(current)
+
+
+@contextmanager
+def collect_stages(stages: Optional[Dict[str, float]] = None) -> Iterator[Dict[str, float]]:
+    """在该上下文中按span名称累计耗时（秒）；并发子任务与分流到线程池的调用共享同一字典"""
+    stages = stages if stages is not None else {}
+    token = _current_stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _current_stages.reset(token)
+
+
+def current_stages() -> Optional[Dict[str, float]]:
+    return _current_stages.get()
+
+
+def merge_stages(stages: Dict[str, float]):
+    """把子进程中累计的阶段耗时并入当前上下文"""
+    target = _current_stages.get()
+    if target is None:
+        return
+    for name, seconds in stages.items():
+        target[name] = target.get(name, 0.0) + seconds
+
+
+@contextmanager
+def start_trace(request_id: str, method: str = "", path: str = "") -> Iterator[Optional[Trace]]:
+    """开始一个请求追踪，结束时交给trace_recorder保存"""
+    if not settings.tracing_enabled:
+        yield None
+        return
+    trace = Trace(request_id, method, path)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    finally:
+        trace.end = time.time()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        trace.attrs["loop_lag_max_ms"] = loop_lag_monitor.max_lag_ms(trace.start, trace.end)
+        trace_recorder.record(trace)
+
+
+def call_with_spans(
+    func: Callable,
+    request_id: Optional[str],
+    with_stages: bool = False
+) -> Tuple[Any, List[Dict[str, Any]], Dict[str, float]]:
+    """在子进程中执行func，收集其中记录的span与阶段耗时（供进程池使用，需为模块级函数以便pickle）"""
+    trace = Trace(request_id) if request_id is not None else None
+    stages: Dict[str, float] = {}
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    stages_token = _current_stages.set(stages if with_stages else None)
+    try:
+        result = func()
+    finally:
+        _current_stages.reset(stages_token)
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+    spans = [span.to_dict() for span in trace.spans] if trace is not None else []
+    return result, spans, stages
+
+
+def current_span_id() -> Optional[str]:
+    current = _current_span.get()
+    return current.span_id if current else None
+
+
+class TraceRecorder:
+    """已完成追踪的导出：进程内环形缓冲，可选追加写入JSONL文件"""
+
+    def __init__(self, size: int = None):
+        self._buffer: Deque[Trace] = deque(maxlen=size or settings.trace_buffer_size)
+        self._lock = threading.Lock()
+
+    def record(self, trace: Trace):
+        with self._lock:
+            self._buffer.append(trace)
+        if settings.trace_file:
+            try:
+                directory = os.path.dirname(settings.trace_file)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(settings.trace_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(trace.to_dict(), ensure_ascii=False) + "\n")
+            except OSError as e:
+                logger.warning(f"Failed to write trace {trace.request_id}: {e}")
+
+    def query(
+        self,
+        limit: int = 50,
+        request_id: Optional[str] = None,
+        path: Optional[str] = None,
+        min_duration_ms: float = 0.0
+    ) -> List[Dict[str, Any]]:
+        """按条件查询最近的追踪（新的在前）"""
+        with self._lock:
+            traces = list(self._buffer)
+        results = []
+        for trace in reversed(traces):
+            if request_id and trace.request_id != request_id:
+                continue
+            if path and not trace.path.startswith(path):
+                continue
+            if trace.duration_ms < min_duration_ms:
+                continue
+            results.append(trace.to_dict())
+            if len(results) >= limit:
+                break
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._buffer.clear()
+
+
+class LoopLagMonitor:
+    """事件循环延迟采样：定时睡眠，记录实际唤醒时间比预定时间晚了多少"""
+
+    def __init__(self, interval: float = None, window: int = 1000):
+        self.interval = interval or settings.loop_lag_interval
+        self.tracker = LatencyTracker(window)
+        # 最近的 (采样时间, 延迟毫秒)，用于查询某个请求期间的最大延迟
+        self._recent: Deque[Tuple[float, float]] = deque(maxlen=window)
+        self.max_ms = 0.0
+        self.samples = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, lag_ms: float, at: float = None):
+        self.tracker.record(lag_ms)
+        self._recent.append((at or time.time(), lag_ms))
+        self.samples += 1
+        self.max_ms = max(self.max_ms, lag_ms)
+        if lag_ms >= settings.loop_lag_warn_ms:
+            logger.warning(f"Event loop lag {lag_ms:.1f}ms (blocking call on the loop?)")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, (loop.time() - scheduled) * 1000))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def max_lag_ms(self, start: float, end: float) -> float:
+        """时间区间内采样到的最大延迟（唤醒时间落在区间后一个采样周期内的也计入）"""
+        end += self.interval
+        lags = [lag for at, lag in list(self._recent) if start <= at <= end]
+        return round(max(lags), 3) if lags else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        def rounded(value: Optional[float]) -> Optional[float]:
+            return round(value, 3) if value is not None else None
+
+        return {
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "p50_ms": rounded(self.tracker.percentile(0.5)),
+            "p95_ms": rounded(self.tracker.percentile(0.95)),
+            "p99_ms": rounded(self.tracker.percentile(0.99)),
+            "max_ms": round(self.max_ms, 3),
+            "running": self._task is not None and not self._task.done()
+        }
+
+
+trace_recorder = TraceRecorder()
+loop_lag_monitor = LoopLagMonitor()
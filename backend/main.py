@@ -1,6 +1,6 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import os
 import argparse
 import time
@@ -8,8 +8,11 @@ import uuid
 from contextlib import asynccontextmanager
 from loguru import logger
 
-from app.routers import research
+from app.routers import research, debug
 from app.core.config import settings
+from app.utils.json_response import FastJSONResponse
+from app.utils import offload, metrics
+from app.utils.tracing import start_trace, loop_lag_monitor
 
 # 默认值
 DEFAULT_HOST = "127.0.0.1"
@@ -36,14 +39,18 @@ async def lifespan(app: FastAPI):
     logger.info(f"后端接口文档: http://127.0.0.1:{port}/docs")
     logger.info(f"后端根路由: http://127.0.0.1:{port}/")
     logger.info(f"健康检查: http://127.0.0.1:{port}/health")
+    loop_lag_monitor.start()
     yield
     logger.info("DeepResearch API 正在关闭...")
+    await loop_lag_monitor.stop()
+    offload.shutdown(wait=False)
 
 app = FastAPI(
     title="DeepResearch API",
     description="智能文档研究助手API",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # CORS中间件配置
@@ -63,11 +70,16 @@ async def log_requests(request: Request, call_next):
     
     logger.info(f"Request {request_id}: {request.method} {request.url}")
     
-    response = await call_next(request)
+    # 按请求ID记录各阶段span，完成后可在 /debug/traces 查询
+    with start_trace(request_id, request.method, request.url.path) as trace:
+        response = await call_next(request)
+        if trace is not None:
+            trace.status_code = response.status_code
     
     process_time = time.time() - start_time
     logger.info(f"Request {request_id} completed in {process_time:.2f}s")
     
+    response.headers["X-Request-ID"] = request_id
     return response
 
 # 全局异常处理
@@ -85,6 +97,7 @@ async def global_exception_handler(request: Request, exc: Exception):
 
 # 注册路由
 app.include_router(research.router, prefix="/api/v1", tags=["research"])
+app.include_router(debug.router, prefix="/debug", tags=["debug"])
 
 @app.get("/")
 async def root():
@@ -108,6 +121,11 @@ async def health_check():
         }
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus文本格式的指标"""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
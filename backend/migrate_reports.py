@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+报告目录迁移与维护脚本
+把旧的平铺报告目录迁移为按哈希前缀分片的布局，可选执行保留策略与归档
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import settings
+from app.services.report_store import ReportStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="迁移报告目录到分片布局")
+    parser.add_argument("--reports-dir", type=str, default=None, help="报告目录，默认使用配置中的REPORTS_DIR")
+    parser.add_argument("--maintenance", action="store_true", help="迁移后执行保留策略与归档")
+    args = parser.parse_args()
+
+    if args.reports_dir:
+        settings.reports_dir = args.reports_dir
+
+    print(f"📁 报告目录: {settings.reports_dir}")
+    migrated = ReportStore().migrate_to_sharded()
+    print(f"✅ 已迁移 {migrated} 份报告到分片目录")
+
+    if args.maintenance:
+        from app.services.report_service import ReportService
+        result = ReportService().run_maintenance()
+        print(f"🧹 已删除 {len(result['deleted'])} 份过期报告，归档 {len(result['archived'])} 份报告")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+"""
+离线性能测试工具（合成语料、模型桩、基准脚本）
+"""
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+文本清理与分片微基准
+对 clean_text、split_text_semantic、split_text_fixed 及“清理+分片”组合，按输入大小（1KB~50MB）、段落长度分布、
+中英文比例、分片大小/重叠分别扫描，记录耗时与分配峰值（tracemalloc），并对大小扫描做对数回归得到缩放指数，
+指数明显大于1（超线性）或分片超过最大长度时以状态码1退出
+
+    python -m perf.bench_chunking --quick
+    python -m perf.bench_chunking --sweeps size --sizes 1K 1M 50M
+    python -m perf.bench_chunking --sweeps chunking --chunk-sizes 1000 4000 --overlaps 0 200 800
+"""
+
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+
+from app.services.pdf_service import PDFService
+from perf import corpus
+
+KB = 1024
+MB = 1024 * 1024
+DEFAULT_SIZES = [KB, 10 * KB, 100 * KB, MB, 10 * MB, 50 * MB]
+QUICK_SIZES = [KB, 10 * KB, 100 * KB, MB, 4 * MB]
+SWEEPS = ("size", "paragraphs", "cjk", "chunking")
+DEFAULT_CJK_RATIOS = [0.0, 0.5, 1.0]
+DEFAULT_CHUNK_SIZES = [500, 2000, 8000]
+DEFAULT_OVERLAPS = [0, 200, 1000]
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# 拟合缩放指数时只用不小于该大小的点，小输入的耗时被固定开销主导
+FIT_MIN_BYTES = 64 * KB
+MAX_EXPONENT = 1.25
+
+
+def _clean_then(split: Callable[[PDFService, str], List[str]]) -> Callable[[PDFService, str], List[str]]:
+    return lambda service, text: split(service, service.clean_text(text))
+
+
+# 分片函数直接作用于带段落的原始文本；pipeline:* 与 split_text 的实际流程一致（先清理再分片）
+TARGETS: Dict[str, Callable[[PDFService, str], Any]] = {
+    "clean": lambda service, text: service.clean_text(text),
+    "semantic": lambda service, text: service.split_text_semantic(text),
+    "fixed": lambda service, text: service.split_text_fixed(text),
+    "pipeline:semantic": _clean_then(lambda service, text: service.split_text_semantic(text)),
+    "pipeline:fixed": _clean_then(lambda service, text: service.split_text_fixed(text)),
+}
+
+
+def parse_size(value: str) -> int:
+    """解析 1K / 10M / 4096 形式的字节数"""
+    value = value.strip().upper().rstrip("B")
+    units = {"K": KB, "M": MB, "G": 1024 * MB}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def format_size(size: int) -> str:
+    if size >= MB:
+        return f"{size / MB:g}M"
+    if size >= KB:
+        return f"{size / KB:g}K"
+    return str(size)
+
+
+def _output_stats(output: Any, text: str) -> Dict[str, Any]:
+    if isinstance(output, str):
+        return {"output_chars": len(output)}
+    lengths = [len(chunk) for chunk in output]
+    return {
+        "chunks": len(lengths),
+        "max_chunk": max(lengths) if lengths else 0,
+        # 输出总字符数/输入字符数，反映重叠带来的放大
+        "amplification": round(sum(lengths) / len(text), 3) if text else 0.0
+    }
+
+
+def measure(func: Callable[[], Any], repeat: int = 5, min_time: float = 0.2, allocations: bool = True) -> Dict[str, Any]:
+    """取多次运行的最短耗时；累计耗时超过min_time后不再重复。分配峰值在单独一次运行中用tracemalloc统计"""
+    timings = []
+    output = None
+    while len(timings) < max(1, repeat):
+        gc.collect()
+        start = time.perf_counter()
+        output = func()
+        timings.append(time.perf_counter() - start)
+        if sum(timings) >= min_time:
+            break
+
+    result = {"seconds": min(timings), "runs": len(timings), "output": output}
+    if allocations:
+        del output
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            result["alloc_peak"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def run_point(
+    service: PDFService,
+    text: str,
+    targets: List[str],
+    max_chunk_size: int,
+    overlap_size: int,
+    repeat: int = 5,
+    allocations: bool = True
+) -> Dict[str, Dict[str, Any]]:
+    service.max_chunk_size = max_chunk_size
+    service.overlap_size = overlap_size
+    size = len(text.encode("utf-8"))
+    results = {}
+    for name in targets:
+        measured = measure(lambda: TARGETS[name](service, text), repeat=repeat, allocations=allocations)
+        entry = {
+            "seconds": round(measured["seconds"], 6),
+            "runs": measured["runs"],
+            "mb_per_s": round(size / MB / measured["seconds"], 2) if measured["seconds"] > 0 else None,
+            **_output_stats(measured["output"], text)
+        }
+        if allocations:
+            entry["alloc_peak_mb"] = round(measured["alloc_peak"] / MB, 3)
+            # 分配峰值/输入字节数，大于常数倍说明存在多余拷贝
+            entry["alloc_ratio"] = round(measured["alloc_peak"] / size, 2)
+        results[name] = entry
+    return results
+
+
+def fit_exponent(points: List[tuple], min_x: float = FIT_MIN_BYTES) -> Optional[float]:
+    """对 (x, y) 点做 log-log 最小二乘，返回斜率（y ∝ x^k 中的k）；可用点少于2个时返回None"""
+    points = [(x, y) for x, y in points if y and y > 0]
+    fitted = [(x, y) for x, y in points if x >= min_x]
+    if len(fitted) < 2:
+        fitted = points
+    if len(fitted) < 2:
+        return None
+    xs = [math.log(x) for x, _ in fitted]
+    ys = [math.log(y) for _, y in fitted]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    denominator = sum((x - mean_x) ** 2 for x in xs)
+    if denominator == 0:
+        return None
+    return round(sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / denominator, 3)
+
+
+def scaling(points: List[Dict[str, Any]], targets: List[str], max_exponent: float = MAX_EXPONENT) -> Dict[str, Dict[str, Any]]:
+    """按大小扫描结果计算各函数耗时与分配峰值的缩放指数"""
+    summary = {}
+    for name in targets:
+        time_exponent = fit_exponent([(point["size_bytes"], point["results"][name]["seconds"]) for point in points])
+        alloc_exponent = fit_exponent([
+            (point["size_bytes"], point["results"][name].get("alloc_peak_mb")) for point in points
+        ])
+        summary[name] = {
+            "time_exponent": time_exponent,
+            "alloc_exponent": alloc_exponent,
+            "superlinear": any(value is not None and value > max_exponent for value in (time_exponent, alloc_exponent))
+        }
+    return summary
+
+
+def run_sweeps(
+    sweeps: List[str] = SWEEPS,
+    sizes: List[int] = DEFAULT_SIZES,
+    base_size: int = MB,
+    distributions: List[str] = corpus.PARAGRAPH_DISTRIBUTIONS,
+    cjk_ratios: List[float] = DEFAULT_CJK_RATIOS,
+    chunk_sizes: List[int] = DEFAULT_CHUNK_SIZES,
+    overlaps: List[int] = DEFAULT_OVERLAPS,
+    targets: List[str] = list(TARGETS),
+    repeat: int = 5,
+    allocations: bool = True,
+    seed: int = 0,
+    max_exponent: float = MAX_EXPONENT
+) -> Dict[str, Any]:
+    """每个扫描只改变一个维度，其余取默认值（mixed段落、中英各半、服务默认分片配置）"""
+    service = PDFService()
+    default_chunk, default_overlap = service.max_chunk_size, service.overlap_size
+
+    def point(sweep: str, size: int, distribution: str = "mixed", cjk_ratio: float = 0.5,
+              max_chunk_size: int = default_chunk, overlap_size: int = default_overlap) -> Dict[str, Any]:
+        text = corpus.synthetic_text(size, distribution, cjk_ratio, seed)
+        results = run_point(service, text, targets, max_chunk_size, overlap_size, repeat, allocations)
+        logger.info(f"Chunking {sweep}: {format_size(size)} {distribution} cjk={cjk_ratio} "
+                    f"chunk={max_chunk_size}/{overlap_size} done")
+        return {
+            "sweep": sweep,
+            "target_bytes": size,
+            "size_bytes": len(text.encode("utf-8")),
+            "chars": len(text),
+            "distribution": distribution,
+            "cjk_ratio": cjk_ratio,
+            "max_chunk_size": max_chunk_size,
+            "overlap_size": overlap_size,
+            "results": results
+        }
+
+    result: Dict[str, Any] = {
+        "meta": {
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "repeat": repeat,
+            "allocations": allocations,
+            "default_chunk_size": default_chunk,
+            "default_overlap_size": default_overlap,
+            "max_exponent": max_exponent
+        },
+        "sweeps": {}
+    }
+    for sweep in sweeps:
+        if sweep == "size":
+            points = [point(sweep, size) for size in sizes]
+        elif sweep == "paragraphs":
+            points = [point(sweep, base_size, distribution=distribution) for distribution in distributions]
+        elif sweep == "cjk":
+            points = [point(sweep, base_size, cjk_ratio=ratio) for ratio in cjk_ratios]
+        elif sweep == "chunking":
+            points = [
+                point(sweep, base_size, max_chunk_size=chunk_size, overlap_size=overlap)
+                for chunk_size in chunk_sizes for overlap in overlaps if overlap < chunk_size
+            ]
+        else:
+            raise ValueError(f"不支持的扫描维度: {sweep}")
+        result["sweeps"][sweep] = points
+
+    if "size" in result["sweeps"]:
+        result["scaling"] = scaling(result["sweeps"]["size"], targets, max_exponent)
+    result["oversized"] = oversized(result)
+    service.max_chunk_size, service.overlap_size = default_chunk, default_overlap
+    return result
+
+
+def oversized(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """列出最大分片超过配置的最大长度的点（分片器退化时大小扫描不一定超线性，但分片会失控）"""
+    found = []
+    for points in result["sweeps"].values():
+        for point in points:
+            for name, entry in point["results"].items():
+                if entry.get("max_chunk", 0) > point["max_chunk_size"]:
+                    found.append({
+                        "sweep": point["sweep"],
+                        "point": _point_label(point),
+                        "target": name,
+                        "max_chunk": entry["max_chunk"],
+                        "max_chunk_size": point["max_chunk_size"]
+                    })
+    return found
+
+
+def _point_label(point: Dict[str, Any]) -> str:
+    sweep = point["sweep"]
+    if sweep == "size":
+        return format_size(point["target_bytes"])
+    if sweep == "paragraphs":
+        return point["distribution"]
+    if sweep == "cjk":
+        return f"cjk={point['cjk_ratio']:g}"
+    return f"{point['max_chunk_size']}/{point['overlap_size']}"
+
+
+def print_tables(result: Dict[str, Any]):
+    """每个扫描一张表，各函数并排：耗时(ms)、分配峰值/输入、分片数"""
+    for sweep, points in result["sweeps"].items():
+        if not points:
+            continue
+        targets = list(points[0]["results"])
+        print(f"\n[{sweep}]")
+        header = f"{'point':<14}" + "".join(f"{name:>26}" for name in targets)
+        print(header)
+        print(f"{'':<14}" + "".join(f"{'ms  alloc/in  chunks':>26}" for _ in targets))
+        print("-" * len(header))
+        for point in points:
+            cells = []
+            for name in targets:
+                entry = point["results"][name]
+                alloc = f"{entry['alloc_ratio']:.1f}x" if "alloc_ratio" in entry else "-"
+                chunks = entry.get("chunks", "-")
+                cells.append(f"{entry['seconds'] * 1000:>10.2f}{alloc:>9}{chunks:>7}")
+            print(f"{_point_label(point):<14}" + "".join(f"{cell:>26}" for cell in cells))
+
+    if result.get("scaling"):
+        print(f"\n缩放指数（log-log 拟合，≥{format_size(FIT_MIN_BYTES)}，阈值 {result['meta']['max_exponent']}）")
+        for name, item in result["scaling"].items():
+            flag = "❌ 超线性" if item["superlinear"] else "✅"
+            print(f"  {name:<20}time^{item['time_exponent']}  alloc^{item['alloc_exponent']}  {flag}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="文本清理与分片微基准（耗时/分配的缩放曲线）")
+    parser.add_argument("--sweeps", nargs="+", choices=SWEEPS, default=list(SWEEPS))
+    parser.add_argument("--sizes", nargs="+", type=parse_size, default=None,
+                        help=f"大小扫描的输入字节数（支持K/M），默认 {' '.join(format_size(size) for size in DEFAULT_SIZES)}")
+    parser.add_argument("--quick", action="store_true",
+                        help=f"快速模式，大小为 {' '.join(format_size(size) for size in QUICK_SIZES)}")
+    parser.add_argument("--base-size", type=parse_size, default=MB, help="其余扫描使用的输入大小")
+    parser.add_argument("--distributions", nargs="+", choices=corpus.PARAGRAPH_DISTRIBUTIONS,
+                        default=list(corpus.PARAGRAPH_DISTRIBUTIONS))
+    parser.add_argument("--cjk-ratios", nargs="+", type=float, default=DEFAULT_CJK_RATIOS)
+    parser.add_argument("--chunk-sizes", nargs="+", type=int, default=DEFAULT_CHUNK_SIZES)
+    parser.add_argument("--overlaps", nargs="+", type=int, default=DEFAULT_OVERLAPS)
+    parser.add_argument("--targets", nargs="+", choices=list(TARGETS), default=list(TARGETS))
+    parser.add_argument("--repeat", type=int, default=5, help="每个点的最多运行次数（取最短耗时）")
+    parser.add_argument("--no-alloc", action="store_true", help="不统计分配峰值（tracemalloc会拖慢大输入）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-exponent", type=float, default=MAX_EXPONENT, help="缩放指数超过该值视为超线性")
+    parser.add_argument("--out", type=str, default=None, help="结果JSON路径，默认写入 perf/results/")
+    args = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    result = run_sweeps(
+        args.sweeps,
+        sizes=args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES),
+        base_size=args.base_size,
+        distributions=args.distributions,
+        cjk_ratios=args.cjk_ratios,
+        chunk_sizes=args.chunk_sizes,
+        overlaps=args.overlaps,
+        targets=args.targets,
+        repeat=args.repeat,
+        allocations=not args.no_alloc,
+        seed=args.seed,
+        max_exponent=args.max_exponent
+    )
+
+    out = args.out or os.path.join(RESULTS_DIR, f"chunking-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print_tables(result)
+    print(f"\n📄 结果已保存: {out}")
+
+    failed = False
+    flagged = [name for name, item in result.get("scaling", {}).items() if item["superlinear"]]
+    if flagged:
+        print(f"\n❌ 超线性缩放: {', '.join(flagged)}")
+        failed = True
+    for item in result["oversized"]:
+        print(f"\n❌ 分片超长: [{item['sweep']}] {item['point']} {item['target']} {item['max_chunk']} > {item['max_chunk_size']}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+端到端流水线基准
+用合成PDF语料和模型桩离线运行 ReportService.generate_report，输出吞吐、延迟分位数与各阶段峰值RSS，
+结果保存为JSON，并可与基线结果对比标记回归
+
+    python -m perf.bench_pipeline --quick
+    python -m perf.bench_pipeline --pages 1 100 2000 --latency 0.2 --latency-dist lognormal --jitter 0.5
+    python -m perf.bench_pipeline --quick --baseline perf/results/baseline.json
+    python -m perf.bench_pipeline --quick --cassette cassettes/llm.jsonl --time-scale 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+
+from app.core.config import settings
+from app.services.report_stats import STAGES
+from app.utils import offload, tracing
+from app.utils.metrics import percentile
+from perf import corpus, stub_llm
+from perf.process_stats import RSSSampler
+
+DEFAULT_PAGES = [1, 10, 100, 500, 2000]
+QUICK_PAGES = [1, 10, 50]
+DEFAULT_QUESTION = "文档的主要结论是什么？"
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+MB = 1024 * 1024
+
+# 对比基线时忽略的绝对差值，避免小用例的计时抖动被当作回归
+TIME_NOISE = 0.05  # 秒
+RSS_NOISE = 20.0  # MB
+
+
+def _summary(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": _round(percentile(values, 0.5)),
+        "p95": _round(percentile(values, 0.95)),
+        "max": _round(max(values) if values else None),
+        "avg": _round(sum(values) / len(values) if values else None)
+    }
+
+
+def _round(value: Optional[float], digits: int = 4) -> Optional[float]:
+    return round(value, digits) if value is not None else None
+
+
+def configure(work_dir: str, cpu_mode: str = "thread", concurrency: Optional[int] = None) -> Dict[str, Any]:
+    """把报告等存储目录指向临时目录，关闭检查点，放宽请求超时；返回被修改的原配置"""
+    names = (
+        "reports_dir", "checkpoint_dir", "upload_dir", "documents_dir", "checkpoint_enabled", "request_timeout",
+        "tracing_enabled", "offload_cpu_mode", "llm_max_concurrency", "llm_endpoint_max_concurrency"
+    )
+    original = {name: getattr(settings, name) for name in names}
+    settings.reports_dir = os.path.join(work_dir, "reports")
+    settings.checkpoint_dir = os.path.join(work_dir, "checkpoints")
+    settings.upload_dir = os.path.join(work_dir, "uploads")
+    settings.documents_dir = os.path.join(work_dir, "documents")
+    settings.checkpoint_enabled = False
+    settings.request_timeout = 24 * 3600
+    settings.tracing_enabled = True
+    settings.offload_cpu_mode = cpu_mode
+    if concurrency:
+        settings.llm_max_concurrency = concurrency
+        settings.llm_endpoint_max_concurrency = concurrency
+    return original
+
+
+def _stage_peaks(trace: Optional[tracing.Trace], sampler: RSSSampler) -> Dict[str, float]:
+    """按span时间区间求各阶段峰值RSS（MB）"""
+    peaks: Dict[str, float] = {}
+    if trace is None:
+        return peaks
+    for span in trace.spans:
+        if span.name in STAGES and span.end is not None:
+            peak = sampler.peak(span.start, span.end) / MB
+            peaks[span.name] = max(peaks.get(span.name, 0.0), peak)
+    return peaks
+
+
+async def run_case(report_service, pdf_path: str, question: str, repeat: int, sampler: RSSSampler) -> List[Dict[str, Any]]:
+    """对同一份PDF重复生成报告，返回每次运行的原始数据"""
+    runs = []
+    for index in range(repeat):
+        started = time.time()
+        with tracing.start_trace(f"bench-{uuid.uuid4().hex[:12]}", "BENCH", os.path.basename(pdf_path)) as trace:
+            result = await report_service.generate_report(pdf_path, f"{question}（{index + 1}）")
+        elapsed = time.time() - started
+        metadata = result["report_metadata"]
+        runs.append({
+            "seconds": elapsed,
+            "chunks": metadata.total_chunks,
+            "is_partial": metadata.is_partial,
+            "stage_timings": dict(metadata.stage_timings),
+            "llm_latency": dict(metadata.llm_latency),
+            "prompt_tokens": metadata.prompt_tokens,
+            "completion_tokens": metadata.completion_tokens,
+            "stage_rss_mb": _stage_peaks(trace, sampler),
+            "peak_rss_mb": sampler.peak(started, time.time()) / MB
+        })
+        report_service.delete_report(result["report_id"])
+    return runs
+
+
+def summarize_case(layout: str, pages: int, pdf_path: str, runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    total_seconds = sum(run["seconds"] for run in runs)
+    chunks = runs[-1]["chunks"]
+    stage_rss: Dict[str, float] = {}
+    for run in runs:
+        for stage, peak in run["stage_rss_mb"].items():
+            stage_rss[stage] = max(stage_rss.get(stage, 0.0), peak)
+    stage_rss["overall"] = max(run["peak_rss_mb"] for run in runs)
+    return {
+        "layout": layout,
+        "pages": pages,
+        "file_bytes": os.path.getsize(pdf_path),
+        "chunks": chunks,
+        "runs": len(runs),
+        "partial_runs": sum(1 for run in runs if run["is_partial"]),
+        "latency": _summary([run["seconds"] for run in runs]),
+        "throughput": {
+            "pages_per_s": _round(pages * len(runs) / total_seconds, 3),
+            "chunks_per_s": _round(chunks * len(runs) / total_seconds, 3)
+        },
+        "stages": {
+            stage: _summary([run["stage_timings"][stage] for run in runs if stage in run["stage_timings"]])
+            for stage in STAGES if any(stage in run["stage_timings"] for run in runs)
+        },
+        "llm_latency": {
+            "calls": runs[-1]["llm_latency"].get("calls", 0),
+            "p50": _round(percentile([run["llm_latency"]["p50"] for run in runs if run["llm_latency"].get("p50") is not None], 0.5)),
+            "p95": _round(max((run["llm_latency"]["p95"] for run in runs if run["llm_latency"].get("p95") is not None), default=None))
+        },
+        "tokens": {"prompt": runs[-1]["prompt_tokens"], "completion": runs[-1]["completion_tokens"]},
+        "peak_rss_mb": {stage: round(peak, 1) for stage, peak in stage_rss.items()}
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def run_benchmark(
+    page_counts: List[int],
+    layouts: List[str],
+    latency: stub_llm.LatencyModel,
+    repeat: int = 3,
+    seed: int = 0,
+    question: str = DEFAULT_QUESTION,
+    cpu_mode: str = "thread",
+    concurrency: Optional[int] = None,
+    corpus_dir: Optional[str] = None,
+    work_dir: Optional[str] = None,
+    cassette: Optional[str] = None,
+    time_scale: float = 1.0
+) -> Dict[str, Any]:
+    """运行基准并返回结果（可直接写入JSON）；指定cassette时回放录制的真实调用代替模型桩"""
+    from app.services.llm_cassette import CassetteClient, LLMCassette
+    from app.services.report_service import ReportService
+
+    with tempfile.TemporaryDirectory(prefix="bench-pipeline-") as tmp_dir:
+        original = configure(work_dir or tmp_dir, cpu_mode, concurrency)
+
+        async def run_all() -> Dict[str, Any]:
+            cases = {}
+            with RSSSampler() as sampler:
+                for pages in page_counts:
+                    for layout in layouts:
+                        pdf_path = corpus.corpus_path(pages, layout, seed, corpus_dir)
+                        runs = await run_case(report_service, pdf_path, question, repeat, sampler)
+                        case = summarize_case(layout, pages, pdf_path, runs)
+                        cases[f"{layout}-{pages}p"] = case
+                        logger.info(f"Benchmark {layout}-{pages}p: p50={case['latency']['p50']}s, chunks={case['chunks']}")
+            return cases
+
+        try:
+            report_service = ReportService()
+            if cassette:
+                replay = LLMCassette(cassette, "replay", time_scale=time_scale)
+                stub_llm.install(report_service, CassetteClient(replay))
+                llm_meta = {"cassette": os.path.basename(cassette)}
+            else:
+                client = stub_llm.install(report_service, stub_llm.StubLLMClient(latency))
+                llm_meta = {"stub_latency": latency.to_dict()}
+            cases = asyncio.run(run_all())
+            llm_meta.update(replay.stats() if cassette else {"stub_calls": client.calls})
+            meta_settings = {
+                "chunk_strategy": settings.chunk_strategy,
+                "max_chunk_size": settings.max_chunk_size,
+                "overlap_size": settings.overlap_size,
+                "llm_max_concurrency": settings.llm_max_concurrency,
+                "llm_endpoint_max_concurrency": settings.llm_endpoint_max_concurrency,
+                "prompt_version": settings.prompt_version
+            }
+        finally:
+            offload.shutdown()
+            for name, value in original.items():
+                setattr(settings, name, value)
+
+    return {
+        "meta": {
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "repeat": repeat,
+            "cpu_mode": cpu_mode,
+            "llm": llm_meta,
+            "settings": meta_settings
+        },
+        "cases": cases
+    }
+
+
+def _metric(case: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = case
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value if isinstance(value, (int, float)) else None
+
+
+def _checks(case: Dict[str, Any]):
+    """(指标, 是否越大越差, 可忽略的绝对差值)"""
+    yield "latency.p50", True, TIME_NOISE
+    yield "latency.p95", True, TIME_NOISE
+    yield "throughput.pages_per_s", False, 0.0
+    for stage in case.get("stages", {}):
+        yield f"stages.{stage}.p50", True, TIME_NOISE
+    yield "peak_rss_mb.overall", True, RSS_NOISE
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.2) -> List[Dict[str, Any]]:
+    """与基线对比，返回超过容差的回归项（基线中没有的用例不比较）"""
+    regressions = []
+    for name, case in current.get("cases", {}).items():
+        base_case = baseline.get("cases", {}).get(name)
+        if base_case is None:
+            continue
+        for path, higher_is_worse, noise in _checks(case):
+            value = _metric(case, path)
+            base = _metric(base_case, path)
+            if value is None or not base:
+                continue
+            if higher_is_worse:
+                regressed = value > base * (1 + tolerance) and value - base > noise
+            else:
+                # 吞吐下降同样要求端到端延迟的增加超过抖动范围
+                latency_delta = (_metric(case, "latency.p50") or 0) - (_metric(base_case, "latency.p50") or 0)
+                regressed = value < base * (1 - tolerance) and latency_delta > TIME_NOISE
+            if regressed:
+                regressions.append({
+                    "case": name,
+                    "metric": path,
+                    "baseline": base,
+                    "current": value,
+                    "change": round(value / base - 1, 3)
+                })
+    return regressions
+
+
+def print_table(result: Dict[str, Any]):
+    header = f"{'case':<16}{'chunks':>8}{'p50(s)':>10}{'p95(s)':>10}{'pages/s':>10}{'extract':>10}{'chunk':>10}{'llm':>10}{'rss(MB)':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, case in result["cases"].items():
+        stages = case["stages"]
+        print(
+            f"{name:<16}{case['chunks']:>8}{case['latency']['p50']:>10.3f}{case['latency']['p95']:>10.3f}"
+            f"{case['throughput']['pages_per_s']:>10.1f}"
+            f"{stages.get('extract', {}).get('p50') or 0:>10.3f}{stages.get('chunk', {}).get('p50') or 0:>10.3f}"
+            f"{stages.get('llm', {}).get('p50') or 0:>10.3f}{case['peak_rss_mb']['overall']:>10.1f}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="离线端到端流水线基准（合成PDF + 模型桩）")
+    parser.add_argument("--pages", type=int, nargs="+", default=None, help=f"页数列表，默认 {DEFAULT_PAGES}")
+    parser.add_argument("--quick", action="store_true", help=f"快速模式，页数为 {QUICK_PAGES}")
+    parser.add_argument("--layouts", nargs="+", choices=corpus.LAYOUTS, default=list(corpus.LAYOUTS))
+    parser.add_argument("--repeat", type=int, default=3, help="每个用例的运行次数")
+    parser.add_argument("--seed", type=int, default=0, help="语料与延迟分布的随机种子")
+    parser.add_argument("--latency", type=float, default=0.05, help="模型桩延迟均值/中位数（秒）")
+    parser.add_argument("--latency-dist", choices=stub_llm.DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform为半宽（秒），lognormal为形状参数")
+    parser.add_argument("--cassette", type=str, default=None, help="回放该录制文件中的真实模型调用，代替模型桩")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="回放延迟倍率，0为不等待")
+    parser.add_argument("--concurrency", type=int, default=None, help="覆盖单报告与单端点的模型并发数")
+    parser.add_argument("--cpu-mode", choices=["thread", "process"], default="thread",
+                        help="CPU任务执行方式；process模式下子进程内存不计入RSS")
+    parser.add_argument("--corpus-dir", type=str, default=None, help="语料缓存目录")
+    parser.add_argument("--out", type=str, default=None, help="结果JSON路径，默认写入 perf/results/")
+    parser.add_argument("--baseline", type=str, default=None, help="基线结果JSON，存在回归时以状态码1退出")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的相对退化比例")
+    args = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    page_counts = args.pages or (QUICK_PAGES if args.quick else DEFAULT_PAGES)
+    latency = stub_llm.LatencyModel(args.latency, args.latency_dist, args.jitter, args.seed)
+    result = run_benchmark(
+        page_counts, args.layouts, latency, repeat=args.repeat, seed=args.seed,
+        cpu_mode=args.cpu_mode, concurrency=args.concurrency, corpus_dir=args.corpus_dir,
+        cassette=args.cassette, time_scale=args.time_scale
+    )
+
+    out = args.out or os.path.join(RESULTS_DIR, f"pipeline-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print_table(result)
+    print(f"\n📄 结果已保存: {out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ 发现 {len(regressions)} 项回归（容差 {args.tolerance:.0%}）:")
+            for item in regressions:
+                print(f"  {item['case']:<16}{item['metric']:<28}{item['baseline']} -> {item['current']} ({item['change']:+.1%})")
+            return 1
+        print(f"\n✅ 与基线相比无回归（容差 {args.tolerance:.0%}）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
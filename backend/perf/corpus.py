@@ -0,0 +1,167 @@
+"""
+合成PDF语料
+按 (版式, 页数, 种子) 确定性地生成测试PDF，相同参数生成的文件内容逐字节一致；另可直接生成类PDF提取文本
+"""
+
+import os
+import random
+from typing import List, Optional
+
+import fitz
+
+LAYOUTS = ("cjk", "latin", "mixed")
+DEFAULT_CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".corpus")
+
+PAGE_RECT = fitz.paper_rect("a4")
+MARGIN = 60
+FONT_SIZE = 10.5
+
+_CJK_TERMS = (
+    "人工智能", "机器学习", "深度学习", "神经网络", "自然语言处理", "知识图谱", "数据治理", "模型训练",
+    "推理服务", "向量检索", "研究方法", "实验结果", "样本数量", "评估指标", "准确率", "召回率",
+    "系统架构", "分布式计算", "存储引擎", "缓存策略", "性能瓶颈", "吞吐量", "响应时间", "资源占用",
+    "政策建议", "市场规模", "产业链", "应用场景", "风险控制", "发展趋势", "技术路线", "核心问题"
+)
+_CJK_GLUE = ("的", "与", "和", "在", "对", "通过", "基于", "对于", "以及", "进一步", "显著", "主要")
+_CJK_ENDINGS = ("。", "。", "。", "；", "！", "？")
+
+_LATIN_WORDS = (
+    "the", "of", "and", "to", "in", "model", "data", "system", "results", "analysis", "method", "performance",
+    "training", "inference", "latency", "throughput", "memory", "evaluation", "baseline", "experiment",
+    "research", "network", "language", "retrieval", "architecture", "pipeline", "benchmark", "observed",
+    "significant", "improvement", "compared", "with", "across", "several", "datasets", "approach", "is", "we"
+)
+_MIXED_TERMS = ("Transformer", "BERT", "GPU", "API", "Python", "F1", "BM25", "LLM", "PDF", "JSON")
+
+
+def cjk_sentence(rng: random.Random, mixed: bool = False) -> str:
+    parts = []
+    for _ in range(rng.randint(3, 7)):
+        term = rng.choice(_CJK_TERMS)
+        if mixed and rng.random() < 0.3:
+            term = f"{rng.choice(_MIXED_TERMS)}{term}"
+        parts.append(term)
+        parts.append(rng.choice(_CJK_GLUE))
+    parts[-1] = rng.choice(_CJK_ENDINGS)
+    if rng.random() < 0.2:
+        parts.insert(len(parts) - 1, f"（{rng.randint(1, 99)}.{rng.randint(0, 9)}%）")
+    return "".join(parts)
+
+
+def latin_sentence(rng: random.Random) -> str:
+    words = [rng.choice(_LATIN_WORDS) for _ in range(rng.randint(8, 20))]
+    if rng.random() < 0.2:
+        words.insert(rng.randrange(len(words)), f"{rng.randint(1, 99)}.{rng.randint(0, 9)}%")
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng: random.Random, layout: str) -> str:
+    """段落长度呈长尾分布：多数为短段落，偶尔出现很长的段落"""
+    sentences = max(1, min(30, int(rng.lognormvariate(1.2, 0.6))))
+    if layout == "latin" or (layout == "mixed" and rng.random() < 0.4):
+        return " ".join(latin_sentence(rng) for _ in range(sentences))
+    return "".join(cjk_sentence(rng, mixed=layout == "mixed") for _ in range(sentences))
+
+
+PARAGRAPH_DISTRIBUTIONS = ("short", "long", "mixed", "single")
+_TEXT_BLOCK_BYTES = 1024 * 1024
+
+
+def _text_paragraph(rng: random.Random, distribution: str, cjk_ratio: float) -> str:
+    if distribution == "short":
+        sentences = max(1, int(rng.lognormvariate(0.7, 0.5)))
+    elif distribution == "long":
+        sentences = rng.randint(15, 40)
+    else:
+        sentences = rng.randint(15, 40) if rng.random() < 0.2 else max(1, int(rng.lognormvariate(0.7, 0.5)))
+    parts = [cjk_sentence(rng) if rng.random() < cjk_ratio else latin_sentence(rng) + " " for _ in range(sentences)]
+    # 模拟PDF提取结果的行内换行
+    text = "".join(parts)
+    width = rng.randint(40, 80)
+    return "\n".join(text[i:i + width] for i in range(0, len(text), width))
+
+
+def synthetic_text(size_bytes: int, distribution: str = "mixed", cjk_ratio: float = 0.5, seed: int = 0) -> str:
+    """生成约size_bytes字节（UTF-8）的类PDF提取文本
+
+    distribution控制段落长度：short（1~3句）、long（15~40句）、mixed（两者8:2）、single（全文无段落分隔）；
+    cjk_ratio为中文句子的比例。超过1MB时重复同一文本块，避免生成本身耗时过长；末尾按目标大小截断
+    """
+    if distribution not in PARAGRAPH_DISTRIBUTIONS:
+        raise ValueError(f"不支持的段落分布: {distribution}")
+    rng = random.Random(f"text:{distribution}:{cjk_ratio}:{seed}")
+    separator = "\n" if distribution == "single" else "\n\n"
+    paragraphs = []
+    block_bytes = 0
+    page = 1
+    while block_bytes < min(size_bytes, _TEXT_BLOCK_BYTES):
+        paragraph = _text_paragraph(rng, "mixed" if distribution == "single" else distribution, cjk_ratio)
+        if rng.random() < 0.05:
+            paragraph += f"\n第 {page} 页" if rng.random() < cjk_ratio else f"\nPage {page}"
+            page += 1
+        paragraphs.append(paragraph)
+        block_bytes += len(paragraph.encode("utf-8")) + len(separator)
+    block = separator.join(paragraphs)
+    repeats = size_bytes // block_bytes + 1
+    text = separator.join([block] * repeats)
+    # 按UTF-8字节截断，丢弃被截断的半个多字节字符
+    return text.encode("utf-8")[:size_bytes].decode("utf-8", errors="ignore")
+
+
+def _page_fonts(layout: str):
+    # china-s 同时覆盖中文与拉丁字符；纯拉丁版式用内置Helvetica
+    return "helv" if layout == "latin" else "china-s"
+
+
+def generate_pdf(path: str, pages: int, layout: str = "mixed", seed: int = 0) -> str:
+    """生成合成PDF：每页包含页眉、若干段落（含小标题）与页码"""
+    if layout not in LAYOUTS:
+        raise ValueError(f"不支持的版式: {layout}")
+    if pages < 1:
+        raise ValueError("页数至少为1")
+
+    rng = random.Random(f"{layout}:{pages}:{seed}")
+    fontname = _page_fonts(layout)
+    title = f"Synthetic {layout} corpus" if layout == "latin" else f"合成语料 {layout}"
+    doc = fitz.open()
+    for number in range(1, pages + 1):
+        page = doc.new_page(width=PAGE_RECT.width, height=PAGE_RECT.height)
+        page.insert_text((MARGIN, MARGIN - 20), title, fontname=fontname, fontsize=8)
+        footer = f"Page {number}" if layout == "latin" else f"第 {number} 页"
+        page.insert_text((PAGE_RECT.width / 2 - 20, PAGE_RECT.height - MARGIN + 30), footer, fontname=fontname, fontsize=8)
+
+        top = MARGIN
+        bottom = PAGE_RECT.height - MARGIN
+        if number == 1 or rng.random() < 0.3:
+            heading = f"{number}. {rng.choice(_CJK_TERMS) if layout != 'latin' else rng.choice(_LATIN_WORDS).title()}"
+            page.insert_text((MARGIN, top + 14), heading, fontname=fontname, fontsize=14)
+            top += 28
+
+        while top < bottom - 3 * FONT_SIZE:
+            rect = fitz.Rect(MARGIN, top, PAGE_RECT.width - MARGIN, bottom)
+            remaining = page.insert_textbox(rect, _paragraph(rng, layout), fontname=fontname, fontsize=FONT_SIZE)
+            if remaining < 0:
+                # 段落放不下时不写入，本页结束
+                break
+            top = bottom - remaining + FONT_SIZE
+
+    data = doc.tobytes(no_new_id=True, garbage=3, deflate=True)
+    doc.close()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+
+def corpus_path(pages: int, layout: str, seed: int = 0, corpus_dir: Optional[str] = None) -> str:
+    """获取（必要时生成）语料文件路径，已生成的文件直接复用"""
+    path = os.path.join(corpus_dir or DEFAULT_CORPUS_DIR, f"{layout}-{pages}p-s{seed}.pdf")
+    if not os.path.exists(path):
+        generate_pdf(path, pages, layout, seed)
+    return path
+
+
+def build_corpus(page_counts: List[int], layouts: List[str] = LAYOUTS, seed: int = 0, corpus_dir: Optional[str] = None) -> List[str]:
+    return [corpus_path(pages, layout, seed, corpus_dir) for pages in page_counts for layout in layouts]
@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+HTTP压测工具
+按配置的操作比例与到达方式（开环泊松到达或闭环并发用户）请求运行中的服务，统计各操作的吞吐、延迟分位数与错误率，
+并从 /debug/traces 读取服务端的事件循环延迟。每次运行的汇总保存为JSON，可与上一次结果对比
+
+    # 完全离线：启动模拟模型服务与本服务后压测
+    python -m perf.loadgen --spawn --rate 2 --duration 60 --mock-args "--latency 0.3 --rate-429 0.02"
+    # 压测已运行的实例
+    python -m perf.loadgen --url http://127.0.0.1:8000 --concurrency 8 --requests 200 --mix generate=1,list=3,get=3,download=1
+    python -m perf.loadgen --spawn --rate 2 --duration 60 --compare perf/results/load-previous.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_ROOT)
+
+from app.utils.metrics import percentile
+from perf import corpus
+
+OPERATIONS = ("generate", "list", "get", "download")
+DEFAULT_MIX = "generate=1,list=2,get=2,download=1"
+DEFAULT_QUESTION = "文档的主要结论是什么？"
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+API_PREFIX = "/api/v1"
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """解析 generate=1,list=2 形式的操作比例"""
+    mix: Dict[str, float] = {}
+    for item in text.split(","):
+        name, _, weight = item.strip().partition("=")
+        if name not in OPERATIONS:
+            raise ValueError(f"未知操作: {name}（可选 {', '.join(OPERATIONS)}）")
+        mix[name] = float(weight or 1)
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("操作比例不能全为0")
+    return mix
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    """延迟分位数（毫秒）"""
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "p50_ms": ms(percentile(values, 0.5)),
+        "p90_ms": ms(percentile(values, 0.9)),
+        "p95_ms": ms(percentile(values, 0.95)),
+        "p99_ms": ms(percentile(values, 0.99)),
+        "max_ms": ms(max(values) if values else None)
+    }
+
+
+class LoadGenerator:
+    """压测执行器：发出请求并记录每次请求的结果"""
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        pdf_path: str,
+        mix: Dict[str, float],
+        question: str = DEFAULT_QUESTION,
+        seed: int = 0
+    ):
+        self.client = client
+        self.pdf_path = pdf_path
+        with open(pdf_path, "rb") as f:
+            self.pdf_bytes = f.read()
+        self.mix = mix
+        self.question = question
+        self._rng = random.Random(seed)
+        self.samples: List[Dict[str, Any]] = []
+        self.report_ids: List[str] = []
+        self.request_ids: List[str] = []
+        self._issued = 0
+        self._generated = 0
+
+    async def load_existing_reports(self):
+        """读取已有报告，使查询与下载操作在生成完成前也有目标"""
+        try:
+            response = await self.client.get(f"{API_PREFIX}/reports")
+            reports = (response.json().get("data") or {}).get("reports", [])
+        except (httpx.HTTPError, ValueError):
+            return
+        self.report_ids.extend(report["report_id"] for report in reports if report.get("report_id"))
+
+    def _choose(self) -> str:
+        names = [name for name, weight in self.mix.items() if weight > 0]
+        operation = self._rng.choices(names, weights=[self.mix[name] for name in names])[0]
+        if operation in ("get", "download") and not self.report_ids:
+            # 还没有可查询的报告时改为生成
+            return "generate" if self.mix.get("generate", 0) > 0 else "list"
+        return operation
+
+    async def _send(self, operation: str) -> httpx.Response:
+        if operation == "generate":
+            self._generated += 1
+            # 每次使用不同的问题，避免命中检查点而跳过模型调用
+            return await self.client.post(
+                f"{API_PREFIX}/generate_report",
+                files={"file": (os.path.basename(self.pdf_path), self.pdf_bytes, "application/pdf")},
+                data={"question": f"{self.question}（{self._generated}）"}
+            )
+        if operation == "list":
+            return await self.client.get(f"{API_PREFIX}/reports")
+        report_id = self._rng.choice(self.report_ids)
+        if operation == "get":
+            return await self.client.get(f"{API_PREFIX}/reports/{report_id}")
+        return await self.client.get(f"{API_PREFIX}/download_report/{report_id}")
+
+    async def execute(self, operation: Optional[str] = None):
+        operation = operation or self._choose()
+        started = time.time()
+        error = None
+        status = None
+        try:
+            response = await self._send(operation)
+            status = response.status_code
+            request_id = response.headers.get("x-request-id")
+            if request_id:
+                self.request_ids.append(request_id)
+            if status >= 400:
+                error = str(status)
+            elif operation != "download":
+                body = response.json()
+                if body.get("code") not in (None, 200):
+                    error = f"code-{body.get('code')}"
+                elif operation == "generate":
+                    report_id = (body.get("data") or {}).get("report_id")
+                    if report_id:
+                        self.report_ids.append(report_id)
+        except httpx.TimeoutException:
+            error = "timeout"
+        except (httpx.HTTPError, ValueError) as e:
+            error = type(e).__name__
+        self.samples.append({
+            "operation": operation,
+            "start": started,
+            "latency": time.time() - started,
+            "status": status,
+            "error": error
+        })
+
+    def _should_issue(self, deadline: Optional[float], requests: Optional[int]) -> bool:
+        if requests is not None and self._issued >= requests:
+            return False
+        return deadline is None or time.time() < deadline
+
+    async def run_closed(self, concurrency: int, duration: Optional[float] = None, requests: Optional[int] = None):
+        """闭环：concurrency个用户各自串行发请求"""
+        deadline = time.time() + duration if duration else None
+
+        async def user():
+            while self._should_issue(deadline, requests):
+                self._issued += 1
+                await self.execute()
+
+        await asyncio.gather(*[user() for _ in range(concurrency)])
+
+    async def run_open(self, rate: float, duration: Optional[float] = None, requests: Optional[int] = None):
+        """开环：按泊松过程以rate个/秒到达，不等待之前的请求完成"""
+        deadline = time.time() + duration if duration else None
+        pending = set()
+        next_at = time.time()
+        while self._should_issue(deadline, requests):
+            delay = next_at - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._issued += 1
+            task = asyncio.ensure_future(self.execute())
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            next_at += self._rng.expovariate(rate)
+        if pending:
+            await asyncio.gather(*pending)
+
+
+async def fetch_server_stats(client: httpx.AsyncClient, request_ids: List[str]) -> Optional[Dict[str, Any]]:
+    """从 /debug/traces 读取本次请求的服务端耗时与事件循环延迟（追踪被关闭时返回None）"""
+    try:
+        response = await client.get("/debug/traces", params={"limit": 1000})
+        if response.status_code != 200:
+            return None
+        data = response.json()["data"]
+    except (httpx.HTTPError, ValueError, KeyError):
+        return None
+    wanted = set(request_ids)
+    traces = [trace for trace in data.get("traces", []) if trace.get("request_id") in wanted]
+    return {
+        "loop_lag": data.get("loop_lag"),
+        "traces_matched": len(traces),
+        "request_loop_lag_max_ms": summarize([trace["attrs"].get("loop_lag_max_ms", 0.0) / 1000 for trace in traces]),
+        "server_latency": summarize([trace["duration_ms"] / 1000 for trace in traces])
+    }
+
+
+async def fetch_mock_stats(mock_url: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not mock_url:
+        return None
+    try:
+        async with httpx.AsyncClient(base_url=mock_url, timeout=10) as client:
+            return (await client.get("/mock/stats")).json()["stats"]
+    except (httpx.HTTPError, ValueError, KeyError):
+        return None
+
+
+def build_summary(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """按操作与总体汇总请求结果"""
+    def group(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        if not items:
+            return {"requests": 0}
+        elapsed = max(item["start"] + item["latency"] for item in items) - min(item["start"] for item in items)
+        ok = [item for item in items if item["error"] is None]
+        errors: Dict[str, int] = {}
+        for item in items:
+            if item["error"] is not None:
+                errors[item["error"]] = errors.get(item["error"], 0) + 1
+        return {
+            "requests": len(items),
+            "ok": len(ok),
+            "errors": errors,
+            "error_rate": round(1 - len(ok) / len(items), 4),
+            "throughput_rps": round(len(ok) / elapsed, 3) if elapsed > 0 else None,
+            "latency": summarize([item["latency"] for item in ok])
+        }
+
+    return {
+        "overall": group(samples),
+        "operations": {
+            operation: group([item for item in samples if item["operation"] == operation])
+            for operation in OPERATIONS if any(item["operation"] == operation for item in samples)
+        }
+    }
+
+
+async def run_load(
+    base_url: str,
+    pdf_path: str,
+    mix: Dict[str, float],
+    rate: Optional[float] = None,
+    concurrency: int = 4,
+    duration: Optional[float] = None,
+    requests: Optional[int] = None,
+    timeout: float = 600.0,
+    seed: int = 0,
+    mock_url: Optional[str] = None,
+    transport: Optional[httpx.AsyncBaseTransport] = None
+) -> Dict[str, Any]:
+    """执行一次压测并返回汇总；rate非空时为开环，否则为concurrency个并发用户的闭环"""
+    if duration is None and requests is None:
+        raise ValueError("需要指定 duration 或 requests")
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=64)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits, transport=transport) as client:
+        generator = LoadGenerator(client, pdf_path, mix, seed=seed)
+        await generator.load_existing_reports()
+        mock_before = await fetch_mock_stats(mock_url)
+        started = time.time()
+        if rate:
+            await generator.run_open(rate, duration, requests)
+        else:
+            await generator.run_closed(concurrency, duration, requests)
+        elapsed = time.time() - started
+        server = await fetch_server_stats(client, generator.request_ids)
+        mock_after = await fetch_mock_stats(mock_url)
+
+    summary = build_summary(generator.samples)
+    summary["meta"] = {
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "base_url": base_url,
+        "mode": "open" if rate else "closed",
+        "rate": rate,
+        "concurrency": None if rate else concurrency,
+        "duration": round(elapsed, 3),
+        "mix": mix,
+        "pdf": os.path.basename(pdf_path),
+        "seed": seed
+    }
+    summary["server"] = server
+    if mock_before is not None and mock_after is not None:
+        summary["mock_llm"] = {
+            key: mock_after[key] - mock_before[key]
+            for key in ("requests", "completed", "rejected", "prompt_tokens", "completion_tokens")
+        }
+        summary["mock_llm"]["faults"] = {
+            fault: count - mock_before["faults"].get(fault, 0) for fault, count in mock_after["faults"].items()
+        }
+        summary["mock_llm"]["peak_in_flight"] = mock_after["peak_in_flight"]
+    return summary
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """逐项对比两次运行的吞吐、延迟与错误率"""
+    rows = []
+    sections = [("overall", current.get("overall", {}), previous.get("overall", {}))]
+    for operation, data in current.get("operations", {}).items():
+        sections.append((operation, data, previous.get("operations", {}).get(operation, {})))
+    for name, now, before in sections:
+        for metric, now_value, before_value in (
+            ("throughput_rps", now.get("throughput_rps"), before.get("throughput_rps")),
+            ("p50_ms", now.get("latency", {}).get("p50_ms"), before.get("latency", {}).get("p50_ms")),
+            ("p95_ms", now.get("latency", {}).get("p95_ms"), before.get("latency", {}).get("p95_ms")),
+            ("error_rate", now.get("error_rate"), before.get("error_rate"))
+        ):
+            change = None
+            if now_value is not None and before_value:
+                change = round(now_value / before_value - 1, 3)
+            rows.append({"scope": name, "metric": metric, "previous": before_value, "current": now_value, "change": change})
+    return rows
+
+
+def print_summary(summary: Dict[str, Any]):
+    meta = summary["meta"]
+    load = f"rate={meta['rate']}/s" if meta["mode"] == "open" else f"concurrency={meta['concurrency']}"
+    print(f"🎯 {meta['base_url']}  {load}  duration={meta['duration']}s")
+    header = f"{'operation':<12}{'requests':>10}{'ok':>8}{'err%':>8}{'rps':>10}{'p50(ms)':>12}{'p95(ms)':>12}{'p99(ms)':>12}"
+    print(header)
+    print("-" * len(header))
+    rows = [("overall", summary["overall"])] + list(summary["operations"].items())
+    for name, data in rows:
+        if not data.get("requests"):
+            continue
+        latency = data["latency"]
+        print(
+            f"{name:<12}{data['requests']:>10}{data['ok']:>8}{data['error_rate'] * 100:>8.1f}"
+            f"{data['throughput_rps'] or 0:>10.2f}{latency['p50_ms'] or 0:>12.1f}"
+            f"{latency['p95_ms'] or 0:>12.1f}{latency['p99_ms'] or 0:>12.1f}"
+        )
+    if summary["overall"].get("errors"):
+        print(f"错误: {summary['overall']['errors']}")
+    server = summary.get("server")
+    if server:
+        lag = server["loop_lag"] or {}
+        print(
+            f"服务端事件循环延迟: p95={lag.get('p95_ms')}ms max={lag.get('max_ms')}ms；"
+            f"单请求期间最大延迟 p95={server['request_loop_lag_max_ms']['p95_ms']}ms（匹配 {server['traces_matched']} 条追踪）"
+        )
+    if summary.get("mock_llm"):
+        print(f"模拟模型服务: {summary['mock_llm']}")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"进程提前退出: {' '.join(process.args)}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"等待服务就绪超时: {url}")
+
+
+@contextmanager
+def spawn_stack(mock_args: str = "", work_dir: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+    """启动模拟模型服务与本服务（数据目录位于临时目录），返回 (服务地址, 模拟服务地址)"""
+    mock_port, app_port = _free_port(), _free_port()
+    mock_url = f"http://127.0.0.1:{mock_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+    processes: List[subprocess.Popen] = []
+    with tempfile.TemporaryDirectory(prefix="loadgen-") as tmp_dir:
+        data_dir = work_dir or tmp_dir
+        env = dict(
+            os.environ,
+            API_BASE=f"{mock_url}/v1",
+            LLM_API_KEY="mock",
+            LLM_ENDPOINTS="[]",
+            REPORTS_DIR=os.path.join(data_dir, "reports"),
+            UPLOAD_DIR=os.path.join(data_dir, "uploads"),
+            CHECKPOINT_DIR=os.path.join(data_dir, "checkpoints"),
+            DOCUMENTS_DIR=os.path.join(data_dir, "documents"),
+            LOG_FILE=os.path.join(data_dir, "logs", "app.log"),
+            TRACE_BUFFER_SIZE="5000"
+        )
+        try:
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "perf.mock_llm", "--port", str(mock_port), *shlex.split(mock_args)],
+                cwd=BACKEND_ROOT, env=env, stdout=subprocess.DEVNULL
+            ))
+            _wait_ready(f"{mock_url}/mock/stats", processes[-1])
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"],
+                cwd=BACKEND_ROOT, env=env, stdout=subprocess.DEVNULL
+            ))
+            _wait_ready(f"{app_url}/health", processes[-1])
+            yield app_url, mock_url
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="服务HTTP压测")
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:8000", help="被测服务地址")
+    parser.add_argument("--spawn", action="store_true", help="自行启动模拟模型服务与本服务（忽略--url）")
+    parser.add_argument("--mock-url", type=str, default=None, help="模拟模型服务地址，用于汇总其请求与故障计数")
+    parser.add_argument("--mock-args", type=str, default="", help="--spawn时传给模拟模型服务的参数")
+    parser.add_argument("--mix", type=str, default=DEFAULT_MIX, help="操作比例")
+    parser.add_argument("--rate", type=float, default=None, help="开环到达速率（请求/秒）；不指定时为闭环")
+    parser.add_argument("--concurrency", type=int, default=4, help="闭环并发用户数")
+    parser.add_argument("--duration", type=float, default=None, help="持续时间（秒）")
+    parser.add_argument("--requests", type=int, default=None, help="请求总数")
+    parser.add_argument("--timeout", type=float, default=600.0, help="单个请求超时（秒）")
+    parser.add_argument("--pages", type=int, default=10, help="上传的合成PDF页数")
+    parser.add_argument("--layout", choices=corpus.LAYOUTS, default="mixed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=str, default=None, help="汇总JSON路径，默认写入 perf/results/")
+    parser.add_argument("--compare", type=str, default=None, help="与之前的汇总JSON对比")
+    args = parser.parse_args(argv)
+
+    if args.duration is None and args.requests is None:
+        args.duration = 30.0
+    mix = parse_mix(args.mix)
+    pdf_path = corpus.corpus_path(args.pages, args.layout, args.seed)
+
+    def run(base_url: str, mock_url: Optional[str]) -> Dict[str, Any]:
+        return asyncio.run(run_load(
+            base_url, pdf_path, mix, rate=args.rate, concurrency=args.concurrency, duration=args.duration,
+            requests=args.requests, timeout=args.timeout, seed=args.seed, mock_url=mock_url
+        ))
+
+    if args.spawn:
+        with spawn_stack(args.mock_args) as (app_url, mock_url):
+            summary = run(app_url, mock_url)
+    else:
+        summary = run(args.url, args.mock_url)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"load-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print_summary(summary)
+    print(f"\n📄 汇总已保存: {out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        print(f"\n{'scope':<12}{'metric':<16}{'previous':>12}{'current':>12}{'change':>10}")
+        for row in compare(summary, previous):
+            change = f"{row['change']:+.1%}" if row["change"] is not None else "-"
+            print(f"{row['scope']:<12}{row['metric']:<16}{str(row['previous']):>12}{str(row['current']):>12}{change:>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+本地模拟模型服务（OpenAI兼容）
+实现 /v1/chat/completions（含流式输出与usage），可配置首token延迟分布、输出速度、429/5xx/超时注入与并发上限，
+用于在本机对并发、重试、对冲与缓存等功能做压测，不产生真实的模型调用费用
+
+    python -m perf.mock_llm --port 9000 --latency 0.5 --tokens-per-second 40 --rate-429 0.05 --max-concurrency 16
+    API_BASE=http://127.0.0.1:9000/v1 uvicorn main:app
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from dataclasses import asdict, dataclass, fields
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from perf.stub_llm import DISTRIBUTIONS, LatencyModel, estimate_tokens
+
+_FILLER = "模拟服务生成的分析内容用于压力测试不代表真实模型输出"
+_STREAM_TICK = 0.02  # 流式输出时每批token的最小间隔（秒），避免极高速度下的逐token调度开销
+
+
+@dataclass
+class MockConfig:
+    """模拟服务配置（运行中可通过 POST /mock/config 部分更新）"""
+    latency: float = 0.2  # 首token延迟均值/中位数（秒）
+    latency_dist: str = "lognormal"
+    jitter: float = 0.3  # uniform为半宽（秒），lognormal为形状参数
+    tokens_per_second: float = 50.0  # 输出速度，0表示首token后立即返回全部内容
+    completion_tokens: int = 300  # 每次输出的token数（不超过请求的max_tokens）
+    rate_429: float = 0.0  # 返回429的概率
+    rate_5xx: float = 0.0  # 返回500/502/503的概率
+    rate_timeout: float = 0.0  # 挂起hang_seconds后返回504的概率
+    hang_seconds: float = 600.0
+    max_concurrency: int = 0  # 同时处理的请求上限，0为不限
+    queue: bool = False  # 超过并发上限时排队等待，否则立即返回429
+    seed: int = 0
+
+    def update(self, values: Dict[str, Any]):
+        known = {field.name for field in fields(self)}
+        for name, value in values.items():
+            if name not in known:
+                raise ValueError(f"未知配置项: {name}")
+            setattr(self, name, value)
+        if self.latency_dist not in DISTRIBUTIONS:
+            raise ValueError(f"不支持的延迟分布: {self.latency_dist}")
+
+
+def _error(status: int, message: str, error_type: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    """OpenAI格式的错误响应"""
+    return JSONResponse(
+        status_code=status,
+        content={"error": {"message": message, "type": error_type, "param": None, "code": str(status)}},
+        headers=headers
+    )
+
+
+class MockLLMServer:
+    """模拟模型服务，app属性为可直接交给uvicorn运行的FastAPI应用"""
+
+    def __init__(self, config: Optional[MockConfig] = None):
+        self.config = config or MockConfig()
+        self._configure()
+        self.reset_stats()
+        self.app = self._build_app()
+
+    def _configure(self):
+        self.latency = LatencyModel(self.config.latency, self.config.latency_dist, self.config.jitter, self.config.seed)
+        self._rng = random.Random(self.config.seed)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_size = 0
+
+    def reset_stats(self):
+        self.stats: Dict[str, Any] = {
+            "requests": 0,
+            "completed": 0,
+            "streamed": 0,
+            "in_flight": 0,
+            "peak_in_flight": 0,
+            "rejected": 0,
+            "faults": {"429": 0, "5xx": 0, "timeout": 0},
+            "prompt_tokens": 0,
+            "completion_tokens": 0
+        }
+
+    # ---- 并发与故障注入 ----
+
+    async def _admit(self) -> Tuple[bool, Optional[asyncio.Semaphore]]:
+        """占用一个并发名额，返回 (是否接纳, 占用的排队信号量)；超出上限且不排队时不接纳"""
+        limit = self.config.max_concurrency
+        semaphore = None
+        if limit > 0:
+            if self.config.queue:
+                if self._semaphore is None or self._semaphore_size != limit:
+                    self._semaphore = asyncio.Semaphore(limit)
+                    self._semaphore_size = limit
+                semaphore = self._semaphore
+                await semaphore.acquire()
+            elif self.stats["in_flight"] >= limit:
+                self.stats["rejected"] += 1
+                return False, None
+        self.stats["in_flight"] += 1
+        self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+        return True, semaphore
+
+    def _release(self, semaphore: Optional[asyncio.Semaphore]):
+        # 释放占用时的信号量（运行中修改配置后新请求使用新的信号量）
+        self.stats["in_flight"] -= 1
+        if semaphore is not None:
+            semaphore.release()
+
+    def _draw_fault(self) -> Optional[str]:
+        draw = self._rng.random()
+        for fault, rate in (("429", self.config.rate_429), ("5xx", self.config.rate_5xx), ("timeout", self.config.rate_timeout)):
+            if draw < rate:
+                return fault
+            draw -= rate
+        return None
+
+    async def _fault_response(self, fault: str) -> JSONResponse:
+        self.stats["faults"][fault] += 1
+        if fault == "429":
+            return _error(429, "Requests rate limit exceeded (injected)", "rate_limit_error", {"Retry-After": "1"})
+        if fault == "5xx":
+            status = self._rng.choice((500, 502, 503))
+            return _error(status, f"Upstream error {status} (injected)", "server_error")
+        await asyncio.sleep(self.config.hang_seconds)
+        return _error(504, "Upstream timeout (injected)", "timeout")
+
+    # ---- 响应内容 ----
+
+    @staticmethod
+    def _tokens(count: int) -> List[str]:
+        """按estimate_tokens的口径，每个汉字计1个token"""
+        return [_FILLER[i % len(_FILLER)] for i in range(count)]
+
+    def _completion_tokens(self, body: Dict[str, Any]) -> int:
+        count = self.config.completion_tokens
+        max_tokens = body.get("max_tokens")
+        if isinstance(max_tokens, int) and max_tokens > 0:
+            count = min(count, max_tokens)
+        return max(1, count)
+
+    @staticmethod
+    def _usage(prompt_tokens: int, completion_tokens: int) -> Dict[str, int]:
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+    def _record_tokens(self, prompt_tokens: int, completion_tokens: int):
+        self.stats["completed"] += 1
+        self.stats["prompt_tokens"] += prompt_tokens
+        self.stats["completion_tokens"] += completion_tokens
+
+    async def _complete(self, body: Dict[str, Any], completion_id: str, prompt_tokens: int) -> JSONResponse:
+        tokens = self._tokens(self._completion_tokens(body))
+        delay = self.latency.sample()
+        if self.config.tokens_per_second > 0:
+            delay += len(tokens) / self.config.tokens_per_second
+        await asyncio.sleep(delay)
+        self._record_tokens(prompt_tokens, len(tokens))
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", ""),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop"
+            }],
+            "usage": self._usage(prompt_tokens, len(tokens))
+        })
+
+    async def _stream(
+        self, body: Dict[str, Any], completion_id: str, prompt_tokens: int, semaphore: Optional[asyncio.Semaphore]
+    ) -> AsyncIterator[str]:
+        """SSE流式输出；stream_options.include_usage为真时最后附带usage块"""
+        try:
+            created = int(time.time())
+            model = body.get("model", "")
+
+            def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+                data = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+                }
+                return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+            tokens = self._tokens(self._completion_tokens(body))
+            await asyncio.sleep(self.latency.sample())
+            yield chunk({"role": "assistant", "content": ""})
+
+            tps = self.config.tokens_per_second
+            batch = max(1, int(tps * _STREAM_TICK)) if tps > 0 else len(tokens)
+            for start in range(0, len(tokens), batch):
+                piece = tokens[start:start + batch]
+                if tps > 0:
+                    await asyncio.sleep(len(piece) / tps)
+                yield chunk({"content": "".join(piece)})
+
+            yield chunk({}, "stop")
+            self._record_tokens(prompt_tokens, len(tokens))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [],
+                    "usage": self._usage(prompt_tokens, len(tokens))
+                }
+                yield f"data: {json.dumps(usage)}\n\n"
+            yield "data: [DONE]\n\n"
+        finally:
+            self._release(semaphore)
+
+    # ---- 路由 ----
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI(title="Mock LLM", docs_url=None, redoc_url=None)
+
+        @app.post("/v1/chat/completions")
+        async def chat_completions(request: Request):
+            try:
+                body = await request.json()
+            except json.JSONDecodeError:
+                return _error(400, "Invalid JSON body", "invalid_request_error")
+            messages = body.get("messages")
+            if not isinstance(messages, list) or not messages:
+                return _error(400, "messages is required", "invalid_request_error")
+
+            self.stats["requests"] += 1
+            admitted, semaphore = await self._admit()
+            if not admitted:
+                return _error(429, "Concurrency limit exceeded", "rate_limit_error", {"Retry-After": "1"})
+
+            streaming = False
+            try:
+                fault = self._draw_fault()
+                if fault is not None:
+                    return await self._fault_response(fault)
+
+                completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:24]}"
+                prompt_tokens = sum(estimate_tokens(str(message.get("content") or "")) for message in messages)
+                if body.get("stream"):
+                    self.stats["streamed"] += 1
+                    streaming = True
+                    return StreamingResponse(
+                        self._stream(body, completion_id, prompt_tokens, semaphore),
+                        media_type="text/event-stream"
+                    )
+                return await self._complete(body, completion_id, prompt_tokens)
+            finally:
+                # 流式响应由生成器结束时释放名额
+                if not streaming:
+                    self._release(semaphore)
+
+        @app.get("/v1/models")
+        async def list_models():
+            return {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]}
+
+        @app.get("/mock/stats")
+        async def get_stats():
+            return {"config": asdict(self.config), "stats": self.stats}
+
+        @app.post("/mock/config")
+        async def update_config(request: Request):
+            try:
+                self.config.update(await request.json())
+            except (ValueError, json.JSONDecodeError) as e:
+                return _error(400, str(e), "invalid_request_error")
+            self._configure()
+            return {"config": asdict(self.config)}
+
+        @app.post("/mock/reset")
+        async def reset():
+            self.reset_stats()
+            return {"stats": self.stats}
+
+        return app
+
+
+def main(argv: Optional[List[str]] = None):
+    defaults = MockConfig()
+    parser = argparse.ArgumentParser(description="本地OpenAI兼容模拟模型服务")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="首token延迟均值/中位数（秒）")
+    parser.add_argument("--latency-dist", choices=DISTRIBUTIONS, default=defaults.latency_dist)
+    parser.add_argument("--jitter", type=float, default=defaults.jitter)
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--completion-tokens", type=int, default=defaults.completion_tokens)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--rate-timeout", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=defaults.hang_seconds)
+    parser.add_argument("--max-concurrency", type=int, default=0)
+    parser.add_argument("--queue", action="store_true", help="超过并发上限时排队而不是返回429")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    config = MockConfig(
+        latency=args.latency, latency_dist=args.latency_dist, jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second, completion_tokens=args.completion_tokens,
+        rate_429=args.rate_429, rate_5xx=args.rate_5xx, rate_timeout=args.rate_timeout,
+        hang_seconds=args.hang_seconds, max_concurrency=args.max_concurrency, queue=args.queue, seed=args.seed
+    )
+    print(f"🤖 模拟模型服务: http://{args.host}:{args.port}/v1")
+    uvicorn.run(MockLLMServer(config).app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+进程资源采样
+读取 /proc/self 获取当前进程RSS（与 /debug/resources 共用 app.utils.resources），不依赖psutil；非Linux平台退化为 getrusage 的峰值RSS
+"""
+
+import os
+import threading
+import time
+from typing import List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from app.utils import resources as app_resources
+
+
+def rss_bytes() -> int:
+    """当前进程常驻内存（字节）"""
+    current = app_resources.rss_bytes()
+    if current is not None:
+        return current
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux单位为KB，macOS为字节
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+    return 0
+
+
+class RSSSampler:
+    """后台线程按固定间隔采样RSS，用于求任意时间区间内的峰值"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[Tuple[float, int]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "RSSSampler":
+        self._stop.clear()
+        self.samples.append((time.time(), rss_bytes()))
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.samples.append((time.time(), rss_bytes()))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.samples.append((time.time(), rss_bytes()))
+
+    def peak(self, start: float = 0.0, end: float = float("inf")) -> int:
+        """[start, end] 区间内的峰值RSS；区间内没有样本时取区间前最后一个样本"""
+        peak = 0
+        before = 0
+        for ts, rss in self.samples:
+            if ts < start:
+                before = rss
+            elif ts <= end:
+                peak = max(peak, rss)
+            else:
+                break
+        return peak or before
+
+    def __enter__(self) -> "RSSSampler":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+长时间稳态压测（泄漏检测）
+以固定负载持续请求服务（默认启动本地模拟模型服务），按间隔从 /debug/resources 采样RSS、文件描述符、线程、asyncio任务、
+loguru处理器与按类型统计的对象数。预热后的采样分成若干时间窗口，某项指标的窗口中位数逐个上升且总增长超过阈值时判定为持续增长，
+以状态码1退出，并列出数量持续增长的对象类型（含每生成一份报告的增量），用于定位累积的对象
+
+    python -m perf.soak --spawn --duration 4h --interval 30 --rate 1 --mock-args "--latency 0.2 --rate-429 0.02"
+    python -m perf.soak --spawn --duration 20m --concurrency 4 --interval 10
+    python -m perf.soak --url http://127.0.0.1:8000 --duration 2h --mix generate=1,list=2,get=2,download=1
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import secrets
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from perf import corpus, loadgen
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+MB = 1024 * 1024
+
+# 指标 -> (最小绝对增长, 最小相对增长)；两者都满足且窗口中位数逐个上升时判定为持续增长
+METRIC_THRESHOLDS: Dict[str, Tuple[float, float]] = {
+    "rss_bytes": (32 * MB, 0.1),
+    "open_fds": (5, 0.0),
+    "threads": (4, 0.0),
+    "asyncio_tasks": (10, 0.0),
+    "loguru_handlers": (1, 0.0),
+    "gc_objects": (20000, 0.05),
+    "gc_garbage": (1, 0.0)
+}
+DEFAULT_MIN_OBJECT_GROWTH = 500
+DEFAULT_OBJECT_REL_GROWTH = 0.1
+# 怀疑的泄漏来源：无论是否超出阈值都输出其数量变化
+WATCH_PREFIXES = ("fitz.", "pymupdf.", "openai.", "httpx.", "httpcore.", "loguru.", "concurrent.futures.", "tempfile.")
+
+
+def parse_duration(text: str) -> float:
+    """解析 90、90s、30m、4h 形式的时长（秒）"""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([smh]?)\s*", text.lower())
+    if not match:
+        raise ValueError(f"无法解析时长: {text}")
+    return float(match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600}[match.group(2)]
+
+
+def _median(values: List[float]) -> float:
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def _slope(xs: List[float], ys: List[float]) -> Optional[float]:
+    """最小二乘斜率；x没有变化时返回None"""
+    count = len(xs)
+    mean_x, mean_y = sum(xs) / count, sum(ys) / count
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if var_x == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+
+
+def growth(
+    times: List[float],
+    reports: List[float],
+    values: List[float],
+    min_abs: float,
+    min_rel: float = 0.0,
+    windows: int = 4
+) -> Optional[Dict[str, Any]]:
+    """一条采样序列的增长情况；采样数不足以分成windows个窗口（每个至少2个样本）时返回None"""
+    if len(values) < windows * 2:
+        return None
+    size = len(values) / windows
+    medians = [_median(values[round(i * size):round((i + 1) * size)]) for i in range(windows)]
+    first, last = medians[0], medians[-1]
+    delta = last - first
+    slope = _slope(times, values)
+    per_report = _slope(reports, values)
+    sustained = (
+        all(later > earlier for earlier, later in zip(medians, medians[1:]))
+        and delta >= min_abs
+        and delta >= min_rel * abs(first)
+    )
+    return {
+        "first": first,
+        "last": last,
+        "growth": delta,
+        "window_medians": medians,
+        "per_hour": round(slope * 3600, 3) if slope is not None else None,
+        "per_report": round(per_report, 4) if per_report is not None else None,
+        "sustained": sustained
+    }
+
+
+def analyze(
+    samples: List[Dict[str, Any]],
+    warmup: float,
+    windows: int = 4,
+    min_object_growth: float = DEFAULT_MIN_OBJECT_GROWTH,
+    object_rel_growth: float = DEFAULT_OBJECT_REL_GROWTH
+) -> Dict[str, Any]:
+    """对预热后的采样判定各项指标与各对象类型是否持续增长"""
+    steady = [sample for sample in samples if sample["elapsed"] >= warmup]
+    times = [sample["elapsed"] for sample in steady]
+    reports = [sample["reports_generated"] for sample in steady]
+
+    metrics = {}
+    for name, (min_abs, min_rel) in METRIC_THRESHOLDS.items():
+        values = [sample[name] for sample in steady if sample.get(name) is not None]
+        if len(values) == len(steady):
+            metrics[name] = growth(times, reports, values, min_abs, min_rel, windows)
+
+    type_names = set()
+    for sample in steady:
+        type_names.update(sample["object_types"])
+    growing = []
+    watched = {}
+    for type_name in type_names:
+        values = [sample["object_types"].get(type_name, 0) for sample in steady]
+        result = growth(times, reports, values, min_object_growth, object_rel_growth, windows)
+        if result is None:
+            continue
+        if result["sustained"]:
+            growing.append({"type": type_name, **result})
+        if type_name.startswith(WATCH_PREFIXES):
+            watched[type_name] = result
+    growing.sort(key=lambda item: item["growth"], reverse=True)
+
+    leaking_metrics = [name for name, result in metrics.items() if result and result["sustained"]]
+    return {
+        "warmup": warmup,
+        "steady_samples": len(steady),
+        "insufficient_samples": len(steady) < windows * 2,
+        "metrics": metrics,
+        "growing_types": growing,
+        "watched_types": dict(sorted(watched.items())),
+        "leaking_metrics": leaking_metrics,
+        "failed": bool(leaking_metrics or growing)
+    }
+
+
+async def fetch_resources(client: httpx.AsyncClient, token: str) -> Dict[str, Any]:
+    response = await client.get("/debug/resources", params={"top": 0, "collect": "true"}, headers={"X-Profile": token})
+    response.raise_for_status()
+    return response.json()["data"]
+
+
+def _reports_generated(generator: loadgen.LoadGenerator) -> int:
+    return sum(1 for item in generator.samples if item["operation"] == "generate" and item["error"] is None)
+
+
+async def _prune_reports(client: httpx.AsyncClient, generator: loadgen.LoadGenerator, existing: set, keep: int):
+    """删除本次压测生成的最早的报告，使服务端的数据量保持稳定（不删除压测开始前已有的报告）"""
+    mine = [report_id for report_id in generator.report_ids if report_id not in existing]
+    for report_id in mine[:max(0, len(mine) - keep)]:
+        # 先移出候选列表，之后的查询与下载不再选中它
+        generator.report_ids.remove(report_id)
+        try:
+            await client.delete(f"{loadgen.API_PREFIX}/reports/{report_id}")
+        except httpx.HTTPError:
+            pass
+
+
+async def run_soak(
+    base_url: str,
+    pdf_path: str,
+    mix: Dict[str, float],
+    duration: float,
+    token: str,
+    interval: float = 30.0,
+    rate: Optional[float] = None,
+    concurrency: int = 2,
+    warmup: Optional[float] = None,
+    windows: int = 4,
+    keep_reports: int = 50,
+    settle: float = 5.0,
+    min_object_growth: float = DEFAULT_MIN_OBJECT_GROWTH,
+    timeout: float = 600.0,
+    seed: int = 0,
+    transport: Optional[httpx.AsyncBaseTransport] = None
+) -> Dict[str, Any]:
+    """在固定负载下运行duration秒并按interval采样，返回采样序列与增长分析；token为服务端的剖析口令，warmup默认为时长的20%"""
+    warmup = duration * 0.2 if warmup is None else warmup
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=64)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits, transport=transport) as load_client, \
+            httpx.AsyncClient(base_url=base_url, timeout=timeout, transport=transport) as probe_client:
+        generator = loadgen.LoadGenerator(load_client, pdf_path, mix, seed=seed)
+        await generator.load_existing_reports()
+        existing = set(generator.report_ids)
+        samples: List[Dict[str, Any]] = []
+        started = time.time()
+
+        async def sample():
+            await _prune_reports(probe_client, generator, existing, keep_reports)
+            data = await fetch_resources(probe_client, token)
+            data["elapsed"] = round(time.time() - started, 3)
+            data["requests"] = len(generator.samples)
+            data["reports_generated"] = _reports_generated(generator)
+            samples.append(data)
+
+        if rate:
+            load = asyncio.ensure_future(generator.run_open(rate, duration))
+        else:
+            load = asyncio.ensure_future(generator.run_closed(concurrency, duration))
+        try:
+            await sample()
+            while not load.done():
+                await asyncio.wait([load], timeout=interval)
+                await sample()
+            await load
+        finally:
+            if not load.done():
+                load.cancel()
+        # 负载结束并空闲一段时间后再采样一次：仍高于负载期间水平的部分不是在途请求占用的
+        await asyncio.sleep(settle)
+        idle = await fetch_resources(probe_client, token)
+
+    analysis = analyze(samples, warmup, windows, min_object_growth)
+    reported_types = {item["type"] for item in analysis["growing_types"]} | set(analysis["watched_types"])
+    return {
+        "meta": {
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "base_url": base_url,
+            "mode": "open" if rate else "closed",
+            "rate": rate,
+            "concurrency": None if rate else concurrency,
+            "duration": round(time.time() - started, 3),
+            "interval": interval,
+            "windows": windows,
+            "keep_reports": keep_reports,
+            "mix": mix,
+            "pdf": os.path.basename(pdf_path),
+            "seed": seed
+        },
+        "load": loadgen.build_summary(generator.samples),
+        "analysis": analysis,
+        # 采样序列只保留标量指标与需要关注的对象类型，避免数小时的全量类型统计使结果文件过大
+        "samples": [
+            {
+                **{key: value for key, value in item.items() if key != "object_types"},
+                "object_types": {name: item["object_types"].get(name, 0) for name in sorted(reported_types)}
+            }
+            for item in samples
+        ],
+        "idle": {key: value for key, value in idle.items() if key != "object_types"},
+        "idle_object_types": {name: idle["object_types"].get(name, 0) for name in sorted(reported_types)}
+    }
+
+
+def _format_value(name: str, value: Optional[float], unit: float = MB, suffix: str = "MB") -> str:
+    if value is None:
+        return "-"
+    if name == "rss_bytes":
+        return f"{value / unit:.1f}{suffix}"
+    return f"{value:.4g}"
+
+
+def print_report(result: Dict[str, Any], limit: int = 20):
+    meta, analysis = result["meta"], result["analysis"]
+    load = f"rate={meta['rate']}/s" if meta["mode"] == "open" else f"concurrency={meta['concurrency']}"
+    overall = result["load"]["overall"]
+    print(
+        f"🎯 {meta['base_url']}  {load}  duration={meta['duration']}s  requests={overall.get('requests', 0)}  "
+        f"errors={overall.get('errors', {})}  samples={len(result['samples'])}（预热后 {analysis['steady_samples']}）"
+    )
+    if analysis["insufficient_samples"]:
+        print(f"⚠️  预热后的采样不足 {meta['windows'] * 2} 个，无法判定增长；请延长时长或缩短采样间隔")
+
+    header = f"{'metric':<18}{'start':>12}{'end':>12}{'idle':>12}{'per hour':>12}{'per report':>12}  status"
+    print(header)
+    print("-" * len(header))
+    for name, data in analysis["metrics"].items():
+        if data is None:
+            continue
+        print(
+            f"{name:<18}{_format_value(name, data['first']):>12}{_format_value(name, data['last']):>12}"
+            f"{_format_value(name, result['idle'].get(name)):>12}{_format_value(name, data['per_hour']):>12}"
+            f"{_format_value(name, data['per_report'], 1024, 'KB'):>12}  {'❌ 持续增长' if data['sustained'] else 'ok'}"
+        )
+
+    def print_types(title: str, items: List[Tuple[str, Dict[str, Any]]]):
+        if not items:
+            return
+        print(f"\n{title}")
+        print(f"{'type':<48}{'start':>10}{'end':>10}{'idle':>10}{'per hour':>12}{'per report':>12}")
+        for type_name, data in items[:limit]:
+            print(
+                f"{type_name:<48}{data['first']:>10g}{data['last']:>10g}{result['idle_object_types'].get(type_name, 0):>10}"
+                f"{_format_value(type_name, data['per_hour']):>12}{_format_value(type_name, data['per_report']):>12}"
+            )
+
+    print_types("❌ 数量持续增长的对象类型:", [(item["type"], item) for item in analysis["growing_types"]])
+    watched = sorted(analysis["watched_types"].items(), key=lambda item: item[1]["growth"], reverse=True)
+    print_types("关注的对象类型（PyMuPDF、OpenAI/httpx客户端、loguru等，按增长排序）:", watched)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="长时间稳态压测与泄漏检测")
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:8000", help="被测服务地址")
+    parser.add_argument("--spawn", action="store_true", help="自行启动模拟模型服务与本服务（忽略--url）")
+    parser.add_argument("--mock-args", type=str, default="--latency 0.2", help="--spawn时传给模拟模型服务的参数")
+    parser.add_argument("--mix", type=str, default=loadgen.DEFAULT_MIX, help="操作比例")
+    parser.add_argument("--rate", type=float, default=None, help="开环到达速率（请求/秒）；不指定时为闭环")
+    parser.add_argument("--concurrency", type=int, default=2, help="闭环并发用户数")
+    parser.add_argument("--duration", type=str, default="1h", help="压测时长，如 90s、30m、4h")
+    parser.add_argument("--interval", type=float, default=30.0, help="采样间隔（秒）")
+    parser.add_argument("--warmup", type=str, default=None, help="不参与判定的预热时长，默认为压测时长的20%%")
+    parser.add_argument("--windows", type=int, default=4, help="判定持续增长的窗口数")
+    parser.add_argument("--min-object-growth", type=float, default=DEFAULT_MIN_OBJECT_GROWTH,
+                        help="对象类型判定为持续增长的最小数量增长")
+    parser.add_argument("--keep-reports", type=int, default=50,
+                        help="保留本次生成的最近N份报告，更早的在采样时删除，使服务端数据量保持稳定")
+    parser.add_argument("--settle", type=float, default=5.0, help="负载结束后空闲该时长（秒）再采样一次")
+    parser.add_argument("--timeout", type=float, default=600.0, help="单个请求超时（秒）")
+    parser.add_argument("--pages", type=int, default=10, help="上传的合成PDF页数")
+    parser.add_argument("--layout", choices=corpus.LAYOUTS, default="mixed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--token", type=str, default=os.environ.get("PROFILING_TOKEN", ""),
+                        help="服务端的剖析口令（PROFILING_TOKEN），/debug/resources 需要；--spawn时未指定则随机生成")
+    parser.add_argument("--out", type=str, default=None, help="结果JSON路径，默认写入 perf/results/")
+    args = parser.parse_args(argv)
+    if args.spawn and not args.token:
+        args.token = secrets.token_hex(16)
+    if not args.token:
+        parser.error("需要 --token 或环境变量 PROFILING_TOKEN（与被测服务的 PROFILING_TOKEN 一致）")
+
+    mix = loadgen.parse_mix(args.mix)
+    duration = parse_duration(args.duration)
+    warmup = parse_duration(args.warmup) if args.warmup else None
+    pdf_path = corpus.corpus_path(args.pages, args.layout, args.seed)
+
+    def run(base_url: str) -> Dict[str, Any]:
+        return asyncio.run(run_soak(
+            base_url, pdf_path, mix, duration, args.token, interval=args.interval, rate=args.rate, concurrency=args.concurrency,
+            warmup=warmup, windows=args.windows, keep_reports=args.keep_reports, settle=args.settle,
+            min_object_growth=args.min_object_growth, timeout=args.timeout, seed=args.seed
+        ))
+
+    if args.spawn:
+        # 启动的服务继承当前环境变量
+        os.environ["PROFILING_TOKEN"] = args.token
+        with loadgen.spawn_stack(args.mock_args) as (app_url, _):
+            result = run(app_url)
+    else:
+        result = run(args.url)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"soak-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print_report(result)
+    print(f"\n📄 结果已保存: {out}")
+    return 1 if result["analysis"]["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+模型桩
+替换 ReportService 中各端点的 OpenAI 客户端，按配置的延迟分布返回固定格式的分析结果，不发起网络请求
+"""
+
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+
+class LatencyModel:
+    """可复现的延迟分布（秒）
+
+    - fixed：恒为mean
+    - uniform：在 mean±jitter 之间均匀分布
+    - lognormal：中位数为mean、形状参数为jitter的对数正态分布（长尾）
+    """
+
+    def __init__(self, mean: float = 0.05, distribution: str = "fixed", jitter: float = 0.0, seed: int = 0):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"不支持的延迟分布: {distribution}")
+        self.mean = mean
+        self.distribution = distribution
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        if self.distribution == "fixed" or self.mean <= 0:
+            return max(0.0, self.mean)
+        with self._lock:
+            if self.distribution == "uniform":
+                value = self._rng.uniform(self.mean - self.jitter, self.mean + self.jitter)
+            else:
+                value = self._rng.lognormvariate(0.0, self.jitter) * self.mean
+        return max(0.0, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"mean": self.mean, "distribution": self.distribution, "jitter": self.jitter}
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文约每字1个token，其他字符约每4个1个token"""
+    cjk = sum(1 for char in text if "一" <= char <= "鿿")
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def make_response(content: str, prompt_tokens: int, completion_tokens: int, model: str = "") -> SimpleNamespace:
+    """构造与 openai ChatCompletion 字段一致的响应对象"""
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(index=0, finish_reason="stop", message=SimpleNamespace(role="assistant", content=content))],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens
+        )
+    )
+
+
+class _Completions:
+    def __init__(self, owner: "StubLLMClient"):
+        self._owner = owner
+
+    def create(self, model: str = "", messages: Optional[List[Dict[str, str]]] = None, **kwargs):
+        return self._owner.complete(model, messages or [], **kwargs)
+
+
+class StubLLMClient:
+    """同步模型桩，接口与 OpenAI 客户端的 chat.completions.create 一致"""
+
+    def __init__(self, latency: Optional[LatencyModel] = None, response_chars: int = 400):
+        self.latency = latency or LatencyModel()
+        self.response_chars = response_chars
+        self.chat = SimpleNamespace(completions=_Completions(self))
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def complete(self, model: str, messages: List[Dict[str, str]], **kwargs):
+        with self._lock:
+            self.calls += 1
+            number = self.calls
+        time.sleep(self.latency.sample())
+        prompt = "".join(message.get("content", "") for message in messages)
+        body = "桩分析结果：该片段讨论了相关主题。" * (self.response_chars // 16 + 1)
+        content = f"## 片段分析 {number}\n\n{body[:self.response_chars]}"
+        return make_response(content, estimate_tokens(prompt), estimate_tokens(content), model)
+
+
+def install(report_service, client: StubLLMClient) -> StubLLMClient:
+    """把 report_service 所有端点的客户端替换为模型桩"""
+    for endpoint in report_service.endpoint_pool.endpoints:
+        endpoint.client = client
+    report_service.client = client
+    return client
@@ -2,6 +2,7 @@
 Pytest配置文件
 """
 
+import fitz
 import pytest
 import tempfile
 import os
@@ -21,17 +22,24 @@ def temp_test_dir():
         yield temp_dir
 
 @pytest.fixture(autouse=True)
-def setup_test_environment(temp_test_dir):
+def setup_test_environment(temp_test_dir, tmp_path):
     """设置测试环境"""
     # 保存原始配置
     original_reports_dir = settings.reports_dir
     original_upload_dir = settings.upload_dir
     original_log_file = settings.log_file
+    original_checkpoint_dir = settings.checkpoint_dir
+    original_documents_dir = settings.documents_dir
+    original_offload_cpu_mode = settings.offload_cpu_mode
     
-    # 设置测试目录
-    settings.reports_dir = os.path.join(temp_test_dir, "reports")
-    settings.upload_dir = os.path.join(temp_test_dir, "uploads")
+    # 设置测试目录（报告、检查点与上传存储按测试隔离，避免测试之间互相命中）
+    settings.reports_dir = str(tmp_path / "reports")
+    settings.upload_dir = str(tmp_path / "uploads")
     settings.log_file = os.path.join(temp_test_dir, "logs", "test.log")
+    settings.checkpoint_dir = str(tmp_path / "checkpoints")
+    settings.documents_dir = str(tmp_path / "documents")
+    # 测试中常用Mock替换解析函数，Mock无法传入子进程，CPU任务改用线程池
+    settings.offload_cpu_mode = "thread"
     
     # 创建必要的目录
     os.makedirs(settings.reports_dir, exist_ok=True)
@@ -44,12 +52,28 @@ def setup_test_environment(temp_test_dir):
     settings.reports_dir = original_reports_dir
     settings.upload_dir = original_upload_dir
     settings.log_file = original_log_file
+    settings.checkpoint_dir = original_checkpoint_dir
+    settings.documents_dir = original_documents_dir
+    settings.offload_cpu_mode = original_offload_cpu_mode
 
 @pytest.fixture
 def sample_pdf_content():
     """示例PDF内容"""
     return b"%PDF-1.4\n1 0 obj\n<<\n/Type /Catalog\n/Pages 2 0 R\n>>\nendobj\n2 0 obj\n<<\n/Type /Pages\n/Kids [3 0 R]\n/Count 1\n>>\nendobj\n3 0 obj\n<<\n/Type /Page\n/Parent 2 0 R\n/MediaBox [0 0 612 792]\n/Contents 4 0 R\n>>\nendobj\n4 0 obj\n<<\n/Length 44\n>>\nstream\nBT\n/F1 12 Tf\n72 720 Td\n(Hello World) Tj\nET\nendstream\nendobj\nxref\n0 5\n0000000000 65535 f \n0000000009 00000 n \n0000000058 00000 n \n0000000115 00000 n \n0000000204 00000 n \ntrailer\n<<\n/Size 5\n/Root 1 0 R\n>>\nstartxref\n297\n%%EOF"
 
+@pytest.fixture
+def make_pdf():
+    """生成多页测试PDF的函数：make_pdf(path, pages=3) -> path"""
+    def make(path: str, pages: int = 3) -> str:
+        doc = fitz.open()
+        for i in range(pages):
+            page = doc.new_page()
+            page.insert_text((72, 72), f"Page {i + 1}: artificial intelligence research notes. " * 3)
+        doc.save(path)
+        doc.close()
+        return path
+    return make
+
 @pytest.fixture
 def sample_text_content():
     """示例文本内容"""
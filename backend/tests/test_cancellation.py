@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+客户端断开取消测试
+"""
+
+import asyncio
+import os
+import time
+import pytest
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.cancellation import CancellationToken, ReportCancelledError, watch_disconnect
+from app.services.report_service import ReportService
+from app.core.config import settings
+
+
+class FakeRequest:
+    """模拟在若干次轮询后断开的客户端"""
+
+    def __init__(self, disconnect_after: int):
+        self.polls = 0
+        self.disconnect_after = disconnect_after
+
+    async def is_disconnected(self) -> bool:
+        self.polls += 1
+        return self.polls > self.disconnect_after
+
+
+class TestCancellationToken:
+    """取消令牌测试类"""
+
+    def test_cancel_runs_callbacks_once(self):
+        token = CancellationToken()
+        calls = []
+        token.add_callback(lambda: calls.append(1))
+        token.cancel("client_disconnected")
+        token.cancel("again")
+        assert calls == [1]
+        assert token.reason == "client_disconnected"
+        with pytest.raises(ReportCancelledError):
+            token.raise_if_cancelled()
+
+    def test_callback_after_cancel_runs_immediately(self):
+        token = CancellationToken()
+        token.cancel()
+        calls = []
+        token.add_callback(lambda: calls.append(1))
+        assert calls == [1]
+
+    @pytest.mark.asyncio
+    async def test_watch_disconnect(self):
+        token = CancellationToken()
+        request = FakeRequest(disconnect_after=2)
+        await asyncio.wait_for(watch_disconnect(request, token, interval=0.01), timeout=1)
+        assert token.cancelled
+        assert request.polls == 3
+
+
+class TestReportCancellation:
+    """报告生成取消测试类"""
+
+    def setup_method(self):
+        self.original_concurrency = settings.llm_max_concurrency
+        settings.llm_max_concurrency = 2
+        self.report_service = ReportService()
+        self.report_service.pdf_service.process_pdf = Mock(return_value=[f"片段{i}" for i in range(8)])
+
+        def slow_create(**kwargs):
+            time.sleep(0.1)
+            response = Mock()
+            response.choices = [Mock()]
+            response.choices[0].message.content = "## 片段分析"
+            return response
+
+        self.create = Mock(side_effect=slow_create)
+        self.report_service.client.chat.completions.create = self.create
+
+    def teardown_method(self):
+        settings.llm_max_concurrency = self.original_concurrency
+
+    @pytest.mark.asyncio
+    async def test_cancel_aborts_and_skips_remaining_chunks(self):
+        """测试取消后中止在途调用、跳过剩余片段且不保存报告"""
+        token = CancellationToken()
+        asyncio.get_running_loop().call_later(0.15, token.cancel, "client_disconnected")
+        reports_before = set(os.listdir(settings.reports_dir))
+
+        with pytest.raises(ReportCancelledError):
+            await self.report_service.generate_report("unused.pdf", "测试问题", cancel_token=token)
+
+        stats = self.report_service.cancellation_stats
+        assert stats["cancelled_reports"] == 1
+        assert stats["aborted_calls"] == 2
+        assert stats["skipped_chunks"] == 4
+        assert stats["discarded_chunks"] == 2
+        assert self.create.call_count == 4
+        assert set(os.listdir(settings.reports_dir)) == reports_before
+
+    @pytest.mark.asyncio
+    async def test_abandoned_call_holds_endpoint_slot(self):
+        """测试被取消的调用在线程中的请求结束前一直占用端点额度，结束后计入放弃统计"""
+        endpoint = self.report_service.endpoint_pool.endpoints[0]
+        call = asyncio.ensure_future(self.report_service._dispatch_llm([{"role": "user", "content": "测试问题"}]))
+        await asyncio.sleep(0.03)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        assert endpoint.outstanding == 1
+
+        await asyncio.sleep(0.2)
+        assert endpoint.outstanding == 0
+        stats = self.report_service.cancellation_stats
+        assert stats["abandoned_calls"] == 1
+        assert stats["abandoned_llm_seconds"] >= 0.1
+        assert self.create.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_cancelled_before_llm_calls(self):
+        token = CancellationToken()
+        token.cancel("client_disconnected")
+        with pytest.raises(ReportCancelledError):
+            await self.report_service.generate_report("unused.pdf", "测试问题", cancel_token=token)
+        assert self.create.call_count == 0
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+检查点与断点续跑测试
+"""
+
+import asyncio
+import os
+import time
+import pytest
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.services.checkpoint_service import Checkpoint, CheckpointStore, CheckpointInUseError, compute_document_hash, compute_checkpoint_key
+from app.services.report_service import ReportService
+from app.core.config import settings
+
+
+class TestCheckpointStore:
+    """检查点存储测试类"""
+
+    def setup_method(self):
+        self.store = CheckpointStore()
+        self.chunks = ["片段一", "片段二", "片段三"]
+        self.checkpoint = self.store.open(compute_document_hash(self.chunks), "问题", "default", self.chunks, "report-1")
+
+    def teardown_method(self):
+        self.store.release(self.checkpoint)
+
+    def test_key_depends_on_question_and_prompt(self):
+        doc_hash = compute_document_hash(self.chunks)
+        assert compute_checkpoint_key(doc_hash, "问题", "v1") != compute_checkpoint_key(doc_hash, "问题", "v2")
+        assert compute_checkpoint_key(doc_hash, "问题", "v1") != compute_checkpoint_key(doc_hash, "另一个问题", "v1")
+
+    def test_record_and_reopen(self):
+        """测试结果持久化后重新打开可恢复，并沿用原报告ID"""
+        self.checkpoint.record(0, "结果一")
+        self.checkpoint.record(1, None)
+
+        # 同一检查点同时只能被一个任务使用
+        with pytest.raises(CheckpointInUseError):
+            self.store.open(compute_document_hash(self.chunks), "问题", "default", self.chunks, "report-2")
+        self.store.release(self.checkpoint)
+
+        reopened = self.store.open(compute_document_hash(self.chunks), "问题", "default", self.chunks, "report-2")
+        assert reopened.report_id == "report-1"
+        assert reopened.completed_results() == {0: "结果一"}
+        assert reopened.pending_indices(3, max_retries=2) == [1, 2]
+        assert reopened.load_chunks() == self.chunks
+
+    def test_retry_budget(self):
+        for _ in range(3):
+            self.checkpoint.record(1, None)
+        assert self.checkpoint.attempts(1) == 3
+        assert 1 not in self.checkpoint.pending_indices(3, max_retries=2)
+        assert 1 in self.checkpoint.pending_indices(3, max_retries=3)
+
+    def test_corrupt_tail_is_ignored(self):
+        self.checkpoint.record(0, "结果一")
+        with open(os.path.join(self.checkpoint.directory, "results.jsonl"), "a", encoding="utf-8") as f:
+            f.write('{"index": 1, "sta')
+        reopened = self.store.get_by_report("report-1")
+        assert reopened.completed_results() == {0: "结果一"}
+
+    def test_delete_by_report(self):
+        self.store.delete_by_report("report-1")
+        assert self.store.get_by_report("report-1") is None
+        assert not os.path.exists(self.checkpoint.directory)
+
+    def test_complete_and_sweep(self):
+        """测试完成标记与过期清理"""
+        other = self.store.open(compute_document_hash(["其他"]), "问题", "default", ["其他"], "report-2")
+        self.store.complete(self.checkpoint, keep_seconds=60)
+        now = self.checkpoint.manifest["completed_at"]
+        # 正在使用的检查点不清理
+        assert self.store.sweep(ttl=3600, completed_ttl=60, now=now + 3601) == []
+        self.store.release(self.checkpoint)
+        self.store.release(other)
+
+        # 已完成的在保留期内、未完成的未超过ttl时都不清理
+        assert self.store.sweep(ttl=3600, completed_ttl=60, now=now + 30) == []
+        assert self.store.sweep(ttl=3600, completed_ttl=60, now=now + 61) == [self.checkpoint.key]
+        assert self.store.get_by_report("report-1") is None
+        assert not os.path.exists(self.store._report_ref_path("report-1"))
+
+        assert self.store.sweep(ttl=0, now=now + 86400) == []
+        assert self.store.sweep(ttl=3600, now=now + 3601) == [other.key]
+        assert os.listdir(self.store.root) == ["by_report"]
+
+
+class TestResumableReport:
+    """可恢复报告生成测试类"""
+
+    def setup_method(self):
+        self.report_service = ReportService()
+        self.chunks = ["第一段内容", "第二段内容", "第三段内容", "第四段内容"]
+        self.report_service.pdf_service.process_pdf = Mock(return_value=self.chunks)
+        self.fail_chunks = {"第二段内容", "第四段内容"}
+
+        def create(**kwargs):
+            content = kwargs["messages"][0]["content"]
+            if any(chunk in content for chunk in self.fail_chunks):
+                raise RuntimeError("upstream 500")
+            response = Mock()
+            response.choices = [Mock()]
+            response.choices[0].message.content = "## 分析"
+            return response
+
+        self.create = Mock(side_effect=create)
+        self.report_service.client.chat.completions.create = self.create
+
+    @pytest.mark.asyncio
+    async def test_rerun_only_calls_failed_chunks(self):
+        """测试重新运行时只为失败的片段调用模型"""
+        first = await self.report_service.generate_report("unused.pdf", "测试问题")
+        assert first["report_metadata"].processed_chunks == 2
+        assert self.create.call_count == 4
+
+        self.fail_chunks = set()
+        self.create.reset_mock()
+        second = await self.report_service.generate_report("unused.pdf", "测试问题")
+
+        assert self.create.call_count == 2
+        assert second["report_id"] == first["report_id"]
+        assert second["report_metadata"].processed_chunks == 4
+        # 全部片段完成后检查点被删除，部分报告的检查点保留到此时
+        assert self.report_service.checkpoint_store.get_by_report(first["report_id"]) is None
+        assert os.listdir(settings.checkpoint_dir) == ["by_report"]
+
+    @pytest.mark.asyncio
+    async def test_resume_report(self):
+        """测试按报告ID恢复"""
+        first = await self.report_service.generate_report("unused.pdf", "测试问题")
+        self.fail_chunks = {"第四段内容"}
+        self.create.reset_mock()
+
+        resumed = await self.report_service.resume_report(first["report_id"])
+        assert self.create.call_count == 2
+        assert resumed["report_metadata"].processed_chunks == 3
+
+    @pytest.mark.asyncio
+    async def test_retry_budget_exhausted(self):
+        """测试失败片段超过重试预算后不再调用模型"""
+        original = settings.checkpoint_max_retries
+        settings.checkpoint_max_retries = 1
+        try:
+            first = await self.report_service.generate_report("unused.pdf", "测试问题")
+            await self.report_service.resume_report(first["report_id"])
+            self.create.reset_mock()
+            await self.report_service.resume_report(first["report_id"])
+            assert self.create.call_count == 0
+        finally:
+            settings.checkpoint_max_retries = original
+
+    @pytest.mark.asyncio
+    async def test_checkpoint_write_failure_keeps_report(self, monkeypatch):
+        """检查点写入失败（如磁盘已满）时报告照常生成"""
+        def record(checkpoint, index, content):
+            raise OSError(28, "No space left on device")
+
+        monkeypatch.setattr(Checkpoint, "record", record)
+        self.fail_chunks = set()
+        result = await self.report_service.generate_report("unused.pdf", "测试问题")
+        assert result["report_metadata"].processed_chunks == 4
+
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_reports(self):
+        """相同请求并发时各自完成：后开始的不使用检查点，使用新的报告ID"""
+        self.fail_chunks = set()
+        original = self.create.side_effect
+
+        def slow_create(**kwargs):
+            time.sleep(0.05)
+            return original(**kwargs)
+
+        self.create.side_effect = slow_create
+        first, second = await asyncio.gather(
+            self.report_service.generate_report("unused.pdf", "测试问题"),
+            self.report_service.generate_report("unused.pdf", "测试问题")
+        )
+        assert first["report_id"] != second["report_id"]
+        assert first["report_metadata"].processed_chunks == 4
+        assert second["report_metadata"].processed_chunks == 4
+        assert os.listdir(settings.checkpoint_dir) == ["by_report"]
+
+    @pytest.mark.asyncio
+    async def test_resume_unknown_report(self):
+        with pytest.raises(FileNotFoundError):
+            await self.report_service.resume_report("no-such-report")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+小片段打包测试
+"""
+
+import pytest
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.services.chunk_packing import ChunkPacker, ChunkBatch
+from app.services.prompt_service import PromptService
+from app.services.report_service import ReportService
+
+
+class TestChunkPacker:
+    """片段打包测试类"""
+
+    def setup_method(self):
+        self.packer = ChunkPacker(small_chunk_chars=10, budget_chars=20, max_chunks=3)
+
+    def test_pack_small_chunks(self):
+        """测试连续小片段合并，大片段单独成批"""
+        chunks = ["aaaa", "bbbb", "x" * 30, "cccc", "dddd", "eeee", "ffff"]
+        batches = self.packer.pack(chunks)
+        assert [batch.indices for batch in batches] == [[0, 1], [2], [3, 4, 5], [6]]
+
+    def test_pack_respects_budget(self):
+        chunks = ["a" * 9, "b" * 9, "c" * 9]
+        batches = self.packer.pack(chunks)
+        assert [batch.indices for batch in batches] == [[0, 1], [2]]
+
+    def test_format_sections(self):
+        text = ChunkPacker.format_sections(ChunkBatch([0, 1], ["第一段", "第二段"]))
+        assert "<<<片段 1>>>\n第一段\n<<<片段 1 结束>>>" in text
+        assert "<<<片段 2>>>" in text
+
+    def test_split_response(self):
+        response = "=== 片段 3 ===\n## 内容三\n\n=== 片段 4 ===\n## 内容四\n"
+        parts = ChunkPacker.split_response(response, [2, 3, 4])
+        assert parts[2] == "## 内容三"
+        assert parts[3] == "## 内容四"
+        assert parts[4] is None
+
+    def test_split_response_without_markers(self):
+        parts = ChunkPacker.split_response("# 整体分析", [0, 1])
+        assert parts == {0: "# 整体分析", 1: None}
+
+
+class TestPackedPrompt:
+    """打包Prompt测试类"""
+
+    def test_build_packed_chat_messages(self):
+        prompt_service = PromptService()
+        messages = prompt_service.build_packed_chat_messages("问题", "<<<片段 1>>>\n内容\n<<<片段 1 结束>>>", [0, 1], 5)
+        assert len(messages) == 2
+        assert "<<<片段 1>>>" in messages[0]["content"]
+        assert "=== 片段 2 ===" in messages[1]["content"]
+
+    @pytest.mark.asyncio
+    async def test_report_service_packs_small_chunks(self):
+        """测试报告服务把小片段打包成一次调用并拆回各片段"""
+        report_service = ReportService()
+        report_service.chunk_packer = ChunkPacker(small_chunk_chars=100, budget_chars=1000, max_chunks=8)
+
+        mock_response = Mock()
+        mock_response.choices = [Mock()]
+        mock_response.choices[0].message.content = "=== 片段 1 ===\n甲\n=== 片段 2 ===\n乙\n=== 片段 3 ===\n丙"
+        create = Mock(return_value=mock_response)
+        report_service.endpoint_pool.endpoints[0].client.chat.completions.create = create
+
+        results = await report_service._process_chunks(["一", "二", "三"], "问题")
+
+        assert create.call_count == 1
+        assert results == ["甲", "乙", "丙"]
+
+    @pytest.mark.asyncio
+    async def test_unmarked_packed_response_fails_other_chunks(self):
+        """打包调用的输出没有片段标记时，只有第一个片段算作完成，其余片段计为失败"""
+        report_service = ReportService()
+        report_service.chunk_packer = ChunkPacker(small_chunk_chars=100, budget_chars=1000, max_chunks=8)
+
+        mock_response = Mock()
+        mock_response.choices = [Mock()]
+        mock_response.choices[0].message.content = "## 整体分析"
+        report_service.endpoint_pool.endpoints[0].client.chat.completions.create = Mock(return_value=mock_response)
+
+        results = await report_service._process_chunks(["一", "二", "三"], "问题")
+
+        assert results == ["## 整体分析", None, None]
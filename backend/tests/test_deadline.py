@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+请求截止时间测试
+"""
+
+import time
+import pytest
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.deadline import Deadline, deadline_from_timeout
+from app.services.report_service import ReportService
+from app.core.config import settings
+
+
+class TestDeadline:
+    """截止时间测试类"""
+
+    def test_remaining_and_expired(self):
+        deadline = Deadline(10)
+        assert not deadline.expired
+        assert 9 < deadline.remaining() <= 10
+        assert deadline.call_timeout(60) <= 10
+        assert deadline.call_timeout(1) == 1
+
+        expired = Deadline(0)
+        assert expired.expired
+        assert expired.remaining() == 0
+
+    def test_deadline_from_timeout(self):
+        assert deadline_from_timeout(0) is None
+        assert deadline_from_timeout(None) is None
+        assert isinstance(deadline_from_timeout(5), Deadline)
+
+
+class TestReportDeadline:
+    """报告生成截止时间测试类"""
+
+    def setup_method(self):
+        self.original_concurrency = settings.llm_max_concurrency
+        settings.llm_max_concurrency = 1
+        self.report_service = ReportService()
+        self.report_service.pdf_service.process_pdf = Mock(return_value=[f"片段{i}" for i in range(6)])
+
+        def slow_create(**kwargs):
+            time.sleep(0.1)
+            response = Mock()
+            response.choices = [Mock()]
+            response.choices[0].message.content = "## 片段分析"
+            return response
+
+        self.create = Mock(side_effect=slow_create)
+        self.report_service.client.chat.completions.create = self.create
+
+    def teardown_method(self):
+        settings.llm_max_concurrency = self.original_concurrency
+
+    @pytest.mark.asyncio
+    async def test_partial_report_after_deadline(self):
+        """测试超过截止时间后跳过剩余片段并保存部分报告"""
+        result = await self.report_service.generate_report("unused.pdf", "测试问题", deadline=Deadline(0.25))
+        metadata = result["report_metadata"]
+
+        assert metadata.is_partial
+        assert metadata.processed_chunks < metadata.total_chunks
+        assert metadata.skipped_chunks > 0
+        assert self.create.call_count < 6
+        assert "部分报告" in result["markdown_report"]
+
+        saved = self.report_service.get_report_metadata(result["report_id"])
+        assert saved["is_partial"] is True
+        assert saved["skipped_chunks"] == metadata.skipped_chunks
+
+        # 因截止时间中止的片段不计为失败，不消耗重试次数
+        checkpoint = self.report_service.checkpoint_store.get_by_report(result["report_id"])
+        assert checkpoint.completed_results()
+        assert all(entry["status"] == "ok" for entry in checkpoint.results.values())
+
+    @pytest.mark.asyncio
+    async def test_per_call_timeout_shrinks(self):
+        """测试单次调用超时不超过剩余时间"""
+        await self.report_service.generate_report("unused.pdf", "测试问题", deadline=Deadline(0.25))
+        timeouts = [call.kwargs["timeout"] for call in self.create.call_args_list]
+        assert all(timeout <= 0.25 for timeout in timeouts)
+        assert timeouts == sorted(timeouts, reverse=True)
+
+    @pytest.mark.asyncio
+    async def test_complete_report_within_deadline(self):
+        result = await self.report_service.generate_report("unused.pdf", "测试问题", deadline=Deadline(30))
+        assert not result["report_metadata"].is_partial
+        assert result["report_metadata"].processed_chunks == 6
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+文档会话测试
+"""
+
+import os
+import time
+import pytest
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from fastapi.testclient import TestClient
+from app.services.document_service import DocumentService
+from app.core.config import settings
+
+
+class TestDocumentService:
+    """文档会话服务测试类"""
+
+    def setup_method(self):
+        self.document_service = DocumentService()
+
+    def test_create_and_load_document(self, tmp_path, make_pdf):
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"))
+        meta = self.document_service.create_document(pdf_path, "sample.pdf")
+
+        assert meta["total_chunks"] > 0
+        assert meta["page_count"] == 3
+        assert meta["size_bytes"] > 0
+
+        document = self.document_service.load_for_report(meta["document_id"])
+        assert len(document["chunks"]) == meta["total_chunks"]
+        assert len(document["chunk_terms"]) == meta["total_chunks"]
+        assert "artificial" in document["chunk_terms"][0]
+        assert document["meta"]["last_accessed_at"] >= meta["last_accessed_at"]
+
+    def test_missing_document(self):
+        with pytest.raises(FileNotFoundError):
+            self.document_service.load_for_report("missing")
+
+    def test_rejects_non_hex_document_id(self, tmp_path, monkeypatch):
+        """文档ID不是32位十六进制时不拼接路径，防止访问或删除文档目录之外的文件"""
+        documents_dir = tmp_path / "documents"
+        documents_dir.mkdir()
+        monkeypatch.setattr(settings, "documents_dir", str(documents_dir))
+        outside = tmp_path / "outside"
+        outside.mkdir()
+        (outside / DocumentService.META_FILE).write_text("{}", encoding="utf-8")
+
+        for document_id in ("../outside", "..", "A" * 32, "0" * 31):
+            with pytest.raises(FileNotFoundError):
+                self.document_service.get_document(document_id)
+            with pytest.raises(FileNotFoundError):
+                self.document_service.delete_document(document_id)
+        assert (outside / DocumentService.META_FILE).exists()
+
+    def test_lru_eviction(self, tmp_path, make_pdf):
+        """测试超出配额时淘汰最久未访问的文档"""
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"))
+        first = self.document_service.create_document(pdf_path)
+        time.sleep(0.01)
+        second = self.document_service.create_document(pdf_path)
+        time.sleep(0.01)
+        # 访问第一个文档，使第二个成为最久未用
+        self.document_service.load_for_report(first["document_id"])
+
+        original_quota = settings.documents_quota_bytes
+        settings.documents_quota_bytes = first["size_bytes"] + second["size_bytes"] - 1
+        try:
+            evicted = self.document_service.evict_if_needed()
+        finally:
+            settings.documents_quota_bytes = original_quota
+
+        assert evicted == [second["document_id"]]
+        assert self.document_service.get_document(first["document_id"])
+
+
+class TestDocumentAPI:
+    """文档会话接口测试类"""
+
+    def test_upload_once_ask_many(self, tmp_path, monkeypatch, make_pdf):
+        from main import app
+        from app.routers import research
+
+        mock_response = Mock()
+        mock_response.choices = [Mock()]
+        mock_response.choices[0].message.content = "## 分析"
+        create = Mock(return_value=mock_response)
+        monkeypatch.setattr(research.report_service.client.chat.completions, "create", create)
+        monkeypatch.setattr(research.report_service.pdf_service, "process_pdf", Mock(side_effect=AssertionError("不应重新解析PDF")))
+
+        client = TestClient(app)
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"))
+        with open(pdf_path, "rb") as f:
+            response = client.post("/api/v1/documents", files={"file": ("sample.pdf", f, "application/pdf")})
+        assert response.status_code == 200
+        document_id = response.json()["data"]["document_id"]
+
+        for question in ("问题一", "问题二"):
+            response = client.post(f"/api/v1/documents/{document_id}/reports", json={"question": question})
+            assert response.status_code == 200
+            assert response.json()["data"]["report_metadata"]["processed_chunks"] > 0
+
+        assert client.post("/api/v1/documents/missing/reports", json={"question": "问题"}).status_code == 404
+        assert client.get("/api/v1/documents/..%2Fuploads").status_code == 404
+        assert client.delete("/api/v1/documents/%2E%2E").status_code == 404
+        assert client.delete(f"/api/v1/documents/{document_id}").status_code == 200
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+对冲请求测试
+"""
+
+import asyncio
+import pytest
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.services.hedging import LatencyTracker, RequestHedger
+
+
+def make_hedger(**kwargs) -> RequestHedger:
+    """创建已预热延迟样本的对冲器"""
+    params = {"quantile": 0.95, "budget_ratio": 1.0, "min_samples": 5, "min_delay": 0.01}
+    params.update(kwargs)
+    hedger = RequestHedger(**params)
+    for _ in range(10):
+        hedger.latency_tracker.record(0.02)
+    return hedger
+
+
+class TestLatencyTracker:
+    """延迟统计测试类"""
+
+    def test_percentile(self):
+        tracker = LatencyTracker(window=100)
+        assert tracker.percentile(0.95) is None
+        for i in range(1, 101):
+            tracker.record(i / 100)
+        assert tracker.percentile(0.5) == 0.5
+        assert tracker.percentile(0.95) == 0.95
+
+    def test_window(self):
+        tracker = LatencyTracker(window=3)
+        for latency in (10, 1, 1, 1):
+            tracker.record(latency)
+        assert tracker.count == 3
+        assert tracker.percentile(1.0) == 1
+
+
+class TestRequestHedger:
+    """对冲器测试类"""
+
+    @pytest.mark.asyncio
+    async def test_no_hedge_without_samples(self):
+        """测试样本不足时不发出对冲"""
+        hedger = RequestHedger(min_samples=5)
+
+        async def call():
+            await asyncio.sleep(0.01)
+            return "ok"
+
+        assert await hedger.run(call) == "ok"
+        assert hedger.hedges_fired == 0
+        assert hedger.latency_tracker.count == 1
+
+    @pytest.mark.asyncio
+    async def test_hedge_wins_on_slow_primary(self):
+        """测试主请求过慢时对冲请求胜出，并取消主请求"""
+        hedger = make_hedger()
+        delays = [1.0, 0.01]
+        cancelled = []
+
+        async def call():
+            delay = delays.pop(0)
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                cancelled.append(delay)
+                raise
+            return delay
+
+        result = await asyncio.wait_for(hedger.run(call), timeout=0.5)
+        assert result == 0.01
+        assert hedger.hedges_fired == 1
+        assert hedger.hedges_won == 1
+        await asyncio.sleep(0)
+        assert cancelled == [1.0]
+
+    @pytest.mark.asyncio
+    async def test_hedge_falls_back_when_hedge_fails(self):
+        """测试对冲请求失败时仍等待主请求"""
+        hedger = make_hedger()
+        attempts = []
+
+        async def call():
+            attempts.append(1)
+            if len(attempts) == 2:
+                raise RuntimeError("429")
+            await asyncio.sleep(0.1)
+            return "primary"
+
+        assert await hedger.run(call) == "primary"
+        assert hedger.hedges_fired == 1
+        assert hedger.hedges_won == 0
+
+    @pytest.mark.asyncio
+    async def test_budget_limits_hedges(self):
+        """测试额外请求预算耗尽后不再对冲"""
+        hedger = make_hedger(budget_ratio=0.0)
+
+        async def call():
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        assert await hedger.run(call) == "ok"
+        assert hedger.hedges_fired == 0
+        assert hedger.hedges_skipped == 1
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+追加写入日志测试
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.journal import JsonlJournal
+
+
+class TestJsonlJournal:
+    """JSONL日志测试类"""
+
+    def _reader(self, path):
+        journal = JsonlJournal()
+        journal.reset(str(path))
+        state = {"records": [], "reloads": 0}
+
+        def reload():
+            state["records"].clear()
+            state["reloads"] += 1
+
+        def read():
+            journal.read(state["records"].append, reload)
+            return state
+
+        return journal, read
+
+    def test_incremental_read_skips_partial_line(self, tmp_path):
+        """只读取新追加的完整行，写入中的半行留到下次"""
+        path = tmp_path / "journal.jsonl"
+        writer = JsonlJournal()
+        writer.reset(str(path))
+        writer.append({"id": 1})
+        _, read = self._reader(path)
+        assert read()["records"] == [{"id": 1}]
+
+        with open(path, "a", encoding="utf-8") as f:
+            f.write('{"id": 2}\n{"id"')
+        assert read()["records"] == [{"id": 1}, {"id": 2}]
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(': 3}\nnot json\n')
+        state = read()
+        assert state["records"] == [{"id": 1}, {"id": 2}, {"id": 3}]
+        assert state["reloads"] == 1
+
+    def test_rewrite_triggers_reload(self, tmp_path):
+        """其他实例压缩重写后从头重放，记录数从重写后的条数开始"""
+        path = tmp_path / "journal.jsonl"
+        writer = JsonlJournal()
+        writer.reset(str(path))
+        for i in range(5):
+            writer.append({"id": i})
+        reader, read = self._reader(path)
+        read()
+        assert reader.records == 5
+        assert reader.needs_compaction(live_records=2, min_records=0)
+
+        writer.rewrite([{"id": 3}, {"id": 4}])
+        state = read()
+        assert state["records"] == [{"id": 3}, {"id": 4}]
+        assert state["reloads"] == 2
+        assert reader.records == 2
+        assert not reader.needs_compaction(live_records=2, min_records=0)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+模型调用录制回放测试
+"""
+
+import json
+import time
+import pytest
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.config import settings
+from app.services.llm_cassette import CassetteClient, LLMCassette, ReplayedLLMError, ReplayedLLMTimeout
+from app.services.report_service import ReportService
+
+MESSAGES = [{"role": "user", "content": "总结文档"}]
+
+
+def mock_client(content: str = "## 分析", delay: float = 0.0, error: Exception = None):
+    def create(**kwargs):
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        response = Mock()
+        response.choices = [Mock(finish_reason="stop")]
+        response.choices[0].message.content = f"{content} {kwargs['messages'][-1]['content']}"
+        response.usage = Mock(prompt_tokens=100, completion_tokens=20)
+        return response
+
+    client = Mock()
+    client.chat.completions.create = create
+    return client
+
+
+def record(path: str, inner, messages=MESSAGES):
+    return CassetteClient(LLMCassette(path, "record"), inner).chat.completions.create(
+        model="qwen-turbo", messages=messages, max_tokens=500, temperature=0.7
+    )
+
+
+class TestLLMCassette:
+    """录制回放测试类"""
+
+    def test_record_and_replay(self, tmp_path):
+        path = str(tmp_path / "llm.jsonl")
+        record(path, mock_client(delay=0.05))
+        with pytest.raises(TimeoutError):
+            record(path, mock_client(error=TimeoutError("stalled")), messages=[{"role": "user", "content": "第二段"}])
+
+        with open(path, "r", encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f]
+        assert entries[0]["response"]["usage"] == {"prompt_tokens": 100, "completion_tokens": 20}
+        assert entries[0]["latency"] >= 0.05
+        assert entries[1]["error"]["type"] == "TimeoutError"
+
+        cassette = LLMCassette(path, "replay")
+        client = CassetteClient(cassette)
+        started = time.monotonic()
+        response = client.chat.completions.create(model="qwen-turbo", messages=MESSAGES, max_tokens=500, temperature=0.7)
+        assert time.monotonic() - started >= 0.05  # 按原耗时回放
+        assert response.choices[0].message.content == "## 分析 总结文档"
+        assert response.usage.completion_tokens == 20
+        with pytest.raises(ReplayedLLMTimeout):
+            client.chat.completions.create(
+                model="qwen-turbo", messages=[{"role": "user", "content": "第二段"}], max_tokens=500, temperature=0.7
+            )
+        assert cassette.stats()["exact_hits"] == 2
+
+    def test_time_scale_and_timeout(self, tmp_path):
+        path = str(tmp_path / "llm.jsonl")
+        record(path, mock_client(delay=0.2))
+
+        client = CassetteClient(LLMCassette(path, "replay", time_scale=0))
+        started = time.monotonic()
+        client.chat.completions.create(model="qwen-turbo", messages=MESSAGES, max_tokens=500, temperature=0.7)
+        assert time.monotonic() - started < 0.1
+
+        # 放大后的延迟超过调用超时时间时按超时处理
+        client = CassetteClient(LLMCassette(path, "replay", time_scale=10))
+        with pytest.raises(ReplayedLLMTimeout):
+            client.chat.completions.create(model="qwen-turbo", messages=MESSAGES, max_tokens=500, timeout=0.01)
+
+    def test_fallback_and_strict(self, tmp_path):
+        path = str(tmp_path / "llm.jsonl")
+        record(path, mock_client(), messages=[{"role": "user", "content": "一"}])
+        record(path, mock_client(), messages=[{"role": "user", "content": "二"}])
+
+        cassette = LLMCassette(path, "replay", time_scale=0)
+        client = CassetteClient(cassette)
+        contents = [
+            client.chat.completions.create(model="other", messages=MESSAGES).choices[0].message.content
+            for _ in range(3)
+        ]
+        assert contents == ["## 分析 一", "## 分析 二", "## 分析 一"]  # 按录制顺序，用完后循环
+        assert cassette.stats()["fallbacks"] == 3
+
+        strict = CassetteClient(LLMCassette(path, "replay", time_scale=0, strict=True))
+        with pytest.raises(ReplayedLLMError):
+            strict.chat.completions.create(model="other", messages=MESSAGES)
+
+    def test_exact_match_after_full_pass(self, tmp_path):
+        """所有录制都用过后从头循环，仍优先完全匹配"""
+        path = str(tmp_path / "llm.jsonl")
+        for content in ("一", "二"):
+            record(path, mock_client(), messages=[{"role": "user", "content": content}])
+
+        def ask(client, content):
+            return client.chat.completions.create(
+                model="qwen-turbo", messages=[{"role": "user", "content": content}], max_tokens=500, temperature=0.7
+            ).choices[0].message.content
+
+        cassette = LLMCassette(path, "replay", time_scale=0)
+        client = CassetteClient(cassette)
+        assert [ask(client, content) for content in ("二", "一", "二", "一", "二")] == [
+            "## 分析 二", "## 分析 一", "## 分析 二", "## 分析 一", "## 分析 二"
+        ]
+        assert cassette.stats()["exact_hits"] == 5
+        assert cassette.stats()["fallbacks"] == 0
+
+        # 严格模式下同一请求多于录制次数时循环使用该请求的录制
+        strict = LLMCassette(path, "replay", time_scale=0, strict=True)
+        client = CassetteClient(strict)
+        assert [ask(client, "一") for _ in range(3)] == ["## 分析 一"] * 3
+        assert ask(client, "二") == "## 分析 二"
+        assert strict.stats()["exact_hits"] == 4
+
+    def test_missing_cassette(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            LLMCassette(str(tmp_path / "missing.jsonl"), "replay")
+        with pytest.raises(ValueError):
+            LLMCassette(str(tmp_path / "llm.jsonl"), "rewind")
+
+
+class TestReportServiceCassette:
+    """报告服务录制回放测试类"""
+
+    @pytest.mark.asyncio
+    async def test_replay_report(self, tmp_path, monkeypatch, make_pdf):
+        path = str(tmp_path / "llm.jsonl")
+        monkeypatch.setattr(settings, "checkpoint_enabled", False)
+        monkeypatch.setattr(settings, "llm_cassette_path", path)
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"), pages=5)
+
+        monkeypatch.setattr(settings, "llm_cassette_mode", "record")
+        recorder = ReportService()
+        for endpoint in recorder.endpoint_pool.endpoints:
+            endpoint.client.inner = mock_client()
+        recorded = await recorder.generate_report(pdf_path, "文档讲了什么？")
+
+        monkeypatch.setattr(settings, "llm_cassette_mode", "replay")
+        replayer = ReportService()
+        replayed = await replayer.generate_report(pdf_path, "文档讲了什么？")
+
+        calls = recorded["report_metadata"].llm_latency["calls"]
+        assert replayer.get_llm_stats()["cassette"]["exact_hits"] == calls
+        assert replayed["report_metadata"].prompt_tokens == recorded["report_metadata"].prompt_tokens
+        assert "## 分析" in replayer.get_report(replayed["report_id"])
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+LLM端点池负载均衡测试
+"""
+
+import asyncio
+import time
+import pytest
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.services.llm_pool import LLMEndpoint, LLMEndpointPool
+from app.services.hedging import RequestHedger
+from app.services.report_service import ReportService
+from app.core.config import settings
+
+
+class MockCompletions:
+    """本地模拟端点：固定延迟返回，并记录调用次数"""
+
+    def __init__(self, name: str, delay: float = 0.0):
+        self.name = name
+        self.delay = delay
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        response = Mock()
+        response.choices = [Mock()]
+        response.choices[0].message.content = f"来自{self.name}的回复"
+        return response
+
+
+def make_endpoint(name: str, delay: float = 0.0, weight: float = 1.0, max_concurrency: int = 4) -> LLMEndpoint:
+    client = Mock()
+    client.chat.completions = MockCompletions(name, delay)
+    return LLMEndpoint(
+        name=name,
+        api_base=f"http://127.0.0.1/{name}",
+        api_key="sk-test",
+        client=client,
+        weight=weight,
+        max_concurrency=max_concurrency
+    )
+
+
+class TestLLMEndpointPool:
+    """LLM端点池测试类"""
+
+    def test_from_settings_default_single_endpoint(self):
+        """测试未配置端点池时使用单一端点"""
+        pool = LLMEndpointPool.from_settings(client_factory=lambda base, key: Mock())
+        assert len(pool.endpoints) == 1
+        assert pool.endpoints[0].api_base == settings.api_base
+
+    def test_from_settings_multiple_endpoints(self):
+        """测试从配置创建多个端点"""
+        original = settings.llm_endpoints
+        settings.llm_endpoints = [
+            {"api_base": "http://127.0.0.1:9001/v1", "api_key": "k1", "weight": 2},
+            {"api_base": "http://127.0.0.1:9002/v1", "api_key": "k2", "max_concurrency": 1}
+        ]
+        try:
+            pool = LLMEndpointPool.from_settings(client_factory=lambda base, key: Mock())
+            assert len(pool.endpoints) == 2
+            assert pool.endpoints[0].weight == 2
+            assert pool.endpoints[1].max_concurrency == 1
+            assert "api_key" not in pool.stats()[0]
+        finally:
+            settings.llm_endpoints = original
+
+    @pytest.mark.asyncio
+    async def test_least_outstanding_respects_weight(self):
+        """测试最少在途请求策略按权重分配"""
+        heavy = make_endpoint("heavy", weight=2, max_concurrency=10)
+        light = make_endpoint("light", weight=1, max_concurrency=10)
+        pool = LLMEndpointPool([heavy, light])
+
+        for _ in range(6):
+            await pool.acquire()
+
+        assert heavy.outstanding == 4
+        assert light.outstanding == 2
+
+    @pytest.mark.asyncio
+    async def test_ewma_prefers_faster_endpoint(self):
+        """测试EWMA策略优先选择延迟更低的端点"""
+        slow = make_endpoint("slow")
+        fast = make_endpoint("fast")
+        pool = LLMEndpointPool([slow, fast], strategy="ewma")
+        pool.release(await pool.acquire(exclude=fast), latency=2.0)
+        pool.release(await pool.acquire(exclude=slow), latency=0.1)
+
+        endpoint = await pool.acquire()
+        assert endpoint is fast
+
+    @pytest.mark.asyncio
+    async def test_unhealthy_endpoint_is_skipped(self):
+        """测试连续失败的端点被暂时摘除"""
+        bad = make_endpoint("bad")
+        good = make_endpoint("good")
+        pool = LLMEndpointPool([bad, good], failure_threshold=2, cooldown=60)
+
+        for _ in range(2):
+            pool.release(bad, success=False)
+        assert not bad.is_healthy()
+
+        for _ in range(3):
+            assert await pool.acquire() is good
+
+    @pytest.mark.asyncio
+    async def test_saturated_healthy_endpoint_waits(self):
+        """测试健康端点满载时等待其释放，而不是转给有空闲额度的不健康端点"""
+        bad = make_endpoint("bad", max_concurrency=4)
+        good = make_endpoint("good", max_concurrency=1)
+        pool = LLMEndpointPool([bad, good], failure_threshold=1, cooldown=60)
+        pool.release(bad, success=False)
+        assert await pool.acquire() is good
+
+        waiter = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        assert bad.outstanding == 0
+
+        pool.release(good, latency=0.1)
+        assert await asyncio.wait_for(waiter, timeout=1) is good
+
+        # 全部不健康时仍退化为在所有端点中选择
+        pool.release(good, success=False)
+        assert await pool.acquire() is bad
+
+    @pytest.mark.asyncio
+    async def test_acquire_waits_for_capacity(self):
+        """测试端点满载时等待释放"""
+        endpoint = make_endpoint("only", max_concurrency=1)
+        pool = LLMEndpointPool([endpoint])
+        await pool.acquire()
+
+        waiter = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+
+        pool.release(endpoint, latency=0.1)
+        assert await asyncio.wait_for(waiter, timeout=1) is endpoint
+
+    @pytest.mark.asyncio
+    async def test_report_service_spreads_calls_across_endpoints(self):
+        """测试报告服务把片段调用分散到多个端点，吞吐随端点数增加"""
+        endpoints = [make_endpoint(f"mock-{i}", delay=0.05, max_concurrency=1) for i in range(4)]
+        report_service = ReportService()
+        report_service.endpoint_pool = LLMEndpointPool(endpoints)
+        report_service.prompt_service.build_chat_messages = Mock(return_value=[{"role": "user", "content": "hi"}])
+
+        start = time.monotonic()
+        results = await report_service._process_chunks([f"片段{i}" for i in range(8)], "测试问题")
+        elapsed = time.monotonic() - start
+
+        assert all(results)
+        assert [e.client.chat.completions.calls for e in endpoints] == [2, 2, 2, 2]
+        # 8次调用、4个端点各并发1，约2轮延迟
+        assert elapsed < 0.05 * 8
+
+    @pytest.mark.asyncio
+    async def test_hedge_avoids_primary_endpoint(self):
+        """测试对冲副本不发往主请求所在的端点，即使该端点的延迟得分最低"""
+        stuck = make_endpoint("stuck", delay=0.3)
+        spare = make_endpoint("spare")
+        stuck.ewma_latency = 0.01
+        spare.ewma_latency = 1.0
+        report_service = ReportService()
+        report_service.endpoint_pool = LLMEndpointPool([stuck, spare], strategy="ewma")
+        report_service.hedger = RequestHedger(budget_ratio=1.0, min_samples=1, min_delay=0.02)
+        report_service.hedger.latency_tracker.record(0.02)
+
+        result = await report_service._call_llm([{"role": "user", "content": "hi"}])
+
+        assert result.endpoint == "spare"
+        assert result.content == "来自spare的回复"
+        assert stuck.client.chat.completions.calls == 1
+        assert spare.client.chat.completions.calls == 1
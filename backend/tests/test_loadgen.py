@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+HTTP压测工具测试
+"""
+
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from perf import loadgen, stub_llm
+
+
+class TestLoadgen:
+    """压测工具测试类"""
+
+    def test_parse_mix(self):
+        assert loadgen.parse_mix("generate=1,list=2") == {"generate": 1.0, "list": 2.0}
+        with pytest.raises(ValueError):
+            loadgen.parse_mix("upload=1")
+        with pytest.raises(ValueError):
+            loadgen.parse_mix("list=0")
+
+    def test_build_summary(self):
+        samples = [
+            {"operation": "list", "start": 0.0, "latency": 0.1, "status": 200, "error": None},
+            {"operation": "list", "start": 0.5, "latency": 0.5, "status": 200, "error": None},
+            {"operation": "get", "start": 0.2, "latency": 0.3, "status": 404, "error": "404"}
+        ]
+        summary = loadgen.build_summary(samples)
+        assert summary["overall"]["requests"] == 3
+        assert summary["overall"]["errors"] == {"404": 1}
+        assert summary["operations"]["list"]["throughput_rps"] == 2.0
+        assert summary["operations"]["list"]["latency"]["max_ms"] == 500.0
+        assert summary["operations"]["get"]["error_rate"] == 1.0
+
+        rows = loadgen.compare(summary, summary)
+        assert all(row["change"] in (0.0, None) for row in rows)
+
+    @pytest.mark.asyncio
+    async def test_run_against_app(self, tmp_path, monkeypatch, make_pdf):
+        """在进程内对应用运行一次闭环与开环压测"""
+        from main import app
+        from app.routers import research
+
+        client = stub_llm.StubLLMClient(stub_llm.LatencyModel(0.0))
+        for endpoint in research.report_service.endpoint_pool.endpoints:
+            monkeypatch.setattr(endpoint, "client", client)
+        monkeypatch.setattr(research.report_service, "client", client)
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"))
+        transport = httpx.ASGITransport(app=app)
+        mix = loadgen.parse_mix("generate=1,list=1,get=1,download=1")
+
+        summary = await loadgen.run_load(
+            "http://testserver", pdf_path, mix, concurrency=2, requests=12, transport=transport
+        )
+        assert summary["overall"]["requests"] == 12
+        assert summary["overall"]["error_rate"] == 0.0
+        assert summary["operations"]["generate"]["ok"] >= 1
+        assert summary["meta"]["mode"] == "closed"
+        assert summary["server"]["traces_matched"] == 12
+        assert summary["server"]["loop_lag"] is not None
+
+        summary = await loadgen.run_load(
+            "http://testserver", pdf_path, mix, rate=50, requests=5, transport=transport
+        )
+        assert summary["overall"]["requests"] == 5
+        assert summary["meta"]["mode"] == "open"
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+内存剖析与单任务内存预算测试
+"""
+
+import os
+import pickle
+import random
+import tracemalloc
+import pytest
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+from fastapi.testclient import TestClient
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.config import settings
+from app.services import pdf_service as pdf_module
+from app.services.pdf_service import PDFService
+from app.services.report_service import ReportService
+from app.utils.memory import MemoryProfile
+from app.utils.spool import ChunkSpool, SpooledText
+from app.utils.tracing import span
+from perf import corpus
+
+MB = 1024 * 1024
+# 基准文档：200页英文合成PDF（约66万字符）
+REFERENCE_PAGES = 200
+REFERENCE_LAYOUT = "latin"
+# 流式处理的峰值只与 STREAM_BLOCK_CHARS 有关，与文档大小无关
+SPOOLED_PEAK_LIMIT = 2 * MB
+
+
+@pytest.fixture(scope="module")
+def reference_pdf(tmp_path_factory):
+    return corpus.corpus_path(REFERENCE_PAGES, REFERENCE_LAYOUT, corpus_dir=str(tmp_path_factory.mktemp("corpus")))
+
+
+def traced_peak(func):
+    tracemalloc.start()
+    try:
+        result = func()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class TestStreamingClean:
+    """流式清理测试类"""
+
+    def test_matches_clean_text(self, monkeypatch):
+        monkeypatch.setattr(pdf_module, "STREAM_BLOCK_CHARS", 2000)
+        service = PDFService()
+        rng = random.Random(0)
+        for trial in range(30):
+            chars = list(corpus.synthetic_text(rng.randint(100, 30000), "mixed", rng.random(), seed=trial))
+            # 在任意位置插入页码、特殊字符与空白，覆盖分块边界附近的情况
+            for _ in range(100):
+                chars.insert(rng.randrange(len(chars) + 1), rng.choice(["第 3 页", "Page 12", "※", " \n ", "第", "e ", "12 "]))
+            text = "  \n" + "".join(chars) + " \t"
+            pieces = [text[i:i + 3000] for i in range(0, len(text), 3000)]
+            assert "".join(service.clean_text_stream(pieces)) == service.clean_text(text)
+        assert "".join(service.clean_text_stream([" ", "\n\n"])) == ""
+
+
+class TestSpool:
+    """落盘中间结果测试类"""
+
+    def test_spooled_text(self):
+        with SpooledText() as text:
+            text.write("中文abc")
+            text.write("𝔘def")
+            assert len(text) == 9
+            assert text[1:5] == "文abc"
+            assert text[5] == "𝔘"
+            assert text[-2:] == "ef"
+            assert text[20:30] == ""
+
+    def test_chunk_spool(self):
+        chunks = ChunkSpool()
+        for chunk in ["第一段", "  ", "second", "第三段"]:
+            chunks.append(chunk)
+        assert len(chunks) == 3  # 空白分片不写入
+        assert list(chunks) == ["第一段", "second", "第三段"]
+        assert chunks[-1] == "第三段"
+        assert list(chunks.lengths) == [3, 6, 3]
+
+        # pickle后由接收方负责删除文件
+        restored = pickle.loads(pickle.dumps(chunks))
+        del chunks
+        assert os.path.exists(restored.path)
+        assert restored[1] == "second"
+        restored.close()
+        assert not os.path.exists(restored.path)
+
+
+class TestMemoryBudget:
+    """单任务内存预算测试类"""
+
+    @pytest.mark.parametrize("strategy", ["semantic", "fixed"])
+    def test_spooled_chunks_match(self, reference_pdf, monkeypatch, strategy):
+        monkeypatch.setattr(settings, "chunk_strategy", strategy)
+        service = PDFService()
+        in_memory = service.process_pdf(reference_pdf, memory_budget=0)
+        spooled = service.process_pdf(reference_pdf, memory_budget=1)
+        assert isinstance(in_memory, list)
+        assert isinstance(spooled, ChunkSpool)
+        assert list(spooled) == in_memory
+        spooled.close()
+
+    def test_budget_threshold(self, reference_pdf):
+        service = PDFService()
+        chars = len(service.extract_text_from_pdf(reference_pdf))
+        estimate = chars * pdf_module.MEMORY_PER_CHAR
+        assert isinstance(service.process_pdf(reference_pdf, memory_budget=estimate * 2), list)
+        spooled = service.process_pdf(reference_pdf, memory_budget=estimate // 2)
+        assert isinstance(spooled, ChunkSpool)
+        spooled.close()
+
+    def test_peak_memory_regression(self, reference_pdf):
+        """基准文档的峰值内存：内存中处理不超过预算估算，超出预算后的流式处理不超过固定上限"""
+        service = PDFService()
+        chars = len(service.extract_text_from_pdf(reference_pdf))
+        chunks, in_memory_peak = traced_peak(lambda: service.process_pdf(reference_pdf, memory_budget=0))
+        assert in_memory_peak <= chars * pdf_module.MEMORY_PER_CHAR, "新增的中间副本使峰值超过了预算估算"
+
+        spooled, spooled_peak = traced_peak(lambda: service.process_pdf(reference_pdf, memory_budget=1))
+        assert len(spooled) == len(chunks)
+        spooled.close()
+        assert spooled_peak <= SPOOLED_PEAK_LIMIT
+        assert spooled_peak < in_memory_peak / 3
+
+    @pytest.mark.asyncio
+    async def test_report_with_budget(self, tmp_path, monkeypatch, make_pdf):
+        monkeypatch.setattr(settings, "job_memory_budget_bytes", 1)
+        monkeypatch.setattr(settings, "spool_dir", str(tmp_path / "spool"))
+        service = ReportService()
+        prompts = []
+
+        def create(**kwargs):
+            prompts.append("\n".join(message["content"] for message in kwargs["messages"]))
+            response = Mock()
+            response.choices = [Mock(finish_reason="stop")]
+            response.choices[0].message.content = f"## 片段 {len(prompts)}"
+            response.usage = None
+            return response
+
+        monkeypatch.setattr(service.client.chat.completions, "create", create)
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"), pages=5)
+        expected = PDFService().process_pdf(pdf_path, memory_budget=0)
+
+        result = await service.generate_report(pdf_path, "文档讲了什么？")
+        assert result["report_metadata"].processed_chunks == len(expected)
+        assert len(prompts) == len(expected)
+        assert any(expected[0] in prompt for prompt in prompts)
+        assert os.listdir(tmp_path / "spool") == []  # 落盘的分片在报告完成后删除
+
+
+class TestMemoryProfile:
+    """内存剖析测试类"""
+
+    def test_stage_accounting(self):
+        profile = MemoryProfile().start()
+        try:
+            with span("parse"):
+                with span("extract"):
+                    transient = bytearray(4 * MB)
+                    del transient
+                with span("chunk"):
+                    retained = [bytearray(2 * MB)]
+        finally:
+            profile.stop()
+        data = profile.to_dict()
+        extract = data["stages"]["extract"]
+        assert extract["alloc_peak_mb"] >= 4
+        assert abs(extract["retained_mb"]) < 1
+        assert data["stages"]["chunk"]["retained_mb"] >= 2
+        assert data["stages"]["parse"]["peak_mb"] >= 4  # 外层阶段包含内层的峰值
+        assert data["peak_mb"] >= 4
+        assert any("test_memory_budget.py" in site["location"] for site in data["top_allocations"]["sites"])
+        assert not tracemalloc.is_tracing()
+        del retained
+
+    def test_memory_profiled_report(self, tmp_path, monkeypatch, make_pdf):
+        from main import app
+        from app.routers import research
+
+        mock_response = Mock()
+        mock_response.choices = [Mock()]
+        mock_response.choices[0].message.content = "## 分析"
+        monkeypatch.setattr(research.report_service.client.chat.completions, "create", lambda **kwargs: mock_response)
+        monkeypatch.setattr(settings, "profiling_token", "secret")
+        client = TestClient(app)
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"))
+
+        with open(pdf_path, "rb") as f:
+            response = client.post(
+                "/api/v1/generate_report",
+                files={"file": ("sample.pdf", f, "application/pdf")},
+                data={"question": "文档讲了什么？"},
+                headers={"X-Memory-Profile": "secret"}
+            )
+        assert response.status_code == 200
+        data = response.json()["data"]
+        assert "profile" not in data
+        assert {"parse", "llm", "combine", "save"} <= set(data["memory_profile"]["stages"])
+
+        response = client.get(f"/api/v1/reports/{data['report_id']}/profile", params={"format": "memory"})
+        assert response.status_code == 200
+        assert response.json()["stages"]["extract"]["count"] == 1
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Prometheus指标测试
+"""
+
+import pytest
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+from fastapi.testclient import TestClient
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.utils import metrics, offload
+from app.utils.metrics import Registry, Counter, Gauge, Histogram
+from app.services.pdf_service import PDFService
+from app.core.config import settings
+
+
+def sample_value(text: str, sample: str) -> float:
+    """从指标文本中取出某个样本的值"""
+    for line in text.splitlines():
+        if line.startswith(sample + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"sample not found: {sample}")
+
+
+class TestMetricTypes:
+    """指标类型测试类"""
+
+    def test_histogram_render(self):
+        registry = Registry()
+        histogram = registry.register(Histogram("test_seconds", "Test latency", ["model"], buckets=(0.1, 1)))
+        child = histogram.labels("qwen")
+        child.observe(0.05)
+        child.observe(0.5)
+        child.observe(5)
+
+        text = registry.render()
+        assert "# TYPE test_seconds histogram" in text
+        assert sample_value(text, 'test_seconds_bucket{model="qwen",le="0.1"}') == 1
+        assert sample_value(text, 'test_seconds_bucket{model="qwen",le="1"}') == 2
+        assert sample_value(text, 'test_seconds_bucket{model="qwen",le="+Inf"}') == 3
+        assert sample_value(text, 'test_seconds_count{model="qwen"}') == 3
+        assert sample_value(text, 'test_seconds_sum{model="qwen"}') == pytest.approx(5.55)
+
+    def test_children_are_cached(self):
+        counter = Counter("test_total", "Test", ["cache", "result"])
+        assert counter.labels("upload", "hit") is counter.labels("upload", "hit")
+        with pytest.raises(ValueError):
+            counter.labels("upload")
+
+    def test_series_limit(self, monkeypatch):
+        monkeypatch.setattr(metrics, "MAX_SERIES_PER_METRIC", 3)
+        gauge = Gauge("test_gauge", "Test", ["model"])
+        for index in range(10):
+            gauge.labels(f"model-{index}").inc()
+        assert len(gauge._children) == 4
+        assert gauge.labels("model-9").value == 7
+
+    def test_label_escaping(self):
+        registry = Registry()
+        counter = registry.register(Counter("test_total", "Test", ["model"]))
+        counter.labels('a"b').inc()
+        assert 'test_total{model="a\\"b"} 1' in registry.render()
+
+    def test_capture_and_replay(self):
+        registry = Registry()
+        histogram = registry.register(Histogram("test_seconds", "Test", buckets=(1,)))
+
+        result, observations = metrics.call_with_capture(lambda: histogram.observe(0.5) or "done")
+        assert result == "done"
+        assert histogram._default.count == 0
+
+        registry.replay(observations)
+        assert histogram._default.count == 1
+
+    def test_capture_and_replay_gauge_set(self):
+        registry = Registry()
+        gauge = registry.register(Gauge("test_bytes", "Test", ["pool"]))
+
+        _, observations = metrics.call_with_capture(lambda: (gauge.labels("cpu").set(5), gauge.labels("cpu").inc()))
+        assert gauge.labels("cpu").value == 0
+
+        registry.replay(observations)
+        assert gauge.labels("cpu").value == 6
+
+    def test_cache_hit_ratio(self):
+        metrics.record_cache("test-cache", hit=True, count=3)
+        metrics.record_cache("test-cache", hit=False)
+        text = metrics.REGISTRY.render()
+        assert sample_value(text, 'docreader_cache_hit_ratio{cache="test-cache"}') == 0.75
+
+
+class TestPipelineMetrics:
+    """报告流水线指标测试类"""
+
+    @pytest.mark.asyncio
+    async def test_process_pool_observations_are_merged(self, tmp_path, make_pdf):
+        """测试子进程中的解析指标回到父进程"""
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"))
+        pdf_service = PDFService()
+        chunk_count = metrics.CHUNK_COUNT.labels(settings.chunk_strategy)
+        before = chunk_count.count
+        settings.offload_cpu_mode = "process"
+        offload.shutdown(kind="cpu")
+        try:
+            await offload.run_cpu(pdf_service.process_pdf, pdf_path)
+        finally:
+            offload.shutdown(kind="cpu")
+        assert chunk_count.count == before + 1
+
+    def test_metrics_endpoint(self, tmp_path, monkeypatch, make_pdf):
+        from main import app
+        from app.routers import research
+
+        mock_response = Mock()
+        mock_response.choices = [Mock()]
+        mock_response.choices[0].message.content = "## 分析"
+        mock_response.usage = Mock(prompt_tokens=1200, completion_tokens=300)
+        monkeypatch.setattr(
+            research.report_service.client.chat.completions, "create", Mock(return_value=mock_response)
+        )
+
+        client = TestClient(app)
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"))
+        with open(pdf_path, "rb") as f:
+            response = client.post(
+                "/api/v1/generate_report",
+                files={"file": ("sample.pdf", f, "application/pdf")},
+                data={"question": "文档讲了什么？"}
+            )
+        assert response.status_code == 200
+
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        text = response.text
+        model = settings.model_name
+        version = research.report_service.prompt_service.prompt_version
+        labels = f'model="{model}",prompt_version="{version}"'
+        assert sample_value(text, f'docreader_llm_call_seconds_count{{{labels},outcome="ok"}}') >= 1
+        assert sample_value(text, f'docreader_llm_prompt_tokens_sum{{{labels}}}') >= 1200
+        assert sample_value(text, f'docreader_llm_calls_in_flight{{model="{model}"}}') == 0
+        assert sample_value(text, f'docreader_chunks_per_document_count{{chunk_strategy="{settings.chunk_strategy}"}}') >= 1
+        assert sample_value(text, "docreader_upload_size_bytes_count") >= 1
+        assert sample_value(text, "docreader_pdf_extract_seconds_per_page_count") >= 1
+        assert sample_value(text, "docreader_chunks_queued") == 0
+        assert sample_value(text, "docreader_reports_in_flight") == 0
+        assert f'docreader_report_save_seconds_count{{prompt_version="{version}"' in text
+        assert 'docreader_cache_requests_total{cache="upload",result="miss"}' in text
+        assert 'docreader_offload_queue_depth{pool="io"}' in text
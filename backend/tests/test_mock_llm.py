@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+模拟模型服务测试
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import httpx
+import openai
+import pytest
+from fastapi.testclient import TestClient
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from perf.mock_llm import MockConfig, MockLLMServer
+from perf.stub_llm import estimate_tokens
+
+MESSAGES = [{"role": "system", "content": "你是助手"}, {"role": "user", "content": "总结文档"}]
+
+
+def make_server(**config) -> MockLLMServer:
+    config.setdefault("latency", 0.0)
+    config.setdefault("tokens_per_second", 0.0)
+    return MockLLMServer(MockConfig(**config))
+
+
+def openai_client(server: MockLLMServer) -> openai.OpenAI:
+    return openai.OpenAI(api_key="mock", base_url="http://testserver/v1", http_client=TestClient(server.app), max_retries=0)
+
+
+class TestMockLLMServer:
+    """模拟模型服务测试类"""
+
+    def test_completion_with_usage(self):
+        server = make_server(completion_tokens=50)
+        client = openai_client(server)
+        completion = client.chat.completions.create(model="qwen-turbo", messages=MESSAGES, max_tokens=20)
+        assert len(completion.choices[0].message.content) == 20
+        assert completion.usage.completion_tokens == 20
+        assert completion.usage.prompt_tokens == sum(estimate_tokens(message["content"]) for message in MESSAGES)
+        assert server.stats["completed"] == 1
+        assert server.stats["in_flight"] == 0
+
+    def test_streaming(self):
+        server = make_server(completion_tokens=30, tokens_per_second=3000)
+        client = openai_client(server)
+        stream = client.chat.completions.create(
+            model="qwen-turbo", messages=MESSAGES, stream=True, stream_options={"include_usage": True}
+        )
+        content = ""
+        usage = None
+        finish_reasons = []
+        for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            for choice in chunk.choices:
+                content += choice.delta.content or ""
+                finish_reasons.append(choice.finish_reason)
+        assert len(content) == 30
+        assert finish_reasons[-1] == "stop"
+        assert usage.completion_tokens == 30
+        assert server.stats["streamed"] == 1
+        assert server.stats["in_flight"] == 0
+
+    def test_fault_injection(self):
+        client = openai_client(make_server(rate_429=1.0))
+        with pytest.raises(openai.RateLimitError):
+            client.chat.completions.create(model="m", messages=MESSAGES)
+
+        server = make_server(rate_5xx=1.0)
+        with pytest.raises(openai.InternalServerError):
+            openai_client(server).chat.completions.create(model="m", messages=MESSAGES)
+        assert server.stats["faults"]["5xx"] == 1
+
+        server = make_server(rate_timeout=1.0, hang_seconds=0.01)
+        response = TestClient(server.app).post("/v1/chat/completions", json={"model": "m", "messages": MESSAGES})
+        assert response.status_code == 504
+        assert response.json()["error"]["type"] == "timeout"
+
+    @pytest.mark.asyncio
+    async def test_concurrency_cap(self):
+        async def burst(server: MockLLMServer):
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+                return await asyncio.gather(*[
+                    client.post("/v1/chat/completions", json={"model": "m", "messages": MESSAGES}) for _ in range(4)
+                ])
+
+        server = make_server(latency=0.05, max_concurrency=2)
+        statuses = sorted(response.status_code for response in await burst(server))
+        assert statuses == [200, 200, 429, 429]
+        assert server.stats["rejected"] == 2
+
+        server = make_server(latency=0.05, max_concurrency=2, queue=True)
+        assert all(response.status_code == 200 for response in await burst(server))
+        assert server.stats["peak_in_flight"] == 2
+
+    def test_runtime_config(self):
+        server = make_server()
+        client = TestClient(server.app)
+        assert client.post("/mock/config", json={"rate_429": 1.0}).status_code == 200
+        assert client.post("/v1/chat/completions", json={"model": "m", "messages": MESSAGES}).status_code == 429
+        assert client.post("/mock/config", json={"unknown": 1}).status_code == 400
+        assert client.get("/mock/stats").json()["stats"]["faults"]["429"] == 1
+        client.post("/mock/reset")
+        assert client.get("/mock/stats").json()["stats"]["requests"] == 0
+
+    @pytest.mark.asyncio
+    async def test_report_service_against_mock(self, tmp_path, make_pdf):
+        """测试报告服务通过OpenAI客户端调用模拟服务"""
+        from app.services.report_service import ReportService
+
+        server = make_server(completion_tokens=40)
+        report_service = ReportService()
+        for endpoint in report_service.endpoint_pool.endpoints:
+            endpoint.client = openai_client(server)
+        result = await report_service.generate_report(make_pdf(str(tmp_path / "sample.pdf")), "文档讲了什么？")
+        metadata = result["report_metadata"]
+        assert metadata.completion_tokens == 40 * server.stats["completed"]
+        assert metadata.prompt_tokens > 0
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+模型路由测试
+"""
+
+import pytest
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.config import settings
+from app.services.model_router import ModelRouter, ModelUsageStats
+from app.services.report_service import ReportService, ReportRun
+from app.utils.tokenizer import tokenize, term_set, relevance_score
+
+
+class TestTokenizer:
+    """分词测试类"""
+
+    def test_tokenize_mixed_text(self):
+        tokens = tokenize("人工智能 AI Models")
+        assert tokens == ["人工", "工智", "智能", "ai", "models"]
+
+    def test_relevance_score(self):
+        question = term_set("人工智能的发展")
+        assert relevance_score(question, term_set("人工智能的发展历程")) == 1.0
+        assert relevance_score(question, term_set("天气预报")) == 0.0
+        assert relevance_score(set(), term_set("任意内容")) == 0.0
+
+
+class TestModelRouter:
+    """模型路由测试类"""
+
+    def setup_method(self):
+        self.router = ModelRouter(
+            ModelRouter.default_rules(light_model="light", heavy_model="heavy", min_chars=50, min_relevance=0.3),
+            default_model="heavy"
+        )
+        self.long_relevant = "人工智能的发展历程非常重要。" * 10
+
+    def test_edges_use_heavy_model(self):
+        """测试首尾片段（引言、总结）使用大模型"""
+        assert self.router.select_model("人工智能", "短", 0, 5) == "heavy"
+        assert self.router.select_model("人工智能", "短", 4, 5) == "heavy"
+
+    def test_short_chunk_uses_light_model(self):
+        assert self.router.select_model("人工智能", "人工智能", 2, 5) == "light"
+
+    def test_low_relevance_uses_light_model(self):
+        chunk = "今天的天气预报显示明天会下雨。" * 10
+        assert self.router.select_model("人工智能的发展", chunk, 2, 5) == "light"
+
+    def test_relevant_long_chunk_uses_default_model(self):
+        assert self.router.select_model("人工智能的发展", self.long_relevant, 2, 5) == "heavy"
+
+    def test_custom_rules(self):
+        router = ModelRouter([{"min_chars": 100, "model": "big"}], default_model="small")
+        assert router.select_model("问题", "x" * 200, 1, 3) == "big"
+        assert router.select_model("问题", "x" * 20, 1, 3) == "small"
+
+    @pytest.mark.parametrize("rules", [
+        [{"max_chars": 300}],
+        [{"max_chars": "300", "model": "light"}],
+        [{"position": "first", "model": "heavy"}],
+        [{"position": ["start"], "model": "heavy"}],
+        [{"max_char": 300, "model": "light"}],
+        ["light"]
+    ])
+    def test_invalid_rules_fail_at_startup(self, monkeypatch, rules):
+        monkeypatch.setattr(settings, "model_routing_rules", rules)
+        with pytest.raises(ValueError):
+            ModelRouter.from_settings()
+
+    def test_valid_custom_rules_from_settings(self, monkeypatch):
+        rules = [{"position": ["first"], "model": "heavy"}, {"max_chars": 300, "min_relevance": 0.2, "model": "light"}]
+        monkeypatch.setattr(settings, "model_routing_rules", rules)
+        assert ModelRouter.from_settings().rules == rules
+
+
+class TestModelUsageStats:
+    """模型调用统计测试类"""
+
+    def test_record(self):
+        stats = ModelUsageStats()
+        stats.record("light", 1.0)
+        stats.record("light", 3.0)
+        stats.record("heavy", 2.0)
+        data = stats.to_dict()
+        assert data["light"] == {"calls": 2, "avg_latency": 2.0, "max_latency": 3.0}
+        assert stats.models() == ["light", "heavy"]
+
+    @pytest.mark.asyncio
+    async def test_report_service_routes_per_chunk(self):
+        """测试报告服务按片段路由并记录各模型调用"""
+        report_service = ReportService()
+        report_service.model_router = ModelRouter([{"max_chars": 10, "model": "light"}], default_model="heavy")
+        report_service.prompt_service.build_chat_messages = Mock(return_value=[{"role": "user", "content": "hi"}])
+
+        mock_response = Mock()
+        mock_response.choices = [Mock()]
+        mock_response.choices[0].message.content = "回复"
+        create = Mock(return_value=mock_response)
+        report_service.endpoint_pool.endpoints[0].client.chat.completions.create = create
+
+        run = ReportRun()
+        await report_service._process_chunks(["短", "这是一个足够长的片段内容" * 2, "短"], "问题", run)
+
+        models = sorted(call.kwargs["model"] for call in create.call_args_list)
+        assert models == ["heavy", "light", "light"]
+        assert run.model_usage.to_dict()["light"]["calls"] == 2
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+阻塞操作分流层测试
+"""
+
+import asyncio
+import threading
+import time
+import pytest
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.utils import offload
+from app.services.pdf_service import PDFService
+from app.core.config import settings
+
+
+class TestOffload:
+    """分流层测试类"""
+
+    @pytest.mark.asyncio
+    async def test_io_runs_off_loop_thread(self):
+        loop_thread = threading.get_ident()
+        worker_thread = await offload.run_io(threading.get_ident)
+        assert worker_thread != loop_thread
+
+    @pytest.mark.asyncio
+    async def test_blocking_call_does_not_stall_loop(self):
+        """测试阻塞调用期间事件循环仍能处理其他任务"""
+        ticks = []
+
+        async def ticker():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(offload.run_io(time.sleep, 0.2), ticker())
+        assert len(ticks) == 5
+        assert ticks[-1] - ticks[0] < 0.2
+
+    @pytest.mark.asyncio
+    async def test_kwargs_are_passed(self):
+        assert await offload.run_io(sorted, [3, 1, 2], reverse=True) == [3, 2, 1]
+
+    def test_llm_pool_sized_from_endpoint_capacity(self, monkeypatch):
+        """测试模型调用线程数按端点池总额度与对冲余量确定"""
+        monkeypatch.setattr(settings, "llm_endpoints", [
+            {"api_base": "http://127.0.0.1:9001/v1", "max_concurrency": 6},
+            {"api_base": "http://127.0.0.1:9002/v1"}
+        ])
+        monkeypatch.setattr(settings, "llm_endpoint_max_concurrency", 4)
+        monkeypatch.setattr(settings, "llm_hedge_enabled", True)
+        monkeypatch.setattr(settings, "llm_hedge_budget_ratio", 0.1)
+        offload.shutdown(kind="llm")
+        try:
+            assert offload.get_executor("llm")._max_workers == 10 + 1
+        finally:
+            offload.shutdown(kind="llm")
+
+    @pytest.mark.asyncio
+    async def test_cpu_process_pool_parses_pdf(self, tmp_path, make_pdf):
+        """测试PDF解析可在独立进程中完成"""
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"))
+        pdf_service = PDFService()
+        settings.offload_cpu_mode = "process"
+        offload.shutdown(kind="cpu")
+        try:
+            chunks = await offload.run_cpu(pdf_service.process_pdf, pdf_path)
+            assert isinstance(offload.get_executor("cpu"), offload.ProcessPoolExecutor)
+        finally:
+            offload.shutdown(kind="cpu")
+        assert chunks == pdf_service.process_pdf(pdf_path)
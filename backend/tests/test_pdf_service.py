@@ -75,6 +75,20 @@ class TestPDFService:
         for chunk in chunks:
             assert len(chunk) <= self.pdf_service.max_chunk_size
     
+    def test_split_oversized_paragraph(self):
+        """测试无段落分隔的超长文本（clean_text后的整篇文档）按最大长度切分"""
+        size, overlap = self.pdf_service.max_chunk_size, self.pdf_service.overlap_size
+        text = "".join(f"{i:05d}" for i in range(size * 2))
+        chunks = self.pdf_service.split_text_semantic(text)
+        assert all(len(chunk) <= size for chunk in chunks)
+        assert len(chunks) == -(-(len(text) - overlap) // (size - overlap))
+        for previous, chunk in zip(chunks, chunks[1:]):
+            assert chunk.startswith(previous[-overlap:])
+
+        fixed = self.pdf_service.split_text_fixed(text)
+        assert fixed[-1] == text[-len(fixed[-1]):]
+        assert fixed[-1] not in fixed[-2]  # 末尾不产生被上一块完全包含的重复分片
+
     def test_chunk_overlap(self):
         """测试分片重叠"""
         text = "第一段。\n\n第二段。\n\n第三段。" * 200
@@ -129,4 +143,34 @@ class TestPDFService:
         if settings.chunk_strategy == "semantic":
             return self.pdf_service.split_text_semantic(cleaned_text)
         else:
-            return self.pdf_service.split_text_fixed(cleaned_text) 
\ No newline at end of file
+            return self.pdf_service.split_text_fixed(cleaned_text) 
+
+    def test_in_memory_matches_disk(self, tmp_path, make_pdf):
+        """测试从内存字节解析与从磁盘解析结果一致"""
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"))
+        with open(pdf_path, "rb") as f:
+            content = f.read()
+
+        disk_chunks, disk_info = self.pdf_service.process_pdf_with_info(pdf_path)
+        memory_chunks, memory_info = self.pdf_service.process_pdf_with_info(content)
+
+        assert memory_chunks == disk_chunks
+        assert memory_info == disk_info
+        assert memory_info["file_size"] == len(content)
+        assert self.pdf_service.process_pdf(content) == disk_chunks
+
+    def test_process_with_info_opens_once(self, tmp_path, monkeypatch, make_pdf):
+        """测试同时获取分片与信息时只打开一次文档"""
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"))
+        opened = []
+        original_open = PDFService.open_document
+
+        def counting_open(source):
+            opened.append(source)
+            return original_open(source)
+
+        monkeypatch.setattr(PDFService, "open_document", staticmethod(counting_open))
+        chunks, info = self.pdf_service.process_pdf_with_info(pdf_path)
+        assert chunks
+        assert info["page_count"] == 3
+        assert len(opened) == 1
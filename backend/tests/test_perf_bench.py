@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+离线流水线基准测试
+"""
+
+import hashlib
+import sys
+from pathlib import Path
+
+import fitz
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.config import settings
+from perf import bench_pipeline, corpus, stub_llm
+
+
+def file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class TestCorpus:
+    """合成语料测试类"""
+
+    def test_deterministic(self, tmp_path):
+        first = corpus.generate_pdf(str(tmp_path / "a.pdf"), pages=3, layout="mixed", seed=1)
+        second = corpus.generate_pdf(str(tmp_path / "b.pdf"), pages=3, layout="mixed", seed=1)
+        other = corpus.generate_pdf(str(tmp_path / "c.pdf"), pages=3, layout="mixed", seed=2)
+        assert file_digest(first) == file_digest(second)
+        assert file_digest(first) != file_digest(other)
+
+    def test_layouts(self, tmp_path):
+        for layout in corpus.LAYOUTS:
+            path = corpus.corpus_path(2, layout, corpus_dir=str(tmp_path))
+            with fitz.open(path) as doc:
+                assert len(doc) == 2
+                text = doc[1].get_text()
+            assert len(text) > 500
+            has_cjk = any("一" <= char <= "鿿" for char in text)
+            assert has_cjk == (layout != "latin")
+
+
+class TestStubLLM:
+    """模型桩测试类"""
+
+    def test_latency_distributions(self):
+        assert stub_llm.LatencyModel(0.1).sample() == 0.1
+        uniform = stub_llm.LatencyModel(0.1, "uniform", jitter=0.05, seed=1)
+        assert all(0.05 <= uniform.sample() <= 0.15 for _ in range(100))
+        samples = [stub_llm.LatencyModel(0.1, "lognormal", jitter=0.5, seed=3).sample() for _ in range(2)]
+        assert samples[0] == samples[1]  # 相同种子可复现
+
+    def test_response_shape(self):
+        client = stub_llm.StubLLMClient(stub_llm.LatencyModel(0.0))
+        response = client.chat.completions.create(model="m", messages=[{"role": "user", "content": "文档内容"}])
+        assert response.choices[0].message.content.startswith("## ")
+        assert response.usage.prompt_tokens == 5
+        assert response.usage.total_tokens == response.usage.prompt_tokens + response.usage.completion_tokens
+
+
+class TestBenchPipeline:
+    """流水线基准测试类"""
+
+    def test_run_and_compare(self, tmp_path):
+        checkpoint_enabled = settings.checkpoint_enabled
+        result = bench_pipeline.run_benchmark(
+            [2], ["latin"], stub_llm.LatencyModel(0.0), repeat=2, corpus_dir=str(tmp_path / "corpus")
+        )
+        assert settings.checkpoint_enabled == checkpoint_enabled  # 运行后恢复配置
+
+        case = result["cases"]["latin-2p"]
+        assert case["runs"] == 2
+        assert case["chunks"] >= 1
+        assert case["latency"]["p50"] > 0
+        assert case["throughput"]["pages_per_s"] > 0
+        for stage in ("extract", "chunk", "llm", "save"):
+            assert stage in case["stages"]
+        assert case["peak_rss_mb"]["overall"] > 0
+        assert case["tokens"]["prompt"] > 0
+        assert result["meta"]["llm"]["stub_calls"] >= 2
+
+        assert bench_pipeline.compare(result, result) == []
+        slower = {"cases": {"latin-2p": {**case, "latency": {"p50": case["latency"]["p50"] + 1.0, "p95": None}}}}
+        regressions = bench_pipeline.compare(slower, result)
+        assert [item["metric"] for item in regressions] == ["latency.p50"]
+
+    def test_compare_ignores_noise(self):
+        baseline = {"cases": {"x": {"latency": {"p50": 0.01}, "peak_rss_mb": {"overall": 100.0}}}}
+        current = {"cases": {"x": {"latency": {"p50": 0.03}, "peak_rss_mb": {"overall": 110.0}}}}
+        assert bench_pipeline.compare(current, baseline) == []
+        current["cases"]["x"]["peak_rss_mb"]["overall"] = 200.0
+        assert bench_pipeline.compare(current, baseline)[0]["metric"] == "peak_rss_mb.overall"
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+文本清理与分片微基准测试
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from perf import bench_chunking, corpus
+
+
+class TestSyntheticText:
+    """合成文本测试类"""
+
+    def test_size_and_determinism(self):
+        for size in (1000, 300 * 1024, 3 * 1024 * 1024):
+            text = corpus.synthetic_text(size, "mixed", 0.5)
+            assert abs(len(text.encode("utf-8")) - size) / size < 0.05
+        assert corpus.synthetic_text(5000, seed=1) == corpus.synthetic_text(5000, seed=1)
+        assert corpus.synthetic_text(5000, seed=1) != corpus.synthetic_text(5000, seed=2)
+
+    def test_distributions(self):
+        def paragraph_count(text):
+            return text.count("\n\n") + 1
+
+        assert "\n\n" not in corpus.synthetic_text(50000, "single")
+        assert paragraph_count(corpus.synthetic_text(50000, "short")) > paragraph_count(corpus.synthetic_text(50000, "long"))
+        latin = corpus.synthetic_text(20000, cjk_ratio=0)
+        cjk = corpus.synthetic_text(20000, cjk_ratio=1)
+        assert not any("一" <= char <= "鿿" for char in latin)
+        assert sum("一" <= char <= "鿿" for char in cjk) > len(cjk) / 2
+
+
+class TestBenchChunking:
+    """分片微基准测试类"""
+
+    def test_fit_exponent(self):
+        linear = [(size, size * 1e-8) for size in (1e5, 1e6, 1e7)]
+        quadratic = [(size, size ** 2 * 1e-14) for size in (1e5, 1e6, 1e7)]
+        assert abs(bench_chunking.fit_exponent(linear) - 1) < 0.01
+        assert abs(bench_chunking.fit_exponent(quadratic) - 2) < 0.01
+        assert bench_chunking.fit_exponent([(1e6, 0.1)]) is None
+        assert bench_chunking.parse_size("10M") == 10 * 1024 * 1024
+        assert bench_chunking.parse_size("512") == 512
+
+    def test_run_sweeps(self):
+        result = bench_chunking.run_sweeps(
+            ["size", "chunking"],
+            sizes=[1024, 64 * 1024, 256 * 1024],
+            base_size=32 * 1024,
+            chunk_sizes=[500],
+            overlaps=[0, 200, 600],
+            repeat=1
+        )
+        assert [point["target_bytes"] for point in result["sweeps"]["size"]] == [1024, 64 * 1024, 256 * 1024]
+        assert len(result["sweeps"]["chunking"]) == 2  # 重叠不小于分片大小的组合被跳过
+        entry = result["sweeps"]["size"][-1]["results"]["pipeline:semantic"]
+        assert entry["chunks"] > 1
+        assert entry["alloc_peak_mb"] > 0
+        assert set(result["scaling"]) == set(bench_chunking.TARGETS)
+        assert all(item["time_exponent"] is not None for item in result["scaling"].values())
+        assert result["oversized"] == []
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+单请求采样剖析测试
+"""
+
+import asyncio
+import json
+import threading
+import time
+import pytest
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+from fastapi.testclient import TestClient
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.utils import offload, profiler
+from app.utils.profiler import SamplingProfiler
+from app.services.pdf_service import PDFService
+from app.core.config import settings
+
+
+def busy(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def profiled_busy_loop(seconds: float):
+    busy(seconds)
+
+
+def unrelated_busy_loop(seconds: float):
+    busy(seconds)
+
+
+def sampled_functions(request_profiler: SamplingProfiler, label: str):
+    return {name for (thread, frames) in request_profiler.samples if thread == label for name, _, _ in frames}
+
+
+class TestSamplingProfiler:
+    """采样剖析器测试类"""
+
+    def test_requested_requires_token(self, monkeypatch):
+        monkeypatch.setattr(settings, "profiling_token", "")
+        assert not profiler.requested("anything", None)
+        monkeypatch.setattr(settings, "profiling_token", "secret")
+        assert profiler.requested("secret", None)
+        assert profiler.requested(None, "secret")
+        assert not profiler.requested("wrong", None)
+
+    @pytest.mark.asyncio
+    async def test_samples_only_the_profiled_request(self):
+        """测试只采样被剖析请求的任务与其分流调用，其他请求的任务不计入"""
+        loop = asyncio.get_running_loop()
+        original_factory = loop.get_task_factory()
+        threads_before = threading.active_count()
+
+        async def other_request():
+            for _ in range(10):
+                unrelated_busy_loop(0.01)
+                await asyncio.sleep(0)
+
+        async def profiled_request():
+            request_profiler = SamplingProfiler(interval_ms=1).start()
+            try:
+                async def child():
+                    profiled_busy_loop(0.05)
+
+                await asyncio.gather(child(), asyncio.sleep(0.01))
+                await offload.run_io(busy, 0.05)
+            finally:
+                request_profiler.stop()
+            return request_profiler
+
+        other = asyncio.ensure_future(other_request())
+        request_profiler = await profiled_request()
+        await other
+
+        assert "profiled_busy_loop" in sampled_functions(request_profiler, "event-loop")
+        assert "unrelated_busy_loop" not in sampled_functions(request_profiler, "event-loop")
+        assert "busy" in sampled_functions(request_profiler, "offload-io")
+        assert profiler.current_profiler() is None
+        assert loop.get_task_factory() is original_factory
+        assert threading.active_count() <= threads_before + 1  # 仅可能多出按需创建的分流线程
+
+    @pytest.mark.asyncio
+    async def test_output_formats(self):
+        request_profiler = SamplingProfiler(interval_ms=1).start()
+        profiled_busy_loop(0.03)
+        request_profiler.stop()
+        request_profiler.stop()  # 可重复调用
+
+        collapsed = request_profiler.collapsed()
+        first = collapsed.splitlines()[0]
+        stack, count = first.rsplit(" ", 1)
+        assert stack.startswith("event-loop;")
+        assert int(count) >= 1
+
+        document = json.loads(request_profiler.speedscope_json(name="test"))
+        assert document["profiles"][0]["type"] == "sampled"
+        frame_names = {frame["name"] for frame in document["shared"]["frames"]}
+        assert "profiled_busy_loop" in frame_names
+        profile = document["profiles"][0]
+        assert len(profile["samples"]) == len(profile["weights"])
+
+    @pytest.mark.asyncio
+    async def test_process_pool_samples_are_merged(self, tmp_path, make_pdf):
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"), pages=20)
+        pdf_service = PDFService()
+        settings.offload_cpu_mode = "process"
+        offload.shutdown(kind="cpu")
+        try:
+            request_profiler = SamplingProfiler(interval_ms=1).start()
+            try:
+                await offload.run_cpu(pdf_service.process_pdf, pdf_path)
+            finally:
+                request_profiler.stop()
+        finally:
+            offload.shutdown(kind="cpu")
+        assert any(thread == "cpu-process" for thread, _ in request_profiler.samples)
+
+
+class TestProfileAPI:
+    """剖析接口测试类"""
+
+    def test_profiled_report(self, tmp_path, monkeypatch, make_pdf):
+        from main import app
+        from app.routers import research
+
+        mock_response = Mock()
+        mock_response.choices = [Mock()]
+        mock_response.choices[0].message.content = "## 分析"
+
+        def slow_create(**kwargs):
+            busy(0.05)
+            return mock_response
+
+        monkeypatch.setattr(research.report_service.client.chat.completions, "create", slow_create)
+        monkeypatch.setattr(settings, "profiling_token", "secret")
+        client = TestClient(app)
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"))
+
+        def post(question, headers=None):
+            with open(pdf_path, "rb") as f:
+                return client.post(
+                    "/api/v1/generate_report",
+                    files={"file": ("sample.pdf", f, "application/pdf")},
+                    data={"question": question},
+                    headers=headers or {}
+                )
+
+        response = post("文档讲了什么？")
+        assert response.status_code == 200
+        assert "profile" not in response.json()["data"]
+
+        # 换一个问题，避免命中检查点而跳过模型调用
+        response = post("文档的结论是什么？", {"X-Profile": "secret"})
+        assert response.status_code == 200
+        data = response.json()["data"]
+        assert data["profile"]["samples"] > 0
+        report_id = data["report_id"]
+
+        response = client.get(f"/api/v1/reports/{report_id}/profile")
+        assert response.status_code == 200
+        frame_names = {frame["name"] for frame in response.json()["shared"]["frames"]}
+        assert "slow_create" in frame_names
+
+        response = client.get(f"/api/v1/reports/{report_id}/profile", params={"format": "collapsed"})
+        assert response.status_code == 200
+        assert "slow_create" in response.text
+
+        assert client.delete(f"/api/v1/reports/{report_id}").status_code == 200
+        assert client.get(f"/api/v1/reports/{report_id}/profile").status_code == 404
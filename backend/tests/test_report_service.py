@@ -112,8 +112,9 @@ class TestReportService:
             try:
                 self.report_service._save_report(report_id, markdown_report, question)
                 
-                # 检查文件是否创建
-                report_file = os.path.join(temp_dir, f"{report_id}.md")
+                # 检查文件是否创建（按报告ID哈希前缀分片保存）
+                report_file = self.report_service.report_store.body_path(report_id)
+                assert report_file and report_file.startswith(temp_dir)
                 assert os.path.exists(report_file)
                 
                 # 检查文件内容
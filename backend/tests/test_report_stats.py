@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+报告资源统计测试
+"""
+
+import pytest
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+from fastapi.testclient import TestClient
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.config import settings
+from app.services.report_service import ReportService
+from app.services.report_stats import ReportStatsLog
+from app.services.report_store import ReportStore
+
+
+def make_record(report_id: str, created_at: str = "2026-01-01 00:00:00", **metadata):
+    metadata.setdefault("processing_time", 10.0)
+    metadata.setdefault("model_used", "qwen-plus")
+    return ReportStatsLog.build_record(report_id, created_at, metadata, prompt_version="v1")
+
+
+def mock_llm_response(content: str = "## 分析", prompt_tokens: int = 1000, completion_tokens: int = 200):
+    response = Mock()
+    response.choices = [Mock()]
+    response.choices[0].message.content = content
+    response.usage = Mock(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    return response
+
+
+class TestReportStatsLog:
+    """统计日志测试类"""
+
+    def setup_method(self):
+        self.store = ReportStore()
+        self.stats = ReportStatsLog(self.store)
+
+    def test_aggregate(self):
+        self.stats.add(make_record(
+            "a", stage_timings={"extract": 1.0, "llm": 8.0}, llm_latency={"p95": 2.0, "max": 3.0},
+            prompt_tokens=1000, completion_tokens=100, retried_chunks=1, cache_hits={"checkpoint": 2}
+        ))
+        self.stats.add(make_record(
+            "b", processing_time=20.0, stage_timings={"extract": 3.0, "llm": 16.0}, llm_latency={"p95": 4.0, "max": 6.0},
+            prompt_tokens=3000, completion_tokens=300, cache_hits={"checkpoint": 1, "document": 1}
+        ))
+
+        result = self.stats.aggregate()
+        assert result["reports"] == 2
+        assert result["processing_time"]["avg"] == 15.0
+        assert result["processing_time"]["max"] == 20.0
+        assert result["stage_timings"]["extract"]["avg"] == 2.0
+        assert result["stage_timings"]["llm"]["p95"] == 16.0
+        assert result["llm_latency"]["max"] == 6.0
+        assert result["tokens"] == {"prompt": 4000, "completion": 400, "avg_per_report": 2200.0}
+        assert result["retried_chunks"] == 1
+        assert result["cache_hits"] == {"checkpoint": 3, "document": 1}
+
+    def test_filters_and_remove(self):
+        self.stats.add(make_record("old", created_at="2025-06-01 00:00:00"))
+        self.stats.add(make_record("new", created_at="2026-06-01 00:00:00", model_used="qwen-max"))
+        assert self.stats.aggregate(since="2026-01-01")["reports"] == 1
+        assert self.stats.aggregate(model="qwen-max")["reports"] == 1
+        assert self.stats.aggregate(prompt_version="v2")["reports"] == 0
+
+        self.stats.remove("new")
+        assert self.stats.aggregate()["reports"] == 1
+        assert self.stats.get("new") is None
+
+    def test_shared_between_instances(self):
+        """测试其他实例追加的记录在汇总前被增量读取"""
+        other = ReportStatsLog(self.store)
+        self.stats.aggregate()
+        other.add(make_record("x"))
+        assert self.stats.aggregate()["reports"] == 1
+
+    def test_rebuild_from_sidecars(self):
+        self.store.save("r1", "# 报告", {"created_at": "2026-01-01 00:00:00", "metadata": {"prompt_tokens": 42}})
+        stats = ReportStatsLog(self.store)
+        assert stats.aggregate()["tokens"]["prompt"] == 42
+
+
+class TestReportMetadataStats:
+    """报告元数据中的资源统计测试类"""
+
+    @pytest.mark.asyncio
+    async def test_generate_report_records_stats(self, tmp_path, monkeypatch, make_pdf):
+        # 保留已完成的检查点，使第二次运行可以复用
+        monkeypatch.setattr(settings, "checkpoint_completed_ttl", 3600.0)
+        report_service = ReportService()
+        report_service.client.chat.completions.create = Mock(return_value=mock_llm_response())
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"))
+
+        result = await report_service.generate_report(pdf_path, "文档讲了什么？")
+        metadata = result["report_metadata"]
+        calls = metadata.llm_latency["calls"]
+        assert calls >= 1
+        assert metadata.prompt_tokens == 1000 * calls
+        assert metadata.completion_tokens == 200 * calls
+        for stage in ("parse", "extract", "clean", "chunk", "llm", "combine", "save"):
+            assert stage in metadata.stage_timings
+        assert metadata.llm_latency["max"] >= metadata.llm_latency["p50"]
+        assert metadata.cache_hits == {"checkpoint": 0, "document": 0}
+
+        # 侧车元数据与统计日志中都有记录
+        sidecar = report_service.report_store.read_sidecar(result["report_id"])
+        assert sidecar["metadata"]["prompt_tokens"] == 1000 * calls
+        record = report_service.stats_log.get(result["report_id"])
+        assert record["stage_timings"]["save"] == metadata.stage_timings["save"]
+
+        # 相同文档与问题的第二次运行从检查点恢复全部片段
+        second = await report_service.generate_report(pdf_path, "文档讲了什么？")
+        assert second["report_metadata"].cache_hits["checkpoint"] == metadata.total_chunks
+        assert second["report_metadata"].prompt_tokens == 0
+
+        report_service.delete_report(result["report_id"])
+        assert report_service.stats_log.get(result["report_id"]) is None
+
+
+class TestReportStatsAPI:
+    """报告统计接口测试类"""
+
+    def test_stats_endpoint(self, tmp_path, monkeypatch, make_pdf):
+        from main import app
+        from app.routers import research
+
+        monkeypatch.setattr(
+            research.report_service.client.chat.completions, "create", Mock(return_value=mock_llm_response())
+        )
+        client = TestClient(app)
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"))
+        with open(pdf_path, "rb") as f:
+            response = client.post(
+                "/api/v1/generate_report",
+                files={"file": ("sample.pdf", f, "application/pdf")},
+                data={"question": "文档讲了什么？"}
+            )
+        assert response.status_code == 200
+
+        response = client.get("/api/v1/reports/stats")
+        assert response.status_code == 200
+        data = response.json()["data"]
+        assert data["reports"] == 1
+        assert data["tokens"]["prompt"] >= 1000
+        assert "llm" in data["stage_timings"]
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+报告压缩存储测试
+"""
+
+import gzip
+import json
+import os
+import pytest
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from fastapi.testclient import TestClient
+from app.services.report_store import ReportStore, parse_accept_encoding
+from app.services.report_service import ReportService
+from app.schemas.report_schema import ReportMetadata
+from app.utils.json_response import FastJSONResponse
+from app.core.config import settings
+
+
+@pytest.fixture
+def gzip_reports():
+    """临时开启gzip报告压缩"""
+    original = settings.report_compression
+    settings.report_compression = "gzip"
+    yield
+    settings.report_compression = original
+
+
+class TestReportStore:
+    """报告存储测试类"""
+
+    def setup_method(self):
+        self.store = ReportStore()
+
+    def test_parse_accept_encoding(self):
+        assert parse_accept_encoding("gzip, deflate, br") == ["gzip", "deflate", "br"]
+        assert parse_accept_encoding("zstd;q=1.0, gzip;q=0") == ["zstd"]
+        assert parse_accept_encoding(None) == []
+
+    def test_gzip_body_with_sidecar(self, gzip_reports):
+        content = "# 研究报告\n\n" + "内容" * 1000
+        path = self.store.save("r1", content, {"question": "问题"})
+
+        assert path.endswith(".md.gz")
+        assert os.path.getsize(path) < len(content.encode("utf-8"))
+        assert self.store.read_text("r1") == content
+        sidecar = self.store.read_sidecar("r1")
+        assert sidecar["question"] == "问题"
+        assert sidecar["encoding"] == "gzip"
+        assert sidecar["size"] == len(content.encode("utf-8"))
+
+    def test_read_encoded_passthrough(self, gzip_reports):
+        """测试客户端接受存储编码时原样返回压缩字节"""
+        self.store.save("r1", "正文", {})
+        with open(self.store.body_path("r1"), "rb") as f:
+            stored = f.read()
+
+        body, encoding = self.store.read_encoded("r1", ["br", "gzip"])
+        assert (body, encoding) == (stored, "gzip")
+        body, encoding = self.store.read_encoded("r1", [])
+        assert (body.decode("utf-8"), encoding) == ("正文", None)
+
+    def test_resave_replaces_other_encoding(self, gzip_reports):
+        self.store.save("r1", "旧内容", {})
+        settings.report_compression = "none"
+        self.store.save("r1", "新内容", {})
+        assert self.store.list_ids().count("r1") == 1
+        assert self.store.read_text("r1") == "新内容"
+
+    def test_delete(self, gzip_reports):
+        self.store.save("r1", "正文", {})
+        assert self.store.delete("r1")
+        assert not self.store.exists("r1")
+        assert self.store.read_sidecar("r1") is None
+        assert not self.store.delete("r1")
+
+
+class TestCompressedReports:
+    """压缩报告的读取与下载测试类"""
+
+    def _metadata(self) -> ReportMetadata:
+        return ReportMetadata(
+            total_chunks=3, processed_chunks=2, token_per_chunk=100, chunk_size=1000,
+            overlap_size=100, model_context_length=8000, processing_time=1.5, model_used="qwen-plus"
+        )
+
+    def test_report_service_reads_sidecar(self, gzip_reports):
+        report_service = ReportService()
+        report_service._save_report("r1", "# 标题\n\n正文", "测试问题", self._metadata())
+
+        assert report_service.get_report("r1").endswith("# 标题\n\n正文")
+        assert report_service.get_report_title("r1") == "标题"
+        assert report_service.get_report_metadata("r1")["processed_chunks"] == 2
+        assert report_service.list_reports()[0]["question"] == "测试问题"
+
+    def test_download_sends_stored_gzip(self, gzip_reports):
+        from main import app
+        from app.routers import research
+
+        research.report_service._save_report("dl-1", "# 标题\n\n" + "正文" * 500, "测试问题", self._metadata())
+        client = TestClient(app)
+
+        response = client.get("/api/v1/download_report/dl-1", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert "正文" in response.text
+
+        response = client.get("/api/v1/download_report/dl-1", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+        assert "正文" in response.text
+
+        assert client.delete("/api/v1/reports/dl-1").status_code == 200
+        assert client.delete("/api/v1/reports/dl-1").status_code == 404
+
+
+class TestFastJSONResponse:
+    """JSON响应编码测试类"""
+
+    def test_render_utf8(self):
+        body = FastJSONResponse({"msg": "报告", "data": {"count": 1}}).body
+        assert body.decode("utf-8").replace(" ", "") == '{"msg":"报告","data":{"count":1}}'
+
+
+class TestReportLayoutAndRetention:
+    """分片布局、归档与保留策略测试类"""
+
+    def setup_method(self):
+        self.store = ReportStore()
+
+    def _age(self, report_id: str, seconds: float):
+        """把报告的保存时间调早"""
+        sidecar_path = self.store.body_path(report_id).rsplit(".md", 1)[0] + ".meta.json"
+        with open(sidecar_path, encoding="utf-8") as f:
+            sidecar = json.load(f)
+        sidecar["saved_at"] -= seconds
+        with open(sidecar_path, "w", encoding="utf-8") as f:
+            json.dump(sidecar, f)
+
+    def test_sharded_layout_and_migration(self):
+        with open(os.path.join(settings.reports_dir, "legacy.md"), "w", encoding="utf-8") as f:
+            f.write("# 研究报告\n\n**研究问题**: 旧问题\n\n---\n\n旧正文")
+        self.store.save("new", "新正文", {})
+
+        assert os.path.dirname(self.store.body_path("new")) != settings.reports_dir
+        assert self.store.read_text("legacy").endswith("旧正文")
+
+        assert self.store.migrate_to_sharded() == 1
+        assert not os.path.exists(os.path.join(settings.reports_dir, "legacy.md"))
+        assert self.store.read_text("legacy").endswith("旧正文")
+        assert self.store.list_ids() == ["legacy", "new"]
+
+    def test_archive_served_by_index_lookup(self, gzip_reports):
+        """测试归档后的报告仍可读取、原样发送压缩内容并可删除"""
+        self.store.save("old-1", "旧报告一", {"question": "问题一"})
+        self.store.save("old-2", "旧报告二", {"question": "问题二"})
+        self.store.save("fresh", "新报告", {})
+        self._age("old-1", 10 * 86400)
+        self._age("old-2", 10 * 86400)
+
+        assert sorted(self.store.archive_older_than(86400)) == ["old-1", "old-2"]
+        assert self.store.body_path("old-1") is None
+        assert self.store.read_text("old-2") == "旧报告二"
+        assert self.store.read_sidecar("old-1")["question"] == "问题一"
+        assert self.store.read_encoded("old-1", ["gzip"])[1] == "gzip"
+        assert self.store.list_ids() == ["fresh", "old-1", "old-2"]
+
+        assert self.store.delete("old-1")
+        assert self.store.delete("old-2")
+        assert not self.store.exists("old-1")
+        assert os.listdir(os.path.join(settings.reports_dir, ReportStore.ARCHIVE_DIR)) == [ReportStore.ARCHIVE_INDEX]
+
+    def test_archive_shard_compaction(self, monkeypatch):
+        """删除使分片中的剩余数据占比低于阈值时重写分片，剩余报告仍可读取"""
+        for i in range(4):
+            self.store.save(f"old-{i}", f"旧报告{i}" * 50, {"question": f"问题{i}"})
+            self._age(f"old-{i}", 10 * 86400)
+        assert len(self.store.archive_older_than(86400)) == 4
+        archive_dir = os.path.join(settings.reports_dir, ReportStore.ARCHIVE_DIR)
+        shards = [name for name in os.listdir(archive_dir) if name.endswith(".bin")]
+        assert len(shards) == 1
+        shard_size = os.path.getsize(os.path.join(archive_dir, shards[0]))
+
+        monkeypatch.setattr(settings, "report_archive_compact_ratio", 0.6)
+        assert self.store.delete("old-0")
+        assert [name for name in os.listdir(archive_dir) if name.endswith(".bin")] == shards  # 剩余3/4，不压缩
+
+        assert self.store.delete("old-1")
+        compacted = [name for name in os.listdir(archive_dir) if name.endswith(".bin")]
+        assert compacted != shards and len(compacted) == 1
+        assert os.path.getsize(os.path.join(archive_dir, compacted[0])) == shard_size // 2
+        assert self.store.read_text("old-2") == "旧报告2" * 50
+        assert self.store.read_text("old-3") == "旧报告3" * 50
+        assert self.store.read_sidecar("old-3")["question"] == "问题3"
+
+        # 压缩后的分片仍可追加新的归档
+        self.store.save("old-4", "旧报告4", {})
+        self._age("old-4", 10 * 86400)
+        assert self.store.archive_older_than(86400) == ["old-4"]
+        assert self.store.read_text("old-4") == "旧报告4"
+        assert [name for name in os.listdir(archive_dir) if name.endswith(".bin")] == compacted
+
+    def test_retention_by_count_and_age(self, monkeypatch):
+        for i in range(4):
+            self.store.save(f"r{i}", "正文", {})
+            self._age(f"r{i}", (4 - i) * 3600)
+
+        monkeypatch.setattr(settings, "report_retention_max_count", 2)
+        assert sorted(self.store.select_expired()) == ["r0", "r1"]
+
+        monkeypatch.setattr(settings, "report_retention_max_count", 0)
+        monkeypatch.setattr(settings, "report_retention_days", 1)
+        assert self.store.select_expired() == []
+        self._age("r0", 86400)
+        assert self.store.select_expired() == ["r0"]
+
+    def test_maintenance_removes_from_search_index(self, monkeypatch):
+        report_service = ReportService()
+        report_service._save_report("r1", "# 标题\n\n正文", "过期问题")
+        report_service._save_report("r2", "# 标题\n\n正文", "保留问题")
+        self._age("r1", 3600)
+        monkeypatch.setattr(settings, "report_retention_max_count", 1)
+
+        assert report_service.run_maintenance() == {"deleted": ["r1"], "archived": [], "expired_checkpoints": []}
+        assert report_service.search_reports("过期")["total"] == 0
+        assert report_service.list_reports()[0]["report_id"] == "r2"
+
+    def test_migrate_script_maintenance_deletes_through_service(self, monkeypatch):
+        """migrate_reports.py --maintenance 删除的报告同时移出搜索索引与统计日志"""
+        import migrate_reports
+
+        report_service = ReportService()
+        report_service._save_report("r1", "# 标题\n\n正文", "过期问题")
+        report_service._save_report("r2", "# 标题\n\n正文", "保留问题")
+        self._age("r1", 3600)
+        monkeypatch.setattr(settings, "report_retention_max_count", 1)
+        deleted = []
+        original_delete = ReportService.delete_report
+
+        def delete_report(service, report_id):
+            deleted.append(report_id)
+            original_delete(service, report_id)
+
+        monkeypatch.setattr(ReportService, "delete_report", delete_report)
+        monkeypatch.setattr(sys, "argv", ["migrate_reports.py", "--maintenance"])
+        migrate_reports.main()
+
+        assert deleted == ["r1"]
+        assert ReportService().search_reports("过期")["total"] == 0
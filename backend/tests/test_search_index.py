@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+报告全文检索测试
+"""
+
+import math
+import os
+import random
+import pytest
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from fastapi.testclient import TestClient
+from app.services.report_store import ReportStore
+from app.services import search_index
+from app.services.search_index import ReportSearchIndex
+from app.utils.tokenizer import tokenize
+from app.services.report_service import ReportService
+from app.core.config import settings
+
+
+class TestReportSearchIndex:
+    """倒排索引测试类"""
+
+    def setup_method(self):
+        self.store = ReportStore()
+        self.index = ReportSearchIndex(self.store)
+
+    def test_ranking_prefers_question_hits(self):
+        self.index.add("body-hit", "市场分析", "市场", "本文附带讨论了人工智能的影响。" + "市场规模很大。" * 20)
+        self.index.add("question-hit", "人工智能的发展历程", "人工智能", "回顾发展的各个阶段。")
+        self.index.add("unrelated", "气候变化", "气候", "温室气体排放。")
+
+        result = self.index.search("人工智能")
+        assert [item["report_id"] for item in result["results"]] == ["question-hit", "body-hit"]
+        assert result["total"] == 2
+
+    def test_latin_terms_case_insensitive(self):
+        self.index.add("r1", "What is RAG", "RAG", "Retrieval augmented generation with LLM")
+        assert self.index.search("llm")["results"][0]["report_id"] == "r1"
+        assert self.index.search("transformer")["total"] == 0
+
+    def test_common_terms_only_refine_ranking(self):
+        """测试常见词项不单独召回，只为已召回的报告加分"""
+        self.index.add("r1", "量子计算", "", "model")
+        self.index.add("r2", "量子纠缠", "", "data")
+        self.index.add("r3", "气候变化", "", "model")
+        self.index.add("r4", "能源政策", "", "model")
+
+        result = self.index.search("量子 model")
+        assert [item["report_id"] for item in result["results"]] == ["r1", "r2"]
+        assert self.index.search("model")["total"] == 3
+
+    def test_pagination(self):
+        for i in range(5):
+            self.index.add(f"r{i}", f"机器学习问题{i}", "", "机器学习", created_at=f"2025-01-0{i + 1}")
+        first = self.index.search("机器学习", page=1, page_size=2)
+        second = self.index.search("机器学习", page=2, page_size=2)
+        assert first["total"] == 5
+        assert len(first["results"]) == 2
+        assert not {r["report_id"] for r in first["results"]} & {r["report_id"] for r in second["results"]}
+
+    def test_remove_and_reindex(self):
+        self.index.add("r1", "深度学习", "", "神经网络")
+        self.index.remove("r1")
+        assert self.index.search("深度学习")["total"] == 0
+
+        self.index.add("r1", "强化学习", "", "策略梯度")
+        self.index.add("r1", "强化学习", "", "价值函数")
+        assert self.index.search("策略梯度")["total"] == 0
+        assert self.index.search("价值函数")["total"] == 1
+
+    def test_other_instance_sees_appended_records(self):
+        other = ReportSearchIndex(self.store)
+        assert other.search("量子计算")["total"] == 0
+        self.index.add("r1", "量子计算", "", "量子比特")
+        assert other.search("量子计算")["total"] == 1
+        self.index.remove("r1")
+        assert other.search("量子计算")["total"] == 0
+
+    def _exhaustive(self, query):
+        """逐个报告计算BM25得分的参考结果"""
+        index = self.index
+        terms = set(tokenize(query))
+        total_documents = len(index.documents)
+        common_limit = search_index.COMMON_TERM_RATIO * total_documents
+        matched = [index.postings[term] for term in terms if term in index.postings]
+        has_selective = any(len(postings) <= common_limit for postings in matched)
+        candidates = set().union(*(p for p in matched if not has_selective or len(p) <= common_limit))
+        scores = {}
+        for report_id in candidates:
+            norm = index._norms[report_id]
+            scores[report_id] = sum(
+                math.log(1 + (total_documents - len(p) + 0.5) / (len(p) + 0.5)) * (search_index.BM25_K1 + 1)
+                * p[report_id] / (p[report_id] + norm)
+                for p in matched if report_id in p
+            )
+        ranked = sorted(scores, key=lambda report_id: (scores[report_id], index.documents[report_id]["created_at"]), reverse=True)
+        return len(scores), ranked
+
+    def test_top_k_matches_exhaustive_scoring(self, monkeypatch):
+        """提前结束的前若干条与逐个打分的结果一致，增删报告后增量维护的分档仍然正确"""
+        monkeypatch.setattr(search_index, "IMPACT_CACHE_MIN_POSTINGS", 1)
+        rng = random.Random(0)
+        words = ["营业收入", "风险", "公司", "市场", "增长", "利润", "政策", "技术"] + [f"术语{i}" for i in range(30)]
+
+        def add(i):
+            body = "研究报告" + "".join(rng.choice(words) for _ in range(rng.randint(5, 60)))
+            self.index.add(f"r{i}", rng.choice(words) + "的前景", "研究报告", body, created_at=f"2025-01-01 {i:05d}")
+
+        for i in range(300):
+            add(i)
+        queries = ["研究报告", "公司", "营业收入 风险", "术语7 市场", "政策 技术 利润"]
+        for round_ in range(3):
+            for query in queries:
+                for page, page_size in ((1, 10), (2, 7)):
+                    result = self.index.search(query, page=page, page_size=page_size)
+                    total, ranked = self._exhaustive(query)
+                    start = (page - 1) * page_size
+                    assert result["total"] == total
+                    assert [item["report_id"] for item in result["results"]] == ranked[start:start + page_size]
+            for i in rng.sample(range(300), 40):
+                self.index.remove(f"r{i}")
+            for i in rng.sample(range(300), 40):
+                add(i)
+
+    def test_compaction(self):
+        original = ReportSearchIndex.COMPACT_MIN_RECORDS
+        ReportSearchIndex.COMPACT_MIN_RECORDS = 4
+        try:
+            for _ in range(5):
+                self.index.add("r1", "数据库索引", "", "倒排索引")
+            with open(os.path.join(settings.reports_dir, ReportSearchIndex.INDEX_FILE), encoding="utf-8") as f:
+                assert len(f.readlines()) <= 4
+            assert ReportSearchIndex(self.store).search("数据库")["total"] == 1
+        finally:
+            ReportSearchIndex.COMPACT_MIN_RECORDS = original
+
+
+class TestReportSearch:
+    """报告检索集成测试类"""
+
+    def test_rebuild_from_existing_reports(self):
+        report_service = ReportService()
+        report_service._save_report("r1", "# 新能源汽车\n\n电池技术", "新能源汽车的前景")
+        os.remove(os.path.join(settings.reports_dir, ReportSearchIndex.INDEX_FILE))
+
+        fresh = ReportService()
+        result = fresh.search_reports("电池")
+        assert [item["report_id"] for item in result["results"]] == ["r1"]
+        assert result["results"][0]["title"] == "新能源汽车"
+
+    def test_search_endpoint(self):
+        from main import app
+        from app.routers import research
+
+        research.report_service._save_report("s1", "# 供应链\n\n库存管理", "供应链优化")
+        client = TestClient(app)
+
+        response = client.get("/api/v1/reports/search", params={"q": "供应链"})
+        assert response.status_code == 200
+        assert response.json()["data"]["results"][0]["report_id"] == "s1"
+
+        assert client.delete("/api/v1/reports/s1").status_code == 200
+        response = client.get("/api/v1/reports/search", params={"q": "供应链"})
+        assert response.json()["data"]["total"] == 0
+        assert client.get("/api/v1/reports/search").status_code == 422
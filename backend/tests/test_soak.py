@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+长时间稳态压测（泄漏检测）测试
+"""
+
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.config import settings
+from app.services.pdf_service import PDFService
+from perf import loadgen, soak, stub_llm
+
+
+def make_samples(count, leak_per_sample=0, rss_step=0):
+    """合成采样：每个采样生成一份报告，Leaky类型按leak_per_sample累积，其余类型上下波动"""
+    return [
+        {
+            "elapsed": float(i),
+            "reports_generated": i,
+            "rss_bytes": 100 * soak.MB + i * rss_step + (i % 3) * soak.MB,
+            "open_fds": 20 + i % 2,
+            "threads": 8,
+            "asyncio_tasks": 3,
+            "loguru_handlers": 3,
+            "gc_objects": 200000 + (i % 4) * 1000,
+            "gc_garbage": 0,
+            "object_types": {"dict": 50000 + (i % 5) * 300, "app.Leaky": 10 + i * leak_per_sample}
+        }
+        for i in range(count)
+    ]
+
+
+class TestSoakAnalysis:
+    """增长判定测试类"""
+
+    def test_parse_duration(self):
+        assert soak.parse_duration("90") == 90
+        assert soak.parse_duration("30m") == 1800
+        assert soak.parse_duration("1.5h") == 5400
+        with pytest.raises(ValueError):
+            soak.parse_duration("3d")
+
+    def test_growth(self):
+        times = list(range(16))
+        linear = soak.growth(times, times, [100 + 10 * t for t in times], min_abs=50)
+        assert linear["sustained"]
+        assert linear["per_report"] == 10
+        assert linear["per_hour"] == 36000
+
+        # 前期增长后进入平台（如缓存填满）不算持续增长
+        plateau = soak.growth(times, times, [min(100 + 50 * t, 300) for t in times], min_abs=50)
+        assert not plateau["sustained"]
+        noisy = soak.growth(times, times, [100 + (t % 3) * 40 for t in times], min_abs=50)
+        assert not noisy["sustained"]
+        assert soak.growth(times[:5], times[:5], [1, 2, 3, 4, 5], min_abs=1) is None
+
+    def test_analyze(self):
+        clean = soak.analyze(make_samples(40), warmup=5)
+        assert not clean["failed"]
+        assert clean["steady_samples"] == 35
+        assert clean["growing_types"] == []
+
+        leaking = soak.analyze(make_samples(40, leak_per_sample=30, rss_step=2 * soak.MB), warmup=5)
+        assert leaking["failed"]
+        assert leaking["leaking_metrics"] == ["rss_bytes"]
+        assert [item["type"] for item in leaking["growing_types"]] == ["app.Leaky"]
+        assert leaking["growing_types"][0]["per_report"] == 30
+
+        assert soak.analyze(make_samples(6), warmup=0)["insufficient_samples"]
+
+
+class TestSoakRun:
+    """稳态压测运行测试类"""
+
+    def test_resources_endpoint(self, monkeypatch):
+        from main import app
+
+        client = TestClient(app)
+        # 未配置口令或口令不符时不可用
+        assert client.get("/debug/resources").status_code == 404
+        monkeypatch.setattr(settings, "profiling_token", "secret")
+        assert client.get("/debug/resources", headers={"X-Profile": "wrong"}).status_code == 404
+
+        response = client.get("/debug/resources", params={"top": 5}, headers={"X-Profile": "secret"})
+        data = response.json()["data"]
+        assert data["gc_collected"] is None  # 默认不执行gc
+        assert len(data["object_types"]) == 5
+        assert data["threads"] >= 1
+        assert data["gc_objects"] >= sum(data["object_types"].values())
+        if sys.platform.startswith("linux"):
+            assert data["rss_bytes"] > 0
+            assert data["open_fds"] > 0
+
+    @pytest.mark.asyncio
+    async def test_detects_leaked_documents(self, tmp_path, monkeypatch, make_pdf):
+        """在进程内运行一次短时压测，注入每份报告泄漏一个PyMuPDF文档，应定位到该类型"""
+        from main import app
+        from app.routers import research
+
+        client = stub_llm.StubLLMClient(stub_llm.LatencyModel(0.0))
+        for endpoint in research.report_service.endpoint_pool.endpoints:
+            monkeypatch.setattr(endpoint, "client", client)
+        monkeypatch.setattr(research.report_service, "client", client)
+        monkeypatch.setattr(settings, "profiling_token", "secret")
+
+        leaked = []
+        original_open = PDFService.open_document
+
+        def leaky_open(source):
+            doc = original_open(source)
+            leaked.append(doc)
+            return doc
+
+        monkeypatch.setattr(PDFService, "open_document", staticmethod(leaky_open))
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"))
+
+        result = await soak.run_soak(
+            "http://testserver", pdf_path, loadgen.parse_mix("generate=1"), duration=4.0, token="secret", interval=0.2,
+            concurrency=2, warmup=0.5, keep_reports=3, settle=0.0, min_object_growth=5,
+            transport=httpx.ASGITransport(app=app)
+        )
+        analysis = result["analysis"]
+        assert result["load"]["overall"]["error_rate"] == 0.0
+        assert not analysis["insufficient_samples"]
+        assert analysis["failed"]
+        document_type = f"{type(leaked[0]).__module__}.{type(leaked[0]).__qualname__}"
+        flagged = {item["type"]: item for item in analysis["growing_types"]}
+        assert document_type in flagged
+        assert 0.5 <= flagged[document_type]["per_report"] <= 2
+        assert document_type in result["samples"][-1]["object_types"]
+
+        # 压测生成的早期报告在采样时被删除
+        async with httpx.AsyncClient(base_url="http://testserver", transport=httpx.ASGITransport(app=app)) as http:
+            reports = (await http.get("/api/v1/reports")).json()["data"]["reports"]
+        assert len(reports) < result["load"]["operations"]["generate"]["ok"]
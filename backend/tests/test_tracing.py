@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+请求追踪与事件循环延迟监控测试
+"""
+
+import asyncio
+import json
+import time
+import pytest
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+from fastapi.testclient import TestClient
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.utils import offload, tracing
+from app.utils.tracing import span, start_trace, TraceRecorder, LoopLagMonitor
+from app.services.pdf_service import PDFService
+from app.core.config import settings
+
+
+@pytest.fixture(autouse=True)
+def clean_recorder():
+    tracing.trace_recorder.clear()
+    yield
+    tracing.trace_recorder.clear()
+
+
+class TestSpans:
+    """span记录测试类"""
+
+    def test_span_outside_trace_is_noop(self):
+        with span("extract") as current:
+            assert current is None
+
+    def test_nested_spans_and_export(self):
+        with start_trace("req-1", "GET", "/x") as trace:
+            with span("outer", stage=1) as outer:
+                with span("inner") as inner:
+                    inner.set(chunks=3)
+        assert inner.parent_id == outer.span_id
+        assert outer.parent_id is None
+        assert {s.name for s in trace.spans} == {"outer", "inner"}
+
+        [exported] = tracing.trace_recorder.query(request_id="req-1")
+        assert exported["path"] == "/x"
+        assert exported["spans"][0]["name"] == "outer"
+        assert exported["spans"][1]["attrs"] == {"chunks": 3}
+
+    def test_span_records_error(self):
+        with start_trace("req-err") as trace:
+            with pytest.raises(ValueError):
+                with span("save"):
+                    raise ValueError("boom")
+        assert trace.spans[0].attrs["error"] == "ValueError"
+
+    def test_tracing_disabled(self, monkeypatch):
+        monkeypatch.setattr(settings, "tracing_enabled", False)
+        with start_trace("req-off") as trace:
+            with span("extract") as current:
+                assert current is None
+        assert trace is None
+        assert tracing.trace_recorder.query() == []
+
+    def test_ring_buffer_and_jsonl(self, tmp_path, monkeypatch):
+        trace_file = tmp_path / "traces" / "traces.jsonl"
+        monkeypatch.setattr(settings, "trace_file", str(trace_file))
+        recorder = TraceRecorder(size=2)
+        for index in range(3):
+            trace = tracing.Trace(f"req-{index}")
+            trace.end = trace.start
+            recorder.record(trace)
+
+        assert [t["request_id"] for t in recorder.query()] == ["req-2", "req-1"]
+        lines = trace_file.read_text(encoding="utf-8").splitlines()
+        assert [json.loads(line)["request_id"] for line in lines] == ["req-0", "req-1", "req-2"]
+
+    @pytest.mark.asyncio
+    async def test_spans_from_offloaded_threads(self):
+        """测试线程池中记录的span挂在调用方span之下"""
+        def work():
+            with span("worker"):
+                return 42
+
+        with start_trace("req-thread") as trace:
+            with span("parent") as parent:
+                assert await offload.run_io(work) == 42
+        worker = next(s for s in trace.spans if s.name == "worker")
+        assert worker.parent_id == parent.span_id
+
+    @pytest.mark.asyncio
+    async def test_spans_from_process_pool(self, tmp_path, make_pdf):
+        """测试子进程中记录的span随结果带回并合并"""
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"))
+        pdf_service = PDFService()
+        settings.offload_cpu_mode = "process"
+        offload.shutdown(kind="cpu")
+        try:
+            with start_trace("req-process") as trace:
+                with span("parse") as parse:
+                    chunks = await offload.run_cpu(pdf_service.process_pdf, pdf_path)
+        finally:
+            offload.shutdown(kind="cpu")
+        assert chunks
+        by_name = {s.name: s for s in trace.spans}
+        assert {"extract", "clean", "chunk"} <= set(by_name)
+        assert by_name["extract"].parent_id == parse.span_id
+        assert by_name["extract"].attrs["pages"] == 3
+
+
+class TestLoopLagMonitor:
+    """事件循环延迟监控测试类"""
+
+    @pytest.mark.asyncio
+    async def test_detects_blocking_call(self):
+        monitor = LoopLagMonitor(interval=0.01)
+        monitor.start()
+        try:
+            await asyncio.sleep(0.05)
+            started = time.time()
+            time.sleep(0.15)  # 故意阻塞事件循环
+            await asyncio.sleep(0.05)
+        finally:
+            await monitor.stop()
+
+        stats = monitor.stats()
+        assert stats["samples"] > 0
+        assert stats["max_ms"] >= 100
+        assert not stats["running"]
+        assert monitor.max_lag_ms(started, time.time()) >= 100
+
+    def test_max_lag_outside_window(self):
+        monitor = LoopLagMonitor(interval=0.5)
+        monitor.record(50.0, at=100.0)
+        assert monitor.max_lag_ms(200.0, 210.0) == 0.0
+        assert monitor.max_lag_ms(99.0, 101.0) == 50.0
+
+
+class TestTracesAPI:
+    """/debug/traces 接口测试类"""
+
+    def test_report_request_is_traced(self, tmp_path, monkeypatch, make_pdf):
+        from main import app
+        from app.routers import research
+
+        mock_response = Mock()
+        mock_response.choices = [Mock()]
+        mock_response.choices[0].message.content = "## 分析"
+        monkeypatch.setattr(
+            research.report_service.client.chat.completions, "create", Mock(return_value=mock_response)
+        )
+
+        client = TestClient(app)
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"))
+        with open(pdf_path, "rb") as f:
+            response = client.post(
+                "/api/v1/generate_report",
+                files={"file": ("sample.pdf", f, "application/pdf")},
+                data={"question": "文档讲了什么？"}
+            )
+        assert response.status_code == 200
+        request_id = response.headers["X-Request-ID"]
+
+        response = client.get("/debug/traces", params={"request_id": request_id})
+        assert response.status_code == 200
+        data = response.json()["data"]
+        assert "p95_ms" in data["loop_lag"]
+        [trace] = data["traces"]
+        assert trace["path"] == "/api/v1/generate_report"
+        assert trace["status_code"] == 200
+        names = [s["name"] for s in trace["spans"]]
+        for stage in ("upload", "parse", "extract", "clean", "chunk", "llm_call", "combine", "save"):
+            assert stage in names
+        llm_call = next(s for s in trace["spans"] if s["name"] == "llm_call")
+        assert llm_call["attrs"]["model"]
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+上传存储测试
+"""
+
+import hashlib
+import io
+import os
+import time
+import pytest
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from fastapi import UploadFile
+from app.services.upload_store import UploadStore
+from app.services.document_service import DocumentService
+from app.core.config import settings
+
+
+class TestUploadStore:
+    """内容寻址上传存储测试类"""
+
+    def setup_method(self):
+        self.store = UploadStore()
+
+    def test_identical_content_stored_once(self):
+        first_hash, first_path = self.store.put_bytes(b"%PDF-1.4 same", ref="report:a")
+        second_hash, second_path = self.store.put_bytes(b"%PDF-1.4 same", ref="report:b")
+
+        assert first_hash == second_hash
+        assert first_path == second_path
+        assert first_path.startswith(os.path.join(settings.upload_dir, first_hash[:2], first_hash[2:4]))
+        assert self.store.get(first_hash)["refs"] == ["report:a", "report:b"]
+        assert self.store.total_size() == len(b"%PDF-1.4 same")
+
+    @pytest.mark.asyncio
+    async def test_save_upload_streams_to_store(self):
+        content = b"%PDF-1.4 " + b"x" * (UploadStore.READ_BLOCK_SIZE + 10)
+        upload = UploadFile(file=io.BytesIO(content), filename="a.pdf")
+        file_hash, path = await self.store.save_upload(upload, ref="upload:1")
+
+        with open(path, "rb") as f:
+            assert f.read() == content
+        assert self.store.get(file_hash)["size"] == len(content)
+        assert os.listdir(os.path.join(settings.upload_dir, "tmp")) == []
+
+    def test_eviction_skips_referenced_files(self):
+        """测试超出配额时只淘汰无引用的文件，且按最久未使用顺序"""
+        kept_hash, _ = self.store.put_bytes(b"a" * 100, ref="document:1")
+        old_hash, old_path = self.store.put_bytes(b"b" * 100, ref="report:1")
+        time.sleep(0.01)
+        new_hash, _ = self.store.put_bytes(b"c" * 100, ref="report:2")
+        self.store.remove_ref("report:1")
+        self.store.remove_ref("report:2")
+
+        original_quota = settings.upload_quota_bytes
+        settings.upload_quota_bytes = 250
+        try:
+            evicted = self.store.evict_if_needed()
+        finally:
+            settings.upload_quota_bytes = original_quota
+
+        assert evicted == [old_hash]
+        assert not os.path.exists(old_path)
+        assert self.store.get(kept_hash) is not None
+        assert self.store.get(new_hash) is not None
+
+    @pytest.mark.asyncio
+    async def test_commit_and_register_under_lock(self, monkeypatch):
+        """测试文件落盘与登记引用在同一把锁内完成，并发淘汰无法在登记前删除文件"""
+        register = self.store._register
+
+        def checked_register(*args):
+            assert self.store._lock.locked()
+            assert os.path.exists(self.store.path_for(args[0]))
+            return register(*args)
+
+        monkeypatch.setattr(self.store, "_register", checked_register)
+        file_hash, _ = self.store.put_bytes(b"%PDF-1.4 locked", ref="upload:1")
+        self.store.put_bytes(b"%PDF-1.4 locked", ref="upload:2")
+        await self.store.save_upload(UploadFile(file=io.BytesIO(b"%PDF-1.4 locked"), filename="a.pdf"), ref="upload:3")
+        assert self.store.get(file_hash)["refs"] == ["upload:1", "upload:2", "upload:3"]
+
+    def test_add_ref_to_missing_file(self):
+        with pytest.raises(FileNotFoundError):
+            self.store.add_ref("0" * 64, "report:1")
+
+
+class TestDocumentUploads:
+    """文档与上传存储的引用关系测试类"""
+
+    def test_documents_share_stored_pdf(self, tmp_path, make_pdf):
+        document_service = DocumentService()
+        pdf_path = make_pdf(str(tmp_path / "sample.pdf"))
+        first = document_service.create_document(pdf_path)
+        second = document_service.create_document(pdf_path)
+
+        assert first["source_hash"] == second["source_hash"]
+        entry = document_service.upload_store.get(first["source_hash"])
+        assert entry["refs"] == [f"document:{first['document_id']}", f"document:{second['document_id']}"]
+
+        document_service.delete_document(first["document_id"])
+        entry = document_service.upload_store.get(first["source_hash"])
+        assert entry["refs"] == [f"document:{second['document_id']}"]
+
+
+class TestReportUploads:
+    """报告与上传文件的引用及配额淘汰测试类"""
+
+    def test_quota_evicts_uploads_after_reports(self, tmp_path, monkeypatch, make_pdf):
+        from unittest.mock import Mock
+        from fastapi.testclient import TestClient
+        from main import app
+        from app.routers import research
+
+        mock_response = Mock()
+        mock_response.choices = [Mock()]
+        mock_response.choices[0].message.content = "## 分析"
+        monkeypatch.setattr(research.report_service.client.chat.completions, "create", lambda **kwargs: mock_response)
+        client = TestClient(app)
+
+        hashes, report_ids = [], []
+        for pages in (2, 3):
+            pdf_path = make_pdf(str(tmp_path / f"sample-{pages}.pdf"), pages=pages)
+            with open(pdf_path, "rb") as f:
+                content = f.read()
+            monkeypatch.setattr(settings, "upload_quota_bytes", len(content))
+            response = client.post(
+                "/api/v1/generate_report",
+                files={"file": ("sample.pdf", content, "application/pdf")},
+                data={"question": "文档讲了什么？"}
+            )
+            assert response.status_code == 200
+            hashes.append(hashlib.sha256(content).hexdigest())
+            report_ids.append(response.json()["data"]["report_id"])
+
+        # 报告引用记录来源但不阻止淘汰，超出配额时较早的上传被淘汰，报告仍可下载
+        assert research.upload_store.get(hashes[0]) is None
+        assert research.upload_store.get(hashes[1])["refs"] == [f"report:{report_ids[1]}"]
+        for report_id in report_ids:
+            assert client.get(f"/api/v1/download_report/{report_id}").status_code == 200
+
+        assert client.delete(f"/api/v1/reports/{report_ids[1]}").status_code == 200
+        assert research.upload_store.get(hashes[1])["refs"] == []
+
+    def test_report_refs_evicted_after_unreferenced(self, monkeypatch):
+        """测试只被报告引用的文件不阻止淘汰，但排在无引用的文件之后"""
+        store = UploadStore()
+        reported_hash, reported_path = store.put_bytes(b"a" * 100, ref="report:1")
+        time.sleep(0.01)
+        free_hash, _ = store.put_bytes(b"b" * 100)
+        kept_hash, _ = store.put_bytes(b"c" * 100, ref="document:1")
+
+        monkeypatch.setattr(settings, "upload_quota_bytes", 250)
+        assert store.evict_if_needed() == [free_hash]
+        monkeypatch.setattr(settings, "upload_quota_bytes", 150)
+        assert store.evict_if_needed() == [reported_hash]
+        assert not os.path.exists(reported_path)
+        assert store.get(kept_hash)["refs"] == ["document:1"]